@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from app.db.models import ProgramaInventarioTipo, InventarioCampo, ItemInventarioPrograma
+from app.services.movimientos_inventario_service import Movimiento, MovimientosInventarioService
 
 # ----- tipos -----
 def get_tipo(db: Session, tipo_id: int):
@@ -58,20 +59,41 @@ def get_item(db: Session, item_id: int):
 def get_items_por_tipo(db: Session, tipo_id: int, skip=0, limit=500):
     return db.query(ItemInventarioPrograma).filter(ItemInventarioPrograma.tipo_id == tipo_id).order_by(ItemInventarioPrograma.fecha_inventario.desc()).offset(skip).limit(limit).all()
 
-def create_item(db: Session, data):
-    item = ItemInventarioPrograma(**data.dict())
+def create_item(db: Session, data, usuario_id: int = None):
+    datos = data.dict()
+    cantidad = datos.pop("cantidad_disponible", 0.0) or 0.0
+    item = ItemInventarioPrograma(**datos, cantidad_disponible=0.0)
     db.add(item)
+    db.flush()
+    # El saldo inicial entra por el libro de movimientos
+    MovimientosInventarioService.aplicar(
+        db, [Movimiento(item.id, cantidad, "ajuste", motivo="Saldo inicial")], usuario_id
+    )
     db.commit()
     db.refresh(item)
     return item
 
-def update_item(db: Session, item: ItemInventarioPrograma, data):
-    for key, value in data.dict(exclude_unset=True).items():
+def update_item(db: Session, item: ItemInventarioPrograma, data, usuario_id: int = None):
+    datos = data.dict(exclude_unset=True)
+    cantidad = datos.pop("cantidad_disponible", None)
+    for key, value in datos.items():
         setattr(item, key, value)
+    if cantidad is not None:
+        MovimientosInventarioService.fijar_saldo(db, item.id, cantidad, usuario_id, motivo="Edición del ítem")
     db.commit()
     db.refresh(item)
     return item
 
+def ajustar_item(db: Session, item: ItemInventarioPrograma, cantidad: float, motivo: str = None, usuario_id: int = None):
+    registros = MovimientosInventarioService.aplicar(
+        db, [Movimiento(item.id, cantidad, "ajuste", motivo=motivo or "Ajuste manual")], usuario_id
+    )
+    db.commit()
+    return registros[0] if registros else None
+
+def get_movimientos_item(db: Session, item_id: int, limit: int = 100):
+    return MovimientosInventarioService.listar(db, item_id, limit)
+
 def delete_item(db: Session, item: ItemInventarioPrograma):
     db.delete(item)
     db.commit()
\ No newline at end of file
@@ -1,5 +1,6 @@
 # app/CRUD/labores.py
-from sqlalchemy.orm import Session
+from collections import defaultdict
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import and_, func
 from datetime import datetime, timedelta
 from fastapi import HTTPException
@@ -12,6 +13,8 @@ from app.schemas.labor_schema import (
     AsignacionInsumoRequest, RegistroAvanceRequest, LaborWithRecursosResponse,
     LaborListResponse, LaborResponse
 )
+from app.services import paginacion
+from app.services.movimientos_inventario_service import MovimientosInventarioService
 
 # Nota: Los modelos Herramienta, Insumo, MovimientoHerramienta, MovimientoInsumo, AsignacionHerramienta
 # han sido eliminados. La funcionalidad de inventario será reemplazada por el nuevo sistema de
@@ -108,7 +111,10 @@ def listar_labores_crud(
     lote_id: int = None,
     recomendacion_id: int = None,
     tipo_labor_id: int = None,
-    usuario: Usuario = None
+    usuario: Usuario = None,
+    modo_paginacion: paginacion.ModoPaginacion = "offset",
+    cursor: str = None,
+    conteo: paginacion.ModoConteo = None
 ):
     query = db.query(Labor)
     
@@ -140,21 +146,24 @@ def listar_labores_crud(
             query = query.filter(False)
     # jefe_talento_humano y admin ven todo (sin filtro adicional)
     
-    total = query.count()
-    items = query.offset(skip).limit(limit).all()
+    usar_cursor, conteo = paginacion.resolver_modos(modo_paginacion, cursor, conteo)
+    total = paginacion.contar(db, query, conteo)
+    siguiente_cursor = None
+    if usar_cursor:
+        items, siguiente_cursor = paginacion.paginar_por_cursor(
+            query.options(*_opciones_carga_labor()), Labor.fecha_asignacion, Labor.id, cursor, limit
+        )
+    else:
+        items = query.options(*_opciones_carga_labor()).offset(skip).limit(limit).all()
     
-    # Convertir a diccionarios con recursos
-    labores_dict = []
-    for item in items:
-        _cargar_relaciones_labor(item)
-        _cargar_recursos_labor(db, item)
-        labor_dict = _labor_a_dict_con_recursos(item)
-        labores_dict.append(labor_dict)
+    # Convertir a diccionarios con recursos (carga por lotes, sin N+1)
+    labores_dict = _labores_a_dicts(db, items)
     
     return {
         "items": labores_dict,
         "total": total,
-        "paginas": (total + limit - 1) // limit
+        "paginas": paginacion.paginas(total, limit),
+        "siguiente_cursor": siguiente_cursor
     }
 
 
@@ -279,7 +288,8 @@ def asignar_insumo_crud(db: Session, labor: Labor, data: AsignacionInsumoRequest
     raise HTTPException(501, "La asignación de insumos está siendo migrada. Próximamente disponible en el nuevo módulo de inventario dinámico.")
 
 
-def registrar_avance_crud(db: Session, labor: Labor, data: RegistroAvanceRequest, usuario: Usuario):
+def aplicar_avance_labor(db: Session, labor: Labor, data: RegistroAvanceRequest, usuario: Usuario):
+    """Registra el avance (y el descuento de inventario al llegar a 100) sin confirmar la transacción."""
     rol = usuario.rol.nombre
     if rol == "trabajador":
         raise HTTPException(403, "Los trabajadores no pueden registrar avance. Contacta a Talento Humano.")
@@ -295,19 +305,13 @@ def registrar_avance_crud(db: Session, labor: Labor, data: RegistroAvanceRequest
         labor.fecha_finalizacion = (datetime.utcnow() - timedelta(hours=5))
         # Descontar inventario si recién se completa
         if not ya_estaba_completada:
-            item_id = labor.inventario_item_id
-            cantidad = labor.cantidad_usada
-            if not item_id and labor.recomendacion:
-                item_id = labor.recomendacion.inventario_item_id
-                if not cantidad:
-                    cantidad = labor.recomendacion.cantidad_sugerida
-            if item_id and cantidad:
-                item = db.query(ItemInventarioPrograma).filter(ItemInventarioPrograma.id == item_id).first()
-                if item:
-                    item.cantidad_disponible = max(0.0, item.cantidad_disponible - cantidad)
+            MovimientosInventarioService.descontar_labor(db, labor, usuario.id)
     elif data.avance_porcentaje > 0 and labor.estado == "pendiente":
         labor.estado = "en_progreso"
-    
+
+
+def registrar_avance_crud(db: Session, labor: Labor, data: RegistroAvanceRequest, usuario: Usuario):
+    aplicar_avance_labor(db, labor, data, usuario)
     db.commit()
     db.refresh(labor)
     _cargar_relaciones_labor(labor)
@@ -316,7 +320,8 @@ def registrar_avance_crud(db: Session, labor: Labor, data: RegistroAvanceRequest
     return _labor_a_dict_con_recursos(labor)
 
 
-def completar_labor_crud(db: Session, labor: Labor, usuario: Usuario, data=None):
+def aplicar_completar_labor(db: Session, labor: Labor, usuario: Usuario, data=None):
+    """Completa la labor y descuenta su inventario sin confirmar la transacción."""
     _verificar_permisos_labor(labor, usuario, "completar")
     
     labor.estado = "completada"
@@ -335,19 +340,13 @@ def completar_labor_crud(db: Session, labor: Labor, usuario: Usuario, data=None)
         if getattr(data, 'unidad_dosis', None):
             labor.unidad_dosis = data.unidad_dosis
 
-    # Descontar del inventario usando dosis_aplicada si existe, sino cantidad_usada
-    item_id = labor.inventario_item_id
-    cantidad_a_descontar = labor.dosis_aplicada or labor.cantidad_usada
-    if not item_id and labor.recomendacion:
-        item_id = labor.recomendacion.inventario_item_id
-        if not cantidad_a_descontar and labor.recomendacion:
-            cantidad_a_descontar = labor.recomendacion.cantidad_sugerida
-    
-    if item_id and cantidad_a_descontar:
-        item = db.query(ItemInventarioPrograma).filter(ItemInventarioPrograma.id == item_id).first()
-        if item:
-            item.cantidad_disponible = max(0.0, item.cantidad_disponible - cantidad_a_descontar)
-    
+    # Descontar del inventario (ítem de la labor, sus productos o el de la
+    # recomendación) usando dosis_aplicada si existe, sino cantidad_usada
+    MovimientosInventarioService.descontar_labor(db, labor, usuario.id)
+
+
+def completar_labor_crud(db: Session, labor: Labor, usuario: Usuario, data=None):
+    aplicar_completar_labor(db, labor, usuario, data)
     db.commit()
     db.refresh(labor)
     _cargar_relaciones_labor(labor)
@@ -382,15 +381,10 @@ def listar_labores_por_trabajador(db: Session, trabajador_id: int, skip: int = 0
         query = query.filter(Labor.estado == estado)
     
     total = query.count()
-    items = query.offset(skip).limit(limit).all()
+    items = query.options(*_opciones_carga_labor()).offset(skip).limit(limit).all()
     
-    # Convertir a diccionarios con recursos
-    labores_dict = []
-    for item in items:
-        _cargar_relaciones_labor(item)
-        _cargar_recursos_labor(db, item)
-        labor_dict = _labor_a_dict_con_recursos(item)
-        labores_dict.append(labor_dict)
+    # Convertir a diccionarios con recursos (carga por lotes, sin N+1)
+    labores_dict = _labores_a_dicts(db, items)
     
     return {
         "items": labores_dict,
@@ -408,15 +402,10 @@ def listar_labores_por_recomendacion(db: Session, recomendacion_id: int, skip: i
             raise HTTPException(403, "No tiene permisos para ver estas labores")
     
     total = query.count()
-    items = query.offset(skip).limit(limit).all()
+    items = query.options(*_opciones_carga_labor()).offset(skip).limit(limit).all()
     
-    # Convertir a diccionarios con recursos
-    labores_dict = []
-    for item in items:
-        _cargar_relaciones_labor(item)
-        _cargar_recursos_labor(db, item)
-        labor_dict = _labor_a_dict_con_recursos(item)
-        labores_dict.append(labor_dict)
+    # Convertir a diccionarios con recursos (carga por lotes, sin N+1)
+    labores_dict = _labores_a_dicts(db, items)
     
     return {
         "items": labores_dict,
@@ -586,16 +575,62 @@ def _cargar_relaciones_labor(labor: Labor):
             labor.granja_nombre = labor.lote.granja.nombre
 
 
+def _opciones_carga_labor():
+    """Relaciones que usa la serialización, cargadas con un IN por relación para toda la página."""
+    return (
+        selectinload(Labor.trabajador),
+        selectinload(Labor.lote).selectinload(Lote.granja),
+        selectinload(Labor.recomendacion).selectinload(Recomendacion.inventario_item),
+        selectinload(Labor.inventario_item),
+    )
+
+
+def _cargar_recursos_labores(db: Session, labores: list):
+    """
+    Carga evidencias (con su creador) y productos (con su ítem de inventario)
+    de varias labores con un número fijo de consultas IN.
+    """
+    labor_ids = [labor.id for labor in labores]
+    evidencias_por_labor = defaultdict(list)
+    productos_por_labor = defaultdict(list)
+    if labor_ids:
+        evidencias = db.query(Evidencia).options(selectinload(Evidencia.usuario)).filter(
+            Evidencia.labor_id.in_(labor_ids)
+        ).order_by(Evidencia.id).all()
+        for evidencia in evidencias:
+            evidencias_por_labor[evidencia.labor_id].append(evidencia)
+
+        productos = db.query(ProductoLabor).options(selectinload(ProductoLabor.inventario_item)).filter(
+            ProductoLabor.labor_id.in_(labor_ids)
+        ).order_by(ProductoLabor.id).all()
+        for pl in productos:
+            productos_por_labor[pl.labor_id].append(pl)
+
+    for labor in labores:
+        _asignar_recursos_labor(labor, evidencias_por_labor[labor.id], productos_por_labor[labor.id])
+
+
+def _labores_a_dicts(db: Session, labores: list) -> list:
+    _cargar_recursos_labores(db, labores)
+    resultado = []
+    for labor in labores:
+        _cargar_relaciones_labor(labor)
+        resultado.append(_labor_a_dict_con_recursos(labor))
+    return resultado
+
+
 def _cargar_recursos_labor(db: Session, labor: Labor):
     """
     ✅ Carga evidencias y productos de la labor
     """
+    _cargar_recursos_labores(db, [labor])
+
+
+def _asignar_recursos_labor(labor: Labor, evidencias: list, productos: list):
     # Evidencias
-    evidencias = db.query(Evidencia).filter(Evidencia.labor_id == labor.id).all()
     evidencias_info = []
     for evidencia in evidencias:
-        usuario_creador = db.query(Usuario).filter(Usuario.id == evidencia.usuario_id).first()
-        creado_por_nombre = usuario_creador.nombre if usuario_creador else None
+        creado_por_nombre = evidencia.usuario.nombre if evidencia.usuario else None
         evidencia_info = {
             "id": evidencia.id,
             "tipo": evidencia.tipo,
@@ -608,7 +643,6 @@ def _cargar_recursos_labor(db: Session, labor: Labor):
     labor.evidencias_info = evidencias_info
 
     # Productos de la labor (productos_labores)
-    productos = db.query(ProductoLabor).filter(ProductoLabor.labor_id == labor.id).all()
     productos_info = []
     for pl in productos:
         d = {
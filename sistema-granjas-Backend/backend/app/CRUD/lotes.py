@@ -1,19 +1,18 @@
 from sqlalchemy.orm import Session
 from app.db.models import Lote, LoteCultivo
 from app.schemas.lote_schema import LoteCreate, LoteUpdate
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from app.services import paginacion
 from . import lote_cultivos
 
 
-def get_lotes(
+def _query_lotes(
     db: Session,
-    skip: int = 0,
-    limit: int = 100,
     programa_id: Optional[int] = None,
     granja_id: Optional[int] = None,
     cultivo_id: Optional[int] = None,
     estado: Optional[str] = None
-) -> List[Lote]:
+):
     query = db.query(Lote).filter(Lote.estado != "eliminado")
 
     if programa_id:
@@ -30,9 +29,39 @@ def get_lotes(
     if estado:
         query = query.filter(Lote.estado == estado)
 
+    return query
+
+
+def get_lotes(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    programa_id: Optional[int] = None,
+    granja_id: Optional[int] = None,
+    cultivo_id: Optional[int] = None,
+    estado: Optional[str] = None
+) -> List[Lote]:
+    query = _query_lotes(db, programa_id, granja_id, cultivo_id, estado)
     return query.offset(skip).limit(limit).all()
 
 
+def get_lotes_por_cursor(
+    db: Session,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    programa_id: Optional[int] = None,
+    granja_id: Optional[int] = None,
+    cultivo_id: Optional[int] = None,
+    estado: Optional[str] = None,
+    conteo: paginacion.ModoConteo = "ninguno"
+) -> Tuple[List[Lote], Optional[str], Optional[int]]:
+    """Lotes por id descendente desde el cursor; devuelve (lotes, siguiente_cursor, total)."""
+    query = _query_lotes(db, programa_id, granja_id, cultivo_id, estado)
+    total = paginacion.contar(db, query, conteo)
+    lotes, siguiente = paginacion.paginar_por_cursor(query, None, Lote.id, cursor, limit)
+    return lotes, siguiente, total
+
+
 def get_lote(db: Session, lote_id: int) -> Optional[Lote]:
     return db.query(Lote).filter(
         Lote.id == lote_id,
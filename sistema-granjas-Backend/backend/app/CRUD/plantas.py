@@ -1,9 +1,17 @@
 import datetime
+import logging
+from sqlalchemy import inspect
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.db.models import Planta, Lote
+from app.db.models import Planta, Lote, colombia_now
+from app.db.upsert import insert_dialecto
 from app.schemas.planta_schema import PlantaCreate, PlantaUpdate
+from app.services.cambios_sync import registrar_cambio
 from typing import List, Optional
 
+logger = logging.getLogger(__name__)
+
 def generar_codigo_planta(lote_nombre: str, surco: int, numero: int) -> str:
     nombre_limpio = lote_nombre.replace(" ", "_").upper()
     return f"{nombre_limpio}-S{surco:02d}P{numero:02d}"
@@ -65,33 +73,98 @@ def delete_planta(db: Session, planta: Planta) -> None:
     db.delete(planta)  # Si quieres eliminar físicamente, usa esto. Si solo quieres marcar, comenta esta línea y descomenta la siguiente.
     db.commit()
 
-def crear_plantas_para_lote(db: Session, lote_id: int) -> List[Planta]:
+PLANTAS_POR_LOTE_INSERT = 1000
+
+
+COLUMNAS_CELDA = ["lote_id", "surco", "numero"]
+
+# Motores en los que ya se comprobó uq_planta_lote_surco_numero (no se borra)
+_motores_con_indice_celda: set = set()
+
+
+def _indice_celda_existe(db: Session) -> bool:
+    """
+    True si plantas tiene un índice único sobre (lote_id, surco, numero). La
+    migración no lo crea mientras haya plantas duplicadas en la misma celda.
+    """
+    motor = db.get_bind()
+    if motor.url in _motores_con_indice_celda:
+        return True
+    inspector = inspect(db.connection())
+    unicos = [i["column_names"] for i in inspector.get_indexes("plantas") if i.get("unique")]
+    unicos += [u["column_names"] for u in inspector.get_unique_constraints("plantas")]
+    if any(sorted(columnas) == sorted(COLUMNAS_CELDA) for columnas in unicos):
+        _motores_con_indice_celda.add(motor.url)
+        return True
+    return False
+
+
+def _insert_sin_conflictos(db: Session):
+    """
+    INSERT ... ON CONFLICT (lote_id, surco, numero) DO NOTHING: solo se omiten
+    las celdas que otra petición creó entretanto. Un choque de `codigo` con
+    otra planta sigue siendo un error. Sin el índice único (PostgreSQL
+    rechazaría ese ON CONFLICT) se usa un INSERT simple: las celdas que faltan
+    ya se leyeron en esta misma transacción.
+    """
+    stmt = insert_dialecto(db, Planta.__table__)
+    if not _indice_celda_existe(db):
+        logger.warning("plantas sin uq_planta_lote_surco_numero: se generan sin ON CONFLICT")
+        return stmt
+    return stmt.on_conflict_do_nothing(index_elements=COLUMNAS_CELDA)
+
+
+def crear_plantas_para_lote(db: Session, lote_id: int) -> List[Row]:
+    """
+    Genera la cuadrícula surco × número del lote e inserta solo las celdas que
+    faltan: una consulta para las existentes y INSERT multi-fila por bloques,
+    recuperando las plantas creadas con RETURNING. Devuelve filas (no objetos
+    ORM) para que el commit no obligue a recargar cada planta.
+    """
     lote = db.query(Lote).filter(Lote.id == lote_id).first()
     if not lote:
         raise ValueError("Lote no encontrado")
     if not lote.surcos or not lote.plantas_por_surco:
         raise ValueError("El lote no tiene definidos surcos o plantas por surco")
 
-    plantas_creadas = []
-    for surco in range(1, lote.surcos + 1):
-        for numero in range(1, lote.plantas_por_surco + 1):
-            existente = db.query(Planta).filter(
-                Planta.lote_id == lote_id,
-                Planta.surco == surco,
-                Planta.numero == numero
-            ).first()
-            if not existente:
-                codigo = generar_codigo_planta(lote.nombre, surco, numero)
-                nueva = Planta(
-                    lote_id=lote_id,
-                    surco=surco,
-                    numero=numero,
-                    codigo=codigo,
-                    estado="productivo"  # Estado por defecto para plantas generadas
-                )
-                db.add(nueva)
-                plantas_creadas.append(nueva)
+    existentes = set(
+        db.query(Planta.surco, Planta.numero).filter(Planta.lote_id == lote_id).all()
+    )
+    ahora = colombia_now()
+    filas = [
+        {
+            "lote_id": lote_id,
+            "surco": surco,
+            "numero": numero,
+            "codigo": generar_codigo_planta(lote.nombre, surco, numero),
+            "estado": "productivo",  # Estado por defecto para plantas generadas
+            "created_at": ahora,
+            "updated_at": ahora,
+        }
+        for surco in range(1, lote.surcos + 1)
+        for numero in range(1, lote.plantas_por_surco + 1)
+        if (surco, numero) not in existentes
+    ]
+
+    # executemany + RETURNING: SQLAlchemy lo envía como INSERT multi-fila
+    # ("insertmanyvalues") reutilizando la sentencia compilada en cada bloque
+    stmt = _insert_sin_conflictos(db).returning(*Planta.__table__.c)
+    plantas_creadas: List[Row] = []
+    try:
+        for inicio in range(0, len(filas), PLANTAS_POR_LOTE_INSERT):
+            bloque = filas[inicio:inicio + PLANTAS_POR_LOTE_INSERT]
+            plantas_creadas.extend(db.execute(stmt, bloque).all())
+    except IntegrityError:
+        nombre_lote = lote.nombre
+        # El código se arma con el nombre del lote en mayúsculas: "Lote 1" y
+        # "lote 1" generan los mismos códigos
+        db.rollback()
+        raise ValueError(
+            f"Los códigos de planta de '{nombre_lote}' ya están en uso por otras plantas; "
+            "renombre el lote antes de generar sus plantas"
+        )
+    # El INSERT de Core no pasa por el flush de la sesión
+    registrar_cambio(db, "planta", [p.id for p in plantas_creadas], lote_id=lote_id)
     db.commit()
-    for p in plantas_creadas:
-        db.refresh(p)
-    return plantas_creadas
\ No newline at end of file
+    plantas_creadas.sort(key=lambda p: (p.surco, p.numero))
+    return plantas_creadas
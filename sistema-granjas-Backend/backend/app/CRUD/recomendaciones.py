@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from app.db.models import Recomendacion, RecomendacionItem, ProductoRecomendacion, Labor, Usuario, Lote, Diagnostico, ItemInventarioPrograma, DiagnosticoTipo  # noqa: F401
 from app.schemas.recomendacion_schema import RecomendacionCreate, RecomendacionUpdate, AprobacionRecomendacionRequest
 from fastapi import HTTPException
+from app.services import paginacion
 
 
 def _nombre_item(item: ItemInventarioPrograma) -> str:
@@ -112,7 +113,10 @@ def listar_recomendaciones(
     lote_id: int = None,
     docente_id: int = None,
     programa_id: int = None,
-    usuario: Usuario = None
+    usuario: Usuario = None,
+    modo_paginacion: paginacion.ModoPaginacion = "offset",
+    cursor: str = None,
+    conteo: paginacion.ModoConteo = None
 ):
     query = db.query(Recomendacion)
 
@@ -138,13 +142,25 @@ def listar_recomendaciones(
             else:
                 query = query.filter(False)
 
-    total = query.count()
-    items = query.order_by(Recomendacion.fecha_creacion.desc()).offset(skip).limit(limit).all()
+    usar_cursor, conteo = paginacion.resolver_modos(modo_paginacion, cursor, conteo)
+    total = paginacion.contar(db, query, conteo)
+    siguiente_cursor = None
+    if usar_cursor:
+        items, siguiente_cursor = paginacion.paginar_por_cursor(
+            query, Recomendacion.fecha_creacion, Recomendacion.id, cursor, limit
+        )
+    else:
+        items = query.order_by(Recomendacion.fecha_creacion.desc()).offset(skip).limit(limit).all()
 
     for item in items:
         _cargar_relaciones_recomendacion(item)
 
-    return {"items": items, "total": total, "paginas": (total + limit - 1) // limit}
+    return {
+        "items": items,
+        "total": total,
+        "paginas": paginacion.paginas(total, limit),
+        "siguiente_cursor": siguiente_cursor,
+    }
 
 
 def obtener_recomendacion(db: Session, id: int, usuario: Usuario = None):
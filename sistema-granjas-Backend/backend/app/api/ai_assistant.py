@@ -1,14 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List, Optional
-from app.db.database import get_db
+from typing import Iterator, List, Optional
+from app.db.database import get_db, SessionLocal
 from app.core.dependencies import get_current_user, require_any_role
-from app.services.ai_service import generar_resumen_diagnostico, responder_chat
+from app.services.ai_service import prompt_resumen_diagnostico, prompt_chat
+from app.services.ai_modelo import Cupo, ModeloOcupado, generar, generar_stream, limite_llm
 from app.CRUD.chat_sesiones import (
     listar_sesiones, crear_sesion, obtener_sesion, eliminar_sesion,
     agregar_mensaje, obtener_mensajes, actualizar_titulo_sesion, touch_sesion
 )
+import itertools
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -79,17 +83,44 @@ def resumen_diagnostico(
     _=Depends(require_any_role(ROLES_IA))
 ):
     try:
-        resumen = generar_resumen_diagnostico(db, diagnostico_id, usuario)
-        return ResumenResponse(resumen=resumen, diagnostico_id=diagnostico_id)
+        prompt = prompt_resumen_diagnostico(db, diagnostico_id, usuario)
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    # La generación no necesita la base de datos: se devuelve la conexión al pool
+    db.close()
+    try:
+        return ResumenResponse(resumen=generar(prompt), diagnostico_id=diagnostico_id)
+    except ModeloOcupado as e:
+        raise _ocupado(e)
     except Exception as e:
         logger.error(f"Error generando resumen IA: {e}")
         raise HTTPException(status_code=500, detail="Error al generar el resumen con IA. Verifica que la clave GEMINI_API_KEY esté configurada.")
 
 
+@router.post("/resumen-diagnostico/{diagnostico_id}/stream")
+def resumen_diagnostico_stream(
+    diagnostico_id: int,
+    db: Session = Depends(get_db),
+    usuario=Depends(get_current_user),
+    _=Depends(require_any_role(ROLES_IA))
+):
+    """
+    Igual que /resumen-diagnostico pero como Server-Sent Events: `inicio`,
+    un `token` por fragmento del modelo y `fin` (o `error`).
+    """
+    try:
+        prompt = prompt_resumen_diagnostico(db, diagnostico_id, usuario)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    db.close()
+    cupo = _adquirir_cupo()
+    return _respuesta_sse(_stream_resumen(prompt, cupo, diagnostico_id))
+
+
 # ── Sesiones ──────────────────────────────────────────────────────────────────
 
 @router.get("/sesiones", response_model=List[SesionResponse])
@@ -181,6 +212,55 @@ def mensajes(
 
 # ── Chat ──────────────────────────────────────────────────────────────────────
 
+def _ocupado(e: ModeloOcupado) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+def _adquirir_cupo() -> Cupo:
+    try:
+        return limite_llm.adquirir()
+    except ModeloOcupado as e:
+        raise _ocupado(e)
+
+
+def _preparar_chat(db: Session, usuario, request: ChatRequest):
+    """
+    Obtiene o crea la sesión, guarda la pregunta y arma el prompt.
+    Devuelve (sesion, prompt, titulo_auto); titulo_auto es None si la sesión ya tenía mensajes.
+    """
+    if request.sesion_id:
+        sesion = obtener_sesion(db, request.sesion_id, usuario.id)
+        if not sesion:
+            raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    else:
+        sesion = crear_sesion(db, usuario.id, "Nueva conversación")
+
+    # Cargar historial de la sesión para contexto
+    msgs_bd = obtener_mensajes(db, sesion.id, limit=20)
+    historial = [{"role": m.rol, "content": m.contenido} for m in msgs_bd]
+
+    # Guardar mensaje del usuario
+    agregar_mensaje(db, sesion.id, "user", request.pregunta)
+
+    prompt = prompt_chat(db, usuario, request.pregunta, historial)
+
+    # Auto-titular la sesión con el primer mensaje si es nueva
+    titulo_auto = None
+    if len(msgs_bd) == 0 and sesion.titulo == "Nueva conversación":
+        titulo_auto = request.pregunta[:80] + ("…" if len(request.pregunta) > 80 else "")
+    return sesion, prompt, titulo_auto
+
+
+def _guardar_respuesta(db: Session, sesion, respuesta: str, titulo_auto: Optional[str]) -> int:
+    mensaje = agregar_mensaje(db, sesion.id, "assistant", respuesta)
+    mensaje_id = mensaje.id
+    if titulo_auto:
+        actualizar_titulo_sesion(db, sesion, titulo_auto)
+    # Actualizar timestamp de la sesión
+    touch_sesion(db, sesion)
+    return mensaje_id
+
+
 @router.post("/chat", response_model=ChatResponse)
 def chat(
     request: ChatRequest,
@@ -189,41 +269,115 @@ def chat(
     _=Depends(require_any_role(ROLES_IA))
 ):
     try:
-        # Obtener o crear sesión
-        if request.sesion_id:
-            sesion = obtener_sesion(db, request.sesion_id, usuario.id)
-            if not sesion:
-                raise HTTPException(status_code=404, detail="Sesión no encontrada")
-        else:
-            sesion = crear_sesion(db, usuario.id, "Nueva conversación")
-
-        # Cargar historial de la sesión para contexto
-        msgs_bd = obtener_mensajes(db, sesion.id, limit=20)
-        historial = [{"role": m.rol, "content": m.contenido} for m in msgs_bd]
-
-        # Guardar mensaje del usuario
-        agregar_mensaje(db, sesion.id, "user", request.pregunta)
-
-        # Generar respuesta con IA
-        respuesta = responder_chat(db, usuario, request.pregunta, historial)
-
-        # Guardar respuesta del asistente
-        agregar_mensaje(db, sesion.id, "assistant", respuesta)
+        sesion, prompt, titulo_auto = _preparar_chat(db, usuario, request)
+        # Cierra la transacción de lectura del contexto: la conexión vuelve al
+        # pool mientras el modelo genera y se toma otra para guardar la respuesta
+        db.commit()
 
-        # Auto-titular la sesión con el primer mensaje si es nueva
-        if len(msgs_bd) == 0 and sesion.titulo == "Nueva conversación":
-            titulo_auto = request.pregunta[:80] + ("…" if len(request.pregunta) > 80 else "")
-            actualizar_titulo_sesion(db, sesion, titulo_auto)
-
-        # Actualizar timestamp de la sesión
-        touch_sesion(db, sesion)
+        respuesta = generar(prompt)
+        _guardar_respuesta(db, sesion, respuesta, titulo_auto)
 
         return ChatResponse(respuesta=respuesta, sesion_id=sesion.id)
 
     except HTTPException:
         raise
+    except ModeloOcupado as e:
+        raise _ocupado(e)
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
     except Exception as e:
         logger.error(f"Error en chat IA: {e}")
         raise HTTPException(status_code=500, detail="Error al procesar tu mensaje. Verifica que la clave GEMINI_API_KEY esté configurada.")
+
+
+@router.post("/chat/stream")
+def chat_stream(
+    request: ChatRequest,
+    db: Session = Depends(get_db),
+    usuario=Depends(get_current_user),
+    _=Depends(require_any_role(ROLES_IA))
+):
+    """
+    Chat como Server-Sent Events. Eventos:
+      - `sesion`  {"sesion_id"}: en cuanto el contexto está listo.
+      - `token`   {"texto"}: cada fragmento según lo entrega el modelo.
+      - `fin`     {"sesion_id", "mensaje_id"}: respuesta completa guardada.
+      - `error`   {"detail"}: la generación falló; no se guarda respuesta.
+
+    La sesión de base de datos de la petición se cierra al terminar de armar
+    el contexto; la respuesta se guarda al final con una sesión nueva.
+    """
+    # El cupo se toma antes de escribir nada: con el modelo saturado se
+    # responde 503 sin dejar la pregunta guardada y sin respuesta
+    cupo = _adquirir_cupo()
+    try:
+        sesion, prompt, titulo_auto = _preparar_chat(db, usuario, request)
+        sesion_id, usuario_id = sesion.id, usuario.id
+    except HTTPException:
+        cupo.liberar()
+        raise
+    except PermissionError as e:
+        cupo.liberar()
+        raise HTTPException(status_code=403, detail=str(e))
+    except Exception as e:
+        cupo.liberar()
+        logger.error(f"Error en chat IA: {e}")
+        raise HTTPException(status_code=500, detail="Error al procesar tu mensaje.")
+    db.close()
+    return _respuesta_sse(_stream_chat(prompt, cupo, sesion_id, usuario_id, titulo_auto))
+
+
+# ── Server-Sent Events ───────────────────────────────────────────────────────
+
+def _evento(nombre: str, datos: dict) -> str:
+    return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def _respuesta_sse(eventos: Iterator[str]) -> StreamingResponse:
+    # El generador se arranca aquí para que su finally (que libera el cupo del
+    # modelo) corra aunque el cliente se desconecte antes del primer fragmento
+    primero = next(eventos)
+    return StreamingResponse(
+        itertools.chain([primero], eventos),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _stream_resumen(prompt: str, cupo: Cupo, diagnostico_id: int) -> Iterator[str]:
+    try:
+        yield _evento("inicio", {"diagnostico_id": diagnostico_id})
+        for texto in generar_stream(prompt, cupo):
+            yield _evento("token", {"texto": texto})
+        yield _evento("fin", {"diagnostico_id": diagnostico_id})
+    except Exception as e:
+        logger.error(f"Error generando resumen IA: {e}")
+        yield _evento("error", {"detail": "Error al generar el resumen con IA."})
+    finally:
+        cupo.liberar()
+
+
+def _stream_chat(prompt: str, cupo: Cupo, sesion_id: int, usuario_id: int,
+                 titulo_auto: Optional[str]) -> Iterator[str]:
+    try:
+        yield _evento("sesion", {"sesion_id": sesion_id})
+        partes = []
+        for texto in generar_stream(prompt, cupo):
+            partes.append(texto)
+            yield _evento("token", {"texto": texto})
+
+        db = SessionLocal()
+        try:
+            sesion = obtener_sesion(db, sesion_id, usuario_id)
+            if not sesion:
+                yield _evento("error", {"detail": "La sesión fue eliminada durante la respuesta"})
+                return
+            mensaje_id = _guardar_respuesta(db, sesion, "".join(partes), titulo_auto)
+        finally:
+            db.close()
+        yield _evento("fin", {"sesion_id": sesion_id, "mensaje_id": mensaje_id})
+    except Exception as e:
+        logger.error(f"Error en chat IA (stream): {e}")
+        yield _evento("error", {"detail": "Error al procesar tu mensaje."})
+    finally:
+        cupo.liberar()
@@ -3,12 +3,13 @@ import json
 import re
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta, date
 
-from app.db.database import get_db
+from app.db.database import get_db, SessionLocal
 from app.db.models import (
     Diagnostico, Usuario, Lote, Programa, Monitoreo, Recomendacion,
     Planta, diagnostico_planta
@@ -21,27 +22,63 @@ from app.schemas.diagnostico_schema import (
     PlantaGenerada
 )
 from app.core.dependencies import get_current_user, require_any_role
-from app.core.r2_storage import upload_file_to_r2, delete_file_from_r2
+from app.core.r2_storage import delete_file_from_r2, subir_archivos_r2, eliminar_archivos_r2
 from app.CRUD import diagnosticos as crud
+from app.services.estadisticas_service import EstadisticasDiagnosticoService
+from app.services.plantas_index import indice_plantas, seleccionar_mas_cercanas
+from app.services.muestreo_plantas import MuestreoPlantas
+from app.services.mapa_salud_service import SaludPlantasService, NIVELES_PRESION
+from app.services import paginacion as pag
+from app.services.subidas_directas_service import SubidasDirectasService
+from app.schemas.subida_schema import ConfirmarFotosRequest
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/diagnosticos", tags=["diagnosticos"])
 
 
 # ── Procesamiento de archivos con R2 ───────────────────────────────────────────
-def procesar_archivos_r2(form_data) -> Dict[str, List[str]]:
-    fotos_por_prefix: Dict[str, List[str]] = {}
-    for key, value in form_data.items():
+async def procesar_archivos_r2(form_data) -> Dict[str, List[Dict[str, Optional[str]]]]:
+    """
+    Procesa y sube en paralelo los campos `files[<prefix>]` del formulario
+    (fuera del event loop) y agrupa por prefix las fotos como
+    {"url", "miniatura"}. Si una subida falla no queda ninguna: se borran
+    las ya subidas y se propaga el error.
+    """
+    archivos = []
+    for key, value in form_data.multi_items():
         if key.startswith("files[") and hasattr(value, "filename"):
             match = re.search(r'files\[(.*?)\]', key)
             if match:
-                prefix = match.group(1)
-                url = upload_file_to_r2(value, prefix)
-                fotos_por_prefix.setdefault(prefix, []).append(url)
-                logger.info(f"Archivo subido: {url}")
+                archivos.append((match.group(1), value))
+
+    fotos_por_prefix: Dict[str, List[Dict[str, Optional[str]]]] = {}
+    for (prefix, _), foto in zip(archivos, await subir_archivos_r2(archivos)):
+        fotos_por_prefix.setdefault(prefix, []).append(foto)
+    if archivos:
+        logger.info(f"{len(archivos)} archivos subidos a R2")
     return fotos_por_prefix
 
 
+def _urls_fotos(fotos_por_prefix: Dict[str, list]) -> List[str]:
+    """URLs guardadas en fotos_subidas: texto (formato anterior) u {"url", "miniatura"}."""
+    urls = []
+    for fotos in fotos_por_prefix.values():
+        for foto in fotos:
+            if isinstance(foto, dict):
+                urls.extend(u for u in (foto.get("url"), foto.get("miniatura")) if u)
+            else:
+                urls.append(foto)
+    return urls
+
+
+async def _descartar_archivos_r2(fotos_por_prefix: Dict[str, list]) -> None:
+    """Borra las fotos recién subidas cuando el diagnóstico no llegó a guardarse."""
+    urls = _urls_fotos(fotos_por_prefix)
+    if urls:
+        await eliminar_archivos_r2(urls)
+        logger.info(f"{len(urls)} archivos descartados de R2 tras un error al guardar")
+
+
 # ── Helpers ────────────────────────────────────────────────────────────────────
 def get_or_404(db: Session, model, id: int, msg: str = "Recurso no encontrado"):
     obj = db.get(model, id)
@@ -59,6 +96,37 @@ def _enriquecer(obj: Diagnostico) -> None:
     obj.usuario_nombre = obj.usuario.nombre if obj.usuario else None
 
 
+def _claves_derivadas(diagnostico: Diagnostico) -> tuple:
+    return (EstadisticasDiagnosticoService.clave(diagnostico), SaludPlantasService.clave(diagnostico))
+
+
+def _refrescar_derivados(claves: List[tuple]) -> None:
+    """
+    Actualiza las tablas derivadas (estadísticas por campo y salud por planta)
+    sin interrumpir la operación principal. `claves` son las de
+    _claves_derivadas, capturadas antes y después de modificar o eliminar.
+
+    Usa su propia sesión: la operación principal ya confirmó y un error aquí
+    no debe tocar los objetos de la petición. Es bloqueante (puede
+    reconstruir un subtipo o un lote completo): desde rutas async se llama
+    con run_in_threadpool.
+    """
+    db = SessionLocal()
+    try:
+        try:
+            EstadisticasDiagnosticoService.refrescar_buckets(db, [c[0] for c in claves])
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error actualizando estadísticas de diagnósticos: {e}")
+        try:
+            SaludPlantasService.refrescar(db, [c[1] for c in claves])
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error actualizando salud de plantas: {e}")
+    finally:
+        db.close()
+
+
 def _cargar_plantas(db: Session, diagnostico: Diagnostico) -> List[PlantaSimpleResponse]:
     plantas = db.query(Planta).join(
         diagnostico_planta,
@@ -87,8 +155,9 @@ def generar_plantas_aleatorias(
     if not lote:
         raise HTTPException(404, "Lote no encontrado")
 
-    total_plantas_lote = db.query(Planta).filter(Planta.lote_id == data.lote_id).count()
-    productivas = db.query(Planta).filter(Planta.lote_id == data.lote_id, Planta.estado == "productivo").count()
+    resumen = indice_plantas.resumen_lote(db, data.lote_id)
+    total_plantas_lote = resumen["total"]
+    productivas = resumen["productivas"]
     advertencias = []
 
     # ── Lógica especial: Monitoreo de Arvenses ────────────────────────────────
@@ -121,12 +190,7 @@ def generar_plantas_aleatorias(
                 (1,      ppsr),
             ]
 
-        todas_productivas = db.query(Planta).filter(
-            Planta.lote_id == data.lote_id,
-            Planta.estado == "productivo"
-        ).all()
-
-        if not todas_productivas:
+        if not productivas:
             return GenerarPlantasResponse(
                 plantas=[],
                 total_plantas_lote=total_plantas_lote,
@@ -135,21 +199,11 @@ def generar_plantas_aleatorias(
                 advertencias=["No hay plantas productivas en este lote."]
             )
 
-        seleccionadas: list = []
-        ids_usados: set = set()
-        for (obj_surco, obj_numero) in objetivos:
-            mejor = None
-            mejor_dist = float('inf')
-            for p in todas_productivas:
-                if p.id in ids_usados:
-                    continue
-                dist = ((p.surco - obj_surco) ** 2 + (p.numero - obj_numero) ** 2) ** 0.5
-                if dist < mejor_dist:
-                    mejor_dist = dist
-                    mejor = p
-            if mejor:
-                seleccionadas.append(mejor)
-                ids_usados.add(mejor.id)
+        # Índice surco × número del lote: solo se cargan las plantas elegidas
+        indice = indice_plantas.obtener(db, lote, resumen["firma"])
+        ids_seleccionados = seleccionar_mas_cercanas(indice, objetivos)
+        por_id = {p.id: p for p in db.query(Planta).filter(Planta.id.in_(ids_seleccionados)).all()}
+        seleccionadas = [por_id[i] for i in ids_seleccionados if i in por_id]
 
         if len(seleccionadas) < 5:
             advertencias.append(f"Solo se encontraron {len(seleccionadas)} plantas para el patrón en {patron}.")
@@ -163,7 +217,7 @@ def generar_plantas_aleatorias(
             plantas=[PlantaGenerada(id=p.id, codigo=p.codigo, surco=p.surco, numero=p.numero, lote_id=p.lote_id) for p in seleccionadas],
             total_plantas_lote=total_plantas_lote,
             productivas=productivas,
-            elegibles=len(todas_productivas),
+            elegibles=productivas,
             advertencias=advertencias
         )
 
@@ -177,22 +231,10 @@ def generar_plantas_aleatorias(
     advertencias.append(f"Generando {cantidad_real} plantas ({porcentaje}% de {productivas} plantas productivas)")
 
     hace_un_mes = datetime.utcnow() - timedelta(days=30)
-
-    subquery = db.query(diagnostico_planta.c.planta_id).join(
-        Diagnostico, Diagnostico.id == diagnostico_planta.c.diagnostico_id
-    ).filter(
-        Diagnostico.tipo_diagnostico == data.tipo_diagnostico,
-        Diagnostico.fecha_creacion >= hace_un_mes
-    ).subquery()
-
-    query = db.query(Planta).filter(
-        Planta.lote_id == data.lote_id,
-        Planta.estado == "productivo",
-        ~Planta.id.in_(subquery)
-    )
-
-    elegibles = query.count()
-    plantas_elegibles = query.order_by(func.random()).limit(cantidad_real).all()
+    muestreo = MuestreoPlantas(db, data.lote_id, data.tipo_diagnostico, hace_un_mes)
+    elegibles, plantas_elegibles = muestreo.muestrear(cantidad_real, data.modo_muestreo)
+    if data.modo_muestreo == "estratificado":
+        advertencias.append("Muestreo estratificado por surco (proporcional a las plantas elegibles de cada surco).")
 
     if elegibles == 0 and productivas > 0:
         advertencias.append("Todas las plantas productivas ya han sido evaluadas con este diagnóstico en el último mes.")
@@ -221,6 +263,9 @@ def listar_diagnosticos(
     usuario_id: Optional[int] = None,
     tipo_diagnostico: Optional[str] = None,
     estado_revision: Optional[str] = None,
+    paginacion: pag.ModoPaginacion = "offset",
+    cursor: Optional[str] = None,
+    conteo: Optional[pag.ModoConteo] = None,
     db: Session = Depends(get_db),
     user: Usuario = Depends(require_any_role(["admin", "docente", "asesor", "estudiante"]))
 ):
@@ -242,8 +287,15 @@ def listar_diagnosticos(
     if estado_revision:
         query = query.filter(Diagnostico.estado_revision == estado_revision)
 
-    total = query.count()
-    items = query.order_by(Diagnostico.fecha_creacion.desc()).offset(skip).limit(limit).all()
+    usar_cursor, conteo = pag.resolver_modos(paginacion, cursor, conteo)
+    total = pag.contar(db, query, conteo)
+    siguiente_cursor = None
+    if usar_cursor:
+        items, siguiente_cursor = pag.paginar_por_cursor(
+            query, Diagnostico.fecha_creacion, Diagnostico.id, cursor, limit
+        )
+    else:
+        items = query.order_by(Diagnostico.fecha_creacion.desc()).offset(skip).limit(limit).all()
 
     # Convertir a diccionarios para la respuesta, incluyendo plantas
     response_items = []
@@ -275,7 +327,8 @@ def listar_diagnosticos(
     return DiagnosticoListResponse(
         items=response_items,
         total=total,
-        paginas=(total + limit - 1) // limit
+        paginas=pag.paginas(total, limit),
+        siguiente_cursor=siguiente_cursor
     )
 
 
@@ -322,12 +375,6 @@ async def crear_diagnostico(
     except json.JSONDecodeError:
         raise HTTPException(400, "El campo 'formulario' debe ser un JSON válido")
 
-    # Procesar archivos y añadir al formulario
-    fotos_por_prefix = procesar_archivos_r2(form_data)
-    if fotos_por_prefix:
-        formulario["fotos_subidas"] = fotos_por_prefix
-        logger.info(f"Archivos subidos: {list(fotos_por_prefix.keys())}")
-
     # Verificar permisos de usuario
     if user.rol.nombre == "estudiante" and usuario_id != user.id:
         raise HTTPException(403, "Solo puede crear diagnósticos para su propio usuario")
@@ -362,7 +409,6 @@ async def crear_diagnostico(
                 "Alguna planta no existe, no pertenece al lote, no está productiva o ya fue evaluada con este diagnóstico en el último mes"
             )
 
-    # Crear el diagnóstico
     data = DiagnosticoCreate(
         programa_id=programa_id,
         tipo_monitoreo_id=tipo_monitoreo_id,
@@ -372,7 +418,21 @@ async def crear_diagnostico(
         condiciones_dia=condiciones_dia,
         formulario=formulario
     )
-    obj = crud.create_diagnostico(db, data)
+
+    # Procesar archivos y añadir al formulario (ya validado todo lo anterior,
+    # para no subir fotos de una solicitud que se va a rechazar)
+    fotos_por_prefix = await procesar_archivos_r2(form_data)
+    if fotos_por_prefix:
+        data.formulario["fotos_subidas"] = fotos_por_prefix
+        logger.info(f"Archivos subidos: {list(fotos_por_prefix.keys())}")
+
+    # Crear el diagnóstico
+    try:
+        obj = crud.create_diagnostico(db, data)
+    except Exception:
+        db.rollback()
+        await _descartar_archivos_r2(fotos_por_prefix)
+        raise
 
     # Asignar estado inicial
     obj.estado_revision = "pendiente_revision"
@@ -394,6 +454,8 @@ async def crear_diagnostico(
         except (ValueError, TypeError):
             pass
 
+    await run_in_threadpool(_refrescar_derivados, [_claves_derivadas(obj)])
+
     # Construir la respuesta
     _enriquecer(obj)
     plantas_resp = _cargar_plantas(db, obj)
@@ -496,17 +558,6 @@ async def actualizar_diagnostico(
         except json.JSONDecodeError:
             raise HTTPException(400, "plantas_ids debe ser un JSON válido")
 
-    # Procesar nuevos archivos
-    fotos_por_prefix = procesar_archivos_r2(form_data)
-    if fotos_por_prefix:
-        formulario_actual = update_data.get("formulario", obj.formulario or {})
-        existing = formulario_actual.get("fotos_subidas", {})
-        for prefix, urls in fotos_por_prefix.items():
-            existing.setdefault(prefix, []).extend(urls)
-        formulario_actual["fotos_subidas"] = existing
-        update_data["formulario"] = formulario_actual
-        logger.info(f"Nuevos archivos añadidos en actualización: {list(fotos_por_prefix.keys())}")
-
     # Validar plantas si se enviaron
     plantas = []
     if plantas_ids:
@@ -532,10 +583,29 @@ async def actualizar_diagnostico(
                 "Alguna planta no existe, no pertenece al lote, no está productiva o ya fue evaluada con este diagnóstico en el último mes"
             )
 
+    # Procesar nuevos archivos (después de validar)
+    if update_data:
+        DiagnosticoUpdate(**update_data)
+    fotos_por_prefix = await procesar_archivos_r2(form_data)
+    if fotos_por_prefix:
+        formulario_actual = update_data.get("formulario", obj.formulario or {})
+        existing = formulario_actual.get("fotos_subidas", {})
+        for prefix, urls in fotos_por_prefix.items():
+            existing.setdefault(prefix, []).extend(urls)
+        formulario_actual["fotos_subidas"] = existing
+        update_data["formulario"] = formulario_actual
+        logger.info(f"Nuevos archivos añadidos en actualización: {list(fotos_por_prefix.keys())}")
+
     # Actualizar el objeto ORM
     if update_data:
-        data_update = DiagnosticoUpdate(**update_data)
-        obj = crud.update_diagnostico(db, obj, data_update)
+        claves_anteriores = _claves_derivadas(obj)
+        try:
+            data_update = DiagnosticoUpdate(**update_data)
+            obj = crud.update_diagnostico(db, obj, data_update)
+        except Exception:
+            db.rollback()
+            await _descartar_archivos_r2(fotos_por_prefix)
+            raise
 
         # Si se enviaron plantas, actualizar la relación (solo en ORM)
         if plantas_ids is not None:
@@ -543,6 +613,8 @@ async def actualizar_diagnostico(
             db.commit()
             db.refresh(obj)
 
+        await run_in_threadpool(_refrescar_derivados, [claves_anteriores, _claves_derivadas(obj)])
+
     # Respuesta final
     _enriquecer(obj)
     plantas_resp = _cargar_plantas(db, obj)
@@ -568,6 +640,48 @@ async def actualizar_diagnostico(
     }
 
 
+@router.post("/{id}/fotos")
+def confirmar_fotos_diagnostico(
+    id: int,
+    datos: ConfirmarFotosRequest,
+    db: Session = Depends(get_db),
+    user: Usuario = Depends(get_current_user)
+):
+    """
+    Asocia al diagnóstico fotos subidas directo a R2 (ver /files/firmar-subidas):
+    verifica que cada objeto exista y lo agrega a formulario["fotos_subidas"]
+    bajo su prefix. Reenviar los mismos tokens no duplica fotos.
+    """
+    obj = get_or_404(db, Diagnostico, id)
+    rol = user.rol.nombre
+    if rol == "estudiante" and obj.usuario_id != user.id:
+        raise HTTPException(403, "No tiene permisos para editar este diagnóstico")
+    if rol in ("estudiante", "docente") and obj.estado_revision == "revisado":
+        raise HTTPException(403, "No se puede editar un diagnóstico que ya ha sido revisado")
+
+    subidas = SubidasDirectasService.verificar(datos.tokens, user.id)
+
+    # Releer con bloqueo: dos confirmaciones simultáneas no se pisan el formulario
+    db.refresh(obj, with_for_update=True)
+    formulario = dict(obj.formulario or {})
+    fotos = {prefix: list(lista) for prefix, lista in (formulario.get("fotos_subidas") or {}).items()}
+    existentes = set(_urls_fotos(fotos))
+    agregadas = 0
+    for subida in subidas:
+        if subida.url in existentes:
+            continue
+        # Sin miniatura: los bytes no pasan por la API (el cliente usa la foto)
+        fotos.setdefault(subida.prefix, []).append({"url": subida.url, "miniatura": None})
+        existentes.add(subida.url)
+        agregadas += 1
+    if agregadas:
+        formulario["fotos_subidas"] = fotos
+        obj.formulario = formulario
+        db.commit()
+
+    return {"id": obj.id, "agregadas": agregadas, "fotos_subidas": fotos}
+
+
 @router.delete("/{id}", status_code=200)
 def eliminar_diagnostico(
     id: int,
@@ -584,138 +698,54 @@ def eliminar_diagnostico(
         raise HTTPException(400, "No se puede eliminar un diagnóstico con recomendaciones asociadas")
 
     if obj.formulario and "fotos_subidas" in obj.formulario:
-        for urls in obj.formulario["fotos_subidas"].values():
-            for url in urls:
-                delete_file_from_r2(url)
+        for url in _urls_fotos(obj.formulario["fotos_subidas"]):
+            delete_file_from_r2(url)
         logger.info(f"Archivos eliminados de R2 para diagnóstico {id}")
 
+    claves = _claves_derivadas(obj)
     crud.delete_diagnostico(db, obj)
+    _refrescar_derivados([claves])
     return {"message": "Diagnóstico eliminado correctamente"}
 
 
 @router.get("/mapa/{lote_id}")
 def obtener_datos_mapa(
     lote_id: int,
+    fecha_inicio: Optional[date] = None,
+    fecha_fin: Optional[date] = None,
+    compacto: bool = False,
     db: Session = Depends(get_db),
     user: Usuario = Depends(require_any_role(["admin", "docente", "asesor", "estudiante", "trabajador", "talento_humano"]))
 ):
-    """Retorna datos de diagnósticos agregados por planta para colorear el mapa del lote."""
-    diagnosticos = db.query(Diagnostico).filter(Diagnostico.lote_id == lote_id).all()
-
-    plant_data: Dict[int, Dict[str, Any]] = {}
-
-    for diag in diagnosticos:
-        formulario = diag.formulario or {}
-
-        # Extraer presión de plagas desde formulario JSON
-        presion = "ninguna"
-        try:
-            articulos = formulario.get("artropodos", {})
-            if isinstance(articulos, dict):
-                total_plagas = sum(
-                    int(v) for v in articulos.values() if str(v).isdigit()
-                )
-                if total_plagas >= 10:
-                    presion = "alta"
-                elif total_plagas >= 5:
-                    presion = "media"
-                elif total_plagas >= 1:
-                    presion = "baja"
-        except Exception:
-            pass
-
-        # Extraer enfermedades
-        tiene_enfermedades = False
-        try:
-            enf = formulario.get("enfermedades", {})
-            if isinstance(enf, dict):
-                tiene_enfermedades = any(
-                    str(v).lower() not in ("0", "false", "no", "", "ninguna")
-                    for v in enf.values()
-                )
-            elif isinstance(enf, list):
-                tiene_enfermedades = len(enf) > 0
-        except Exception:
-            pass
-
-        # Obtener plantas asociadas via pivot
-        try:
-            rows = db.execute(
-                diagnostico_planta.select().where(diagnostico_planta.c.diagnostico_id == diag.id)
-            ).fetchall()
-            plant_ids = [r[1] for r in rows]
-        except Exception:
-            plant_ids = []
-
-        for pid in plant_ids:
-            if pid not in plant_data:
-                plant_data[pid] = {
-                    "planta_id": pid,
-                    "diagnosticos_count": 0,
-                    "ultima_fecha": None,
-                    "presion_plagas": "ninguna",
-                    "tiene_enfermedades": False,
-                }
-            d = plant_data[pid]
-            d["diagnosticos_count"] += 1
-            fecha_str = diag.fecha_creacion.isoformat() if diag.fecha_creacion else None
-            if not d["ultima_fecha"] or (fecha_str and fecha_str > d["ultima_fecha"]):
-                d["ultima_fecha"] = fecha_str
-            prioridad = {"alta": 3, "media": 2, "baja": 1, "ninguna": 0}
-            if prioridad.get(presion, 0) > prioridad.get(d["presion_plagas"], 0):
-                d["presion_plagas"] = presion
-            if tiene_enfermedades:
-                d["tiene_enfermedades"] = True
-
-    return {"lote_id": lote_id, "plants": list(plant_data.values())}
-
-
-def _extraer_valores_campo(formulario: dict, nombre_campo: str) -> list:
     """
-    Extrae todos los valores de un campo desde el formulario de un diagnóstico.
-
-    Soporta dos estructuras:
-      1. Plana: formulario = {"campo": valor, ...}
-      2. Anidada: formulario = {"formularios_por_planta": {"1807": {"campo74": valor, ...}}}
-
-    Los nombres de clave en la estructura anidada pueden tener sufijos numéricos
-    concatenados directamente al nombre_campo (ej. "cuadrante74", "nmero_total...79").
-    Los valores pueden ser escalares o listas; las listas se aplanan.
+    Retorna datos de diagnósticos agregados por planta para colorear el mapa del lote.
+    Con `compacto=true` devuelve arreglos paralelos por columna (para lotes grandes).
     """
-    import re
-    valores: list = []
-
-    # ── Estructura anidada (formularios_por_planta) ──────────────────────────
-    if "formularios_por_planta" in formulario:
-        # Patrón: nombre_campo exacto O nombre_campo + dígitos opcionales al final
-        pattern = re.compile(r'^' + re.escape(nombre_campo) + r'\d*$')
-        for planta_data in formulario["formularios_por_planta"].values():
-            if not isinstance(planta_data, dict):
-                continue
-            for key, val in planta_data.items():
-                if not pattern.match(key):
-                    continue
-                if val is None or val == "":
-                    continue
-                if isinstance(val, list):
-                    for item in val:
-                        if item is not None and item != "":
-                            valores.append(item)
-                else:
-                    valores.append(val)
-        return valores
-
-    # ── Estructura plana ─────────────────────────────────────────────────────
-    val = formulario.get(nombre_campo)
-    if val is None or val == "":
-        return valores
-    if isinstance(val, list):
-        for item in val:
-            if item is not None and item != "":
-                valores.append(item)
-    else:
-        valores.append(val)
-    return valores
+    filas = SaludPlantasService.resumen_lote(db, lote_id, fecha_inicio, fecha_fin)
+
+    if compacto:
+        return {
+            "lote_id": lote_id,
+            "niveles_presion": list(NIVELES_PRESION),
+            "planta_id": [f.planta_id for f in filas],
+            "surco": [f.surco for f in filas],
+            "numero": [f.numero for f in filas],
+            "diagnosticos_count": [int(f.diagnosticos_count) for f in filas],
+            "ultima_fecha": [f.ultima_fecha.isoformat() if f.ultima_fecha else None for f in filas],
+            "presion_plagas": [int(f.presion_max) for f in filas],
+            "tiene_enfermedades": [int(f.tiene_enfermedades) for f in filas],
+        }
+
+    return {"lote_id": lote_id, "plants": [
+        {
+            "planta_id": f.planta_id,
+            "diagnosticos_count": int(f.diagnosticos_count),
+            "ultima_fecha": f.ultima_fecha.isoformat() if f.ultima_fecha else None,
+            "presion_plagas": NIVELES_PRESION[int(f.presion_max)],
+            "tiene_enfermedades": bool(f.tiene_enfermedades),
+        }
+        for f in filas
+    ]}
 
 
 def _apply_diag_scope(query, user: Usuario, programa_id: Optional[int],
@@ -840,72 +870,22 @@ def estadisticas_items_subtipo(
     diag_query = db.query(Diagnostico).filter(Diagnostico.diagnostico_tipo_id == subtipo_id)
     diag_query = _apply_diag_scope_full(diag_query, user, programa_id, fecha_inicio, fecha_fin)
 
-    diagnosticos_list = diag_query.all()
-    total = len(diagnosticos_list)
-
-    campos_stats = []
-    for campo in sorted(tipo.campos, key=lambda c: c.orden):
-        nombre = campo.nombre_campo
-        etiqueta = campo.etiqueta
-        tipo_dato = campo.tipo_dato
-        opciones = campo.opciones
-
-        valores = []
-        for diag in diagnosticos_list:
-            formulario = diag.formulario or {}
-            valores.extend(_extraer_valores_campo(formulario, nombre))
-
-        stat: Dict[str, Any] = {
-            "nombre_campo": nombre,
-            "etiqueta": etiqueta,
-            "tipo_dato": tipo_dato,
-            "opciones": opciones,
-            "total_respuestas": len(valores),
-        }
-
-        if tipo_dato in ("select", "radio"):
-            distribucion: Dict[str, int] = {}
-            if opciones and isinstance(opciones, list):
-                for op in opciones:
-                    distribucion[str(op)] = 0
-            for v in valores:
-                key = str(v)
-                distribucion[key] = distribucion.get(key, 0) + 1
-            stat["distribucion"] = distribucion
-
-        elif tipo_dato in ("checkbox",):
-            distribucion = {}
-            for v in valores:
-                if isinstance(v, list):
-                    for item in v:
-                        k = str(item)
-                        distribucion[k] = distribucion.get(k, 0) + 1
-                else:
-                    k = str(v)
-                    distribucion[k] = distribucion.get(k, 0) + 1
-            stat["distribucion"] = distribucion
-
-        elif tipo_dato in ("number", "integer", "float"):
-            nums = []
-            for v in valores:
-                try:
-                    nums.append(float(v))
-                except (ValueError, TypeError):
-                    pass
-            if nums:
-                stat["promedio"] = round(sum(nums) / len(nums), 2)
-                stat["minimo"] = min(nums)
-                stat["maximo"] = max(nums)
-            else:
-                stat["promedio"] = None
-                stat["minimo"] = None
-                stat["maximo"] = None
-
-        elif tipo_dato == "boolean":
-            true_count = sum(1 for v in valores if v is True or str(v).lower() in ("true", "1", "si", "sí"))
-            stat["distribucion"] = {"Sí": true_count, "No": len(valores) - true_count}
-
-        campos_stats.append(stat)
+    rol = user.rol.nombre
+    if rol == "estudiante":
+        # Los buckets no se guardan por usuario: el estudiante se calcula en vivo
+        diagnosticos_list = diag_query.all()
+        total = len(diagnosticos_list)
+        campos_stats = EstadisticasDiagnosticoService.calcular_en_vivo(tipo.campos, diagnosticos_list)
+    else:
+        if rol == "docente":
+            prog_ids = [p.id for p in user.programas]
+            programa_ids = [programa_id] if programa_id in prog_ids else ([] if programa_id else prog_ids)
+        else:
+            programa_ids = [programa_id] if programa_id else None
+        total = diag_query.count()
+        campos_stats = EstadisticasDiagnosticoService.estadisticas_campos(
+            db, tipo, programa_ids, fecha_inicio, fecha_fin
+        )
 
     return {
         "subtipo_id": subtipo_id,
@@ -926,35 +906,53 @@ def obtener_estadisticas(
     db: Session = Depends(get_db),
     user: Usuario = Depends(require_any_role(["admin", "docente", "asesor", "estudiante"]))
 ):
-    query = db.query(Diagnostico)
-    query = _apply_diag_scope_full(query, user, programa_id, fecha_inicio, fecha_fin)
-
-    total = query.count()
-
-    # Group by tipo_diagnostico
-    por_tipo: Dict[str, int] = {}
-    for row in db.query(Diagnostico.tipo_diagnostico).distinct():
-        t = row[0]
-        if t:
-            por_tipo[t] = query.filter(Diagnostico.tipo_diagnostico == t).count()
-
-    # Group by tipo_monitoreo
-    por_monitoreo: Dict[str, int] = {}
-    for d in query.all():
-        nombre_mon = d.tipo_monitoreo.nombre if d.tipo_monitoreo else f"monitoreo_{d.tipo_monitoreo_id}"
-        por_monitoreo[nombre_mon] = por_monitoreo.get(nombre_mon, 0) + 1
-
-    # Group by lote
-    por_lote: Dict[str, int] = {}
-    for d in query.all():
-        nombre_lote = d.lote.nombre if d.lote else f"lote_{d.lote_id}"
-        por_lote[nombre_lote] = por_lote.get(nombre_lote, 0) + 1
-
-    # Group by programa
-    por_programa: Dict[str, int] = {}
-    for d in query.all():
-        nombre_prog = d.programa.nombre if d.programa else f"programa_{d.programa_id}"
-        por_programa[nombre_prog] = por_programa.get(nombre_prog, 0) + 1
+    from sqlalchemy import select, literal, cast, union_all, Integer
+
+    # Diagnósticos dentro del alcance, solo con las columnas de agrupación
+    query = db.query(
+        Diagnostico.tipo_diagnostico,
+        Diagnostico.tipo_monitoreo_id,
+        Diagnostico.lote_id,
+        Diagnostico.programa_id,
+    )
+    d = _apply_diag_scope_full(query, user, programa_id, fecha_inicio, fecha_fin).subquery()
+
+    # Las cuatro agrupaciones en una sola consulta (UNION ALL de GROUP BY)
+    conteos = union_all(
+        select(
+            literal("tipo").label("dimension"), cast(None, Integer).label("clave_id"),
+            d.c.tipo_diagnostico.label("nombre"), func.count().label("total"),
+        ).group_by(d.c.tipo_diagnostico),
+        select(
+            literal("monitoreo"), d.c.tipo_monitoreo_id, Monitoreo.nombre, func.count(),
+        ).select_from(d).outerjoin(Monitoreo, Monitoreo.id == d.c.tipo_monitoreo_id)
+        .group_by(d.c.tipo_monitoreo_id, Monitoreo.nombre),
+        select(
+            literal("lote"), d.c.lote_id, Lote.nombre, func.count(),
+        ).select_from(d).outerjoin(Lote, Lote.id == d.c.lote_id)
+        .group_by(d.c.lote_id, Lote.nombre),
+        select(
+            literal("programa"), d.c.programa_id, Programa.nombre, func.count(),
+        ).select_from(d).outerjoin(Programa, Programa.id == d.c.programa_id)
+        .group_by(d.c.programa_id, Programa.nombre),
+    )
+
+    grupos: Dict[str, Dict[str, int]] = {"tipo": {}, "monitoreo": {}, "lote": {}, "programa": {}}
+    for dimension, clave_id, nombre, cantidad in db.execute(conteos):
+        if dimension == "tipo":
+            if not nombre:
+                continue
+            clave = nombre
+        else:
+            clave = nombre or f"{dimension}_{clave_id}"
+        grupos[dimension][clave] = grupos[dimension].get(clave, 0) + cantidad
+
+    # Cada diagnóstico pertenece a exactamente un programa
+    total = sum(grupos["programa"].values())
+    por_tipo = grupos["tipo"]
+    por_monitoreo = grupos["monitoreo"]
+    por_lote = grupos["lote"]
+    por_programa = grupos["programa"]
 
     return EstadisticasDiagnosticosResponse(
         total=total,
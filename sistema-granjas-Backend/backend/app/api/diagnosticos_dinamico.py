@@ -13,6 +13,7 @@ from app.schemas.diagnostico_dinamico_schema import (
     CampoLaborCreate, CampoLaborUpdate, CampoLaborResponse,
 )
 from app.db.models import Programa, Monitoreo
+from app.services.estadisticas_service import EstadisticasDiagnosticoService
 
 router = APIRouter(prefix="/diagnosticos-dinamico", tags=["Diagnósticos Dinámico"])
 role_admin = Depends(require_any_role(["admin", "docente", "asesor", "jefe_talento_humano"]))
@@ -90,7 +91,9 @@ def crear_campo(data: DiagnosticoCampoCreate, db: Session = Depends(get_db), _=r
     tipo = crud.get_tipo(db, data.tipo_id)
     if not tipo:
         raise HTTPException(404, "Tipo no encontrado")
-    return crud.create_campo(db, data)
+    campo = crud.create_campo(db, data)
+    EstadisticasDiagnosticoService.invalidar_subtipo(db, data.tipo_id)
+    return campo
 
 
 @router.put("/campos/{campo_id}", response_model=DiagnosticoCampoResponse)
@@ -98,7 +101,9 @@ def actualizar_campo(campo_id: int, data: DiagnosticoCampoUpdate, db: Session =
     campo = crud.get_campo(db, campo_id)
     if not campo:
         raise HTTPException(404, "Campo no encontrado")
-    return crud.update_campo(db, campo, data)
+    campo = crud.update_campo(db, campo, data)
+    EstadisticasDiagnosticoService.invalidar_subtipo(db, campo.tipo_id)
+    return campo
 
 
 @router.delete("/campos/{campo_id}")
@@ -106,7 +111,9 @@ def eliminar_campo(campo_id: int, db: Session = Depends(get_db), _=role_admin):
     campo = crud.get_campo(db, campo_id)
     if not campo:
         raise HTTPException(404, "Campo no encontrado")
+    tipo_id = campo.tipo_id
     crud.delete_campo(db, campo)
+    EstadisticasDiagnosticoService.invalidar_subtipo(db, tipo_id)
     return {"message": "Campo eliminado"}
 
 
@@ -2,8 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.core.dependencies import get_current_user
+from app.db.models import Evidencia
 from app.schemas.evidencia_schema import EvidenciaCreate, EvidenciaResponse, EvidenciaListResponse
-from app.CRUD.evidencias import crear_evidencia_crud, listar_evidencias_entidad_crud, eliminar_evidencia_crud
+from app.schemas.subida_schema import ConfirmarEvidenciaRequest
+from app.CRUD.evidencias import (
+    crear_evidencia_crud, listar_evidencias_entidad_crud, eliminar_evidencia_crud, _cargar_relaciones_evidencia
+)
+from app.services.subidas_directas_service import SubidasDirectasService
 
 router = APIRouter(prefix="/evidencias", tags=["Evidencias"])
 
@@ -16,6 +21,28 @@ def crear_evidencia(
     """Crear una nueva evidencia para cualquier entidad"""
     return crear_evidencia_crud(db, data, usuario)
 
+@router.post("/confirmar-subida", response_model=EvidenciaResponse)
+def confirmar_subida_evidencia(
+    data: ConfirmarEvidenciaRequest,
+    db: Session = Depends(get_db),
+    usuario = Depends(get_current_user)
+):
+    """Crear la evidencia de un archivo subido directo a R2 (ver /files/firmar-subidas)"""
+    subida = SubidasDirectasService.verificar([data.token], usuario.id)[0]
+    # Reintento de una confirmación que ya se guardó: misma evidencia
+    existente = db.query(Evidencia).filter(Evidencia.url_archivo == subida.url).first()
+    if existente:
+        _cargar_relaciones_evidencia(db, existente)
+        return existente
+    return crear_evidencia_crud(db, EvidenciaCreate(
+        tipo=data.tipo,
+        descripcion=data.descripcion,
+        url_archivo=subida.url,
+        tipo_entidad=data.tipo_entidad,
+        entidad_id=data.entidad_id,
+        usuario_id=usuario.id,
+    ), usuario)
+
 @router.get("/{tipo_entidad}/{entidad_id}", response_model=EvidenciaListResponse)
 def listar_evidencias_entidad(
     tipo_entidad: str,  # labor, diagnostico, recomendacion
@@ -1,41 +1,175 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+import os
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi.responses import FileResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
 from app.db.database import get_db
 from app.core.dependencies import get_current_user, require_any_role
 from app.export import ExportService
+from app.export.exportJobs import export_jobs
+from app.schemas.export_schema import FiltrosExportacion
 
 router = APIRouter(prefix="/export", tags=["Exportación"])
 
+
+def get_filtros_exportacion(
+    lote_id: int = Query(None),
+    granja_id: int = Query(None),
+    programa_id: int = Query(None),
+    estado: str = Query(None),
+    tipo: str = Query(None),
+    rol: str = Query(None),
+    activo: bool = Query(None),
+    fecha_desde: date = Query(None),
+    fecha_hasta: date = Query(None),
+) -> FiltrosExportacion:
+    """Filtros comunes a todas las exportaciones (se aplican en SQL)"""
+    try:
+        return FiltrosExportacion(
+            lote_id=lote_id,
+            granja_id=granja_id,
+            programa_id=programa_id,
+            estado=estado or None,
+            tipo=tipo or None,
+            rol=rol or None,
+            activo=activo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors()[0]["msg"])
+
+# Roles con acceso a cada tipo de exportación (admin siempre tiene acceso)
+ROLES_POR_TIPO = {
+    "backup": ["admin", "docente"],
+    "granjas": ["admin", "docente", "asesor"],
+    "lotes": ["admin", "docente", "asesor", "estudiante"],
+    "diagnosticos": ["admin", "docente", "asesor", "estudiante"],
+    "recomendaciones": ["admin", "docente", "asesor", "estudiante"],
+    "labores": ["admin", "docente", "asesor"],
+    "inventario": ["admin", "docente", "asesor"],
+    "usuarios": ["admin"],
+    "programas": ["admin", "docente"],
+    "cultivos": ["admin", "docente", "asesor"],
+    "plantas": ["admin", "docente", "asesor"],
+    "movimientos": ["admin", "docente"],
+    "resumen": ["admin", "docente"],
+}
+
+def verificar_rol_tipo(usuario, tipo: str):
+    """Mismas reglas de rol que la ruta /excel de cada tipo"""
+    if tipo not in ROLES_POR_TIPO:
+        raise HTTPException(status_code=400, detail=f"Tipo de exportación no soportado: {tipo}")
+
+    rol = usuario.rol.nombre
+    if rol != "admin" and rol not in ROLES_POR_TIPO[tipo]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Se requiere uno de los siguientes roles: {', '.join(ROLES_POR_TIPO[tipo])}"
+        )
+
+# ========================== TRABAJOS EN SEGUNDO PLANO ==========================
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def crear_trabajo_exportacion(
+    tipo_export: str = Query("backup"),
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
+    usuario = Depends(get_current_user)
+):
+    """
+    Encola una exportación; el archivo se genera fuera del event loop.
+    `tipo_export` es el tipo de exportación: `tipo` queda para el filtro.
+    """
+    verificar_rol_tipo(usuario, tipo_export)
+    return export_jobs.crear(usuario, tipo_export, filtros).to_dict()
+
+@router.get("/jobs/{job_id}")
+async def estado_trabajo_exportacion(
+    job_id: str,
+    usuario = Depends(get_current_user)
+):
+    job = export_jobs.obtener(job_id, usuario)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo de exportación no encontrado o expirado")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/download")
+async def descargar_trabajo_exportacion(
+    job_id: str,
+    usuario = Depends(get_current_user)
+):
+    job = export_jobs.obtener(job_id, usuario)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo de exportación no encontrado o expirado")
+    if job.estado != "completado":
+        raise HTTPException(status_code=409, detail=f"El trabajo está en estado '{job.estado}'")
+    if not job.archivo or not os.path.exists(job.archivo):
+        raise HTTPException(status_code=404, detail="El archivo de la exportación ya no está disponible")
+
+    return FileResponse(
+        job.archivo,
+        media_type=job.media_type,
+        filename=job.filename
+    )
+
 # ========================== BACKUP COMPLETO ==========================
 @router.get("/backup/excel")
-async def export_backup_excel(
+def export_backup_excel(
+    streaming: bool = Query(False),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente"]))
 ):
     try:
-        return ExportService(db, usuario).export_todo_excel()
+        return ExportService(db, usuario).export_todo_excel(streaming=streaming)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ========================== EXPORTACIÓN INCREMENTAL ==========================
+@router.get("/delta")
+def export_delta(
+    since: datetime = Query(None),
+    formato: str = Query("csv"),
+    entidad: str = Query(None),
+    db: Session = Depends(get_db),
+    usuario = Depends(get_current_user),
+    _ = Depends(require_any_role(["admin", "docente"]))
+):
+    """
+    Filas creadas o modificadas después de `since`. El header
+    X-Export-Watermark trae el valor a usar como `since` en la siguiente
+    ejecución (sin `since` se exporta todo hasta ahora). Se incluyen también
+    las filas de un margen anterior a `since` (EXPORT_DELTA_SOLAPE_MINUTOS):
+    al anexar, quedarse con la última versión de cada `id`.
+    """
+    try:
+        return ExportService(db, usuario).export_delta(since=since, formato=formato, entidad=entidad)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError:
+        raise HTTPException(status_code=501, detail="La exportación Parquet requiere pyarrow instalado")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== GRANJAS ==========================
 @router.get("/granjas/excel")
-async def export_granjas(
+def export_granjas(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente", "asesor"]))
 ):
     try:
-        return ExportService(db, usuario).export_granjas_excel()
+        return ExportService(db, usuario).export_granjas_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== LOTES ==========================
 @router.get("/lotes/excel")
-async def export_lotes(
+def export_lotes(
     detallado: bool = Query(False),
-    lote_id: int = Query(None),
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente", "asesor", "estudiante"]))
@@ -43,143 +177,131 @@ async def export_lotes(
     try:
         return ExportService(db, usuario).export_lotes_excel(
             detallado=detallado,
-            lote_id=lote_id
+            filtros=filtros
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== DIAGNÓSTICOS ==========================
 @router.get("/diagnosticos/excel")
-async def export_diagnosticos(
+def export_diagnosticos(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente", "asesor", "estudiante"]))
 ):
     try:
-        return ExportService(db, usuario).export_diagnosticos_excel()
+        return ExportService(db, usuario).export_diagnosticos_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== RECOMENDACIONES ==========================
 @router.get("/recomendaciones/excel")
-async def export_recomendaciones(
-    estado: str = Query(None),
-    tipo: str = Query(None),
+def export_recomendaciones(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente", "asesor", "estudiante"]))
 ):
     try:
-        filtros = {}
-        if estado:
-            filtros["estado"] = estado
-        if tipo:
-            filtros["tipo"] = tipo
-
-        return ExportService(db, usuario).export_recomendaciones_excel(**filtros)
+        return ExportService(db, usuario).export_recomendaciones_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== LABORES ==========================
 @router.get("/labores/excel")
-async def export_labores(
-    estado: str = Query(None),
+def export_labores(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente", "asesor"]))
 ):
     try:
-        filtros = {}
-        if estado:
-            filtros["estado"] = estado
-
-        return ExportService(db, usuario).export_labores_excel(**filtros)
+        return ExportService(db, usuario).export_labores_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== INVENTARIO COMPLETO ==========================
 @router.get("/inventario/excel")
-async def export_inventario(
+def export_inventario(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente", "asesor"]))
 ):
     try:
-        return ExportService(db, usuario).export_inventario_excel()
+        return ExportService(db, usuario).export_inventario_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== USUARIOS ==========================
 @router.get("/usuarios/excel")
-async def export_usuarios(
-    rol: str = Query(None),
-    activo: bool = Query(None),
+def export_usuarios(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin"]))
 ):
     try:
-        filtros = {}
-        if rol:
-            filtros["rol"] = rol
-        if activo is not None:
-            filtros["activo"] = activo
-
-        return ExportService(db, usuario).export_usuarios_excel(**filtros)
+        return ExportService(db, usuario).export_usuarios_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== PROGRAMAS ==========================
 @router.get("/programas/excel")
-async def export_programas(
+def export_programas(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente"]))
 ):
     try:
-        return ExportService(db, usuario).export_programas_excel()
+        return ExportService(db, usuario).export_programas_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== CULTIVOS ==========================
 @router.get("/cultivos/excel")
-async def export_cultivos(
+def export_cultivos(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente", "asesor"]))
 ):
     try:
-        return ExportService(db, usuario).export_cultivos_excel()
+        return ExportService(db, usuario).export_cultivos_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== PLANTAS ==========================
 @router.get("/plantas/excel")
-async def export_plantas(
+def export_plantas(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente", "asesor"]))
 ):
     try:
-        return ExportService(db, usuario).export_plantas_excel()
+        return ExportService(db, usuario).export_plantas_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== MOVIMIENTOS ==========================
 @router.get("/movimientos/excel")
-async def export_movimientos(
+def export_movimientos(
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente"]))
 ):
     try:
-        return ExportService(db, usuario).export_movimientos_excel()
+        return ExportService(db, usuario).export_movimientos_excel(filtros)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========================== RESUMEN / ESTADÍSTICAS ==========================
 @router.get("/resumen/excel")
-async def export_resumen(
+def export_resumen(
     db: Session = Depends(get_db),
     usuario = Depends(get_current_user),
     _ = Depends(require_any_role(["admin", "docente"]))
@@ -188,3 +310,37 @@ async def export_resumen(
         return ExportService(db, usuario).export_resumen_excel()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# ========================== CSV / PARQUET ==========================
+# El tipo de exportación va en la ruta como {tipo_export}: `tipo` es el filtro
+# de get_filtros_exportacion y FastAPI no admite el mismo nombre en ambos
+@router.get("/{tipo_export}/csv")
+def export_csv(
+    tipo_export: str,
+    gzip: bool = Query(False),
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
+    db: Session = Depends(get_db),
+    usuario = Depends(get_current_user)
+):
+    """CSV de cualquier tipo (mismas columnas que /excel); .zip si tiene varias hojas"""
+    verificar_rol_tipo(usuario, tipo_export)
+    try:
+        return ExportService(db, usuario).export_csv(tipo_export, filtros, comprimir=gzip)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{tipo_export}/parquet")
+def export_parquet(
+    tipo_export: str,
+    filtros: FiltrosExportacion = Depends(get_filtros_exportacion),
+    db: Session = Depends(get_db),
+    usuario = Depends(get_current_user)
+):
+    """Parquet con columnas tipadas de cualquier tipo; .zip si tiene varias hojas"""
+    verificar_rol_tipo(usuario, tipo_export)
+    try:
+        return ExportService(db, usuario).export_parquet(tipo_export, filtros)
+    except ImportError:
+        raise HTTPException(status_code=501, detail="La exportación Parquet requiere pyarrow instalado")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
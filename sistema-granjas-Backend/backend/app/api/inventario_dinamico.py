@@ -9,7 +9,8 @@ from app.schemas.inventario_dinamico_schema import (
     ProgramaInventarioTipoCreate, ProgramaInventarioTipoUpdate, ProgramaInventarioTipoResponse,
     InventarioCampoCreate, InventarioCampoUpdate, InventarioCampoResponse,
     ItemInventarioProgramaCreate, ItemInventarioProgramaUpdate, ItemInventarioProgramaResponse,
-    TipoConCamposResponse, TipoConItemsResponse
+    TipoConCamposResponse, TipoConItemsResponse,
+    AjusteInventarioRequest, MovimientoInventarioResponse
 )
 from app.db.models import Programa
 
@@ -165,7 +166,7 @@ def crear_item(data: ItemInventarioProgramaCreate, db: Session = Depends(get_db)
         raise HTTPException(404, "Tipo no encontrado")
     _verificar_acceso_programa(usuario, tipo.programa_id)
     _validar_valores_segun_campos(db, data.tipo_id, data.valores)
-    return crud.create_item(db, data)
+    return crud.create_item(db, data, usuario.id)
 
 @router.put("/items/{item_id}", response_model=ItemInventarioProgramaResponse)
 def actualizar_item(item_id: int, data: ItemInventarioProgramaUpdate, db: Session = Depends(get_db), usuario=role_required):
@@ -177,7 +178,7 @@ def actualizar_item(item_id: int, data: ItemInventarioProgramaUpdate, db: Sessio
         _verificar_acceso_programa(usuario, tipo.programa_id)
     if data.valores is not None:
         _validar_valores_segun_campos(db, item.tipo_id, data.valores)
-    return crud.update_item(db, item, data)
+    return crud.update_item(db, item, data, usuario.id)
 
 @router.delete("/items/{item_id}")
 def eliminar_item(item_id: int, db: Session = Depends(get_db), usuario=role_required):
@@ -201,4 +202,32 @@ def obtener_item(item_id: int, db: Session = Depends(get_db), usuario=role_requi
     tipo = crud.get_tipo(db, item.tipo_id)
     if tipo:
         _verificar_acceso_programa(usuario, tipo.programa_id)
-    return item
\ No newline at end of file
+    return item
+
+
+# ---------- Movimientos (libro de inventario) ----------
+
+@router.post("/items/{item_id}/ajustes", response_model=MovimientoInventarioResponse, status_code=201)
+def ajustar_item(item_id: int, data: AjusteInventarioRequest, db: Session = Depends(get_db), usuario=role_required):
+    """Entrada o salida manual; el saldo no baja de cero (ver cantidad vs cantidad_solicitada)."""
+    item = crud.get_item(db, item_id)
+    if not item:
+        raise HTTPException(404, "Item no encontrado")
+    tipo = crud.get_tipo(db, item.tipo_id)
+    if tipo:
+        _verificar_acceso_programa(usuario, tipo.programa_id)
+    movimiento = crud.ajustar_item(db, item, data.cantidad, data.motivo, usuario.id)
+    if not movimiento:
+        raise HTTPException(404, "Item no encontrado")
+    return movimiento
+
+@router.get("/items/{item_id}/movimientos", response_model=List[MovimientoInventarioResponse])
+def listar_movimientos_item(item_id: int, limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db), usuario=role_required):
+    """Movimientos del ítem, del más reciente al más antiguo."""
+    item = crud.get_item(db, item_id)
+    if not item:
+        raise HTTPException(404, "Item no encontrado")
+    tipo = crud.get_tipo(db, item.tipo_id)
+    if tipo:
+        _verificar_acceso_programa(usuario, tipo.programa_id)
+    return crud.get_movimientos_item(db, item_id, limit)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
+from app.services.paginacion import ModoPaginacion, ModoConteo
 from app.db.database import get_db
 from app.core.dependencies import require_any_role, get_current_user
 from app.CRUD.labores import (
@@ -44,12 +45,16 @@ def listar_labores(
     lote_id: Optional[int] = None,
     recomendacion_id: Optional[int] = None,
     tipo_labor_id: Optional[int] = None,  # ✅ AGREGADO: Filtro por tipo de labor
+    paginacion: ModoPaginacion = "offset",
+    cursor: Optional[str] = None,
+    conteo: Optional[ModoConteo] = None,
     db: Session = Depends(get_db),
     usuario = Depends(require_any_role(["admin", "talento_humano", "estudiante", "docente", "asesor", "trabajador", "jefe_talento_humano"]))
 ):
-    """Listar labores con filtros"""
+    """Listar labores con filtros (offset o cursor; ver app/services/paginacion.py)"""
     return listar_labores_crud(
-        db, skip, limit, estado, trabajador_id, lote_id, recomendacion_id, tipo_labor_id, usuario
+        db, skip, limit, estado, trabajador_id, lote_id, recomendacion_id, tipo_labor_id, usuario,
+        paginacion, cursor, conteo
     )
 
 
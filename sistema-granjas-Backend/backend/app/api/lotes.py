@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from app.db.database import get_db
 from app.core.dependencies import require_any_role
 from app.CRUD.lotes import (
-    get_lotes, get_lote, create_lote, update_lote, delete_lote,
+    get_lotes, get_lotes_por_cursor, get_lote, create_lote, update_lote, delete_lote,
     get_lotes_por_programa, get_lotes_por_granja, get_lotes_activos,
     buscar_lotes_por_nombre, get_estadisticas_lotes,
     get_lotes_por_cultivo
@@ -15,6 +15,7 @@ from app.schemas.lote_schema import (
     LoteCreate, LoteUpdate, LoteResponse, LoteWithRelations
 )
 from app.db.models import Lote, LoteCultivo, CultivoEspecie, Planta
+from app.services.paginacion import ModoPaginacion, ModoConteo
 
 router = APIRouter(prefix="/lotes", tags=["Lotes"])
 
@@ -40,16 +41,33 @@ def construir_lote_dict(lote: Lote):
 
 @router.get("/", response_model=List[LoteResponse])
 def listar_lotes(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     programa_id: Optional[int] = Query(None),
     granja_id: Optional[int] = Query(None),
     cultivo_id: Optional[int] = Query(None),
     estado: Optional[str] = Query(None),
+    paginacion: ModoPaginacion = "offset",
+    cursor: Optional[str] = None,
+    conteo: Optional[ModoConteo] = None,
     db: Session = Depends(get_db),
     _=role_required
 ):
-    lotes = get_lotes(db, skip, limit, programa_id, granja_id, cultivo_id, estado)
+    """
+    La respuesta sigue siendo una lista; en modo cursor el siguiente cursor
+    viaja en la cabecera X-Siguiente-Cursor y el total (si se pide) en X-Total-Count.
+    """
+    if paginacion == "cursor" or cursor:
+        lotes, siguiente, total = get_lotes_por_cursor(
+            db, cursor, limit, programa_id, granja_id, cultivo_id, estado, conteo or "ninguno"
+        )
+        if siguiente:
+            response.headers["X-Siguiente-Cursor"] = siguiente
+        if total is not None:
+            response.headers["X-Total-Count"] = str(total)
+    else:
+        lotes = get_lotes(db, skip, limit, programa_id, granja_id, cultivo_id, estado)
     return [construir_lote_dict(l) for l in lotes]
 
 
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.db.database import get_db
+from app.services.paginacion import ModoPaginacion, ModoConteo
 from app.core.dependencies import require_any_role, get_current_user
 from app.CRUD.recomendaciones import (
     crear_recomendacion, listar_recomendaciones, obtener_recomendacion,
@@ -44,10 +45,16 @@ def listar(
     lote_id: Optional[int] = None,
     docente_id: Optional[int] = None,
     programa_id: Optional[int] = None,
+    paginacion: ModoPaginacion = "offset",
+    cursor: Optional[str] = None,
+    conteo: Optional[ModoConteo] = None,
     db: Session = Depends(get_db),
     usuario=Depends(get_current_user)
 ):
-    return listar_recomendaciones(db, skip, limit, estado, tipo, lote_id, docente_id, programa_id, usuario)
+    return listar_recomendaciones(
+        db, skip, limit, estado, tipo, lote_id, docente_id, programa_id, usuario,
+        paginacion, cursor, conteo
+    )
 
 
 @router.get("/{id}", response_model=RecomendacionResponse)
@@ -1,17 +1,162 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
+import logging
+from typing import Dict
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.api.labores import CompletarLaborRequest
+from app.core.dependencies import get_current_user
+from app.CRUD.labores import aplicar_avance_labor, aplicar_completar_labor, obtener_labor_objeto
+from app.db.database import get_db
+from app.db.models import SyncOperacion
+from app.schemas.labor_schema import RegistroAvanceRequest
+from app.schemas.sync_schema import (
+    OperacionSync, SyncLoteRequest, SyncLoteResponse, ResultadoOperacionSync, CambiosSyncResponse
+)
+from app.services.cambios_sync import cambios_desde
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Modelo de datos que recibimos desde IndexedDB
-class SyncItem(BaseModel):
-    tipo: str
-    data: dict
-    synced: bool | None = None
-    createdAt: str | None = None
-
-@router.post("/sync")
-async def sync_data(item: SyncItem):
-    print(f"📥 Recibido desde frontend: {item}")
-    # Aquí en el futuro guardarás en la base de datos
-    return {"status": "ok", "received": item}
+# Mismos roles que /labores/{id}/registrar-avance y /labores/{id}/completar
+ROLES_OPERACIONES_LABOR = ("admin", "talento_humano", "jefe_talento_humano")
+
+
+@router.post("/sync", status_code=410, include_in_schema=False)
+def sync_data():
+    """Endpoint anterior: solo devolvía el cuerpo recibido, sin guardar nada."""
+    raise HTTPException(410, "Endpoint retirado; use POST /api/sync/operaciones")
+
+
+# ── Sincronización por lotes ─────────────────────────────────────────────────
+
+def _aplicar_operacion(db: Session, op: OperacionSync, usuario) -> dict:
+    """Aplica una operación sin confirmar; devuelve el estado resultante de la labor."""
+    if usuario.rol.nombre not in ROLES_OPERACIONES_LABOR:
+        raise HTTPException(403, "No tiene permisos para sincronizar acciones de labores")
+    labor = obtener_labor_objeto(db, op.labor_id, usuario)
+    if not labor:
+        raise HTTPException(404, "Labor no encontrada")
+
+    if op.tipo == "avance":
+        datos = RegistroAvanceRequest(avance_porcentaje=op.avance_porcentaje, comentario=op.comentario)
+        aplicar_avance_labor(db, labor, datos, usuario)
+    else:
+        aplicar_completar_labor(db, labor, usuario, CompletarLaborRequest(comentario=op.comentario))
+    db.flush()
+    return {"id": labor.id, "estado": labor.estado, "avance_porcentaje": labor.avance_porcentaje}
+
+
+def _resultado(registro: SyncOperacion, repetida: bool = False) -> ResultadoOperacionSync:
+    datos = registro.resultado or {}
+    return ResultadoOperacionSync(
+        clave=registro.clave,
+        tipo=registro.tipo,
+        estado=registro.estado,
+        status_code=datos.get("status_code", 200),
+        detalle=datos.get("detalle"),
+        repetida=repetida,
+        labor=datos.get("labor"),
+    )
+
+
+def _guardar_rechazo(db: Session, op: OperacionSync, usuario_id: int, error: HTTPException):
+    """Guarda el rechazo (4xx) para que un reenvío reciba la misma respuesta sin reintentar."""
+    registro = SyncOperacion(
+        usuario_id=usuario_id, clave=op.clave, tipo=op.tipo, estado="rechazada",
+        resultado={"status_code": error.status_code, "detalle": str(error.detail)},
+    )
+    try:
+        with db.begin_nested():
+            db.add(registro)
+    except IntegrityError:
+        pass
+    return registro
+
+
+@router.post("/sync/operaciones", response_model=SyncLoteResponse)
+def sincronizar_operaciones(
+    lote: SyncLoteRequest,
+    db: Session = Depends(get_db),
+    usuario=Depends(get_current_user),
+):
+    """
+    Aplica en orden las acciones acumuladas sin conexión, en una sola
+    transacción (un savepoint por operación) y con un resultado por operación.
+
+    Cada operación trae una clave de idempotencia del cliente. Las claves ya
+    procesadas por este usuario no se vuelven a aplicar: se devuelve el
+    resultado guardado con `repetida=true`, así que reenviar un lote
+    completo tras un corte de red no descuenta inventario dos veces.
+    Estados: `aplicada` y `rechazada` (4xx: permisos, labor inexistente)
+    son definitivos; `error` es transitorio y la operación puede reenviarse.
+    """
+    claves = {op.clave for op in lote.operaciones}
+    previas: Dict[str, SyncOperacion] = {
+        s.clave: s for s in db.query(SyncOperacion).filter(
+            SyncOperacion.usuario_id == usuario.id,
+            SyncOperacion.clave.in_(claves),
+        )
+    }
+    usuario_id = usuario.id
+
+    resultados = []
+    for op in lote.operaciones:
+        if op.clave in previas:
+            resultados.append(_resultado(previas[op.clave], repetida=True))
+            continue
+        try:
+            with db.begin_nested():
+                registro = SyncOperacion(usuario_id=usuario_id, clave=op.clave, tipo=op.tipo, estado="aplicada")
+                db.add(registro)
+                # Ocupa la clave antes de aplicar: un reenvío concurrente del
+                # mismo lote espera aquí al índice único en vez de aplicar dos veces
+                db.flush()
+                registro.resultado = {"status_code": 200, "labor": _aplicar_operacion(db, op, usuario)}
+        except HTTPException as e:
+            registro = _guardar_rechazo(db, op, usuario_id, e)
+        except IntegrityError:
+            resultados.append(ResultadoOperacionSync(
+                clave=op.clave, tipo=op.tipo, estado="error", status_code=409,
+                detalle="La operación se está procesando en otra solicitud",
+            ))
+            continue
+        except Exception as e:
+            logger.error(f"Error sincronizando operación {op.clave} ({op.tipo}): {e}")
+            resultados.append(ResultadoOperacionSync(
+                clave=op.clave, tipo=op.tipo, estado="error", status_code=500,
+                detalle="Error interno al aplicar la operación",
+            ))
+            continue
+        previas[op.clave] = registro
+        resultados.append(_resultado(registro))
+
+    db.commit()
+    return SyncLoteResponse(
+        resultados=resultados,
+        aplicadas=sum(1 for r in resultados if r.estado == "aplicada" and not r.repetida),
+        rechazadas=sum(1 for r in resultados if r.estado == "rechazada"),
+        errores=sum(1 for r in resultados if r.estado == "error"),
+    )
+
+
+# ── Cambios incrementales ────────────────────────────────────────────────────
+
+@router.get("/sync/changes", response_model=CambiosSyncResponse)
+def obtener_cambios(
+    since: int = Query(0, ge=0, description="Último seq recibido (0 = desde el inicio del registro)"),
+    limit: int = Query(500, ge=1, le=2000),
+    db: Session = Depends(get_db),
+    usuario=Depends(get_current_user),
+):
+    """
+    Labores, recomendaciones, diagnósticos, plantas e ítems de inventario
+    que cambiaron después de `since`, limitados al alcance del usuario.
+    Cada entidad llega una vez (su último cambio) como `upsert` con la fila
+    actual o `delete` como lápida. El cliente guarda `hasta` y lo envía como
+    `since` en la próxima llamada; si `hay_mas` es true, vuelve a pedir de
+    inmediato. Con `reiniciar` debe descartar su copia local y recargar.
+    """
+    return cambios_desde(db, usuario, since, limit)
@@ -1,27 +1,41 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from fastapi.responses import FileResponse
+from app.core.dependencies import get_current_user
 from app.services.file_service import FileService
-from app.services.storage_service import upload_file_r2
+from app.services.subidas_directas_service import SubidasDirectasService
+from app.core.r2_storage import key_diagnostico, subir_foto_r2
+from app.schemas.subida_schema import FirmarSubidasRequest, FirmarSubidasResponse
 
 router = APIRouter(prefix="/files", tags=["Archivos"])
 
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
-        contents = await file.read()
+        # Las fotos se recodifican (sin EXIF, tamaño acotado) y llevan miniatura;
+        # otros archivos se suben tal cual
+        # Key única por archivo: con el nombre original, dos fotos "IMG_0001.jpg"
+        # se sobrescribían
+        subida = await subir_foto_r2(file, key_diagnostico(file.filename, "evidencia"))
 
-        url = upload_file_r2(
-            file_bytes=contents,
-            file_name=file.filename,
-            content_type=file.content_type
-        )
-
-        return {"message": "Archivo subido correctamente", "url": url}
+        return {"message": "Archivo subido correctamente", "url": subida["url"], "miniatura_url": subida["miniatura"]}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/firmar-subidas", response_model=FirmarSubidasResponse)
+def firmar_subidas(datos: FirmarSubidasRequest, usuario=Depends(get_current_user)):
+    """
+    URLs firmadas para subir archivos directo a R2 (PUT con las cabeceras
+    indicadas), sin pasar los bytes por la API. Después se confirma con
+    POST /diagnosticos/{id}/fotos o POST /evidencias/confirmar-subida
+    enviando el token de cada subida.
+    """
+    return FirmarSubidasResponse(subidas=SubidasDirectasService.firmar(datos.archivos, usuario.id))
+
+
 @router.post("/upload/local")
 async def upload_file_local(file: UploadFile = File(...)):
     filename = await FileService.save_file(file)
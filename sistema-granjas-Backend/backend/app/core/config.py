@@ -14,6 +14,32 @@ class Settings(BaseSettings):
     # === Directorio temporal (solo para procesamiento, no guardado final) ===
     TEMP_DIR: str = "/tmp/uploads"
 
+    # === Trabajos de exportación en segundo plano ===
+    EXPORT_DIR: str = "/tmp/exports"
+    EXPORT_JOB_WORKERS: int = 2
+    EXPORT_JOB_TTL_MINUTES: int = 60
+    EXPORT_DELTA_SOLAPE_MINUTOS: int = 10  # el delta relee este margen antes de `since`
+
+    # === Asistente de IA: caché y presupuesto del contexto ===
+    AI_CONTEXTO_TTL_SEGUNDOS: int = 900
+    AI_CONTEXTO_MAX_TOKENS: int = 8000   # por encima se recuperan solo los registros relevantes
+    AI_CONTEXTO_TOP_K: int = 60
+
+    # === Asistente de IA: modelo y concurrencia ===
+    AI_MODELO: str = "gemini"            # "stub" = modelo local de prueba, sin red
+    AI_STUB_RETARDO_MS: int = 0
+    AI_MAX_CONCURRENCIA: int = 4         # llamadas simultáneas al modelo por worker
+    AI_ESPERA_COLA_SEGUNDOS: float = 10  # espera máxima por un cupo antes de responder 503
+
+    # === Fotos: procesamiento antes de subirlas ===
+    IMAGENES_PROCESAR: bool = True
+    IMAGENES_FORMATO: str = "webp"       # "webp" o "jpeg"
+    IMAGENES_MAX_LADO: int = 2048        # lado mayor de la foto guardada (px)
+    IMAGENES_CALIDAD: int = 80
+    IMAGENES_MINIATURA_LADO: int = 320
+    IMAGENES_MINIATURA_CALIDAD: int = 70
+    IMAGENES_PROCESOS: int = 2           # procesos para codificar, por worker
+
     # === JWT ===
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
@@ -25,6 +51,10 @@ class Settings(BaseSettings):
     R2_BUCKET_NAME: str = ""
     R2_ENDPOINT: str = ""
     R2_PUBLIC_URL: str = ""
+    R2_ADDRESSING_STYLE: str = "virtual"   # "path" para servidores S3 locales (MinIO, stubs)
+    R2_MAX_SUBIDAS_CONCURRENTES: int = 8   # subidas simultáneas por worker
+    R2_SUBIDA_EXPIRA_SEGUNDOS: int = 900   # vigencia de las URLs firmadas para subir directo
+    R2_SUBIDA_MAX_MB: int = 25             # tamaño máximo de una subida directa
 
     # === Datos semilla (opcionales) ===
     ROLES_POR_DEFECTO: Optional[Dict] = None
@@ -55,7 +85,8 @@ class Settings(BaseSettings):
                 connect_timeout=30,
                 read_timeout=60,
                 retries={'max_attempts': 3},
-                s3={'addressing_style': 'virtual'}
+                max_pool_connections=max(10, self.R2_MAX_SUBIDAS_CONCURRENTES),
+                s3={'addressing_style': self.R2_ADDRESSING_STYLE}
             )
             session = boto3.Session()
             self.r2_client = session.client(
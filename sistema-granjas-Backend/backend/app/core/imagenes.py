@@ -0,0 +1,89 @@
+"""
+Procesamiento de fotos antes de subirlas a R2.
+
+`procesar_imagen` se ejecuta en un pool de procesos (ver r2_storage): este
+módulo solo importa Pillow y la biblioteca estándar, porque cada proceso lo
+importa al arrancar y no debe cargar la configuración, R2 ni la base de datos.
+"""
+import io
+from typing import NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# formato configurado -> (formato Pillow, content type, extensión)
+FORMATOS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+}
+
+
+class ImagenProcesada(NamedTuple):
+    contenido: bytes
+    content_type: str
+    extension: str
+    ancho: int
+    alto: int
+
+
+def _preparar_modo(img: Image.Image, formato: str) -> Image.Image:
+    """Convierte a un modo que el formato de salida acepte (JPEG no tiene alfa)."""
+    if img.mode == "P":
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    if img.mode in ("RGBA", "LA") and formato == "JPEG":
+        fondo = Image.new("RGB", img.size, (255, 255, 255))
+        fondo.paste(img, mask=img.getchannel("A"))
+        return fondo
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGB")
+    return img
+
+
+def _codificar(img: Image.Image, formato: str, calidad: int, icc: Optional[bytes]) -> ImagenProcesada:
+    nombre, content_type, extension = FORMATOS[formato]
+    img = _preparar_modo(img, nombre)
+    opciones = {"quality": calidad}
+    if nombre == "JPEG":
+        opciones.update(optimize=True, progressive=True)
+    else:
+        # method=2: ~3% más pesado que el 4 por defecto en la mitad del tiempo
+        opciones.update(method=2)
+    if icc:
+        # El perfil de color no identifica a nadie y evita colores lavados
+        opciones["icc_profile"] = icc
+    buffer = io.BytesIO()
+    # Sin exif= ni xmp=: no se copia ningún metadato (GPS, modelo del teléfono...)
+    img.save(buffer, nombre, **opciones)
+    return ImagenProcesada(buffer.getvalue(), content_type, extension, *img.size)
+
+
+def procesar_imagen(datos: bytes, max_lado: int, lado_miniatura: int, formato: str = "webp",
+                    calidad: int = 80, calidad_miniatura: int = 70) -> Optional[Tuple[ImagenProcesada, ImagenProcesada]]:
+    """
+    Aplica la orientación EXIF, limita el lado mayor a `max_lado`, recodifica
+    sin metadatos y genera una miniatura de `lado_miniatura`. Devuelve
+    (principal, miniatura), o None si Pillow no reconoce el archivo o es una
+    animación: en ese caso se sube el original sin cambios.
+    """
+    try:
+        img = Image.open(io.BytesIO(datos))
+        if getattr(img, "is_animated", False):
+            return None
+        ancho, alto = img.size
+        factor = max_lado / max(ancho, alto)
+        if factor < 1 and img.format == "JPEG":
+            # JPEG puede decodificar directamente a 1/2, 1/4 u 1/8: mucho menos trabajo
+            img.draft(img.mode if img.mode in ("RGB", "L") else None, (int(ancho * factor), int(alto * factor)))
+        img.load()
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return None
+
+    icc = img.info.get("icc_profile")
+    # Primero reducir (el límite es cuadrado, no depende de la orientación) y
+    # luego rotar la imagen ya pequeña
+    img.thumbnail((max_lado, max_lado), Image.Resampling.LANCZOS)
+    img = ImageOps.exif_transpose(img)
+    principal = _codificar(img, formato, calidad, icc)
+
+    miniatura = img.copy()
+    miniatura.thumbnail((lado_miniatura, lado_miniatura), Image.Resampling.LANCZOS)
+    return principal, _codificar(miniatura, formato, calidad_miniatura, icc)
@@ -1,18 +1,57 @@
 import os
 import uuid
+import asyncio
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from fastapi import UploadFile, HTTPException
 from app.core.config import settings
+from app.core.imagenes import ImagenProcesada, procesar_imagen
 
 logger = logging.getLogger(__name__)
 
+# Pool propio para las llamadas bloqueantes de boto3: acota las subidas
+# simultáneas por worker y no compite con el threadpool de las rutas síncronas
+_pool_r2 = ThreadPoolExecutor(max_workers=settings.R2_MAX_SUBIDAS_CONCURRENTES, thread_name_prefix="r2")
+
+# Pool de procesos para recodificar fotos (CPU): se crea al primer uso y con
+# "spawn", para no duplicar por fork los hilos y conexiones del worker
+_pool_imagenes: Optional[ProcessPoolExecutor] = None
+
+EXTENSIONES_IMAGEN = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+# Las keys llevan un uuid y nunca se sobrescriben: el navegador puede cachearlas
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 def get_r2_client():
     """Devuelve el cliente R2 desde settings."""
     if not settings.r2_client:
         raise HTTPException(500, "R2 no está inicializado")
     return settings.r2_client
 
+def _procesos() -> ProcessPoolExecutor:
+    global _pool_imagenes
+    if _pool_imagenes is None:
+        _pool_imagenes = ProcessPoolExecutor(
+            max_workers=settings.IMAGENES_PROCESOS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool_imagenes
+
+def key_diagnostico(filename: str, prefix: str) -> str:
+    """Key de un archivo de diagnóstico: diagnosticos/{año}/{mes}/{día}/{prefix}_{uuid}.ext"""
+    now = (datetime.utcnow() - timedelta(hours=5))  # Ajuste de zona horaria
+    year = now.strftime("%Y")
+    month = now.strftime("%m")
+    day = now.strftime("%d")
+    ext = os.path.splitext(filename or "")[1]
+    unique_id = uuid.uuid4().hex
+    safe_prefix = prefix.replace('[', '_').replace(']', '_').replace('/', '_')
+    return f"diagnosticos/{year}/{month}/{day}/{safe_prefix}_{unique_id}{ext}"
+
 def upload_file_to_r2(file: UploadFile, prefix: str) -> str:
     """
     Sube un archivo a Cloudflare R2 y devuelve la URL pública.
@@ -21,22 +60,22 @@ def upload_file_to_r2(file: UploadFile, prefix: str) -> str:
     if not settings.r2_client:
         raise HTTPException(500, "Servicio de almacenamiento no disponible")
 
-    now = (datetime.utcnow() - timedelta(hours=5))  # Ajuste de zona horaria
-    year = now.strftime("%Y")
-    month = now.strftime("%m")
-    day = now.strftime("%d")
-    ext = os.path.splitext(file.filename)[1]
-    unique_id = uuid.uuid4().hex
-    safe_prefix = prefix.replace('[', '_').replace(']', '_').replace('/', '_')
-    key = f"diagnosticos/{year}/{month}/{day}/{safe_prefix}_{unique_id}{ext}"
+    return subir_archivo_r2(file, key_diagnostico(file.filename, prefix))
 
+def subir_archivo_r2(file: UploadFile, key: str) -> str:
+    """Sube el archivo tal cual con la key indicada y devuelve la URL pública."""
+    if not settings.r2_client:
+        raise HTTPException(500, "Servicio de almacenamiento no disponible")
     try:
-        # Subir a R2
+        from boto3.s3.transfer import TransferConfig
+        # Se lee directo del archivo temporal del formulario (sin copiarlo a
+        # memoria). Sin hilos propios de s3transfer: la concurrencia la da _pool_r2
         settings.r2_client.upload_fileobj(
             file.file,
             settings.R2_BUCKET_NAME,
             key,
-            ExtraArgs={"ContentType": file.content_type or "image/jpeg"}
+            ExtraArgs={"ContentType": file.content_type or "image/jpeg", "CacheControl": CACHE_CONTROL},
+            Config=TransferConfig(use_threads=False),
         )
         # Construir URL pública
         public_url = f"{settings.R2_PUBLIC_URL}/{key}"
@@ -46,6 +85,66 @@ def upload_file_to_r2(file: UploadFile, prefix: str) -> str:
         logger.error(f"Error subiendo a R2: {e}")
         raise HTTPException(500, f"No se pudo subir el archivo: {e}")
 
+def subir_bytes_r2(contenido: bytes, key: str, content_type: str) -> str:
+    """Sube un contenido ya en memoria (p. ej. una foto recodificada)."""
+    if not settings.r2_client:
+        raise HTTPException(500, "Servicio de almacenamiento no disponible")
+    try:
+        settings.r2_client.put_object(
+            Bucket=settings.R2_BUCKET_NAME,
+            Key=key,
+            Body=contenido,
+            ContentType=content_type,
+            CacheControl=CACHE_CONTROL,
+        )
+        public_url = url_publica_r2(key)
+        logger.info(f"Archivo subido a R2: {public_url}")
+        return public_url
+    except Exception as e:
+        logger.error(f"Error subiendo a R2: {e}")
+        raise HTTPException(500, f"No se pudo subir el archivo: {e}")
+
+def url_publica_r2(key: str) -> str:
+    return f"{settings.R2_PUBLIC_URL}/{key}"
+
+def firmar_subida_r2(key: str, content_type: str, expira_segundos: int) -> str:
+    """
+    URL firmada para que el cliente haga PUT del archivo directo a R2. Firma
+    también Content-Type y Cache-Control: el PUT debe enviarlos iguales.
+    Se genera localmente, sin llamada de red.
+    """
+    if not settings.r2_client:
+        raise HTTPException(500, "Servicio de almacenamiento no disponible")
+    return settings.r2_client.generate_presigned_url(
+        "put_object",
+        Params={
+            "Bucket": settings.R2_BUCKET_NAME,
+            "Key": key,
+            "ContentType": content_type,
+            "CacheControl": CACHE_CONTROL,
+        },
+        ExpiresIn=expira_segundos,
+        HttpMethod="PUT",
+    )
+
+def consultar_objeto_r2(key: str) -> Optional[dict]:
+    """HEAD del objeto: {"tamano", "content_type"} o None si no existe."""
+    if not settings.r2_client:
+        raise HTTPException(500, "Servicio de almacenamiento no disponible")
+    from botocore.exceptions import ClientError
+    try:
+        respuesta = settings.r2_client.head_object(Bucket=settings.R2_BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        logger.error(f"Error consultando {key} en R2: {e}")
+        raise HTTPException(502, "No se pudo verificar el archivo en el almacenamiento")
+    return {"tamano": respuesta.get("ContentLength", 0), "content_type": respuesta.get("ContentType")}
+
+def consultar_objetos_r2(keys: List[str]) -> List[Optional[dict]]:
+    """consultar_objeto_r2 para varias keys en paralelo (mismo orden)."""
+    return list(_pool_r2.map(consultar_objeto_r2, keys))
+
 def delete_file_from_r2(file_url: str) -> bool:
     """
     Elimina un archivo de R2 dada su URL pública.
@@ -65,4 +164,97 @@ def delete_file_from_r2(file_url: str) -> bool:
         return False
     except Exception as e:
         logger.error(f"Error eliminando archivo {file_url}: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+async def procesar_foto(file: UploadFile) -> Optional[Tuple[ImagenProcesada, ImagenProcesada]]:
+    """
+    Recodifica la foto en el pool de procesos: sin EXIF, lado mayor acotado y
+    con miniatura. None si no es una imagen procesable (se sube el original).
+    """
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    es_imagen = (file.content_type or "").startswith("image/") or ext in EXTENSIONES_IMAGEN
+    if not settings.IMAGENES_PROCESAR or not es_imagen:
+        return None
+    global _pool_imagenes
+    datos = await file.read()
+    await file.seek(0)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            _procesos(), procesar_imagen, datos,
+            settings.IMAGENES_MAX_LADO, settings.IMAGENES_MINIATURA_LADO, settings.IMAGENES_FORMATO,
+            settings.IMAGENES_CALIDAD, settings.IMAGENES_MINIATURA_CALIDAD,
+        )
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. sin memoria): el siguiente uso crea otro pool
+        _pool_imagenes = None
+        logger.error(f"El pool de procesamiento de imágenes falló con {file.filename}")
+        raise HTTPException(500, "No se pudo procesar la imagen, intenta de nuevo")
+
+
+async def _en_pool_r2(subidas: List[str], funcion, *args) -> str:
+    url = await asyncio.get_running_loop().run_in_executor(_pool_r2, funcion, *args)
+    subidas.append(url)
+    return url
+
+
+async def _subir_foto(file: UploadFile, key: str, subidas: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Sube la foto procesada y su miniatura ({base}_mini.ext, junto a la
+    original); si no es procesable, el archivo tal cual. Cada URL que llega
+    a R2 se agrega a `subidas` para poder limpiarla si algo falla después.
+    """
+    procesada = await procesar_foto(file)
+    if procesada is None:
+        return {"url": await _en_pool_r2(subidas, subir_archivo_r2, file, key), "miniatura": None}
+
+    principal, miniatura = procesada
+    base = os.path.splitext(key)[0]
+    resultados = await asyncio.gather(
+        _en_pool_r2(subidas, subir_bytes_r2, principal.contenido, base + principal.extension, principal.content_type),
+        _en_pool_r2(subidas, subir_bytes_r2, miniatura.contenido, f"{base}_mini{miniatura.extension}", miniatura.content_type),
+        return_exceptions=True,
+    )
+    for r in resultados:
+        if isinstance(r, BaseException):
+            raise r
+    return {"url": resultados[0], "miniatura": resultados[1]}
+
+
+async def subir_foto_r2(file: UploadFile, key: str) -> Dict[str, Optional[str]]:
+    """Procesa y sube una foto con la key indicada; si falla no deja nada en R2."""
+    subidas: List[str] = []
+    try:
+        return await _subir_foto(file, key, subidas)
+    except BaseException:
+        await eliminar_archivos_r2(subidas)
+        raise
+
+
+async def subir_archivos_r2(archivos: List[Tuple[str, UploadFile]]) -> List[Dict[str, Optional[str]]]:
+    """
+    Procesa y sube varias fotos (prefix, archivo) en paralelo fuera del event
+    loop. Devuelve {"url", "miniatura"} por archivo, en el mismo orden. Si
+    alguna falla, borra todo lo que sí se subió y relanza el error: no quedan
+    objetos huérfanos.
+    """
+    if not archivos:
+        return []
+    subidas: List[str] = []
+    resultados = await asyncio.gather(
+        *(_subir_foto(archivo, key_diagnostico(archivo.filename, prefix), subidas) for prefix, archivo in archivos),
+        return_exceptions=True,
+    )
+    fallo = next((r for r in resultados if isinstance(r, BaseException)), None)
+    if fallo is not None:
+        await eliminar_archivos_r2(subidas)
+        raise fallo
+    return resultados
+
+
+async def eliminar_archivos_r2(urls: List[str]) -> None:
+    """Borra varias URLs en paralelo fuera del event loop (errores solo se registran)."""
+    if not urls:
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(_pool_r2, delete_file_from_r2, url) for url in urls))
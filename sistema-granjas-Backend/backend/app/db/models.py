@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Boolean, Text, Table, Date, JSON
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, Float, DateTime, Boolean, Text, Table, Date, JSON, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
 from app.db.database import Base
@@ -40,6 +40,8 @@ diagnostico_planta = Table(
     Column("diagnostico_id", Integer, ForeignKey("diagnosticos.id", ondelete="CASCADE")),
     Column("planta_id", Integer, ForeignKey("plantas.id", ondelete="CASCADE")),
     Column("created_at", DateTime, default=colombia_now),
+    Index("idx_diagnostico_planta_diagnostico", "diagnostico_id"),
+    Index("idx_diagnostico_planta_planta", "planta_id"),
 )
 
 # ---------- Modelos ----------
@@ -149,6 +151,9 @@ class Recomendacion(Base):
     inventario_item = relationship("ItemInventarioPrograma", foreign_keys=[inventario_item_id])
     items_sugeridos = relationship("RecomendacionItem", back_populates="recomendacion", cascade="all, delete-orphan")
     productos = relationship("ProductoRecomendacion", back_populates="recomendacion", cascade="all, delete-orphan")
+    __table_args__ = (
+        Index("idx_recomendaciones_fecha_id", "fecha_creacion", "id"),
+    )
 
 class Evidencia(Base):
     __tablename__ = "evidencias"
@@ -189,6 +194,9 @@ class Labor(Base):
     evidencias = relationship("Evidencia", back_populates="labor")
     inventario_item = relationship("ItemInventarioPrograma", foreign_keys=[inventario_item_id])
     productos = relationship("ProductoLabor", back_populates="labor", cascade="all, delete-orphan")
+    __table_args__ = (
+        Index("idx_labores_fecha_asignacion_id", "fecha_asignacion", "id"),
+    )
 
 class Diagnostico(Base):
     __tablename__ = "diagnosticos"
@@ -211,6 +219,10 @@ class Diagnostico(Base):
     recomendaciones = relationship("Recomendacion", back_populates="diagnostico")
     evidencias = relationship("Evidencia", back_populates="diagnostico")
     plantas = relationship("Planta", secondary=diagnostico_planta, back_populates="diagnosticos")
+    __table_args__ = (
+        Index("idx_diagnosticos_lote_tipo_fecha", "lote_id", "tipo_diagnostico", "fecha_creacion"),
+        Index("idx_diagnosticos_fecha_id", "fecha_creacion", "id"),
+    )
 
 class Monitoreo(Base):
     __tablename__ = "monitoreos"
@@ -245,6 +257,10 @@ class Planta(Base):
     updated_at = Column(DateTime, default=colombia_now, onupdate=colombia_now)
     lote = relationship("Lote", back_populates="plantas")
     diagnosticos = relationship("Diagnostico", secondary=diagnostico_planta, back_populates="plantas")
+    __table_args__ = (
+        UniqueConstraint("lote_id", "surco", "numero", name="uq_planta_lote_surco_numero"),
+        Index("idx_plantas_lote_estado", "lote_id", "estado"),
+    )
 
 # ---------- Diagnóstico dinámico ----------
 class DiagnosticoTipo(Base):
@@ -311,6 +327,45 @@ class CampoLabor(Base):
     created_at = Column(DateTime, default=colombia_now)
     subtipo = relationship("DiagnosticoTipo", back_populates="campos_labor")
 
+# Estadísticas pre-agregadas de los formularios de diagnóstico, una fila por
+# (subtipo, campo, programa, día). Se recalculan al crear/editar/eliminar
+# diagnósticos (ver app/services/estadisticas_service.py).
+class DiagnosticoCampoEstadistica(Base):
+    __tablename__ = "diagnostico_campo_estadisticas"
+    id = Column(Integer, primary_key=True, index=True)
+    subtipo_id = Column(Integer, ForeignKey("diagnostico_tipos.id", ondelete="CASCADE"), nullable=False)
+    programa_id = Column(Integer, ForeignKey("programas.id", ondelete="CASCADE"), nullable=False)
+    nombre_campo = Column(String(100), nullable=False)
+    dia = Column(Date, nullable=False)
+    total_respuestas = Column(Integer, nullable=False, default=0)
+    distribucion = Column(JSON, nullable=True)
+    conteo_numerico = Column(Integer, nullable=False, default=0)
+    suma = Column(Float, nullable=False, default=0.0)
+    minimo = Column(Float, nullable=True)
+    maximo = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=colombia_now, onupdate=colombia_now)
+    __table_args__ = (
+        UniqueConstraint("subtipo_id", "programa_id", "nombre_campo", "dia", name="uq_diag_campo_estadistica"),
+        Index("idx_diag_campo_estadistica_subtipo_dia", "subtipo_id", "dia"),
+    )
+
+# Resumen de salud por planta y día para el mapa del lote; se recalcula al
+# crear/editar/eliminar diagnósticos (ver app/services/mapa_salud_service.py).
+class PlantaSaludDiaria(Base):
+    __tablename__ = "planta_salud_diaria"
+    id = Column(Integer, primary_key=True, index=True)
+    lote_id = Column(Integer, ForeignKey("lotes.id", ondelete="CASCADE"), nullable=False)
+    planta_id = Column(Integer, ForeignKey("plantas.id", ondelete="CASCADE"), nullable=False)
+    dia = Column(Date, nullable=False)
+    diagnosticos_count = Column(Integer, nullable=False, default=0)
+    ultima_fecha = Column(DateTime, nullable=True)
+    presion_max = Column(Integer, nullable=False, default=0)  # 0 ninguna, 1 baja, 2 media, 3 alta
+    tiene_enfermedades = Column(Boolean, nullable=False, default=False)
+    __table_args__ = (
+        UniqueConstraint("planta_id", "dia", name="uq_planta_salud_dia"),
+        Index("idx_planta_salud_lote_dia", "lote_id", "dia"),
+    )
+
 # ---------- Inventario dinámico ----------
 class ProgramaInventarioTipo(Base):
     __tablename__ = "programas_inventario_tipos"
@@ -390,6 +445,63 @@ class ProductoLabor(Base):
     inventario_item = relationship("ItemInventarioPrograma")
 
 
+
+# Libro de movimientos de inventario (solo inserción). cantidad_disponible del
+# ítem es el saldo materializado; todo cambio pasa por
+# app/services/movimientos_inventario_service.py, que escribe ambos a la vez.
+class MovimientoInventario(Base):
+    __tablename__ = "movimientos_inventario"
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items_inventario_programa.id", ondelete="CASCADE"), nullable=False)
+    origen = Column(String(20), nullable=False)  # labor, recomendacion, ajuste
+    cantidad = Column(Float, nullable=False)  # aplicada: negativa = salida
+    cantidad_solicitada = Column(Float, nullable=False)  # difiere si el saldo no alcanzaba
+    saldo_resultante = Column(Float, nullable=False)
+    labor_id = Column(Integer, ForeignKey("labores.id", ondelete="SET NULL"), nullable=True)
+    producto_labor_id = Column(Integer, ForeignKey("productos_labores.id", ondelete="SET NULL"), nullable=True)
+    recomendacion_id = Column(Integer, ForeignKey("recomendaciones.id", ondelete="SET NULL"), nullable=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id", ondelete="SET NULL"), nullable=True)
+    motivo = Column(String(200), nullable=True)
+    created_at = Column(DateTime, default=colombia_now)
+    item = relationship("ItemInventarioPrograma")
+    __table_args__ = (
+        Index("idx_movimientos_inventario_item_id", "item_id", "id"),
+        Index("idx_movimientos_inventario_labor", "labor_id"),
+    )
+
+
+# Operaciones de sincronización offline ya procesadas, por clave de idempotencia
+# generada en el cliente: reenviar la misma clave devuelve el resultado guardado.
+class SyncOperacion(Base):
+    __tablename__ = "sync_operaciones"
+    id = Column(Integer, primary_key=True, index=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id", ondelete="CASCADE"), nullable=False)
+    clave = Column(String(100), nullable=False)
+    tipo = Column(String(30), nullable=False)
+    estado = Column(String(20), nullable=False)  # aplicada, rechazada
+    resultado = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=colombia_now)
+    __table_args__ = (
+        UniqueConstraint("usuario_id", "clave", name="uq_sync_operacion_usuario_clave"),
+    )
+
+
+# Registro de cambios para la sincronización incremental (/api/sync/changes).
+# `seq` crece en el orden en que se confirman las transacciones; lo escriben
+# los listeners de app/services/cambios_sync.py. El alcance (programa, granja,
+# usuario) se guarda al registrar el cambio para poder filtrar también las bajas.
+class CambioSync(Base):
+    __tablename__ = "cambios_sync"
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    entidad = Column(String(30), nullable=False)  # labor, recomendacion, diagnostico, planta, item_inventario
+    entidad_id = Column(Integer, nullable=False)
+    operacion = Column(String(10), nullable=False)  # upsert, delete
+    programa_id = Column(Integer, nullable=True)
+    granja_id = Column(Integer, nullable=True)
+    usuario_id = Column(Integer, nullable=True)  # trabajador, docente o autor
+    docente_id = Column(Integer, nullable=True)  # docente de la recomendación (labores y recomendaciones)
+    created_at = Column(DateTime, default=colombia_now)
+
 # ---------- Historial de Chat IA ----------
 class ChatSesion(Base):
     __tablename__ = "chat_sesiones"
@@ -0,0 +1,41 @@
+"""
+Escrituras concurrentes en tablas derivadas: INSERT ... ON CONFLICT y bloqueos
+por transacción, con el dialecto de PostgreSQL en producción y de SQLite en
+desarrollo.
+"""
+from sqlalchemy import Table, text
+from sqlalchemy.orm import Session
+
+
+def insert_dialecto(db: Session, tabla: Table):
+    """insert() del dialecto de la sesión, que admite on_conflict_do_*."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(tabla)
+
+
+def upsert(db: Session, tabla: Table, filas: list, columnas_unicas: list) -> None:
+    """
+    Inserta las filas y, si ya existe una con las mismas `columnas_unicas`,
+    reemplaza sus demás columnas.
+    """
+    if not filas:
+        return
+    stmt = insert_dialecto(db, tabla)
+    actualizar = [c for c in filas[0] if c not in columnas_unicas]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=columnas_unicas,
+        set_={c: stmt.excluded[c] for c in actualizar},
+    )
+    db.execute(stmt, filas)
+
+
+def bloquear(db: Session, clase: int, clave: int) -> None:
+    """
+    pg_advisory_xact_lock(clase, clave): serializa hasta el commit a quienes
+    recalculan lo mismo. En SQLite los escritores ya se serializan.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:clase, :clave)"), {"clase": clase, "clave": clave})
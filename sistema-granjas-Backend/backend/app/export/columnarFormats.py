@@ -0,0 +1,92 @@
+"""
+Salidas columnares - CSV por streaming (gzip opcional) y Parquet con tipos reales
+"""
+from itertools import chain, islice
+from typing import Any, Dict, IO, Iterable, Iterator
+import csv
+import io
+import logging
+import zlib
+import pandas as pd
+from app.export.dataframeFetchers import DataframeFetchers
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnarWriter:
+    """Serialización de hojas a CSV y Parquet"""
+
+    # Filas por bloque emitido en el CSV
+    CSV_CHUNK_ROWS = 1000
+
+    @classmethod
+    def iter_csv(cls, rows: Iterable[Dict[str, Any]], comprimir: bool = False) -> Iterator[bytes]:
+        """
+        Genera el CSV por bloques a partir de un iterable de diccionarios. Las
+        columnas se toman del primer registro con los nombres del Excel. Con
+        comprimir=True la salida es un flujo gzip.
+        """
+        gzip = zlib.compressobj(wbits=31) if comprimir else None
+
+        def emitir(texto: str) -> bytes:
+            datos = texto.encode("utf-8")
+            return gzip.compress(datos) if gzip else datos
+
+        rows = iter(rows)
+        primera = list(islice(rows, 1))
+        if primera:
+            columnas = DataframeFetchers.format_columns(list(primera[0].keys()))
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow([nombre for _, nombre in columnas])
+
+            for idx, fila in enumerate(chain(primera, rows), start=1):
+                writer.writerow([fila.get(col) for col, _ in columnas])
+                if idx % cls.CSV_CHUNK_ROWS == 0:
+                    bloque = emitir(buffer.getvalue())
+                    buffer.seek(0)
+                    buffer.truncate()
+                    if bloque:
+                        yield bloque
+
+            bloque = emitir(buffer.getvalue())
+            if bloque:
+                yield bloque
+
+        if gzip:
+            yield gzip.flush()
+
+    @classmethod
+    def write_csv(cls, rows: Iterable[Dict[str, Any]], destino: IO[bytes], db=None) -> None:
+        """
+        Escribe el CSV en un archivo abierto (miembro de un .zip). Igual que en
+        StreamingExcelWriter.add_sheet, un error al consultar deja una fila
+        Error en lugar de abortar el paquete completo, y con `db` se revierte
+        la sesión para que las hojas siguientes puedan consultar.
+        """
+        rows = iter(rows)
+        try:
+            primera = list(islice(rows, 1))
+        except Exception as e:
+            logger.error(f"Error obteniendo datos para CSV: {str(e)}")
+            if db is not None:
+                db.rollback()
+            primera, rows = [{"Error": f"No se pudieron obtener datos: {str(e)}"}], iter(())
+
+        for bloque in cls.iter_csv(chain(primera, rows)):
+            destino.write(bloque)
+
+    @staticmethod
+    def parquet_bytes(df: pd.DataFrame) -> bytes:
+        """
+        Serializa a Parquet (requiere pyarrow). Las columnas de texto con
+        valores de tipos mezclados se convierten a string, que Parquet no
+        admite en una misma columna.
+        """
+        df = df.copy()
+        for col in df.select_dtypes(include="object").columns:
+            if pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed"):
+                df[col] = df[col].map(lambda v: None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+        output = io.BytesIO()
+        df.to_parquet(output, index=False)
+        return output.getvalue()
@@ -1,12 +1,13 @@
 """
 Módulo para obtener DataFrames de diferentes modelos
 """
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Tuple, Callable
 import pandas as pd
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, case, literal, or_, and_
 import logging
 from datetime import datetime, timedelta
+from app.schemas.export_schema import FiltrosExportacion
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +15,9 @@ logger = logging.getLogger(__name__)
 class DataframeFetchers:
     """Clase para obtener DataFrames de diferentes entidades"""
 
+    # Filas por bloque que se piden al cursor del servidor en los iter_*_rows
+    STREAM_CHUNK_SIZE = 1000
+
     def __init__(self, db: Session, usuario=None):
         self.db = db
         self.usuario = usuario
@@ -63,38 +67,144 @@ class DataframeFetchers:
         ids = [g.id for g in (self.usuario.granjas or [])]
         return ids
 
+    # ------------------------------------------------------------------
+    # Ejecución de proyecciones
+    # ------------------------------------------------------------------
+    # Cada hoja se define como un SELECT con las columnas ya resueltas en SQL
+    # (joins y conteos incluidos) más una transformación vectorizada sobre el
+    # DataFrame resultante. El modo DataFrame lee todo con fetchall y el modo
+    # streaming aplica la misma transformación por bloques del cursor.
+
+    def _read_dataframe(self, stmt) -> pd.DataFrame:
+        """Ejecuta un SELECT y construye el DataFrame directamente de las tuplas"""
+        result = self.db.execute(stmt)
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
+
+    def _iter_dataframes(self, stmt) -> Iterator[pd.DataFrame]:
+        """Ejecuta un SELECT con cursor del servidor y entrega DataFrames por bloques"""
+        result = self.db.execute(stmt.execution_options(yield_per=self.STREAM_CHUNK_SIZE))
+        columnas = list(result.keys())
+        for particion in result.partitions():
+            yield pd.DataFrame.from_records(particion, columns=columnas)
+
+    def _projection_dataframe(self, stmt, transform: Callable[[pd.DataFrame], pd.DataFrame]) -> pd.DataFrame:
+        df = self._read_dataframe(stmt)
+        if df.empty:
+            return self._format_dataframe(df)
+        return self._format_dataframe(transform(df))
+
+    def _projection_rows(self, stmt, transform: Callable[[pd.DataFrame], pd.DataFrame]) -> Iterator[Dict[str, Any]]:
+        for chunk in self._iter_dataframes(stmt):
+            yield from transform(chunk).to_dict("records")
+
+    @staticmethod
+    def _fmt_fecha(serie: pd.Series, formato: str = "%Y-%m-%d %H:%M", tipado: bool = False) -> pd.Series:
+        """
+        Formatea una columna de fechas; los nulos quedan como cadena vacía.
+        Con tipado=True se conserva como datetime (salidas Parquet).
+        """
+        if tipado:
+            return pd.to_datetime(serie)
+        return pd.to_datetime(serie).dt.strftime(formato).fillna("")
+
+    @staticmethod
+    def _fmt_porcentaje(parte: pd.Series, total: pd.Series, tipado: bool = False) -> pd.Series:
+        """
+        parte/total como texto 'xx.x%'; '0.0%' cuando el total es 0 o nulo.
+        Con tipado=True se retorna el porcentaje como float.
+        """
+        total = total.astype(float)
+        valor = (parte.astype(float) / total.where(total > 0) * 100).fillna(0.0)
+        if tipado:
+            return valor.round(1)
+        return valor.map("{:.1f}%".format)
+
+    @staticmethod
+    def _aplicar_filtros(stmt, filtros: Optional[FiltrosExportacion], columnas: Dict[str, Any]):
+        """
+        Traduce los filtros a condiciones WHERE.
+
+        `columnas` asocia cada filtro que la hoja soporta con su columna
+        ("fecha" cubre fecha_desde/fecha_hasta). Un valor callable recibe el
+        valor del filtro y devuelve la condición (p. ej. un semijoin). Los
+        filtros sin columna en la hoja se ignoran.
+        """
+        if filtros is None:
+            return stmt
+
+        for campo in ("lote_id", "granja_id", "programa_id", "estado", "tipo", "rol"):
+            valor = getattr(filtros, campo)
+            if valor is None or campo not in columnas:
+                continue
+            columna = columnas[campo]
+            stmt = stmt.where(columna(valor) if callable(columna) else columna == valor)
+
+        if filtros.activo is not None and "activo" in columnas:
+            columna = columnas["activo"]
+            # Un activo NULL se exporta como inactivo
+            stmt = stmt.where(columna == True if filtros.activo else or_(columna == False, columna.is_(None)))
+
+        if "fecha" in columnas:
+            columna = columnas["fecha"]
+            if filtros.fecha_desde:
+                stmt = stmt.where(columna >= datetime.combine(filtros.fecha_desde, datetime.min.time()))
+            if filtros.fecha_hasta:
+                stmt = stmt.where(columna <= datetime.combine(filtros.fecha_hasta, datetime.max.time()))
+        return stmt
+
+    @staticmethod
+    def _conteo_por(columna_fk, nombre: str, *condiciones):
+        """Subconsulta agrupada (fk, count) para unir a la proyección principal"""
+        stmt = select(columna_fk.label("fk"), func.count().label(nombre))
+        if condiciones:
+            stmt = stmt.where(*condiciones)
+        return stmt.group_by(columna_fk).subquery()
+
     # ------------------------------------------------------------------
     # Granjas
     # ------------------------------------------------------------------
 
-    def get_granjas_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de granjas bien formateado"""
-        from app.db.models import Granja
+    def _granjas_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        from app.db.models import Granja, Lote
+
+        lotes = self._conteo_por(Lote.granja_id, "cantidad_lotes")
+        stmt = (
+            select(
+                Granja.id,
+                Granja.nombre,
+                Granja.ubicacion,
+                Granja.activo,
+                Granja.fecha_creacion,
+                func.coalesce(lotes.c.cantidad_lotes, 0).label("cantidad_lotes"),
+            )
+            .outerjoin(lotes, lotes.c.fk == Granja.id)
+        )
 
+        granja_ids = self._get_granja_ids()
+        if granja_ids is not None:
+            stmt = stmt.where(Granja.id.in_(granja_ids))
+        return self._aplicar_filtros(stmt, filtros, {
+            "granja_id": Granja.id,
+            "activo": Granja.activo,
+            "fecha": Granja.fecha_creacion,
+        })
+
+    @classmethod
+    def _transform_granjas(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        df["estado"] = df["activo"].map({True: "Activa"}).fillna("Inactiva")
+        df["fecha_creacion"] = cls._fmt_fecha(df["fecha_creacion"], tipado=tipado)
+        ubicacion = df["ubicacion"].fillna("")
+        df["descripcion"] = ("Granja en " + ubicacion).where(ubicacion != "", "")
+        return df[["id", "nombre", "ubicacion", "estado", "fecha_creacion", "cantidad_lotes", "descripcion"]]
+
+    def iter_granjas_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera las granjas por bloques usando un cursor del lado del servidor"""
+        yield from self._projection_rows(self._granjas_stmt(filtros), self._transform_granjas)
+
+    def get_granjas_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """Obtener DataFrame de granjas bien formateado"""
         try:
-            query = self.db.query(Granja)
-
-            granja_ids = self._get_granja_ids()
-            if granja_ids is not None:
-                query = query.filter(Granja.id.in_(granja_ids))
-
-            granjas = query.all()
-
-            data = []
-            for g in granjas:
-                lotes_count = len(g.lotes) if hasattr(g, "lotes") else 0
-                data.append({
-                    "id": g.id,
-                    "nombre": g.nombre,
-                    "ubicacion": g.ubicacion,
-                    "estado": "Activa" if g.activo else "Inactiva",
-                    "fecha_creacion": g.fecha_creacion.strftime("%Y-%m-%d %H:%M") if g.fecha_creacion else "",
-                    "cantidad_lotes": lotes_count,
-                    "descripcion": f"Granja en {g.ubicacion}" if g.ubicacion else "",
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+            return self._projection_dataframe(self._granjas_stmt(filtros), self._transform_granjas)
         except Exception as e:
             logger.error(f"Error obteniendo granjas: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener granjas: {str(e)}"]})
@@ -103,45 +213,62 @@ class DataframeFetchers:
     # Lotes
     # ------------------------------------------------------------------
 
-    def get_lotes_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de lotes bien formateado"""
-        from app.db.models import Lote
+    def _lotes_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        from app.db.models import Lote, Granja, Programa, TipoLote, LoteCultivo, CultivoEspecie
 
-        try:
-            query = self.db.query(Lote).options(
-                joinedload(Lote.granja),
-                joinedload(Lote.programa),
+        cultivos = (
+            select(
+                LoteCultivo.lote_id.label("fk"),
+                func.aggregate_strings(CultivoEspecie.nombre, ", ").label("cultivo"),
+            )
+            .join(CultivoEspecie, CultivoEspecie.id == LoteCultivo.cultivo_id)
+            .group_by(LoteCultivo.lote_id)
+            .subquery()
+        )
+        stmt = (
+            select(
+                Lote.id,
+                Lote.nombre,
+                Granja.nombre.label("granja"),
+                Programa.nombre.label("programa"),
+                cultivos.c.cultivo,
+                TipoLote.nombre.label("tipo_lote"),
+                Lote.estado,
+                Lote.fecha_inicio,
+                Lote.surcos,
+                Lote.plantas_por_surco,
             )
+            .outerjoin(Granja, Granja.id == Lote.granja_id)
+            .outerjoin(Programa, Programa.id == Lote.programa_id)
+            .outerjoin(TipoLote, TipoLote.id == Lote.tipo_lote_id)
+            .outerjoin(cultivos, cultivos.c.fk == Lote.id)
+        )
 
-            program_ids = self._get_program_ids()
-            if program_ids is not None:
-                query = query.filter(Lote.programa_id.in_(program_ids))
-
-            lotes = query.all()
-
-            data = []
-            for l in lotes:
-                cultivo_nombre = ""
-                if hasattr(l, "cultivos_asignados") and l.cultivos_asignados:
-                    cultivo_nombre = ", ".join(
-                        lc.cultivo.nombre for lc in l.cultivos_asignados if lc.cultivo
-                    )
-
-                data.append({
-                    "id": l.id,
-                    "nombre": l.nombre,
-                    "granja": l.granja.nombre if l.granja else "",
-                    "programa": l.programa.nombre if l.programa else "",
-                    "cultivo": cultivo_nombre,
-                    "tipo_lote": l.tipo_lote.nombre if l.tipo_lote else "",
-                    "estado": l.estado,
-                    "fecha_inicio": l.fecha_inicio.strftime("%Y-%m-%d") if l.fecha_inicio else "",
-                    "surcos": l.surcos,
-                    "plantas_por_surco": l.plantas_por_surco,
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+        program_ids = self._get_program_ids()
+        if program_ids is not None:
+            stmt = stmt.where(Lote.programa_id.in_(program_ids))
+        return self._aplicar_filtros(stmt, filtros, {
+            "lote_id": Lote.id,
+            "granja_id": Lote.granja_id,
+            "programa_id": Lote.programa_id,
+            "estado": Lote.estado,
+            "fecha": Lote.fecha_inicio,
+        })
+
+    @classmethod
+    def _transform_lotes(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        df[["granja", "programa", "cultivo", "tipo_lote"]] = df[["granja", "programa", "cultivo", "tipo_lote"]].fillna("")
+        df["fecha_inicio"] = cls._fmt_fecha(df["fecha_inicio"], "%Y-%m-%d", tipado=tipado)
+        return df
+
+    def iter_lotes_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera los lotes por bloques usando un cursor del lado del servidor"""
+        yield from self._projection_rows(self._lotes_stmt(filtros), self._transform_lotes)
+
+    def get_lotes_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """Obtener DataFrame de lotes bien formateado"""
+        try:
+            return self._projection_dataframe(self._lotes_stmt(filtros), self._transform_lotes)
         except Exception as e:
             logger.error(f"Error obteniendo lotes: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener lotes: {str(e)}"]})
@@ -150,53 +277,65 @@ class DataframeFetchers:
     # Diagnósticos  ← CORREGIDO + filtrado por rol
     # ------------------------------------------------------------------
 
-    def get_diagnosticos_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de diagnósticos bien formateado.
-
+    def _diagnosticos_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        """
         Reglas:
           - Admin / Coordinador : todos los diagnósticos.
           - Docente              : todos los diagnósticos de sus programas.
           - Estudiante           : únicamente sus propios diagnósticos.
         """
-        from app.db.models import Diagnostico
-
-        try:
-            query = self.db.query(Diagnostico).options(
-                joinedload(Diagnostico.usuario),
-                joinedload(Diagnostico.lote),
-                joinedload(Diagnostico.programa),
-                joinedload(Diagnostico.diagnostico_tipo),
+        from app.db.models import Diagnostico, DiagnosticoTipo, Lote, Programa, Usuario
+
+        stmt = (
+            select(
+                Diagnostico.id,
+                Diagnostico.tipo_diagnostico,
+                DiagnosticoTipo.nombre.label("subtipo"),
+                Diagnostico.condiciones_dia,
+                Lote.nombre.label("lote"),
+                Programa.nombre.label("programa"),
+                Usuario.nombre.label("usuario"),
+                Usuario.email.label("email_usuario"),
+                Diagnostico.estado_revision,
+                Diagnostico.fecha_creacion,
             )
+            .outerjoin(DiagnosticoTipo, DiagnosticoTipo.id == Diagnostico.diagnostico_tipo_id)
+            .outerjoin(Lote, Lote.id == Diagnostico.lote_id)
+            .outerjoin(Programa, Programa.id == Diagnostico.programa_id)
+            .outerjoin(Usuario, Usuario.id == Diagnostico.usuario_id)
+        )
 
-            if self._is_estudiante():
-                # Solo sus propios diagnósticos (filtro directo, sin JOIN)
-                query = query.filter(Diagnostico.usuario_id == self.usuario.id)
-            else:
-                # Docente / admin: subconsulta por programas asignados
-                program_ids = self._get_program_ids()
-                if program_ids is not None:
-                    # programa_id es columna directa — no hay conflicto con joinedload
-                    query = query.filter(Diagnostico.programa_id.in_(program_ids))
-
-            diagnosticos = query.all()
-
-            data = []
-            for d in diagnosticos:
-                data.append({
-                    "id": d.id,
-                    "tipo_diagnostico": d.tipo_diagnostico,
-                    "subtipo": d.diagnostico_tipo.nombre if d.diagnostico_tipo else "",
-                    "condiciones_dia": d.condiciones_dia,
-                    "lote": d.lote.nombre if d.lote else "",
-                    "programa": d.programa.nombre if d.programa else "",
-                    "usuario": d.usuario.nombre if d.usuario else "",
-                    "email_usuario": d.usuario.email if d.usuario else "",
-                    "estado_revision": d.estado_revision,
-                    "fecha_creacion": d.fecha_creacion.strftime("%Y-%m-%d %H:%M") if d.fecha_creacion else "",
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+        if self._is_estudiante():
+            # Solo sus propios diagnósticos
+            stmt = stmt.where(Diagnostico.usuario_id == self.usuario.id)
+        else:
+            program_ids = self._get_program_ids()
+            if program_ids is not None:
+                stmt = stmt.where(Diagnostico.programa_id.in_(program_ids))
+        return self._aplicar_filtros(stmt, filtros, {
+            "lote_id": Diagnostico.lote_id,
+            "granja_id": Lote.granja_id,
+            "programa_id": Diagnostico.programa_id,
+            "estado": Diagnostico.estado_revision,
+            "tipo": Diagnostico.tipo_diagnostico,
+            "fecha": Diagnostico.fecha_creacion,
+        })
+
+    @classmethod
+    def _transform_diagnosticos(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        texto = ["subtipo", "lote", "programa", "usuario", "email_usuario"]
+        df[texto] = df[texto].fillna("")
+        df["fecha_creacion"] = cls._fmt_fecha(df["fecha_creacion"], tipado=tipado)
+        return df
+
+    def iter_diagnosticos_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera los diagnósticos por bloques (ver _diagnosticos_stmt)"""
+        yield from self._projection_rows(self._diagnosticos_stmt(filtros), self._transform_diagnosticos)
+
+    def get_diagnosticos_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """Obtener DataFrame de diagnósticos bien formateado (ver _diagnosticos_stmt)"""
+        try:
+            return self._projection_dataframe(self._diagnosticos_stmt(filtros), self._transform_diagnosticos)
         except Exception as e:
             logger.error(f"Error obteniendo diagnósticos: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener diagnósticos: {str(e)}"]})
@@ -205,74 +344,87 @@ class DataframeFetchers:
     # Recomendaciones  ← CORREGIDO + filtrado por rol
     # ------------------------------------------------------------------
 
-    def get_recomendaciones_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de recomendaciones bien formateado.
-
+    def _recomendaciones_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        """
         Reglas:
           - Admin / Coordinador : todas las recomendaciones.
           - Docente              : solo las recomendaciones que él mismo creó.
           - Estudiante           : solo las recomendaciones vinculadas a sus
                                    propios diagnósticos.
         """
-        from app.db.models import Recomendacion, Lote, Diagnostico
+        from app.db.models import Recomendacion, Lote, Programa, Diagnostico, Usuario, Labor
 
-        try:
-            query = self.db.query(Recomendacion).options(
-                joinedload(Recomendacion.docente),
-                joinedload(Recomendacion.lote).joinedload(Lote.programa),
-                joinedload(Recomendacion.diagnostico),
-                joinedload(Recomendacion.labores),
+        labores = (
+            select(
+                Labor.recomendacion_id.label("fk"),
+                func.count().label("labores_totales"),
+                func.count(case((Labor.estado == "completada", 1))).label("labores_completadas"),
+            )
+            .group_by(Labor.recomendacion_id)
+            .subquery()
+        )
+        stmt = (
+            select(
+                Recomendacion.id,
+                Recomendacion.titulo,
+                Recomendacion.descripcion,
+                Recomendacion.tipo,
+                Recomendacion.estado,
+                Usuario.nombre.label("docente"),
+                Usuario.email.label("email_docente"),
+                Lote.nombre.label("lote"),
+                Programa.nombre.label("programa"),
+                Diagnostico.tipo_diagnostico.label("diagnostico"),
+                Recomendacion.fecha_creacion,
+                Recomendacion.fecha_aprobacion,
+                func.coalesce(labores.c.labores_totales, 0).label("labores_totales"),
+                func.coalesce(labores.c.labores_completadas, 0).label("labores_completadas"),
             )
+            .outerjoin(Usuario, Usuario.id == Recomendacion.docente_id)
+            .outerjoin(Lote, Lote.id == Recomendacion.lote_id)
+            .outerjoin(Programa, Programa.id == Lote.programa_id)
+            .outerjoin(Diagnostico, Diagnostico.id == Recomendacion.diagnostico_id)
+            .outerjoin(labores, labores.c.fk == Recomendacion.id)
+        )
 
-            if self._is_estudiante():
-                # Subconsulta: IDs de diagnósticos propios del estudiante
-                diag_ids = (
-                    self.db.query(Diagnostico.id)
-                    .filter(Diagnostico.usuario_id == self.usuario.id)
-                    .subquery()
-                )
-                query = query.filter(Recomendacion.diagnostico_id.in_(diag_ids))
-            elif self._is_docente():
-                # Solo las recomendaciones que él mismo creó (filtro directo, sin JOIN)
-                query = query.filter(Recomendacion.docente_id == self.usuario.id)
-            else:
-                # Admin: subconsulta por lotes de sus programas
-                program_ids = self._get_program_ids()
-                if program_ids is not None:
-                    lotes_ids = (
-                        self.db.query(Lote.id)
-                        .filter(Lote.programa_id.in_(program_ids))
-                        .subquery()
-                    )
-                    query = query.filter(Recomendacion.lote_id.in_(lotes_ids))
-
-            recomendaciones = query.all()
-
-            data = []
-            for r in recomendaciones:
-                labores_count = len(r.labores)
-                labores_completadas = sum(1 for l in r.labores if l.estado == "completada")
-
-                data.append({
-                    "id": r.id,
-                    "titulo": r.titulo,
-                    "descripcion": r.descripcion or "",
-                    "tipo": r.tipo or "",
-                    "estado": r.estado,
-                    "docente": r.docente.nombre if r.docente else "",
-                    "email_docente": r.docente.email if r.docente else "",
-                    "lote": r.lote.nombre if r.lote else "",
-                    "programa": r.lote.programa.nombre if (r.lote and r.lote.programa) else "",
-                    "diagnostico": r.diagnostico.tipo_diagnostico if r.diagnostico else "",
-                    "fecha_creacion": r.fecha_creacion.strftime("%Y-%m-%d %H:%M") if r.fecha_creacion else "",
-                    "fecha_aprobacion": r.fecha_aprobacion.strftime("%Y-%m-%d %H:%M") if r.fecha_aprobacion else "",
-                    "labores_totales": labores_count,
-                    "labores_completadas": labores_completadas,
-                    "porcentaje_avance": f"{(labores_completadas / labores_count * 100):.1f}%" if labores_count > 0 else "0%",
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+        if self._is_estudiante():
+            # Recomendaciones de los diagnósticos propios del estudiante
+            stmt = stmt.where(Diagnostico.usuario_id == self.usuario.id)
+        elif self._is_docente():
+            # Solo las recomendaciones que él mismo creó
+            stmt = stmt.where(Recomendacion.docente_id == self.usuario.id)
+        else:
+            program_ids = self._get_program_ids()
+            if program_ids is not None:
+                stmt = stmt.where(Lote.programa_id.in_(program_ids))
+        return self._aplicar_filtros(stmt, filtros, {
+            "lote_id": Recomendacion.lote_id,
+            "granja_id": Lote.granja_id,
+            "programa_id": Lote.programa_id,
+            "estado": Recomendacion.estado,
+            "tipo": Recomendacion.tipo,
+            "fecha": Recomendacion.fecha_creacion,
+        })
+
+    @classmethod
+    def _transform_recomendaciones(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        texto = ["descripcion", "tipo", "docente", "email_docente", "lote", "programa", "diagnostico"]
+        df[texto] = df[texto].fillna("")
+        df["fecha_creacion"] = cls._fmt_fecha(df["fecha_creacion"], tipado=tipado)
+        df["fecha_aprobacion"] = cls._fmt_fecha(df["fecha_aprobacion"], tipado=tipado)
+        df["porcentaje_avance"] = cls._fmt_porcentaje(df["labores_completadas"], df["labores_totales"], tipado=tipado)
+        if not tipado:
+            df.loc[df["labores_totales"] == 0, "porcentaje_avance"] = "0%"
+        return df
+
+    def iter_recomendaciones_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera las recomendaciones por bloques (ver _recomendaciones_stmt)"""
+        yield from self._projection_rows(self._recomendaciones_stmt(filtros), self._transform_recomendaciones)
+
+    def get_recomendaciones_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """Obtener DataFrame de recomendaciones bien formateado (ver _recomendaciones_stmt)"""
+        try:
+            return self._projection_dataframe(self._recomendaciones_stmt(filtros), self._transform_recomendaciones)
         except Exception as e:
             logger.error(f"Error obteniendo recomendaciones: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener recomendaciones: {str(e)}"]})
@@ -281,63 +433,77 @@ class DataframeFetchers:
     # Labores  ← CORREGIDO + filtrado por rol/programa
     # ------------------------------------------------------------------
 
-    def get_labores_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de labores bien formateado.
-
+    def _labores_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        """
         Reglas:
           - Admin / Coordinador : todas las labores.
           - Docente / resto      : solo labores de sus programas asignados.
         """
-        from app.db.models import Labor, Lote
-
-        try:
-            query = self.db.query(Labor).options(
-                joinedload(Labor.trabajador),
-                joinedload(Labor.recomendacion),
-                joinedload(Labor.lote).joinedload(Lote.programa),
-                joinedload(Labor.productos),
+        from app.db.models import Labor, Lote, Programa, Recomendacion, Usuario, ProductoLabor
+
+        productos = self._conteo_por(ProductoLabor.labor_id, "productos_utilizados")
+        stmt = (
+            select(
+                Labor.id,
+                Labor.comentario.label("descripcion"),
+                Labor.tipo_labor_id,
+                Labor.estado,
+                Labor.avance_porcentaje,
+                Usuario.nombre.label("trabajador"),
+                Usuario.email.label("email_trabajador"),
+                Recomendacion.titulo.label("recomendacion"),
+                Lote.nombre.label("lote"),
+                Programa.nombre.label("programa"),
+                Labor.fecha_asignacion,
+                Labor.fecha_finalizacion,
+                func.coalesce(productos.c.productos_utilizados, 0).label("productos_utilizados"),
             )
+            .outerjoin(Usuario, Usuario.id == Labor.trabajador_id)
+            .outerjoin(Recomendacion, Recomendacion.id == Labor.recomendacion_id)
+            .outerjoin(Lote, Lote.id == Labor.lote_id)
+            .outerjoin(Programa, Programa.id == Lote.programa_id)
+            .outerjoin(productos, productos.c.fk == Labor.id)
+        )
 
-            program_ids = self._get_program_ids()
-            if program_ids is not None:
-                # Subconsulta para evitar conflicto con el joinedload de lote
-                lotes_del_programa = (
-                    self.db.query(Lote.id)
-                    .filter(Lote.programa_id.in_(program_ids))
-                    .subquery()
-                )
-                query = query.filter(Labor.lote_id.in_(lotes_del_programa))
-
-            labores = query.all()
-
-            data = []
-            for l in labores:
-                productos_count = len(l.productos) if l.productos else 0
-
-                duracion = ""
-                if l.fecha_asignacion and l.fecha_finalizacion:
-                    duracion_dias = (l.fecha_finalizacion - l.fecha_asignacion).days
-                    duracion = f"{duracion_dias} días"
-
-                data.append({
-                    "id": l.id,
-                    "descripcion": l.comentario or "Sin descripción",
-                    "tipo_labor_id": l.tipo_labor_id or "",
-                    "estado": l.estado,
-                    "avance_porcentaje": l.avance_porcentaje,
-                    "trabajador": l.trabajador.nombre if l.trabajador else "",
-                    "email_trabajador": l.trabajador.email if l.trabajador else "",
-                    "recomendacion": l.recomendacion.titulo if l.recomendacion else "",
-                    "lote": l.lote.nombre if l.lote else "",
-                    "programa": l.lote.programa.nombre if (l.lote and l.lote.programa) else "",
-                    "fecha_asignacion": l.fecha_asignacion.strftime("%Y-%m-%d %H:%M") if l.fecha_asignacion else "",
-                    "fecha_finalizacion": l.fecha_finalizacion.strftime("%Y-%m-%d %H:%M") if l.fecha_finalizacion else "",
-                    "productos_utilizados": productos_count,
-                    "duracion": duracion,
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+        program_ids = self._get_program_ids()
+        if program_ids is not None:
+            stmt = stmt.where(Lote.programa_id.in_(program_ids))
+        return self._aplicar_filtros(stmt, filtros, {
+            "lote_id": Labor.lote_id,
+            "granja_id": Lote.granja_id,
+            "programa_id": Lote.programa_id,
+            "estado": Labor.estado,
+            "fecha": Labor.fecha_asignacion,
+        })
+
+    @classmethod
+    def _transform_labores(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        texto = ["trabajador", "email_trabajador", "recomendacion", "lote", "programa"]
+        df[texto] = df[texto].fillna("")
+        df["descripcion"] = df["descripcion"].fillna("").replace("", "Sin descripción")
+        asignacion = pd.to_datetime(df["fecha_asignacion"])
+        finalizacion = pd.to_datetime(df["fecha_finalizacion"])
+        dias = (finalizacion - asignacion).dt.days
+
+        if tipado:
+            df["tipo_labor_id"] = df["tipo_labor_id"].astype("Int64")
+            df["duracion"] = dias.astype("Int64")
+        else:
+            df["tipo_labor_id"] = df["tipo_labor_id"].astype("Int64").astype(object).where(df["tipo_labor_id"].notna(), "")
+            df["duracion"] = (dias.astype("Int64").astype(str) + " días").where(dias.notna(), "")
+
+        df["fecha_asignacion"] = cls._fmt_fecha(asignacion, tipado=tipado)
+        df["fecha_finalizacion"] = cls._fmt_fecha(finalizacion, tipado=tipado)
+        return df
+
+    def iter_labores_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera las labores por bloques (ver _labores_stmt)"""
+        yield from self._projection_rows(self._labores_stmt(filtros), self._transform_labores)
+
+    def get_labores_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """Obtener DataFrame de labores bien formateado (ver _labores_stmt)"""
+        try:
+            return self._projection_dataframe(self._labores_stmt(filtros), self._transform_labores)
         except Exception as e:
             logger.error(f"Error obteniendo labores: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener labores: {str(e)}"]})
@@ -346,42 +512,62 @@ class DataframeFetchers:
     # Usuarios
     # ------------------------------------------------------------------
 
-    def get_usuarios_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de usuarios bien formateado"""
-        from app.db.models import Usuario, usuario_programa
-
-        try:
-            program_ids = self._get_program_ids()
+    def _usuarios_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        from app.db.models import Usuario, Rol, Labor, usuario_programa, usuario_granja
+
+        labores = self._conteo_por(Labor.trabajador_id, "labores_asignadas")
+        stmt = (
+            select(
+                Usuario.id,
+                Usuario.nombre,
+                Usuario.email,
+                Rol.nombre.label("rol"),
+                Usuario.activo,
+                Usuario.fecha_creacion.label("fecha_registro"),
+                func.coalesce(labores.c.labores_asignadas, 0).label("labores_asignadas"),
+                Usuario.auth_provider.label("proveedor_autenticacion"),
+            )
+            .outerjoin(Rol, Rol.id == Usuario.rol_id)
+            .outerjoin(labores, labores.c.fk == Usuario.id)
+        )
 
-            if program_ids is not None:
-                query = (
-                    self.db.query(Usuario)
-                    .options(joinedload(Usuario.rol))
-                    .join(usuario_programa, Usuario.id == usuario_programa.c.usuario_id)
-                    .filter(usuario_programa.c.programa_id.in_(program_ids))
-                    .distinct()
+        program_ids = self._get_program_ids()
+        if program_ids is not None:
+            # Semijoin en lugar de JOIN + DISTINCT sobre la tabla pivote
+            stmt = stmt.where(
+                Usuario.id.in_(
+                    select(usuario_programa.c.usuario_id)
+                    .where(usuario_programa.c.programa_id.in_(program_ids))
                 )
-            else:
-                query = self.db.query(Usuario).options(joinedload(Usuario.rol))
-
-            usuarios = query.all()
-
-            data = []
-            for u in usuarios:
-                labores_count = len(u.labores_asignadas) if hasattr(u, "labores_asignadas") else 0
-                data.append({
-                    "id": u.id,
-                    "nombre": u.nombre,
-                    "email": u.email,
-                    "rol": u.rol.nombre if u.rol else "",
-                    "estado": "Activo" if u.activo else "Inactivo",
-                    "fecha_registro": u.fecha_creacion.strftime("%Y-%m-%d %H:%M") if u.fecha_creacion else "",
-                    "labores_asignadas": labores_count,
-                    "proveedor_autenticacion": u.auth_provider or "Sistema",
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+            )
+        return self._aplicar_filtros(stmt, filtros, {
+            "rol": Rol.nombre,
+            "activo": Usuario.activo,
+            "programa_id": lambda programa_id: Usuario.id.in_(
+                select(usuario_programa.c.usuario_id).where(usuario_programa.c.programa_id == programa_id)
+            ),
+            "granja_id": lambda granja_id: Usuario.id.in_(
+                select(usuario_granja.c.usuario_id).where(usuario_granja.c.granja_id == granja_id)
+            ),
+            "fecha": Usuario.fecha_creacion,
+        })
+
+    @classmethod
+    def _transform_usuarios(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        df["rol"] = df["rol"].fillna("")
+        df["estado"] = df["activo"].map({True: "Activo"}).fillna("Inactivo")
+        df["fecha_registro"] = cls._fmt_fecha(df["fecha_registro"], tipado=tipado)
+        df["proveedor_autenticacion"] = df["proveedor_autenticacion"].fillna("").replace("", "Sistema")
+        return df[["id", "nombre", "email", "rol", "estado", "fecha_registro", "labores_asignadas", "proveedor_autenticacion"]]
+
+    def iter_usuarios_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera los usuarios por bloques usando un cursor del lado del servidor"""
+        yield from self._projection_rows(self._usuarios_stmt(filtros), self._transform_usuarios)
+
+    def get_usuarios_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """Obtener DataFrame de usuarios bien formateado"""
+        try:
+            return self._projection_dataframe(self._usuarios_stmt(filtros), self._transform_usuarios)
         except Exception as e:
             logger.error(f"Error obteniendo usuarios: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener usuarios: {str(e)}"]})
@@ -390,40 +576,48 @@ class DataframeFetchers:
     # Insumos
     # ------------------------------------------------------------------
 
-    def get_insumos_dataframe(self) -> pd.DataFrame:
+    def _insumos_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        from app.db.models import Insumo, Programa
+
+        stmt = (
+            select(
+                Insumo.id,
+                Insumo.nombre,
+                Insumo.descripcion,
+                Programa.nombre.label("programa"),
+                Insumo.cantidad_total,
+                Insumo.cantidad_disponible,
+                Insumo.unidad_medida,
+                Insumo.nivel_alerta,
+                Insumo.estado,
+            )
+            .outerjoin(Programa, Programa.id == Insumo.programa_id)
+        )
+
+        program_ids = self._get_program_ids()
+        if program_ids is not None:
+            stmt = stmt.where(Insumo.programa_id.in_(program_ids))
+        return self._aplicar_filtros(stmt, filtros, {
+            "programa_id": Insumo.programa_id,
+            "estado": Insumo.estado,
+        })
+
+    @classmethod
+    def _transform_insumos(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        df[["descripcion", "programa", "unidad_medida"]] = df[["descripcion", "programa", "unidad_medida"]].fillna("")
+        df["porcentaje_disponible"] = cls._fmt_porcentaje(df["cantidad_disponible"], df["cantidad_total"], tipado=tipado)
+        suficiente = df["cantidad_disponible"] > df["nivel_alerta"]
+        df["disponibilidad"] = suficiente.map({True: "Suficiente", False: "Bajo stock"})
+        return df
+
+    def iter_insumos_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera los insumos por bloques usando un cursor del lado del servidor"""
+        yield from self._projection_rows(self._insumos_stmt(filtros), self._transform_insumos)
+
+    def get_insumos_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
         """Obtener DataFrame de insumos bien formateado"""
         try:
-            from app.db.models import Insumo
-            query = self.db.query(Insumo).options(joinedload(Insumo.programa))
-
-            program_ids = self._get_program_ids()
-            if program_ids is not None:
-                query = query.filter(Insumo.programa_id.in_(program_ids))
-
-            insumos = query.all()
-
-            data = []
-            for i in insumos:
-                porcentaje = 0
-                if i.cantidad_total and i.cantidad_total > 0:
-                    porcentaje = (i.cantidad_disponible / i.cantidad_total) * 100
-
-                data.append({
-                    "id": i.id,
-                    "nombre": i.nombre,
-                    "descripcion": i.descripcion or "",
-                    "programa": i.programa.nombre if i.programa else "",
-                    "cantidad_total": i.cantidad_total,
-                    "cantidad_disponible": i.cantidad_disponible,
-                    "unidad_medida": i.unidad_medida or "",
-                    "nivel_alerta": i.nivel_alerta,
-                    "estado": i.estado,
-                    "porcentaje_disponible": f"{porcentaje:.1f}%",
-                    "disponibilidad": "Suficiente" if i.cantidad_disponible > i.nivel_alerta else "Bajo stock",
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+            return self._projection_dataframe(self._insumos_stmt(filtros), self._transform_insumos)
         except Exception as e:
             logger.error(f"Error obteniendo insumos: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener insumos: {str(e)}"]})
@@ -432,34 +626,39 @@ class DataframeFetchers:
     # Herramientas
     # ------------------------------------------------------------------
 
-    def get_herramientas_dataframe(self) -> pd.DataFrame:
+    def _herramientas_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        from app.db.models import Herramienta, CategoriaHerramienta
+
+        stmt = (
+            select(
+                Herramienta.id,
+                Herramienta.nombre,
+                Herramienta.descripcion,
+                CategoriaHerramienta.nombre.label("categoria"),
+                Herramienta.cantidad_total,
+                Herramienta.cantidad_disponible,
+                Herramienta.estado,
+            )
+            .outerjoin(CategoriaHerramienta, CategoriaHerramienta.id == Herramienta.categoria_id)
+        )
+        return self._aplicar_filtros(stmt, filtros, {"estado": Herramienta.estado})
+
+    @classmethod
+    def _transform_herramientas(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        df[["descripcion", "categoria"]] = df[["descripcion", "categoria"]].fillna("")
+        df["porcentaje_disponible"] = cls._fmt_porcentaje(df["cantidad_disponible"], df["cantidad_total"], tipado=tipado)
+        disponible = df["cantidad_disponible"] > 0
+        df["disponibilidad"] = disponible.map({True: "Disponible", False: "No disponible"})
+        return df
+
+    def iter_herramientas_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera las herramientas por bloques usando un cursor del lado del servidor"""
+        yield from self._projection_rows(self._herramientas_stmt(filtros), self._transform_herramientas)
+
+    def get_herramientas_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
         """Obtener DataFrame de herramientas bien formateado"""
         try:
-            from app.db.models import Herramienta
-            query = self.db.query(Herramienta).options(joinedload(Herramienta.categoria))
-
-            herramientas = query.all()
-
-            data = []
-            for h in herramientas:
-                porcentaje = 0
-                if h.cantidad_total and h.cantidad_total > 0:
-                    porcentaje = (h.cantidad_disponible / h.cantidad_total) * 100
-
-                data.append({
-                    "id": h.id,
-                    "nombre": h.nombre,
-                    "descripcion": h.descripcion or "",
-                    "categoria": h.categoria.nombre if h.categoria else "",
-                    "cantidad_total": h.cantidad_total,
-                    "cantidad_disponible": h.cantidad_disponible,
-                    "estado": h.estado,
-                    "porcentaje_disponible": f"{porcentaje:.1f}%",
-                    "disponibilidad": "Disponible" if h.cantidad_disponible > 0 else "No disponible",
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+            return self._projection_dataframe(self._herramientas_stmt(filtros), self._transform_herramientas)
         except Exception as e:
             logger.error(f"Error obteniendo herramientas: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener herramientas: {str(e)}"]})
@@ -468,35 +667,54 @@ class DataframeFetchers:
     # Programas
     # ------------------------------------------------------------------
 
-    def get_programas_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de programas bien formateado"""
-        from app.db.models import Programa
+    def _programas_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        from app.db.models import Programa, Lote, GranjaPrograma, usuario_programa
+
+        lotes = self._conteo_por(Lote.programa_id, "cantidad_lotes")
+        usuarios = self._conteo_por(usuario_programa.c.programa_id, "cantidad_usuarios")
+        stmt = (
+            select(
+                Programa.id,
+                Programa.nombre,
+                Programa.descripcion,
+                Programa.tipo,
+                Programa.activo,
+                Programa.fecha_creacion,
+                func.coalesce(lotes.c.cantidad_lotes, 0).label("cantidad_lotes"),
+                func.coalesce(usuarios.c.cantidad_usuarios, 0).label("cantidad_usuarios"),
+            )
+            .outerjoin(lotes, lotes.c.fk == Programa.id)
+            .outerjoin(usuarios, usuarios.c.fk == Programa.id)
+        )
 
+        program_ids = self._get_program_ids()
+        if program_ids is not None:
+            stmt = stmt.where(Programa.id.in_(program_ids))
+        return self._aplicar_filtros(stmt, filtros, {
+            "programa_id": Programa.id,
+            "granja_id": lambda granja_id: Programa.id.in_(
+                select(GranjaPrograma.programa_id).where(GranjaPrograma.granja_id == granja_id)
+            ),
+            "tipo": Programa.tipo,
+            "activo": Programa.activo,
+            "fecha": Programa.fecha_creacion,
+        })
+
+    @classmethod
+    def _transform_programas(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        df["descripcion"] = df["descripcion"].fillna("")
+        df["estado"] = df["activo"].map({True: "Activo"}).fillna("Inactivo")
+        df["fecha_creacion"] = cls._fmt_fecha(df["fecha_creacion"], tipado=tipado)
+        return df[["id", "nombre", "descripcion", "tipo", "estado", "fecha_creacion", "cantidad_lotes", "cantidad_usuarios"]]
+
+    def iter_programas_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera los programas por bloques usando un cursor del lado del servidor"""
+        yield from self._projection_rows(self._programas_stmt(filtros), self._transform_programas)
+
+    def get_programas_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """Obtener DataFrame de programas bien formateado"""
         try:
-            query = self.db.query(Programa)
-
-            program_ids = self._get_program_ids()
-            if program_ids is not None:
-                query = query.filter(Programa.id.in_(program_ids))
-
-            programas = query.all()
-
-            data = []
-            for p in programas:
-                lotes_count = len(p.lotes) if hasattr(p, "lotes") else 0
-                data.append({
-                    "id": p.id,
-                    "nombre": p.nombre,
-                    "descripcion": p.descripcion or "",
-                    "tipo": p.tipo,
-                    "estado": "Activo" if p.activo else "Inactivo",
-                    "fecha_creacion": p.fecha_creacion.strftime("%Y-%m-%d %H:%M") if p.fecha_creacion else "",
-                    "cantidad_lotes": lotes_count,
-                    "cantidad_usuarios": len(p.usuarios) if hasattr(p, "usuarios") else 0,
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+            return self._projection_dataframe(self._programas_stmt(filtros), self._transform_programas)
         except Exception as e:
             logger.error(f"Error obteniendo programas: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener programas: {str(e)}"]})
@@ -505,28 +723,39 @@ class DataframeFetchers:
     # Cultivos  ← CORREGIDO (elimina fecha_inicio y duracion_dias)
     # ------------------------------------------------------------------
 
-    def get_cultivos_dataframe(self) -> pd.DataFrame:
+    def _cultivos_stmt(self, filtros: Optional[FiltrosExportacion] = None):
+        from app.db.models import CultivoEspecie, Granja
+
+        stmt = (
+            select(
+                CultivoEspecie.id,
+                CultivoEspecie.nombre,
+                CultivoEspecie.tipo,
+                CultivoEspecie.descripcion,
+                Granja.nombre.label("granja"),
+                CultivoEspecie.estado,
+            )
+            .outerjoin(Granja, Granja.id == CultivoEspecie.granja_id)
+        )
+        return self._aplicar_filtros(stmt, filtros, {
+            "granja_id": CultivoEspecie.granja_id,
+            "tipo": CultivoEspecie.tipo,
+            "estado": CultivoEspecie.estado,
+        })
+
+    @classmethod
+    def _transform_cultivos(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        df[["descripcion", "granja"]] = df[["descripcion", "granja"]].fillna("")
+        return df
+
+    def iter_cultivos_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera los cultivos por bloques usando un cursor del lado del servidor"""
+        yield from self._projection_rows(self._cultivos_stmt(filtros), self._transform_cultivos)
+
+    def get_cultivos_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
         """Obtener DataFrame de cultivos bien formateado"""
-        from app.db.models import CultivoEspecie
-
         try:
-            cultivos = self.db.query(CultivoEspecie).options(
-                joinedload(CultivoEspecie.granja)
-            ).all()
-
-            data = []
-            for c in cultivos:
-                data.append({
-                    "id": c.id,
-                    "nombre": c.nombre,
-                    "tipo": c.tipo,
-                    "descripcion": c.descripcion or "",
-                    "granja": c.granja.nombre if c.granja else "",
-                    "estado": c.estado,
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+            return self._projection_dataframe(self._cultivos_stmt(filtros), self._transform_cultivos)
         except Exception as e:
             logger.error(f"Error obteniendo cultivos: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener cultivos: {str(e)}"]})
@@ -535,43 +764,44 @@ class DataframeFetchers:
     # Plantas
     # ------------------------------------------------------------------
 
-    def get_plantas_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de plantas bien formateado"""
+    def _plantas_stmt(self, filtros: Optional[FiltrosExportacion] = None):
         from app.db.models import Planta, Lote
 
-        try:
-            query = (
-                self.db.query(
-                    Planta.id,
-                    Planta.codigo,
-                    Planta.surco,
-                    Planta.numero,
-                    Planta.estado,
-                    Lote.nombre.label("lote_nombre"),
-                    Lote.programa_id.label("programa_id"),
-                )
-                .outerjoin(Lote, Planta.lote_id == Lote.id)
+        stmt = (
+            select(
+                Planta.id,
+                Planta.codigo,
+                Planta.surco,
+                Planta.numero,
+                Planta.estado,
+                Lote.nombre.label("lote"),
             )
+            .outerjoin(Lote, Planta.lote_id == Lote.id)
+        )
 
-            program_ids = self._get_program_ids()
-            if program_ids is not None:
-                query = query.filter(Lote.programa_id.in_(program_ids))
-
-            plantas_data = query.all()
-
-            data = []
-            for p in plantas_data:
-                data.append({
-                    "id": p.id,
-                    "codigo": p.codigo,
-                    "surco": p.surco,
-                    "numero": p.numero,
-                    "estado": p.estado,
-                    "lote": p.lote_nombre or "",
-                })
-
-            df = pd.DataFrame(data)
-            return self._format_dataframe(df)
+        program_ids = self._get_program_ids()
+        if program_ids is not None:
+            stmt = stmt.where(Lote.programa_id.in_(program_ids))
+        return self._aplicar_filtros(stmt, filtros, {
+            "lote_id": Planta.lote_id,
+            "granja_id": Lote.granja_id,
+            "programa_id": Lote.programa_id,
+            "estado": Planta.estado,
+        })
+
+    @classmethod
+    def _transform_plantas(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        df["lote"] = df["lote"].fillna("")
+        return df
+
+    def iter_plantas_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera las plantas por bloques usando un cursor del lado del servidor"""
+        yield from self._projection_rows(self._plantas_stmt(filtros), self._transform_plantas)
+
+    def get_plantas_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """Obtener DataFrame de plantas bien formateado"""
+        try:
+            return self._projection_dataframe(self._plantas_stmt(filtros), self._transform_plantas)
         except Exception as e:
             logger.error(f"Error obteniendo plantas: {str(e)}")
             return pd.DataFrame({"Error": [f"No se pudieron obtener plantas: {str(e)}"]})
@@ -580,65 +810,233 @@ class DataframeFetchers:
     # Movimientos
     # ------------------------------------------------------------------
 
-    def get_movimientos_dataframe(self) -> pd.DataFrame:
+    def _movimientos_stmts(self, filtros: Optional[FiltrosExportacion] = None):
+        """Un SELECT para insumos y otro para herramientas (columnas distintas)"""
+        from app.db.models import (
+            MovimientoInsumo, MovimientoHerramienta, Insumo, Herramienta,
+            Labor, Recomendacion,
+        )
+
+        def base(mov, recurso_cols, tipo_recurso):
+            return (
+                select(
+                    literal(tipo_recurso).label("tipo_recurso"),
+                    mov.id.label("id_movimiento"),
+                    *recurso_cols,
+                    mov.cantidad,
+                    mov.tipo_movimiento,
+                    Labor.comentario.label("labor"),
+                    Recomendacion.titulo.label("recomendacion"),
+                    mov.fecha_movimiento,
+                    mov.observaciones,
+                )
+                .outerjoin(Labor, Labor.id == mov.labor_id)
+                .outerjoin(Recomendacion, Recomendacion.id == Labor.recomendacion_id)
+            )
+
+        insumos = base(
+            MovimientoInsumo,
+            [Insumo.nombre.label("recurso"), Insumo.unidad_medida.label("unidad")],
+            "INSUMO",
+        ).outerjoin(Insumo, Insumo.id == MovimientoInsumo.insumo_id)
+        herramientas = base(
+            MovimientoHerramienta,
+            [Herramienta.nombre.label("recurso")],
+            "HERRAMIENTA",
+        ).outerjoin(Herramienta, Herramienta.id == MovimientoHerramienta.herramienta_id)
+        return [
+            self._aplicar_filtros(insumos, filtros, {"lote_id": Labor.lote_id, "fecha": MovimientoInsumo.fecha_movimiento}),
+            self._aplicar_filtros(herramientas, filtros, {"lote_id": Labor.lote_id, "fecha": MovimientoHerramienta.fecha_movimiento}),
+        ]
+
+    @classmethod
+    def _transform_movimientos(cls, df: pd.DataFrame, tipado: bool = False) -> pd.DataFrame:
+        texto = [c for c in ("recurso", "unidad", "recomendacion", "observaciones") if c in df.columns]
+        df[texto] = df[texto].fillna("")
+        labor = df["labor"].fillna("")
+        df["labor"] = (labor.str.slice(0, 50) + "...").where(labor != "", "")
+        df["fecha_movimiento"] = cls._fmt_fecha(df["fecha_movimiento"], tipado=tipado)
+        return df
+
+    def iter_movimientos_rows(self, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Itera los movimientos de insumos y herramientas por bloques"""
+        try:
+            stmts = self._movimientos_stmts(filtros)
+        except ImportError:
+            return
+        for stmt in stmts:
+            yield from self._projection_rows(stmt, self._transform_movimientos)
+
+    def get_movimientos_dataframe(self, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
         """Obtener DataFrame de movimientos bien formateado"""
         try:
-            from app.db.models import MovimientoInsumo, MovimientoHerramienta, Labor
+            stmts = self._movimientos_stmts(filtros)
         except ImportError:
             return pd.DataFrame()
 
         try:
-            data = []
-
-            movimientos_insumos = self.db.query(MovimientoInsumo).options(
-                joinedload(MovimientoInsumo.insumo),
-                joinedload(MovimientoInsumo.labor).joinedload(Labor.recomendacion),
-            ).all()
-
-            for mov in movimientos_insumos:
-                data.append({
-                    "tipo_recurso": "INSUMO",
-                    "id_movimiento": mov.id,
-                    "recurso": mov.insumo.nombre if mov.insumo else "",
-                    "cantidad": mov.cantidad,
-                    "tipo_movimiento": mov.tipo_movimiento,
-                    "unidad": mov.insumo.unidad_medida if mov.insumo else "",
-                    "labor": (mov.labor.comentario[:50] + "...") if mov.labor and mov.labor.comentario else "",
-                    "recomendacion": mov.labor.recomendacion.titulo if mov.labor and mov.labor.recomendacion else "",
-                    "fecha_movimiento": mov.fecha_movimiento.strftime("%Y-%m-%d %H:%M") if mov.fecha_movimiento else "",
-                    "observaciones": mov.observaciones or "",
-                })
-
-            movimientos_herramientas = self.db.query(MovimientoHerramienta).options(
-                joinedload(MovimientoHerramienta.herramienta),
-                joinedload(MovimientoHerramienta.labor).joinedload(Labor.recomendacion),
-            ).all()
-
-            for mov in movimientos_herramientas:
-                data.append({
-                    "tipo_recurso": "HERRAMIENTA",
-                    "id_movimiento": mov.id,
-                    "recurso": mov.herramienta.nombre if mov.herramienta else "",
-                    "cantidad": mov.cantidad,
-                    "tipo_movimiento": mov.tipo_movimiento,
-                    "labor": (mov.labor.comentario[:50] + "...") if mov.labor and mov.labor.comentario else "",
-                    "recomendacion": mov.labor.recomendacion.titulo if mov.labor and mov.labor.recomendacion else "",
-                    "fecha_movimiento": mov.fecha_movimiento.strftime("%Y-%m-%d %H:%M") if mov.fecha_movimiento else "",
-                    "observaciones": mov.observaciones or "",
-                })
-
-            df = pd.DataFrame(data)
+            frames = [self._read_dataframe(stmt) for stmt in stmts]
+            frames = [self._transform_movimientos(df) for df in frames if not df.empty]
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
             return self._format_dataframe(df)
         except Exception as e:
             logger.error(f"Error obteniendo movimientos: {str(e)}")
             return pd.DataFrame()
 
+    # ------------------------------------------------------------------
+    # Acceso genérico por nombre de hoja (CSV / Parquet)
+    # ------------------------------------------------------------------
+
+    # Hojas definidas como _<hoja>_stmt + _transform_<hoja>
+    HOJAS_PROYECTADAS = (
+        "granjas", "lotes", "diagnosticos", "recomendaciones", "labores", "usuarios",
+        "insumos", "herramientas", "programas", "cultivos", "plantas",
+    )
+
+    def iter_rows(self, hoja: str, filtros: Optional[FiltrosExportacion] = None) -> Iterator[Dict[str, Any]]:
+        """Filas formateadas (como en el Excel) de cualquier hoja"""
+        if hoja == "resumen":
+            return iter(self.get_resumen_dataframe().to_dict("records"))
+        if hoja == "movimientos":
+            return self.iter_movimientos_rows(filtros)
+        if hoja not in self.HOJAS_PROYECTADAS:
+            raise ValueError(f"Hoja no soportada: {hoja}")
+        return getattr(self, f"iter_{hoja}_rows")(filtros)
+
+    def get_typed_dataframe(self, hoja: str, filtros: Optional[FiltrosExportacion] = None) -> pd.DataFrame:
+        """
+        DataFrame de una hoja con tipos reales (fechas, enteros, floats) en lugar
+        de texto preformateado, con los nombres de columna del Excel. A
+        diferencia de get_*_dataframe los errores se propagan; las hojas cuyo
+        modelo no existe retornan un DataFrame vacío.
+        """
+        if hoja == "resumen":
+            df = self.get_resumen_dataframe()
+            df["Valor"] = df["Valor"].astype(str)
+            return df
+
+        try:
+            if hoja == "movimientos":
+                stmts = self._movimientos_stmts(filtros)
+            elif hoja in self.HOJAS_PROYECTADAS:
+                stmts = [getattr(self, f"_{hoja}_stmt")(filtros)]
+            else:
+                raise ValueError(f"Hoja no soportada: {hoja}")
+        except ImportError:
+            return pd.DataFrame()
+
+        transform = getattr(self, f"_transform_{hoja}")
+        frames = [transform(self._read_dataframe(stmt), tipado=True) for stmt in stmts]
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+        pares = self.format_columns(df.columns)
+        df = df.rename(columns=dict(pares))
+        return df[[nombre for _, nombre in pares]]
+
+    # ------------------------------------------------------------------
+    # Exportación incremental (delta)
+    # ------------------------------------------------------------------
+
+    # Entidades del export incremental, en el orden en que se entregan
+    DELTA_ENTIDADES = (
+        "diagnosticos", "recomendaciones", "labores",
+        "plantas", "items_inventario", "diagnostico_tipos",
+    )
+
+    def _delta_stmts(self, since: Optional[datetime], hasta: datetime) -> Dict[str, Any]:
+        """
+        SELECT de cada entidad restringido a las filas creadas o modificadas en
+        (since, hasta]. Se reutilizan las proyecciones de las hojas (con su
+        alcance por rol) y se añade la marca de tiempo usada como watermark.
+        """
+        from app.db.models import (
+            Diagnostico, Recomendacion, Labor, Planta, Lote,
+            ItemInventarioPrograma, ProgramaInventarioTipo, DiagnosticoTipo,
+        )
+
+        def ventana(*columnas):
+            condiciones = []
+            for columna in columnas:
+                condicion = columna <= hasta
+                if since is not None:
+                    condicion = and_(columna > since, condicion)
+                condiciones.append(condicion)
+            return or_(*condiciones)
+
+        program_ids = self._get_program_ids()
+
+        items = (
+            select(
+                ItemInventarioPrograma.id,
+                ItemInventarioPrograma.tipo_id,
+                ProgramaInventarioTipo.nombre.label("tipo"),
+                ProgramaInventarioTipo.programa_id,
+                ItemInventarioPrograma.fecha_inventario,
+                ItemInventarioPrograma.cantidad_disponible,
+                ItemInventarioPrograma.unidad_medida,
+                ItemInventarioPrograma.observaciones,
+                ItemInventarioPrograma.updated_at,
+            )
+            .join(ProgramaInventarioTipo, ProgramaInventarioTipo.id == ItemInventarioPrograma.tipo_id)
+            .where(ventana(ItemInventarioPrograma.updated_at))
+        )
+        subtipos = (
+            select(
+                DiagnosticoTipo.id,
+                DiagnosticoTipo.programa_id,
+                DiagnosticoTipo.monitoreo_id,
+                DiagnosticoTipo.nombre,
+                DiagnosticoTipo.descripcion,
+                DiagnosticoTipo.orden,
+                DiagnosticoTipo.activo,
+                DiagnosticoTipo.patron_arvenses,
+                DiagnosticoTipo.updated_at,
+            )
+            .where(ventana(DiagnosticoTipo.updated_at))
+        )
+        if program_ids is not None:
+            items = items.where(ProgramaInventarioTipo.programa_id.in_(program_ids))
+            subtipos = subtipos.where(DiagnosticoTipo.programa_id.in_(program_ids))
+
+        # Labor no tiene fecha_creacion: se usa la asignación (valor por defecto
+        # al insertar) y la finalización, que es la modificación relevante.
+        return {
+            "diagnosticos": self._diagnosticos_stmt().add_columns(
+                Diagnostico.lote_id, Diagnostico.programa_id, Diagnostico.diagnostico_tipo_id,
+            ).where(ventana(Diagnostico.fecha_creacion)),
+            "recomendaciones": self._recomendaciones_stmt().add_columns(
+                Recomendacion.lote_id, Recomendacion.diagnostico_id,
+            ).where(ventana(Recomendacion.fecha_creacion, Recomendacion.fecha_aprobacion)),
+            "labores": self._labores_stmt().add_columns(
+                Labor.lote_id, Labor.recomendacion_id, Labor.trabajador_id,
+            ).where(ventana(Labor.fecha_asignacion, Labor.fecha_finalizacion)),
+            "plantas": self._plantas_stmt().add_columns(
+                Planta.lote_id, Planta.updated_at,
+            ).where(ventana(Planta.updated_at)),
+            "items_inventario": items,
+            "diagnostico_tipos": subtipos,
+        }
+
+    def get_delta_dataframes(
+        self, since: Optional[datetime], hasta: datetime, entidades: Optional[List[str]] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        DataFrames con los cambios de cada entidad en (since, hasta]. Las
+        columnas conservan nombres y tipos de la base de datos (sin formato de
+        hoja) para que puedan anexarse directamente a extracciones previas.
+        """
+        stmts = self._delta_stmts(since, hasta)
+        return {
+            entidad: self._read_dataframe(stmts[entidad])
+            for entidad in (entidades or self.DELTA_ENTIDADES)
+        }
+
     # ------------------------------------------------------------------
     # Resumen
     # ------------------------------------------------------------------
 
     def get_resumen_dataframe(self) -> pd.DataFrame:
-        """Obtener DataFrame de resumen bien formateado"""
+        """Obtener DataFrame de resumen bien formateado (todos los conteos en un SELECT)"""
         from app.db.models import (
             Granja, Lote, Diagnostico, Recomendacion,
             Labor, Usuario, Programa,
@@ -647,63 +1045,56 @@ class DataframeFetchers:
         try:
             program_ids = self._get_program_ids()
 
-            def count(model, extra_filter=None):
-                q = self.db.query(func.count(model.id))
-                if extra_filter is not None:
-                    q = q.filter(extra_filter)
-                return q.scalar() or 0
+            def count(model, *condiciones, join=None):
+                q = select(func.count(model.id))
+                if join is not None:
+                    q = q.join(*join)
+                if condiciones:
+                    q = q.where(*condiciones)
+                return q.scalar_subquery()
 
             if program_ids is None:
-                total_granjas = count(Granja)
                 total_lotes = count(Lote)
                 total_diagnosticos = count(Diagnostico)
                 total_recomendaciones = count(Recomendacion)
                 total_labores = count(Labor)
-                total_usuarios = count(Usuario)
                 total_programas = count(Programa)
             else:
-                total_granjas = count(Granja)
                 total_lotes = count(Lote, Lote.programa_id.in_(program_ids))
                 total_diagnosticos = count(Diagnostico, Diagnostico.programa_id.in_(program_ids))
-                total_recomendaciones = (
-                    self.db.query(func.count(Recomendacion.id))
-                    .join(Recomendacion.lote)
-                    .filter(Lote.programa_id.in_(program_ids))
-                    .scalar() or 0
+                total_recomendaciones = count(
+                    Recomendacion, Lote.programa_id.in_(program_ids),
+                    join=(Lote, Lote.id == Recomendacion.lote_id),
                 )
-                total_labores = (
-                    self.db.query(func.count(Labor.id))
-                    .join(Labor.lote)
-                    .filter(Lote.programa_id.in_(program_ids))
-                    .scalar() or 0
+                total_labores = count(
+                    Labor, Lote.programa_id.in_(program_ids),
+                    join=(Lote, Lote.id == Labor.lote_id),
                 )
-                total_usuarios = count(Usuario)
-                total_programas = len(program_ids)
-
-            labores_completadas = (
-                self.db.query(func.count(Labor.id))
-                .filter(Labor.estado == "completada")
-                .scalar() or 0
-            )
-            recomendaciones_aprobadas = (
-                self.db.query(func.count(Recomendacion.id))
-                .filter(Recomendacion.estado == "aprobada")
-                .scalar() or 0
-            )
-            usuarios_activos = (
-                self.db.query(func.count(Usuario.id))
-                .filter(Usuario.activo == True)
-                .scalar() or 0
-            )
+                total_programas = literal(len(program_ids))
+
+            totales = self.db.execute(
+                select(
+                    count(Granja).label("granjas"),
+                    total_lotes.label("lotes"),
+                    total_diagnosticos.label("diagnosticos"),
+                    total_recomendaciones.label("recomendaciones"),
+                    total_labores.label("labores"),
+                    count(Usuario).label("usuarios"),
+                    total_programas.label("programas"),
+                    count(Labor, Labor.estado == "completada").label("labores_completadas"),
+                    count(Recomendacion, Recomendacion.estado == "aprobada").label("recomendaciones_aprobadas"),
+                    count(Usuario, Usuario.activo == True).label("usuarios_activos"),
+                )
+            ).one()
 
             data = [
-                {"Métrica": "Total Granjas", "Valor": total_granjas, "Detalle": ""},
-                {"Métrica": "Total Lotes", "Valor": total_lotes, "Detalle": ""},
-                {"Métrica": "Total Diagnósticos", "Valor": total_diagnosticos, "Detalle": ""},
-                {"Métrica": "Total Recomendaciones", "Valor": total_recomendaciones, "Detalle": f"Aprobadas: {recomendaciones_aprobadas}"},
-                {"Métrica": "Total Labores", "Valor": total_labores, "Detalle": f"Completadas: {labores_completadas}"},
-                {"Métrica": "Total Usuarios", "Valor": total_usuarios, "Detalle": f"Activos: {usuarios_activos}"},
-                {"Métrica": "Total Programas", "Valor": total_programas, "Detalle": ""},
+                {"Métrica": "Total Granjas", "Valor": totales.granjas or 0, "Detalle": ""},
+                {"Métrica": "Total Lotes", "Valor": totales.lotes or 0, "Detalle": ""},
+                {"Métrica": "Total Diagnósticos", "Valor": totales.diagnosticos or 0, "Detalle": ""},
+                {"Métrica": "Total Recomendaciones", "Valor": totales.recomendaciones or 0, "Detalle": f"Aprobadas: {totales.recomendaciones_aprobadas or 0}"},
+                {"Métrica": "Total Labores", "Valor": totales.labores or 0, "Detalle": f"Completadas: {totales.labores_completadas or 0}"},
+                {"Métrica": "Total Usuarios", "Valor": totales.usuarios or 0, "Detalle": f"Activos: {totales.usuarios_activos or 0}"},
+                {"Métrica": "Total Programas", "Valor": totales.programas or 0, "Detalle": ""},
                 {
                     "Métrica": "Fecha Generación",
                     "Valor": (datetime.utcnow() - timedelta(hours=5)).strftime("%Y-%m-%d %H:%M:%S"),
@@ -725,30 +1116,42 @@ class DataframeFetchers:
     # Formato interno
     # ------------------------------------------------------------------
 
+    PREFERRED_ORDER = [
+        "Id", "Código", "Nombre", "Título", "Descripción",
+        "Tipo", "Estado", "Fecha Creación", "Fecha Actualización",
+        "Usuario", "Email", "Rol", "Granja", "Lote", "Programa",
+        "Cultivo", "Cantidad", "Unidad", "Avance", "Comentario",
+    ]
+
+    @staticmethod
+    def _display_name(col) -> str:
+        """Nombre legible de una columna (snake_case → Title Case)"""
+        if "_" in str(col):
+            return " ".join(word.capitalize() for word in str(col).split("_"))
+        if col.lower() == col:
+            return str(col).capitalize()
+        return col
+
+    @classmethod
+    def format_columns(cls, columns) -> List[Tuple[Any, str]]:
+        """
+        Retorna pares (columna original, nombre legible) en el orden de
+        exportación. Lo comparten _format_dataframe y la exportación por
+        streaming, que no construye DataFrames.
+        """
+        pares = [(col, cls._display_name(col)) for col in columns]
+        nombres = {nombre for _, nombre in pares}
+        existing = [n for n in cls.PREFERRED_ORDER if n in nombres]
+        por_nombre = {nombre: col for col, nombre in pares}
+        ordenados = [(por_nombre[n], n) for n in existing]
+        ordenados += [(col, n) for col, n in pares if n not in existing]
+        return ordenados
+
     def _format_dataframe(self, df: pd.DataFrame, title: str = "") -> pd.DataFrame:
         """Formatear DataFrame para Excel (método interno)"""
         if df.empty:
             return pd.DataFrame({"Mensaje": ["No hay datos para mostrar"]})
 
-        column_rename = {}
-        for col in df.columns:
-            if "_" in str(col):
-                new_name = " ".join(word.capitalize() for word in str(col).split("_"))
-                column_rename[col] = new_name
-            elif col.lower() == col:
-                column_rename[col] = str(col).capitalize()
-
-        if column_rename:
-            df = df.rename(columns=column_rename)
-
-        preferred_order = [
-            "Id", "Código", "Nombre", "Título", "Descripción",
-            "Tipo", "Estado", "Fecha Creación", "Fecha Actualización",
-            "Usuario", "Email", "Rol", "Granja", "Lote", "Programa",
-            "Cultivo", "Cantidad", "Unidad", "Avance", "Comentario",
-        ]
-
-        existing_cols = [col for col in preferred_order if col in df.columns]
-        other_cols = [col for col in df.columns if col not in existing_cols]
-
-        return df[existing_cols + other_cols]
+        pares = self.format_columns(df.columns)
+        df = df.rename(columns=dict(pares))
+        return df[[nombre for _, nombre in pares]]
@@ -0,0 +1,271 @@
+"""
+Trabajos de exportación en segundo plano - el libro se genera fuera del event loop
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from app.core.config import settings
+from app.schemas.export_schema import FiltrosExportacion
+
+logger = logging.getLogger(__name__)
+
+# extensión del archivo generado -> media type con que se descarga
+MEDIA_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Un trabajo que nunca terminó (p. ej. el worker se reinició) se descarta después de esto
+MAX_DURACION_TRABAJO = timedelta(hours=24)
+
+
+class ExportJob:
+    """
+    Estado de un trabajo de exportación. Se guarda como {id}.json junto al
+    archivo generado, de modo que cualquier worker puede consultarlo.
+    """
+
+    def __init__(self, usuario_id: int, tipo: str, filtros: Optional[FiltrosExportacion]):
+        self.id = uuid.uuid4().hex
+        self.usuario_id = usuario_id
+        self.tipo = tipo
+        self.filtros = filtros
+        self.estado = "pendiente"  # pendiente | procesando | completado | error
+        self.progreso = 0
+        self.hoja_actual: Optional[str] = None
+        self.error: Optional[str] = None
+        self.archivo: Optional[str] = None
+        self.media_type: Optional[str] = None
+        self.filename = f"{tipo}_{(datetime.utcnow() - timedelta(hours=5)).strftime('%Y%m%d_%H%M%S')}.xlsx"
+        self.creado = datetime.utcnow()
+        self.finalizado: Optional[datetime] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "estado": self.estado,
+            "progreso": self.progreso,
+            "hoja_actual": self.hoja_actual,
+            "error": self.error,
+            "filename": self.filename,
+            "creado": self.creado.isoformat(),
+            "finalizado": self.finalizado.isoformat() if self.finalizado else None,
+        }
+
+    def guardar(self, directorio: str):
+        """Escribe el estado de forma atómica (quien lo lee nunca ve un JSON a medias)"""
+        datos = {
+            **self.to_dict(),
+            "usuario_id": self.usuario_id,
+            "filtros": self.filtros.model_dump(mode="json") if self.filtros else None,
+            "archivo": self.archivo,
+            "media_type": self.media_type,
+        }
+        os.makedirs(directorio, exist_ok=True)
+        fd, temporal = tempfile.mkstemp(dir=directorio, prefix=f".{self.id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(datos, f)
+            os.replace(temporal, _ruta_estado(directorio, self.id))
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    @classmethod
+    def cargar(cls, directorio: str, job_id: str) -> Optional["ExportJob"]:
+        try:
+            with open(_ruta_estado(directorio, job_id)) as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        job = cls.__new__(cls)
+        job.id = datos["id"]
+        job.usuario_id = datos["usuario_id"]
+        job.tipo = datos["tipo"]
+        job.filtros = FiltrosExportacion(**datos["filtros"]) if datos.get("filtros") else None
+        job.estado = datos["estado"]
+        job.progreso = datos["progreso"]
+        job.hoja_actual = datos.get("hoja_actual")
+        job.error = datos.get("error")
+        job.archivo = datos.get("archivo")
+        job.media_type = datos.get("media_type")
+        job.filename = datos["filename"]
+        job.creado = datetime.fromisoformat(datos["creado"])
+        job.finalizado = datetime.fromisoformat(datos["finalizado"]) if datos.get("finalizado") else None
+        return job
+
+
+def _ruta_estado(directorio: str, job_id: str) -> str:
+    return os.path.join(directorio, f"{job_id}.json")
+
+
+def _ejecutar_trabajo(directorio: str, job_id: str):
+    """
+    Genera el archivo de un trabajo. Corre en un proceso del pool, con su
+    propia conexión a la base de datos, y reporta el avance en {id}.json.
+    """
+    from app.db.database import SessionLocal
+    from app.db.models import Usuario
+    from app.export.exportService import ExportService
+
+    job = ExportJob.cargar(directorio, job_id)
+    if not job:
+        return
+
+    job.estado = "procesando"
+    job.guardar(directorio)
+    db = SessionLocal()
+    try:
+        # El usuario se recarga en esta sesión para conservar el alcance por rol
+        usuario = db.get(Usuario, job.usuario_id)
+        if not usuario:
+            raise ValueError("Usuario no encontrado")
+
+        service = ExportService(db, usuario)
+        sheets = service.sheets_para_tipo(job.tipo, job.filtros)
+
+        def progreso(terminadas: int, total: int, hoja: str):
+            job.progreso = int(terminadas * 100 / total) if total else 100
+            job.hoja_actual = hoja
+            job.guardar(directorio)
+
+        destino = os.path.join(directorio, f"{job.id}.xlsx")
+        service.write_excel_file(sheets, destino, progreso)
+
+        job.archivo = destino
+        job.media_type = MEDIA_TYPES[os.path.splitext(destino)[1]]
+        job.progreso = 100
+        job.estado = "completado"
+    except Exception as e:
+        logger.error(f"Error en trabajo de exportación {job.id}: {str(e)}")
+        job.estado = "error"
+        job.error = str(e)
+    finally:
+        job.finalizado = datetime.utcnow()
+        job.guardar(directorio)
+        db.close()
+
+
+class ExportJobManager:
+    """
+    Cola de exportaciones: cada trabajo corre en un pool de procesos (la
+    serialización con openpyxl es CPU y no debe competir por el GIL con las
+    peticiones), abre su propia sesión de base de datos y escribe el archivo
+    en EXPORT_DIR. Los archivos terminados se conservan EXPORT_JOB_TTL_MINUTES
+    y luego se eliminan.
+
+    El estado de cada trabajo vive en EXPORT_DIR/{id}.json, no en memoria:
+    con varios workers de uvicorn/gunicorn cualquiera puede responder el
+    estado y la descarga. Con varias máquinas EXPORT_DIR debe ser un volumen
+    compartido.
+    """
+
+    def __init__(self, max_workers: int, ttl_minutes: int, directorio: str):
+        self.ttl = timedelta(minutes=ttl_minutes)
+        self.directorio = directorio
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _procesos(self) -> ProcessPoolExecutor:
+        # Se crea al primer uso y con "spawn", para no duplicar por fork los
+        # hilos y conexiones del worker
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reiniciar_pool(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def crear(self, usuario, tipo: str, filtros: Optional[FiltrosExportacion] = None) -> ExportJob:
+        self.limpiar_expirados()
+        job = ExportJob(usuario.id, tipo, filtros)
+        job.guardar(self.directorio)
+
+        executor = self._procesos()
+        try:
+            future = executor.submit(_ejecutar_trabajo, self.directorio, job.id)
+        except BrokenProcessPool:
+            # Un proceso murió (p. ej. sin memoria): se crea otro pool
+            self._reiniciar_pool(executor)
+            executor = self._procesos()
+            future = executor.submit(_ejecutar_trabajo, self.directorio, job.id)
+        future.add_done_callback(lambda f: self._al_terminar(f, executor, job.id))
+        return job
+
+    def _al_terminar(self, future: Future, executor: ProcessPoolExecutor, job_id: str):
+        """Si el proceso murió sin reportar, el trabajo se marca como error"""
+        error = future.exception()
+        if error is None:
+            return
+        if isinstance(error, BrokenProcessPool):
+            self._reiniciar_pool(executor)
+        logger.error(f"El proceso del trabajo de exportación {job_id} falló: {str(error)}")
+        job = ExportJob.cargar(self.directorio, job_id)
+        if job and job.estado in ("pendiente", "procesando"):
+            job.estado = "error"
+            job.error = "El proceso de exportación terminó inesperadamente"
+            job.finalizado = datetime.utcnow()
+            job.guardar(self.directorio)
+
+    def obtener(self, job_id: str, usuario) -> Optional[ExportJob]:
+        """Retorna el trabajo si existe y pertenece al usuario (admin ve todos)"""
+        self.limpiar_expirados()
+        try:
+            uuid.UUID(hex=job_id)
+        except ValueError:
+            return None
+        job = ExportJob.cargar(self.directorio, job_id)
+        if not job:
+            return None
+        if job.usuario_id != usuario.id and usuario.rol.nombre != "admin":
+            return None
+        return job
+
+    def limpiar_expirados(self):
+        """Elimina los trabajos terminados (y sus archivos) con más de TTL de antigüedad"""
+        if not os.path.isdir(self.directorio):
+            return
+        ahora = datetime.utcnow()
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".json") or nombre.startswith("."):
+                continue
+            job = ExportJob.cargar(self.directorio, nombre[:-len(".json")])
+            if not job:
+                continue
+            if job.finalizado:
+                expirado = job.finalizado < ahora - self.ttl
+            else:
+                expirado = job.creado < ahora - MAX_DURACION_TRABAJO
+            if not expirado:
+                continue
+
+            for ruta in (job.archivo, _ruta_estado(self.directorio, job.id)):
+                if ruta and os.path.exists(ruta):
+                    try:
+                        os.remove(ruta)
+                    except OSError as e:
+                        logger.warning(f"No se pudo eliminar {ruta}: {str(e)}")
+
+
+export_jobs = ExportJobManager(
+    max_workers=settings.EXPORT_JOB_WORKERS,
+    ttl_minutes=settings.EXPORT_JOB_TTL_MINUTES,
+    directorio=settings.EXPORT_DIR,
+)
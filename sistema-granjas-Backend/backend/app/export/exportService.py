@@ -2,13 +2,22 @@
 Servicio de exportación con Excel - Archivos XLSX bien formateados
 """
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from itertools import chain, islice
+from typing import Dict, List, Any, Optional, Iterable, Tuple, Callable, IO
 import pandas as pd
 import io
+import json
+import tempfile
+import zipfile
 from fastapi.responses import StreamingResponse
 import logging
-from openpyxl.styles import Font, PatternFill
+from openpyxl.styles import Font, PatternFill, NamedStyle
+from openpyxl.utils import get_column_letter
 from app.export.dataframeFetchers import DataframeFetchers
+from app.export.streamingExcel import StreamingExcelWriter
+from app.export.columnarFormats import ColumnarWriter
+from app.core.config import settings
+from app.schemas.export_schema import FiltrosExportacion
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +29,43 @@ class ExportService:
         self.usuario = usuario
         self.dataframe_fetcher = DataframeFetchers(db, usuario)
     
+    # Estilo con nombre para encabezados: se registra una vez por libro y cada
+    # celda solo guarda la referencia
+    HEADER_STYLE_NAME = "encabezado_exportacion"
+
+    @staticmethod
+    def _estimar_anchos(df: pd.DataFrame) -> List[int]:
+        """
+        Ancho de cada columna a partir de una muestra de filas (str.len()
+        vectorizado), con el mismo límite que la exportación por streaming.
+        """
+        muestra_filas = StreamingExcelWriter.WIDTH_SAMPLE_ROWS
+        muestra = df.sample(n=muestra_filas, random_state=0) if len(df) > muestra_filas else df
+
+        anchos = []
+        for idx, column in enumerate(df.columns):
+            largo = muestra.iloc[:, idx].astype(str).str.len().max() if len(muestra) else 0
+            largo = max(int(largo) if pd.notna(largo) else 0, len(str(column)))
+            anchos.append(min(largo + 2, StreamingExcelWriter.MAX_COLUMN_WIDTH))
+        return anchos
+
+    def _header_style(self, workbook) -> str:
+        """Registra (si hace falta) el estilo de encabezado en el libro y retorna su nombre"""
+        if self.HEADER_STYLE_NAME not in workbook.named_styles:
+            estilo = NamedStyle(name=self.HEADER_STYLE_NAME)
+            estilo.font = Font(bold=True, color="000000")
+            estilo.fill = PatternFill(start_color="DDDDDD", fill_type="solid")
+            workbook.add_named_style(estilo)
+        return self.HEADER_STYLE_NAME
+
     def _create_excel_response(self, dataframes: Dict[str, pd.DataFrame], filename: str) -> StreamingResponse:
         """Crear respuesta Excel (.xlsx) con múltiples hojas"""
         try:
             output = io.BytesIO()
             
             with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                header_style = self._header_style(writer.book)
+
                 for sheet_name, df in dataframes.items():
                     # Limitar nombre de hoja a 31 caracteres (limitación de Excel)
                     safe_sheet_name = sheet_name[:31]
@@ -40,19 +80,13 @@ class ExportService:
                     # Obtener worksheet
                     worksheet = writer.sheets[safe_sheet_name]
                     
-                    # Ajustar ancho de columnas automáticamente
-                    for column in df.columns:
-                        column_length = max(
-                            df[column].astype(str).map(len).max(),
-                            len(str(column))
-                        )
-                        col_idx = df.columns.get_loc(column)
-                        worksheet.column_dimensions[chr(65 + col_idx)].width = min(column_length + 2, 50)
+                    # Ajustar ancho de columnas (get_column_letter sirve más allá de la Z)
+                    for col_idx, ancho in enumerate(self._estimar_anchos(df), start=1):
+                        worksheet.column_dimensions[get_column_letter(col_idx)].width = ancho
                     
-                    # Formatear encabezados SIN usar _default_cell_style
+                    # Formatear encabezados con el estilo compartido
                     for cell in worksheet[1]:
-                        cell.font = Font(bold=True, color="000000")
-                        cell.fill = PatternFill(start_color="DDDDDD", fill_type="solid")
+                        cell.style = header_style
 
             output.seek(0)
             
@@ -67,6 +101,35 @@ class ExportService:
             logger.error(f"Error creando Excel: {str(e)}")
             raise
     
+    def _create_streaming_excel_response(
+        self, sheets: List[Tuple[str, Iterable[Dict[str, Any]], bool]], filename: str
+    ) -> StreamingResponse:
+        """
+        Crear respuesta Excel escribiendo las hojas fila a fila.
+
+        `sheets` es una lista de (nombre_hoja, filas, omitir_si_vacia). Las filas
+        se consumen desde el cursor del servidor, el libro se vuelca a un archivo
+        temporal y se envía al cliente por bloques.
+        """
+        try:
+            writer = StreamingExcelWriter(self.db)
+            for sheet_name, rows, omitir_si_vacia in sheets:
+                total = writer.add_sheet(sheet_name, rows, omitir_si_vacia=omitir_si_vacia)
+                logger.info(f"Hoja {sheet_name}: {total} filas escritas")
+
+            archivo = writer.save_to_tempfile()
+
+            return StreamingResponse(
+                StreamingExcelWriter.iter_file(archivo),
+                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                headers={
+                    "Content-Disposition": f"attachment; filename={filename}.xlsx"
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error creando Excel por streaming: {str(e)}")
+            raise
+
     def _create_single_excel_response(self, df: pd.DataFrame, filename: str, sheet_name: str = "Datos") -> StreamingResponse:
         """Crear respuesta Excel con una sola hoja"""
         return self._create_excel_response({sheet_name: df}, filename)
@@ -105,10 +168,19 @@ class ExportService:
         return df[existing_cols + other_cols]
     
     # ==================== EXPORTACIÓN COMPLETA EN EXCEL ====================
-    def export_todo_excel(self) -> StreamingResponse:
+    def export_todo_excel(self, streaming: bool = False) -> StreamingResponse:
         """
-        Exporta TODA la base de datos en un Excel con múltiples hojas
+        Exporta TODA la base de datos en un Excel con múltiples hojas.
+
+        Con streaming=True las hojas se escriben fila a fila sin construir
+        DataFrames, de modo que la memoria no depende del volumen de datos.
         """
+        fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d_%H%M%S")
+        filename = f"backup_completo_{fecha}"
+
+        if streaming:
+            return self._create_streaming_excel_response(self._backup_sheets(), filename)
+
         dataframes = {}
         
         # 1. RESUMEN
@@ -149,62 +221,293 @@ class ExportService:
         if not movimientos_df.empty:
             dataframes['11_Movimientos'] = movimientos_df
         
-        fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d_%H%M%S")
-        filename = f"backup_completo_{fecha}"
-        
         return self._create_excel_response(dataframes, filename)
+
+    def _backup_sheets(self, filtros: Optional[FiltrosExportacion] = None) -> List[Tuple[str, Iterable[Dict[str, Any]], bool]]:
+        """Hojas del backup completo como iteradores de filas (modo streaming)"""
+        return self.sheets_para_tipo("backup", filtros)
     
+    # ==================== EXPORTACIÓN INCREMENTAL ====================
+    FORMATOS_DELTA = ("csv", "parquet")
+
+    @staticmethod
+    def _serializar_dataframe(df: pd.DataFrame, formato: str) -> bytes:
+        """Serializa un DataFrame a CSV (UTF-8) o Parquet (requiere pyarrow)"""
+        if formato == "csv":
+            return df.to_csv(index=False).encode("utf-8")
+        if formato == "parquet":
+            return ColumnarWriter.parquet_bytes(df)
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    def export_delta(
+        self, since: Optional[datetime] = None, formato: str = "csv", entidad: Optional[str] = None
+    ) -> StreamingResponse:
+        """
+        Exporta solo las filas creadas o modificadas después de `since`.
+
+        El nuevo watermark es la hora de corte de la consulta y la siguiente
+        ejecución debe enviarlo como `since`. Las marcas de tiempo se asignan
+        en el flush, no en el commit: una fila marcada antes del corte pero
+        confirmada después no era visible en la consulta anterior. Por eso se
+        relee un margen de EXPORT_DELTA_SOLAPE_MINUTOS antes de `since`
+        (since - solape < marca <= watermark) y el cliente debe quedarse con
+        la última versión de cada `id`. Con `entidad` se retorna un solo
+        archivo; sin ella, un .zip con un archivo por entidad y watermark.json.
+        """
+        if formato not in self.FORMATOS_DELTA:
+            raise ValueError(f"Formato no soportado: {formato}")
+        if entidad and entidad not in self.dataframe_fetcher.DELTA_ENTIDADES:
+            raise ValueError(f"Entidad no soportada: {entidad}")
+
+        hasta = datetime.utcnow() - timedelta(hours=5)
+        watermark = hasta.isoformat()
+        solape = timedelta(minutes=settings.EXPORT_DELTA_SOLAPE_MINUTOS)
+        desde = since - solape if since else None
+        dataframes = self.dataframe_fetcher.get_delta_dataframes(desde, hasta, [entidad] if entidad else None)
+        headers = {"X-Export-Watermark": watermark}
+        fecha = hasta.strftime("%Y%m%d_%H%M%S")
+
+        if entidad:
+            contenido = self._serializar_dataframe(dataframes[entidad], formato)
+            headers["Content-Disposition"] = f"attachment; filename={entidad}_delta_{fecha}.{formato}"
+            media_type = "text/csv" if formato == "csv" else "application/vnd.apache.parquet"
+            return StreamingResponse(io.BytesIO(contenido), media_type=media_type, headers=headers)
+
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+            for nombre, df in dataframes.items():
+                zf.writestr(f"{nombre}.{formato}", self._serializar_dataframe(df, formato))
+            zf.writestr("watermark.json", json.dumps({
+                "since": since.isoformat() if since else None,
+                "desde_consulta": desde.isoformat() if desde else None,
+                "watermark": watermark,
+                "filas": {nombre: len(df) for nombre, df in dataframes.items()},
+            }, indent=2))
+        output.seek(0)
+
+        headers["Content-Disposition"] = f"attachment; filename=delta_{fecha}.zip"
+        return StreamingResponse(output, media_type="application/zip", headers=headers)
+
+    # ==================== HOJAS POR TIPO ====================
+    # (nombre de hoja, hoja en DataframeFetchers, omitir_si_vacia) de cada tipo
+    # de exportación. Lo comparten el backup por streaming, los trabajos en
+    # segundo plano y las salidas CSV/Parquet.
+    HOJAS_POR_TIPO = {
+        "backup": [
+            ("00_Resumen", "resumen", False),
+            ("01_Granjas", "granjas", False),
+            ("02_Lotes", "lotes", False),
+            ("03_Diagnosticos", "diagnosticos", False),
+            ("04_Recomendaciones", "recomendaciones", False),
+            ("05_Labores", "labores", False),
+            ("06_Usuarios", "usuarios", False),
+            ("07_Insumos", "insumos", False),
+            ("08_Herramientas", "herramientas", False),
+            ("09_Programas", "programas", False),
+            ("10_Cultivos", "cultivos", False),
+            ("11_Movimientos", "movimientos", True),
+        ],
+        "granjas": [("Granjas", "granjas", False)],
+        "lotes": [("Lotes", "lotes", False)],
+        "diagnosticos": [("Diagnósticos", "diagnosticos", False)],
+        "recomendaciones": [("Recomendaciones", "recomendaciones", False)],
+        "labores": [("Labores", "labores", False)],
+        "inventario": [("Insumos", "insumos", False), ("Herramientas", "herramientas", False)],
+        "usuarios": [("Usuarios", "usuarios", False)],
+        "programas": [("Programas", "programas", False)],
+        "cultivos": [("Cultivos", "cultivos", False)],
+        "plantas": [("Plantas", "plantas", False)],
+        "movimientos": [("Movimientos", "movimientos", False)],
+        "resumen": [("Resumen", "resumen", False)],
+    }
+    TIPOS_EXPORTACION = tuple(HOJAS_POR_TIPO)
+
+    def _hojas(self, tipo: str) -> List[Tuple[str, str, bool]]:
+        if tipo not in self.HOJAS_POR_TIPO:
+            raise ValueError(f"Tipo de exportación no soportado: {tipo}")
+        return self.HOJAS_POR_TIPO[tipo]
+
+    def sheets_para_tipo(
+        self, tipo: str, filtros: Optional[FiltrosExportacion] = None
+    ) -> List[Tuple[str, Iterable[Dict[str, Any]], bool]]:
+        """Hojas (nombre, filas, omitir_si_vacia) que componen cada tipo de exportación"""
+        return [
+            (nombre, self.dataframe_fetcher.iter_rows(hoja, filtros), omitir_si_vacia)
+            for nombre, hoja, omitir_si_vacia in self._hojas(tipo)
+        ]
+
+    def write_excel_file(
+        self,
+        sheets: List[Tuple[str, Iterable[Dict[str, Any]], bool]],
+        destino: str,
+        progreso: Optional[Callable[[int, int, str], None]] = None,
+    ) -> None:
+        """
+        Escribe las hojas en un archivo .xlsx en disco. `progreso` se llama con
+        (hojas_terminadas, total_hojas, hoja_actual) después de cada hoja.
+        """
+        writer = StreamingExcelWriter(self.db)
+        total_hojas = len(sheets)
+        for idx, (sheet_name, rows, omitir_si_vacia) in enumerate(sheets, start=1):
+            total = writer.add_sheet(sheet_name, rows, omitir_si_vacia=omitir_si_vacia)
+            logger.info(f"Hoja {sheet_name}: {total} filas escritas")
+            if progreso:
+                progreso(idx, total_hojas, sheet_name)
+        writer.workbook.save(destino)
+
+    # ==================== CSV Y PARQUET ====================
+    def _create_zip_response(
+        self, archivos: Iterable[Tuple[str, Callable[[IO[bytes]], None]]], filename: str
+    ) -> StreamingResponse:
+        """Empaqueta varios archivos (nombre, escritor) en un .zip temporal enviado por bloques"""
+        archivo = tempfile.TemporaryFile(suffix=".zip")
+        try:
+            with zipfile.ZipFile(archivo, "w", zipfile.ZIP_DEFLATED) as zf:
+                for nombre, escribir in archivos:
+                    with zf.open(nombre, "w") as destino:
+                        escribir(destino)
+            archivo.seek(0)
+        except Exception:
+            archivo.close()
+            raise
+
+        return StreamingResponse(
+            StreamingExcelWriter.iter_file(archivo),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename={filename}.zip"}
+        )
+
+    def _sesion_propia(self) -> Tuple[Any, DataframeFetchers]:
+        """Sesión nueva con el usuario recargado en ella (conserva el alcance por rol)"""
+        from app.db.database import SessionLocal
+        from app.db.models import Usuario
+
+        db = SessionLocal()
+        try:
+            usuario = db.get(Usuario, self.usuario.id) if self.usuario is not None else None
+        except Exception:
+            db.close()
+            raise
+        return db, DataframeFetchers(db, usuario)
+
+    def export_csv(self, tipo: str, filtros: Optional[FiltrosExportacion] = None, comprimir: bool = False) -> StreamingResponse:
+        """
+        Exporta un tipo en CSV con las mismas columnas que el Excel. Las filas
+        salen del cursor del servidor y se envían por bloques (gzip opcional).
+        Los tipos con varias hojas se entregan como .zip con un CSV por hoja.
+        """
+        hojas = self._hojas(tipo)
+        fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d_%H%M%S")
+        filename = f"{tipo}_{fecha}"
+
+        if len(hojas) > 1:
+            return self._create_zip_response(
+                ((f"{nombre}.csv", lambda destino, filas=filas: ColumnarWriter.write_csv(filas, destino, self.db))
+                 for nombre, filas, _ in self.sheets_para_tipo(tipo, filtros)),
+                filename,
+            )
+
+        _, hoja, _ = hojas[0]
+        # El cuerpo se genera después de que la dependencia get_db cierra la
+        # sesión de la petición: el cursor del servidor necesita una sesión
+        # propia, que se cierra al terminar (o abandonar) la descarga
+        db, fetcher = self._sesion_propia()
+        try:
+            filas = iter(fetcher.iter_rows(hoja, filtros))
+            # La primera fila se lee antes de responder para que un error de
+            # la consulta llegue como 500 y no como un archivo truncado
+            primera = list(islice(filas, 1))
+        except Exception:
+            db.close()
+            raise
+
+        def contenido():
+            try:
+                yield from ColumnarWriter.iter_csv(chain(primera, filas), comprimir=comprimir)
+            finally:
+                db.close()
+
+        if comprimir:
+            return StreamingResponse(
+                contenido(),
+                media_type="application/gzip",
+                headers={"Content-Disposition": f"attachment; filename={filename}.csv.gz"}
+            )
+        return StreamingResponse(
+            contenido(),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename={filename}.csv"}
+        )
+
+    def export_parquet(self, tipo: str, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
+        """
+        Exporta un tipo en Parquet con columnas tipadas (fechas, enteros y
+        floats reales). Los tipos con varias hojas se entregan como .zip.
+        """
+        hojas = self._hojas(tipo)
+        fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d_%H%M%S")
+        filename = f"{tipo}_{fecha}"
+        fetcher = self.dataframe_fetcher
+
+        def escribir(hoja: str) -> Callable[[IO[bytes]], None]:
+            return lambda destino: destino.write(
+                ColumnarWriter.parquet_bytes(fetcher.get_typed_dataframe(hoja, filtros))
+            )
+
+        if len(hojas) > 1:
+            return self._create_zip_response(
+                ((f"{nombre}.parquet", escribir(hoja)) for nombre, hoja, _ in hojas),
+                filename,
+            )
+
+        _, hoja, _ = hojas[0]
+        contenido = ColumnarWriter.parquet_bytes(fetcher.get_typed_dataframe(hoja, filtros))
+        return StreamingResponse(
+            io.BytesIO(contenido),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": f"attachment; filename={filename}.parquet"}
+        )
+
     # ==================== MÉTODOS PÚBLICOS SIMPLIFICADOS ====================
+    # Los filtros (FiltrosExportacion) se resuelven en SQL dentro de
+    # DataframeFetchers; aquí no se filtran DataFrames.
     
-    def export_granjas_excel(self) -> StreamingResponse:
+    def export_granjas_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
         """Exportar granjas en Excel"""
-        df = self.dataframe_fetcher.get_granjas_dataframe()
+        df = self.dataframe_fetcher.get_granjas_dataframe(filtros)
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d_%H%M%S")
         return self._create_single_excel_response(df, f"granjas_{fecha}", "Granjas")
     
-    def export_lotes_excel(self, detallado: bool = False, lote_id: Optional[int] = None) -> StreamingResponse:
-        """Exportar lotes en Excel"""
-        df = self.dataframe_fetcher.get_lotes_dataframe()
-        if lote_id:
-            df = df[df['id'] == lote_id]
+    def export_lotes_excel(self, detallado: bool = False, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
+        """Exportar lotes en Excel (filtros.lote_id exporta un solo lote)"""
+        df = self.dataframe_fetcher.get_lotes_dataframe(filtros)
         
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         filename = f"lotes_detallados_{fecha}" if detallado else f"lotes_{fecha}"
         return self._create_single_excel_response(df, filename, "Lotes")
     
-    def export_diagnosticos_excel(self) -> StreamingResponse:
+    def export_diagnosticos_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
         """Exportar diagnósticos en Excel"""
-        df = self.dataframe_fetcher.get_diagnosticos_dataframe()
+        df = self.dataframe_fetcher.get_diagnosticos_dataframe(filtros)
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_single_excel_response(df, f"diagnosticos_{fecha}", "Diagnósticos")
     
-    def export_recomendaciones_excel(self, **filters) -> StreamingResponse:
-        """Exportar recomendaciones en Excel"""
-        df = self.dataframe_fetcher.get_recomendaciones_dataframe()
-        
-        # Aplicar filtros básicos
-        if filters.get('estado'):
-            df = df[df['estado'] == filters['estado']]
-        if filters.get('tipo'):
-            df = df[df['tipo'] == filters['tipo']]
-        
+    def export_recomendaciones_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
+        """Exportar recomendaciones en Excel (filtros: estado, tipo, lote, programa, fechas...)"""
+        df = self.dataframe_fetcher.get_recomendaciones_dataframe(filtros)
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_single_excel_response(df, f"recomendaciones_{fecha}", "Recomendaciones")
     
-    def export_labores_excel(self, **filters) -> StreamingResponse:
-        """Exportar labores en Excel"""
-        df = self.dataframe_fetcher.get_labores_dataframe()
-        
-        if filters.get('estado'):
-            df = df[df['estado'] == filters['estado']]
-        
+    def export_labores_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
+        """Exportar labores en Excel (filtros: estado, lote, programa, fechas...)"""
+        df = self.dataframe_fetcher.get_labores_dataframe(filtros)
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_single_excel_response(df, f"labores_{fecha}", "Labores")
     
-    def export_inventario_excel(self) -> StreamingResponse:
+    def export_inventario_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
         """Exportar inventario en Excel con dos hojas"""
-        insumos_df = self.dataframe_fetcher.get_insumos_dataframe()
-        herramientas_df = self.dataframe_fetcher.get_herramientas_dataframe()
+        insumos_df = self.dataframe_fetcher.get_insumos_dataframe(filtros)
+        herramientas_df = self.dataframe_fetcher.get_herramientas_dataframe(filtros)
         
         dataframes = {
             "Insumos": insumos_df,
@@ -214,40 +517,33 @@ class ExportService:
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_excel_response(dataframes, f"inventario_{fecha}")
     
-    def export_usuarios_excel(self, **filters) -> StreamingResponse:
-        """Exportar usuarios en Excel"""
-        df = self.dataframe_fetcher.get_usuarios_dataframe()
-        
-        if filters.get('rol'):
-            df = df[df['rol'] == filters['rol']]
-        if filters.get('activo') is not None:
-            estado = 'Activo' if filters['activo'] else 'Inactivo'
-            df = df[df['estado'] == estado]
-        
+    def export_usuarios_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
+        """Exportar usuarios en Excel (filtros: rol, activo, programa, granja...)"""
+        df = self.dataframe_fetcher.get_usuarios_dataframe(filtros)
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_single_excel_response(df, f"usuarios_{fecha}", "Usuarios")
     
-    def export_programas_excel(self) -> StreamingResponse:
+    def export_programas_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
         """Exportar programas en Excel"""
-        df = self.dataframe_fetcher.get_programas_dataframe()
+        df = self.dataframe_fetcher.get_programas_dataframe(filtros)
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_single_excel_response(df, f"programas_{fecha}", "Programas")
     
-    def export_cultivos_excel(self) -> StreamingResponse:
+    def export_cultivos_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
         """Exportar cultivos en Excel"""
-        df = self.dataframe_fetcher.get_cultivos_dataframe()
+        df = self.dataframe_fetcher.get_cultivos_dataframe(filtros)
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_single_excel_response(df, f"cultivos_{fecha}", "Cultivos")
     
-    def export_plantas_excel(self) -> StreamingResponse:
+    def export_plantas_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
         """Exportar plantas en Excel"""
-        df = self.dataframe_fetcher.get_plantas_dataframe()
+        df = self.dataframe_fetcher.get_plantas_dataframe(filtros)
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_single_excel_response(df, f"plantas_{fecha}", "Plantas")
     
-    def export_movimientos_excel(self) -> StreamingResponse:
+    def export_movimientos_excel(self, filtros: Optional[FiltrosExportacion] = None) -> StreamingResponse:
         """Exportar movimientos de inventario en Excel"""
-        df = self.dataframe_fetcher.get_movimientos_dataframe()
+        df = self.dataframe_fetcher.get_movimientos_dataframe(filtros)
         
         fecha = (datetime.utcnow()-timedelta(hours=5)).strftime("%Y%m%d")
         return self._create_single_excel_response(df, f"movimientos_{fecha}", "Movimientos")
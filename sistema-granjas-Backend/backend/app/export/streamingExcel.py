@@ -0,0 +1,119 @@
+"""
+Escritura de Excel por streaming - hojas .xlsx fila a fila con memoria constante
+"""
+from itertools import chain, islice
+from typing import Any, Dict, IO, Iterable, Iterator
+import logging
+import tempfile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+from app.export.dataframeFetchers import DataframeFetchers
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingExcelWriter:
+    """
+    Construye un libro .xlsx con openpyxl en modo write_only.
+
+    Cada hoja se escribe a medida que llegan las filas y openpyxl las vuelca a
+    disco, así que la memoria no crece con el número de registros. El libro
+    final se guarda en un archivo temporal que se envía al cliente por bloques.
+
+    Con `db`, un error al leer una hoja revierte la sesión antes de seguir:
+    en PostgreSQL la transacción queda abortada y las hojas siguientes
+    fallarían con "current transaction is aborted".
+    """
+
+    # Filas que se leen por adelantado para estimar el ancho de columnas
+    WIDTH_SAMPLE_ROWS = 500
+    MAX_COLUMN_WIDTH = 50
+    FILE_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, db=None):
+        self.db = db
+        self.workbook = Workbook(write_only=True)
+        self._header_font = Font(bold=True, color="000000")
+        self._header_fill = PatternFill(start_color="DDDDDD", fill_type="solid")
+
+    def _header_cell(self, worksheet, value: str) -> WriteOnlyCell:
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.font = self._header_font
+        cell.fill = self._header_fill
+        return cell
+
+    def _revertir(self):
+        if self.db is None:
+            return
+        try:
+            self.db.rollback()
+        except Exception as e:
+            logger.error(f"Error revirtiendo la sesión tras fallar una hoja: {str(e)}")
+
+    def add_sheet(self, sheet_name: str, rows: Iterable[Dict[str, Any]], omitir_si_vacia: bool = False) -> int:
+        """
+        Escribe una hoja a partir de un iterable de diccionarios y retorna el
+        número de filas escritas. Las columnas se toman del primer registro y
+        se renombran igual que en DataframeFetchers._format_dataframe.
+        """
+        rows = iter(rows)
+        try:
+            muestra = list(islice(rows, self.WIDTH_SAMPLE_ROWS))
+        except Exception as e:
+            logger.error(f"Error obteniendo datos de la hoja {sheet_name}: {str(e)}")
+            self._revertir()
+            muestra = [{"Error": f"No se pudieron obtener datos: {str(e)}"}]
+            rows = iter(())
+
+        if not muestra:
+            if omitir_si_vacia:
+                return 0
+            muestra = [{"Mensaje": "No hay datos para mostrar"}]
+
+        columnas = DataframeFetchers.format_columns(list(muestra[0].keys()))
+        worksheet = self.workbook.create_sheet(title=sheet_name[:31])
+
+        # En modo write_only los anchos deben fijarse antes de la primera fila
+        for idx, (col, nombre) in enumerate(columnas, start=1):
+            largo = max([len(str(nombre))] + [len(str(fila.get(col))) for fila in muestra])
+            worksheet.column_dimensions[get_column_letter(idx)].width = min(largo + 2, self.MAX_COLUMN_WIDTH)
+
+        worksheet.append([self._header_cell(worksheet, nombre) for _, nombre in columnas])
+
+        total = 0
+        try:
+            for fila in chain(muestra, rows):
+                worksheet.append([fila.get(col) for col, _ in columnas])
+                total += 1
+        except Exception as e:
+            # Las filas ya escritas no se pueden retirar: se deja constancia en la hoja
+            logger.error(f"Error escribiendo la hoja {sheet_name} tras {total} filas: {str(e)}")
+            self._revertir()
+            worksheet.append([f"Error: exportación incompleta ({str(e)})"])
+
+        return total
+
+    def save_to_tempfile(self) -> IO[bytes]:
+        """Guarda el libro en un archivo temporal (se borra al cerrarlo)"""
+        archivo = tempfile.TemporaryFile(suffix=".xlsx")
+        try:
+            self.workbook.save(archivo)
+            archivo.seek(0)
+        except Exception:
+            archivo.close()
+            raise
+        return archivo
+
+    @classmethod
+    def iter_file(cls, archivo: IO[bytes]) -> Iterator[bytes]:
+        """Lee el archivo por bloques y lo cierra al terminar"""
+        try:
+            while True:
+                chunk = archivo.read(cls.FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            archivo.close()
@@ -134,6 +134,148 @@ def _aplicar_migraciones_seguras():
         ALTER TABLE labores
         ADD COLUMN IF NOT EXISTS formulario_labor JSON;
         """,
+        """
+        CREATE TABLE IF NOT EXISTS diagnostico_campo_estadisticas (
+            id SERIAL PRIMARY KEY,
+            subtipo_id INTEGER NOT NULL REFERENCES diagnostico_tipos(id) ON DELETE CASCADE,
+            programa_id INTEGER NOT NULL REFERENCES programas(id) ON DELETE CASCADE,
+            nombre_campo VARCHAR(100) NOT NULL,
+            dia DATE NOT NULL,
+            total_respuestas INTEGER NOT NULL DEFAULT 0,
+            distribucion JSON,
+            conteo_numerico INTEGER NOT NULL DEFAULT 0,
+            suma DOUBLE PRECISION NOT NULL DEFAULT 0,
+            minimo DOUBLE PRECISION,
+            maximo DOUBLE PRECISION,
+            updated_at TIMESTAMP DEFAULT NOW(),
+            CONSTRAINT uq_diag_campo_estadistica UNIQUE (subtipo_id, programa_id, nombre_campo, dia)
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_diag_campo_estadistica_subtipo_dia
+        ON diagnostico_campo_estadisticas(subtipo_id, dia);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_plantas_lote_estado ON plantas(lote_id, estado);
+        """,
+        # Una planta por celda del lote. Si ya hay duplicados no se crea el
+        # índice (fallaría todo el bloque) y queda el aviso en el log de
+        # PostgreSQL; mientras tanto crear_plantas_para_lote inserta sin ON CONFLICT
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM plantas GROUP BY lote_id, surco, numero HAVING COUNT(*) > 1
+            ) THEN
+                RAISE WARNING 'plantas duplicadas por (lote_id, surco, numero): no se crea uq_planta_lote_surco_numero';
+            ELSE
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_planta_lote_surco_numero
+                ON plantas(lote_id, surco, numero);
+            END IF;
+        END $$;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_diagnosticos_lote_tipo_fecha
+        ON diagnosticos(lote_id, tipo_diagnostico, fecha_creacion);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_diagnostico_planta_diagnostico ON diagnostico_planta(diagnostico_id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_diagnostico_planta_planta ON diagnostico_planta(planta_id);
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS planta_salud_diaria (
+            id SERIAL PRIMARY KEY,
+            lote_id INTEGER NOT NULL REFERENCES lotes(id) ON DELETE CASCADE,
+            planta_id INTEGER NOT NULL REFERENCES plantas(id) ON DELETE CASCADE,
+            dia DATE NOT NULL,
+            diagnosticos_count INTEGER NOT NULL DEFAULT 0,
+            ultima_fecha TIMESTAMP,
+            presion_max INTEGER NOT NULL DEFAULT 0,
+            tiene_enfermedades BOOLEAN NOT NULL DEFAULT FALSE,
+            CONSTRAINT uq_planta_salud_dia UNIQUE (planta_id, dia)
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_planta_salud_lote_dia ON planta_salud_diaria(lote_id, dia);
+        """,
+        # Paginación por cursor: orden (fecha, id) de los listados
+        """
+        CREATE INDEX IF NOT EXISTS idx_diagnosticos_fecha_id ON diagnosticos(fecha_creacion, id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_recomendaciones_fecha_id ON recomendaciones(fecha_creacion, id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_labores_fecha_asignacion_id ON labores(fecha_asignacion, id);
+        """,
+        # Libro de movimientos de inventario
+        """
+        CREATE TABLE IF NOT EXISTS movimientos_inventario (
+            id SERIAL PRIMARY KEY,
+            item_id INTEGER NOT NULL REFERENCES items_inventario_programa(id) ON DELETE CASCADE,
+            origen VARCHAR(20) NOT NULL,
+            cantidad DOUBLE PRECISION NOT NULL,
+            cantidad_solicitada DOUBLE PRECISION NOT NULL,
+            saldo_resultante DOUBLE PRECISION NOT NULL,
+            labor_id INTEGER REFERENCES labores(id) ON DELETE SET NULL,
+            producto_labor_id INTEGER REFERENCES productos_labores(id) ON DELETE SET NULL,
+            recomendacion_id INTEGER REFERENCES recomendaciones(id) ON DELETE SET NULL,
+            usuario_id INTEGER REFERENCES usuarios(id) ON DELETE SET NULL,
+            motivo VARCHAR(200),
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_movimientos_inventario_item_id ON movimientos_inventario(item_id, id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_movimientos_inventario_labor ON movimientos_inventario(labor_id);
+        """,
+        # Idempotencia de la sincronización offline por lotes
+        """
+        CREATE TABLE IF NOT EXISTS sync_operaciones (
+            id SERIAL PRIMARY KEY,
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            clave VARCHAR(100) NOT NULL,
+            tipo VARCHAR(30) NOT NULL,
+            estado VARCHAR(20) NOT NULL,
+            resultado JSON,
+            created_at TIMESTAMP DEFAULT NOW(),
+            CONSTRAINT uq_sync_operacion_usuario_clave UNIQUE (usuario_id, clave)
+        );
+        """,
+        # Registro de cambios para la sincronización incremental
+        """
+        CREATE TABLE IF NOT EXISTS cambios_sync (
+            seq BIGSERIAL PRIMARY KEY,
+            entidad VARCHAR(30) NOT NULL,
+            entidad_id INTEGER NOT NULL,
+            operacion VARCHAR(10) NOT NULL,
+            programa_id INTEGER,
+            granja_id INTEGER,
+            usuario_id INTEGER,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        # Docente de la recomendación: /sync/changes filtra con él las labores
+        # de docentes y asesores. Los registros previos lo toman de la
+        # recomendación actual
+        """
+        ALTER TABLE cambios_sync
+        ADD COLUMN IF NOT EXISTS docente_id INTEGER;
+        """,
+        """
+        UPDATE cambios_sync c SET docente_id = r.docente_id
+        FROM recomendaciones r
+        WHERE c.docente_id IS NULL AND c.entidad = 'recomendacion' AND r.id = c.entidad_id;
+        """,
+        """
+        UPDATE cambios_sync c SET docente_id = r.docente_id
+        FROM labores l JOIN recomendaciones r ON r.id = l.recomendacion_id
+        WHERE c.docente_id IS NULL AND c.entidad = 'labor' AND l.id = c.entidad_id;
+        """,
     ]
     from app.db.database import SessionLocal
     db = SessionLocal()
@@ -188,6 +330,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Export-Watermark", "X-Siguiente-Cursor", "X-Total-Count"],
 )
 
 app.add_middleware(
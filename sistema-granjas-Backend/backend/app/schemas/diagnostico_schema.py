@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime, date
 
 CONDICIONES_DIA_PERMITIDAS = ["Soleado", "Nublado", "Lluvia"]
@@ -107,8 +107,9 @@ class DiagnosticoWithRecomendacionesResponse(DiagnosticoResponse):
 
 class DiagnosticoListResponse(BaseModel):
     items:   List[DiagnosticoResponse]
-    total:   int
-    paginas: int
+    total:   Optional[int] = None
+    paginas: Optional[int] = None
+    siguiente_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -130,6 +131,8 @@ class GenerarPlantasRequest(BaseModel):
     tipo_diagnostico: str
     cantidad: int = Field(10, ge=1, le=100)
     patron_arvenses: bool = False
+    # "aleatorio" o "estratificado" (proporcional por surco)
+    modo_muestreo: Literal["aleatorio", "estratificado"] = "aleatorio"
 
 
 class PlantaGenerada(BaseModel):
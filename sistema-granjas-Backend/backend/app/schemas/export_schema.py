@@ -0,0 +1,25 @@
+from pydantic import BaseModel, model_validator
+from typing import Optional
+from datetime import date
+
+
+class FiltrosExportacion(BaseModel):
+    """
+    Filtros comunes de las exportaciones. Se traducen a condiciones WHERE en
+    DataframeFetchers; cada hoja aplica solo los que tienen sentido para ella.
+    """
+    lote_id: Optional[int] = None
+    granja_id: Optional[int] = None
+    programa_id: Optional[int] = None
+    estado: Optional[str] = None
+    tipo: Optional[str] = None
+    rol: Optional[str] = None
+    activo: Optional[bool] = None
+    fecha_desde: Optional[date] = None
+    fecha_hasta: Optional[date] = None
+
+    @model_validator(mode="after")
+    def validar_rango_fechas(self):
+        if self.fecha_desde and self.fecha_hasta and self.fecha_desde > self.fecha_hasta:
+            raise ValueError("fecha_desde no puede ser posterior a fecha_hasta")
+        return self
@@ -100,6 +100,34 @@ class ItemInventarioProgramaResponse(ItemInventarioProgramaBase):
     class Config:
         from_attributes = True
 
+# ========== MOVIMIENTOS (LIBRO DE INVENTARIO) ==========
+class AjusteInventarioRequest(BaseModel):
+    cantidad: float = Field(..., description="Entrada (positiva) o salida (negativa) del ítem")
+    motivo: Optional[str] = Field(None, max_length=200)
+
+    @field_validator('cantidad')
+    def cantidad_no_cero(cls, v):
+        if v == 0:
+            raise ValueError('La cantidad del ajuste no puede ser cero')
+        return v
+
+class MovimientoInventarioResponse(BaseModel):
+    id: int
+    item_id: int
+    origen: str
+    cantidad: float
+    cantidad_solicitada: float
+    saldo_resultante: float
+    labor_id: Optional[int] = None
+    producto_labor_id: Optional[int] = None
+    recomendacion_id: Optional[int] = None
+    usuario_id: Optional[int] = None
+    motivo: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 # ===== Respuestas enriquecidas =====
 class TipoConCamposResponse(ProgramaInventarioTipoResponse):
     campos: List[InventarioCampoResponse] = []
@@ -169,8 +169,9 @@ class LaborWithRecursosResponse(LaborResponse):
 
 class LaborListResponse(BaseModel):
     items: List[LaborResponse]
-    total: int
-    paginas: int
+    total: Optional[int] = None
+    paginas: Optional[int] = None
+    siguiente_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -130,8 +130,9 @@ class RecomendacionResponse(RecomendacionBase):
 
 class RecomendacionListResponse(BaseModel):
     items: List[RecomendacionResponse]
-    total: int
-    paginas: int
+    total: Optional[int] = None
+    paginas: Optional[int] = None
+    siguiente_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
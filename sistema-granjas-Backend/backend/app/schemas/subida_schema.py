@@ -0,0 +1,52 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+from app.schemas.evidencia_schema import TipoEvidencia, TipoEntidad
+
+
+class ArchivoSubida(BaseModel):
+    """Metadatos de un archivo que el cliente va a subir directo a R2."""
+    nombre: str = Field(..., min_length=1, max_length=255, description="Nombre original (se usa su extensión)")
+    content_type: str = Field(..., min_length=3, max_length=100)
+    tamano: int = Field(..., gt=0, description="Tamaño en bytes")
+    prefix: str = Field("foto", min_length=1, max_length=100, description="Grupo en fotos_subidas (p. ej. planta_12)")
+
+
+class FirmarSubidasRequest(BaseModel):
+    archivos: List[ArchivoSubida] = Field(..., min_length=1, max_length=50)
+
+
+class SubidaFirmada(BaseModel):
+    key: str
+    # PUT directo a R2 con exactamente estas cabeceras
+    url_subida: str
+    metodo: str = "PUT"
+    headers: Dict[str, str]
+    url_publica: str
+    # Se envía al confirmar la subida; identifica el archivo y a quien lo pidió
+    token: str
+    expira_en: int
+
+
+class FirmarSubidasResponse(BaseModel):
+    subidas: List[SubidaFirmada]
+
+
+class ConfirmarFotosRequest(BaseModel):
+    tokens: List[str] = Field(..., min_length=1, max_length=50)
+
+
+class ConfirmarEvidenciaRequest(BaseModel):
+    token: str
+    tipo: TipoEvidencia
+    descripcion: str = Field(..., min_length=5, max_length=500)
+    tipo_entidad: TipoEntidad
+    entidad_id: int = Field(..., gt=0)
+
+
+class SubidaVerificada(BaseModel):
+    key: str
+    url: str
+    prefix: str
+    content_type: Optional[str] = None
+    tamano: int
@@ -0,0 +1,67 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, Dict, Optional, List, Literal
+from datetime import datetime
+
+
+class OperacionSync(BaseModel):
+    """Acción registrada sin conexión; `clave` la genera el cliente (p. ej. un UUID)."""
+    clave: str = Field(..., min_length=1, max_length=100)
+    tipo: Literal["avance", "completar"]
+    labor_id: int = Field(..., gt=0)
+    avance_porcentaje: Optional[int] = Field(None, ge=0, le=100)
+    comentario: Optional[str] = Field(None, max_length=2000)
+    creado_en: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def avance_requerido(self):
+        if self.tipo == "avance" and self.avance_porcentaje is None:
+            raise ValueError("Las operaciones de avance requieren avance_porcentaje")
+        return self
+
+
+class SyncLoteRequest(BaseModel):
+    operaciones: List[OperacionSync] = Field(..., min_length=1, max_length=500)
+
+
+class LaborSyncEstado(BaseModel):
+    id: int
+    estado: Optional[str] = None
+    avance_porcentaje: Optional[int] = None
+
+
+class ResultadoOperacionSync(BaseModel):
+    clave: str
+    tipo: str
+    # aplicada y rechazada son definitivas (el cliente puede descartar la
+    # operación); error es transitorio y conviene reintentar
+    estado: Literal["aplicada", "rechazada", "error"]
+    status_code: int
+    detalle: Optional[str] = None
+    repetida: bool = False
+    labor: Optional[LaborSyncEstado] = None
+
+
+class SyncLoteResponse(BaseModel):
+    resultados: List[ResultadoOperacionSync]
+    aplicadas: int
+    rechazadas: int
+    errores: int
+
+
+class CambioSyncResponse(BaseModel):
+    seq: int
+    entidad: Literal["labor", "recomendacion", "diagnostico", "planta", "item_inventario"]
+    id: int
+    operacion: Literal["upsert", "delete"]
+    # Fila actual (solo en upsert); en delete es None
+    datos: Optional[Dict[str, Any]] = None
+
+
+class CambiosSyncResponse(BaseModel):
+    desde: int
+    # Valor de `since` para la siguiente llamada
+    hasta: int
+    hay_mas: bool
+    # El cliente trae un seq que esta base no conoce: debe descartar su copia y recargar
+    reiniciar: bool
+    cambios: List[CambioSyncResponse]
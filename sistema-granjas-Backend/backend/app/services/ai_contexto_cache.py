@@ -0,0 +1,218 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import (
+    Diagnostico, Recomendacion, Labor, Planta, Lote, LoteCultivo,
+    Usuario, TipoLote, CultivoEspecie, DiagnosticoTipo,
+    ProgramaInventarioTipo, ItemInventarioPrograma,
+    ProductoLabor, ProductoRecomendacion,
+)
+
+# Claves de versión:
+#   ("lote", id)       datos mostrados en el fragmento del lote (diagnósticos, recomendaciones, labores, plantas)
+#   ("programa", id)   totales de diagnósticos por programa_id
+#   ("inv", id)        inventario del programa
+#   ("global",)        nombres compartidos por todos los lotes (usuarios, tipos de lote, cultivos, subtipos)
+#   ("inv_global",)    cambio de inventario cuyo programa no se conoce en memoria
+Clave = Tuple[Hashable, ...]
+
+_POR_LOTE = (Diagnostico, Recomendacion, Labor, Planta, LoteCultivo)
+_COMPARTIDOS = (TipoLote, CultivoEspecie, DiagnosticoTipo)
+_TABLAS_LOTE = {m.__table__.name for m in _POR_LOTE + _COMPARTIDOS + (Lote,)}
+_TABLAS_INVENTARIO = {
+    m.__table__.name for m in (ProgramaInventarioTipo, ItemInventarioPrograma, ProductoLabor, ProductoRecomendacion)
+}
+
+
+class _EntradasTTL:
+    """LRU acotado con caducidad; cada entrada guarda la firma con la que se construyó."""
+
+    def __init__(self, max_entradas: int):
+        self.max_entradas = max_entradas
+        self._datos: "OrderedDict[Hashable, Tuple[float, Any, Any]]" = OrderedDict()
+
+    def obtener(self, clave: Hashable, firma: Any, ttl: float) -> Optional[Any]:
+        entrada = self._datos.get(clave)
+        if entrada is None or entrada[1] != firma or time.monotonic() - entrada[0] > ttl:
+            return None
+        self._datos.move_to_end(clave)
+        return entrada[2]
+
+    def guardar(self, clave: Hashable, firma: Any, valor: Any) -> None:
+        self._datos[clave] = (time.monotonic(), firma, valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+
+
+class ContextoIACache:
+    """
+    Caché en proceso del contexto del asistente de IA.
+
+    El contexto se arma con fragmentos (un lote, el inventario de un programa,
+    los totales de una granja o programa) guardados junto con la versión de los
+    datos de los que salen. Las versiones suben solo cuando se confirma una
+    escritura sobre esas filas (ver los listeners de sesión al final del
+    módulo), así que los turnos siguientes del chat reutilizan todo lo que no
+    cambió. Encima, el contexto completo se guarda por (rol, ids de alcance)
+    con la firma de todos sus fragmentos.
+
+    Las escrituras hechas en otro worker no se ven aquí: el TTL acota cuánto
+    puede tardar en reflejarse un cambio en ese caso.
+    """
+
+    def __init__(self, ttl_segundos: int, max_fragmentos: int = 4096, max_snapshots: int = 128):
+        self.ttl = ttl_segundos
+        self._versiones: Dict[Clave, int] = {}
+        self._contador = itertools.count(1)
+        self._fragmentos = _EntradasTTL(max_fragmentos)
+        self._snapshots = _EntradasTTL(max_snapshots)
+        self._programa_de_tipo: Dict[int, int] = {}
+        self._programa_de_item: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    # ── Versiones ────────────────────────────────────────────────────────────
+    def version(self, *clave: Hashable) -> int:
+        return self._versiones.get(clave, 0)
+
+    def invalidar(self, claves: Iterable[Clave]) -> None:
+        with self._lock:
+            for clave in claves:
+                self._versiones[clave] = next(self._contador)
+
+    def registrar_inventario(self, programa_id: int, tipo_ids: Iterable[int], item_ids: Iterable[int]) -> None:
+        """Recuerda a qué programa pertenecen tipos e ítems para invalidar solo ese programa."""
+        with self._lock:
+            for tipo_id in tipo_ids:
+                self._programa_de_tipo[tipo_id] = programa_id
+            for item_id in item_ids:
+                self._programa_de_item[item_id] = programa_id
+
+    def clave_inventario(self, item_id: Optional[int] = None, tipo_id: Optional[int] = None) -> Clave:
+        """Versión a invalidar por un cambio en un ítem/tipo; si no se conoce su programa, la global."""
+        programa_id = self._programa_de_item.get(item_id)
+        if programa_id is None:
+            programa_id = self._programa_de_tipo.get(tipo_id)
+        return ("inv", programa_id) if programa_id is not None else ("inv_global",)
+
+    # ── Fragmentos y snapshots ───────────────────────────────────────────────
+    def obtener_fragmento(self, clave: Hashable, firma: Any) -> Optional[list]:
+        with self._lock:
+            return self._fragmentos.obtener(clave, firma, self.ttl)
+
+    def guardar_fragmento(self, clave: Hashable, firma: Any, lineas: list) -> None:
+        with self._lock:
+            self._fragmentos.guardar(clave, firma, lineas)
+
+    def fragmento(self, clave: Hashable, firma: Any, construir: Callable[[], list]) -> list:
+        """
+        Devuelve las líneas en caché o las construye. La firma se calcula
+        antes de construir: si algo cambia a mitad, la siguiente lectura ve
+        una versión mayor y reconstruye.
+        """
+        lineas = self.obtener_fragmento(clave, firma)
+        if lineas is None:
+            lineas = construir()
+            self.guardar_fragmento(clave, firma, lineas)
+        return lineas
+
+    def snapshot(self, clave: Hashable, firma: Any, construir: Callable[[], Any]) -> Any:
+        with self._lock:
+            contexto = self._snapshots.obtener(clave, firma, self.ttl)
+        if contexto is None:
+            contexto = construir()
+            with self._lock:
+                self._snapshots.guardar(clave, firma, contexto)
+        return contexto
+
+
+contexto_ia = ContextoIACache(ttl_segundos=settings.AI_CONTEXTO_TTL_SEGUNDOS)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Invalidación: se acumula en cada flush y se aplica al confirmar la transacción
+# ─────────────────────────────────────────────────────────────────────────────
+
+_PENDIENTES = "ai_contexto_pendientes"
+
+
+def _valores(obj, atributo: str) -> Set[Any]:
+    """Valor actual y anterior (si cambió) de un atributo."""
+    historia = inspect(obj).attrs[atributo].history
+    return {v for v in (*historia.added, *historia.unchanged, *historia.deleted) if v is not None}
+
+
+def _claves_objeto(obj, nuevo: bool) -> Set[Clave]:
+    claves: Set[Clave] = set()
+    if isinstance(obj, _POR_LOTE):
+        claves.update(("lote", lote_id) for lote_id in _valores(obj, "lote_id"))
+        if isinstance(obj, Diagnostico):
+            claves.update(("programa", p) for p in _valores(obj, "programa_id"))
+    elif isinstance(obj, Lote):
+        if obj.id is not None:
+            claves.add(("lote", obj.id))
+    elif isinstance(obj, Usuario):
+        # Solo el nombre aparece en el contexto (autores, docentes, trabajadores)
+        if not nuevo and inspect(obj).attrs.nombre.history.has_changes():
+            claves.add(("global",))
+    elif isinstance(obj, _COMPARTIDOS):
+        if not nuevo:
+            claves.add(("global",))
+    elif isinstance(obj, ProgramaInventarioTipo):
+        claves.update(("inv", p) for p in _valores(obj, "programa_id"))
+    elif isinstance(obj, ItemInventarioPrograma):
+        claves.add(contexto_ia.clave_inventario(item_id=obj.id, tipo_id=obj.tipo_id))
+    elif isinstance(obj, (ProductoLabor, ProductoRecomendacion)):
+        claves.update(contexto_ia.clave_inventario(item_id=i) for i in _valores(obj, "inventario_item_id"))
+    return claves
+
+
+@event.listens_for(Session, "after_flush")
+def _al_flush(session, flush_context):
+    pendientes = session.info.setdefault(_PENDIENTES, set())
+    for obj in session.new:
+        pendientes |= _claves_objeto(obj, nuevo=True)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            pendientes |= _claves_objeto(obj, nuevo=False)
+    for obj in session.deleted:
+        pendientes |= _claves_objeto(obj, nuevo=False)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _al_ejecutar(estado):
+    """INSERT/UPDATE/DELETE masivos (Query.update/delete, Core vía Session.execute)."""
+    if not (estado.is_insert or estado.is_update or estado.is_delete):
+        return
+    tabla = getattr(estado.statement, "table", None)
+    nombre = getattr(tabla, "name", None)
+    pendientes = estado.session.info.setdefault(_PENDIENTES, set())
+    if nombre in _TABLAS_LOTE:
+        pendientes.add(("global",))
+    elif nombre in _TABLAS_INVENTARIO:
+        pendientes.add(("inv_global",))
+
+
+@event.listens_for(Session, "after_commit")
+def _al_confirmar(session):
+    # Liberar un savepoint no confirma nada todavía: se espera a la transacción externa
+    if session.in_nested_transaction():
+        return
+    pendientes = session.info.pop(_PENDIENTES, None)
+    if pendientes:
+        contexto_ia.invalidar(pendientes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _al_revertir(session):
+    # Revertir un savepoint conserva lo acumulado fuera de él (invalidar de más es inocuo)
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_PENDIENTES, None)
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from typing import Iterator
+
+from app.core.config import settings
+
+
+class ModeloOcupado(Exception):
+    """No hubo cupo para otra llamada al modelo dentro de AI_ESPERA_COLA_SEGUNDOS."""
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Modelos
+# ─────────────────────────────────────────────────────────────────────────────
+
+class _Respuesta:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class ModeloLocal:
+    """
+    Modelo de prueba sin red (AI_MODELO=stub). Responde con un texto fijo que
+    repite la pregunta del prompt y, en modo stream, lo entrega palabra a
+    palabra con AI_STUB_RETARDO_MS entre fragmentos. Misma interfaz que
+    `genai.GenerativeModel.generate_content`.
+    """
+
+    def __init__(self, retardo_ms: int = 0):
+        self.retardo = retardo_ms / 1000
+
+    @staticmethod
+    def _responder(prompt: str) -> str:
+        pregunta = prompt.rsplit("PREGUNTA:", 1)[-1].replace("RESPUESTA:", "").strip()
+        pregunta = pregunta or prompt.strip().split("\n", 1)[0]
+        return f"Respuesta de prueba a: {pregunta[:200]} ({len(prompt)} caracteres de contexto)"
+
+    def _fragmentos(self, texto: str) -> Iterator[_Respuesta]:
+        palabras = texto.split(" ")
+        for i, palabra in enumerate(palabras):
+            if self.retardo:
+                time.sleep(self.retardo)
+            yield _Respuesta(palabra if i == 0 else " " + palabra)
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        texto = self._responder(prompt)
+        if stream:
+            return self._fragmentos(texto)
+        if self.retardo:
+            time.sleep(self.retardo)
+        return _Respuesta(texto)
+
+
+def _get_gemini_model():
+    import google.generativeai as genai
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY no está configurada")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel("gemini-2.5-flash")
+
+
+def obtener_modelo():
+    if settings.AI_MODELO == "stub":
+        return ModeloLocal(settings.AI_STUB_RETARDO_MS)
+    return _get_gemini_model()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Límite de llamadas simultáneas
+# ─────────────────────────────────────────────────────────────────────────────
+
+class LimiteLLM:
+    """
+    Semáforo de llamadas salientes al modelo. Cada generación (completa o en
+    stream) ocupa un cupo hasta terminar; quien no obtiene cupo en
+    `espera_segundos` recibe ModeloOcupado (503) en vez de quedarse
+    bloqueando un hilo del threadpool indefinidamente.
+    """
+
+    def __init__(self, max_concurrencia: int, espera_segundos: float):
+        self.max_concurrencia = max_concurrencia
+        self.espera = espera_segundos
+        self._semaforo = threading.BoundedSemaphore(max_concurrencia)
+        self._lock = threading.Lock()
+        self.activas = 0
+
+    def adquirir(self) -> "Cupo":
+        if not self._semaforo.acquire(timeout=self.espera):
+            raise ModeloOcupado("El asistente de IA está atendiendo demasiadas solicitudes, intenta de nuevo")
+        with self._lock:
+            self.activas += 1
+        return Cupo(self)
+
+    def _liberar(self) -> None:
+        with self._lock:
+            self.activas -= 1
+        self._semaforo.release()
+
+
+class Cupo:
+    """Cupo adquirido; `liberar` es idempotente para poder llamarlo desde varios finally."""
+
+    def __init__(self, limite: LimiteLLM):
+        self._limite = limite
+        self._liberado = False
+
+    def liberar(self) -> None:
+        if not self._liberado:
+            self._liberado = True
+            self._limite._liberar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.liberar()
+
+
+limite_llm = LimiteLLM(settings.AI_MAX_CONCURRENCIA, settings.AI_ESPERA_COLA_SEGUNDOS)
+
+
+def generar(prompt: str) -> str:
+    """Respuesta completa del modelo, dentro del límite de concurrencia."""
+    with limite_llm.adquirir():
+        return obtener_modelo().generate_content(prompt).text
+
+
+def generar_stream(prompt: str, cupo: Cupo) -> Iterator[str]:
+    """
+    Texto del modelo a medida que llega. El cupo se adquiere antes (para poder
+    responder 503 antes de empezar el stream) y se libera al terminar, fallar
+    o cerrarse el generador porque el cliente se desconectó.
+    """
+    try:
+        for fragmento in obtener_modelo().generate_content(prompt, stream=True):
+            try:
+                texto = fragmento.text
+            except ValueError:
+                # Fragmento sin partes de texto (p. ej. bloqueado por seguridad)
+                continue
+            if texto:
+                yield texto
+    finally:
+        cupo.liberar()
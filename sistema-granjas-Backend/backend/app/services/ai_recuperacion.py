@@ -0,0 +1,199 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante con como cual cuales cuando cuanto cuanta cuantos
+cuantas de del desde donde el ella ellas ellos en entre era es esa ese eso esta estan estas este esto
+estos fue hay la las le les lo los mas me mi mis muy no nos o para pero por que quien se sea ser si
+sin sobre su sus tiene tienen todo todos tu un una uno unos unas y ya
+""".split())
+
+_PALABRA = re.compile(r"[a-z0-9]+")
+
+
+def _raiz(termino: str) -> str:
+    """Plurales simples del español: 'labores' → 'labor', 'plagas' → 'plaga'."""
+    if termino.isdigit() or len(termino) <= 4:
+        return termino
+    if termino.endswith("es") and termino[-3] not in "aeiou":
+        return termino[:-2]
+    if termino.endswith("s"):
+        return termino[:-1]
+    return termino
+
+
+def terminos(texto: str) -> List[str]:
+    """Minúsculas, sin tildes ni stopwords, con plurales reducidos."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [
+        _raiz(t) for t in _PALABRA.findall(texto)
+        if t not in _STOPWORDS and (len(t) > 1 or t.isdigit())
+    ]
+
+
+def estimar_tokens(lineas: Sequence[str]) -> int:
+    """Aproximación de tokens del modelo (~4 caracteres por token)."""
+    return sum(len(linea) + 1 for linea in lineas) // 4 + 1
+
+
+class Bloque(NamedTuple):
+    """
+    Unidad recuperable del contexto. `padre` es el índice de otro bloque del
+    mismo grupo; los bloques sin padre son el ancla del grupo (encabezado y
+    TOTAL del lote o del inventario) y se emiten siempre que el grupo aparezca.
+    """
+    tipo: str
+    lineas: Tuple[str, ...]
+    padre: Optional[int] = None
+
+
+class GrupoBloques:
+    """Bloques de un lote o del inventario de un programa, en orden de aparición."""
+
+    def __init__(self):
+        self.bloques: List[Bloque] = []
+
+    def agregar(self, tipo: str, lineas: Sequence[str], padre: Optional[int] = None) -> int:
+        self.bloques.append(Bloque(tipo, tuple(lineas), padre))
+        return len(self.bloques) - 1
+
+    def lineas(self) -> List[str]:
+        return [linea for bloque in self.bloques for linea in bloque.lineas]
+
+
+class IndiceBM25:
+    """BM25 en memoria sobre listas de términos (k1=1.5, b=0.75)."""
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, documentos: List[List[str]]):
+        self.frecuencias = [Counter(doc) for doc in documentos]
+        self.longitudes = [len(doc) for doc in documentos]
+        self.promedio = (sum(self.longitudes) / len(documentos)) if documentos else 0.0
+        df: Counter = Counter()
+        for frecuencia in self.frecuencias:
+            df.update(frecuencia.keys())
+        n = len(documentos)
+        self.idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+
+    def puntajes(self, consulta: List[str]) -> List[float]:
+        terminos_consulta = [t for t in set(consulta) if t in self.idf]
+        resultado = [0.0] * len(self.frecuencias)
+        if not terminos_consulta:
+            return resultado
+        for i, frecuencia in enumerate(self.frecuencias):
+            norma = self.K1 * (1 - self.B + self.B * self.longitudes[i] / (self.promedio or 1))
+            puntaje = 0.0
+            for t in terminos_consulta:
+                f = frecuencia.get(t)
+                if f:
+                    puntaje += self.idf[t] * f * (self.K1 + 1) / (f + norma)
+            resultado[i] = puntaje
+        return resultado
+
+
+class ContextoRecuperable:
+    """
+    Contexto del asistente como secuencia de líneas fijas (encabezados de
+    granja/programa y sus TOTAL) y grupos de bloques (lotes, inventarios).
+
+    `texto_completo` reproduce el contexto entero. `seleccionar` conserva las
+    líneas fijas y, si el total supera el presupuesto de tokens, solo los
+    bloques más relevantes para la pregunta según BM25, con sus anclas.
+    """
+
+    NOTA_FILTRADO = (
+        "(Contexto filtrado por relevancia: se muestran {n} de {total} registros. "
+        "Los TOTAL de cada granja, programa y lote son completos.)"
+    )
+
+    def __init__(self, partes: List[Union[str, GrupoBloques]]):
+        self.partes = partes
+        self._grupos = [p for p in partes if isinstance(p, GrupoBloques)]
+        self._indice: Optional[IndiceBM25] = None
+        self._refs: List[Tuple[int, int]] = []  # (grupo, bloque) de cada documento
+        self._completo: Optional[str] = None
+
+    def texto_completo(self) -> str:
+        if self._completo is None:
+            lineas: List[str] = []
+            for parte in self.partes:
+                lineas.extend(parte.lineas() if isinstance(parte, GrupoBloques) else [parte])
+            self._completo = "\n".join(lineas)
+        return self._completo
+
+    def _indexar(self) -> IndiceBM25:
+        if self._indice is None:
+            documentos, refs = [], []
+            for g, grupo in enumerate(self._grupos):
+                cabecera = grupo.bloques[0].lineas[0] if grupo.bloques and grupo.bloques[0].lineas else ""
+                for b, bloque in enumerate(grupo.bloques):
+                    # Cada bloque hereda el nombre de su grupo y de su padre (lote, categoría)
+                    texto = [bloque.tipo, cabecera, *bloque.lineas]
+                    if bloque.padre is not None:
+                        texto.append(grupo.bloques[bloque.padre].lineas[0])
+                    documentos.append(terminos(" ".join(texto)))
+                    refs.append((g, b))
+            self._refs, self._indice = refs, IndiceBM25(documentos)
+        return self._indice
+
+    def _con_ancestros(self, g: int, b: int, elegidos: Dict[int, Set[int]]) -> Set[int]:
+        """Bloques que habría que añadir para mostrar (g, b) con su contexto."""
+        grupo = self._grupos[g].bloques
+        actuales = elegidos.get(g)
+        nuevos: Set[int] = set()
+        if actuales is None:
+            nuevos |= {i for i, bloque in enumerate(grupo) if bloque.padre is None}
+        while b is not None and b not in nuevos and not (actuales and b in actuales):
+            nuevos.add(b)
+            b = grupo[b].padre
+        return nuevos
+
+    def seleccionar(self, pregunta: str, max_tokens: int, top_k: int) -> str:
+        completo = self.texto_completo()
+        if estimar_tokens(completo.split("\n")) <= max_tokens or not self._grupos:
+            return completo
+
+        indice = self._indexar()
+        puntajes = indice.puntajes(terminos(pregunta))
+        # Primero lo relevante; sin coincidencias se prioriza el resumen de cada grupo
+        orden = sorted(
+            range(len(self._refs)),
+            key=lambda i: (-puntajes[i], self._grupos[self._refs[i][0]].bloques[self._refs[i][1]].padre is not None, i),
+        )
+
+        fijas = [p for p in self.partes if isinstance(p, str)]
+        usados = estimar_tokens(fijas)
+        elegidos: Dict[int, Set[int]] = {}
+        seleccionados = 0
+        for i in orden:
+            if seleccionados >= top_k:
+                break
+            g, b = self._refs[i]
+            nuevos = self._con_ancestros(g, b, elegidos)
+            if not nuevos:
+                continue
+            costo = estimar_tokens([l for n in nuevos for l in self._grupos[g].bloques[n].lineas])
+            if usados + costo > max_tokens:
+                continue
+            elegidos.setdefault(g, set()).update(nuevos)
+            usados += costo
+            seleccionados += 1
+
+        lineas: List[str] = []
+        g = 0
+        for parte in self.partes:
+            if isinstance(parte, GrupoBloques):
+                for n in sorted(elegidos.get(g, ())):
+                    lineas.extend(parte.bloques[n].lineas)
+                g += 1
+            else:
+                lineas.append(parte)
+        mostrados = sum(len(v) for v in elegidos.values())
+        lineas.append("\n" + self.NOTA_FILTRADO.format(n=mostrados, total=len(self._refs)))
+        return "\n".join(lineas)
@@ -1,37 +1,34 @@
-import os
 import json
 import logging
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func as sqlfunc
+from collections import defaultdict
+from typing import List
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func as sqlfunc, or_
 from app.db.models import (
     Diagnostico, Recomendacion, Granja, Programa, Lote,
     Labor, Usuario, Planta,
     ProgramaInventarioTipo, ItemInventarioPrograma,
     ProductoLabor, ProductoRecomendacion,
 )
+from app.core.config import settings
+from app.services.ai_contexto_cache import contexto_ia
+from app.services.ai_modelo import generar
+from app.services.ai_recuperacion import ContextoRecuperable, GrupoBloques
 
 logger = logging.getLogger(__name__)
 
 
-# ─────────────────────────────────────────────────────────────────────────────
-# Modelo Gemini
-# ─────────────────────────────────────────────────────────────────────────────
-
-def _get_gemini_model():
-    import google.generativeai as genai
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY no está configurada")
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel("gemini-2.5-flash")
-
-
 # ─────────────────────────────────────────────────────────────────────────────
 # Helper: contexto detallado de UN lote
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _contexto_lote(db: Session, lote: Lote, ind: str = "  ") -> list:
-    """Devuelve lista de líneas con el contexto completo de un lote."""
+def _contexto_lote(db: Session, lote: Lote, ind: str = "  ") -> GrupoBloques:
+    """
+    Contexto completo de un lote en bloques: el encabezado y las líneas TOTAL
+    son el ancla del grupo; cada diagnóstico, recomendación y labor reciente
+    es un bloque recuperable por separado.
+    """
+    grupo = GrupoBloques()
     partes = []
 
     # ── Info básica ──────────────────────────────────────────────────────────
@@ -66,6 +63,7 @@ def _contexto_lote(db: Session, lote: Lote, ind: str = "  ") -> list:
         .group_by(Diagnostico.estado_revision).all()
     )
     partes.append(f"{ind}   Diagnósticos — TOTAL: {total_diags} | Por estado: {json.dumps(estados_diags, ensure_ascii=False)}")
+    grupo.agregar("lote", partes)
 
     diags_recientes = (
         db.query(Diagnostico)
@@ -78,10 +76,10 @@ def _contexto_lote(db: Session, lote: Lote, ind: str = "  ") -> list:
         autor = d.usuario.nombre if d.usuario else "—"
         subtipo = d.diagnostico_tipo.nombre if d.diagnostico_tipo else "—"
         fecha = d.fecha_creacion.strftime("%d/%m/%Y") if d.fecha_creacion else "—"
-        partes.append(
+        grupo.agregar("diagnostico", [
             f"{ind}     · Diag #{d.id} | {d.tipo_diagnostico} / {subtipo} | {d.estado_revision} | "
             f"Cond: {d.condiciones_dia} | Autor: {autor} | {fecha}"
-        )
+        ], padre=0)
 
     # ── Recomendaciones ──────────────────────────────────────────────────────
     total_recs = db.query(sqlfunc.count(Recomendacion.id)).filter(Recomendacion.lote_id == lote.id).scalar() or 0
@@ -90,7 +88,7 @@ def _contexto_lote(db: Session, lote: Lote, ind: str = "  ") -> list:
         .filter(Recomendacion.lote_id == lote.id)
         .group_by(Recomendacion.estado).all()
     )
-    partes.append(f"{ind}   Recomendaciones — TOTAL: {total_recs} | Por estado: {json.dumps(estados_recs, ensure_ascii=False)}")
+    grupo.agregar("lote", [f"{ind}   Recomendaciones — TOTAL: {total_recs} | Por estado: {json.dumps(estados_recs, ensure_ascii=False)}"])
 
     recs_recientes = (
         db.query(Recomendacion)
@@ -103,12 +101,13 @@ def _contexto_lote(db: Session, lote: Lote, ind: str = "  ") -> list:
         docente = r.docente.nombre if r.docente else "—"
         fecha = r.fecha_creacion.strftime("%d/%m/%Y") if r.fecha_creacion else "—"
         desc = (r.descripcion or "")[:120]
-        partes.append(
+        lineas = [
             f"{ind}     · Rec #{r.id} | \"{r.titulo}\" | Estado: {r.estado} | Tipo: {r.tipo or '—'} | "
             f"Docente: {docente} | {fecha}"
-        )
+        ]
         if desc:
-            partes.append(f"{ind}       Descripción: {desc}")
+            lineas.append(f"{ind}       Descripción: {desc}")
+        grupo.agregar("recomendacion", lineas, padre=0)
 
     # ── Labores ──────────────────────────────────────────────────────────────
     total_labores = db.query(sqlfunc.count(Labor.id)).filter(Labor.lote_id == lote.id).scalar() or 0
@@ -117,7 +116,7 @@ def _contexto_lote(db: Session, lote: Lote, ind: str = "  ") -> list:
         .filter(Labor.lote_id == lote.id)
         .group_by(Labor.estado).all()
     )
-    partes.append(f"{ind}   Labores — TOTAL: {total_labores} | Por estado: {json.dumps(estados_labores, ensure_ascii=False)}")
+    grupo.agregar("lote", [f"{ind}   Labores — TOTAL: {total_labores} | Por estado: {json.dumps(estados_labores, ensure_ascii=False)}"])
 
     labores_recientes = (
         db.query(Labor)
@@ -131,12 +130,12 @@ def _contexto_lote(db: Session, lote: Lote, ind: str = "  ") -> list:
         rec_titulo = l.recomendacion.titulo if l.recomendacion else "—"
         fecha = l.fecha_asignacion.strftime("%d/%m/%Y") if l.fecha_asignacion else "—"
         desc = (l.comentario or "Sin descripción")[:100]
-        partes.append(
+        grupo.agregar("labor", [
             f"{ind}     · Labor #{l.id} | {desc} | Estado: {l.estado} | Avance: {l.avance_porcentaje}% | "
             f"Trabajador: {trabajador} | Rec: \"{rec_titulo}\" | {fecha}"
-        )
+        ], padre=0)
 
-    return partes
+    return grupo
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -162,9 +161,9 @@ def _totales_granja(db: Session, granja_id: int) -> list:
 # Helper: inventario de un programa
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _contexto_inventario_programa(db: Session, prog: Programa, ind: str = "  ") -> list:
-    """Devuelve líneas con el inventario completo del programa, agrupado por categoría."""
-    partes = []
+def _contexto_inventario_programa(db: Session, prog: Programa, ind: str = "  ") -> GrupoBloques:
+    """Inventario completo del programa en bloques: categoría → ítem (con sus usos)."""
+    grupo = GrupoBloques()
 
     tipos = (
         db.query(ProgramaInventarioTipo)
@@ -177,10 +176,10 @@ def _contexto_inventario_programa(db: Session, prog: Programa, ind: str = "  ")
     )
 
     if not tipos:
-        partes.append(f"{ind}Inventario: sin categorías registradas.")
-        return partes
+        grupo.agregar("inventario", [f"{ind}Inventario: sin categorías registradas."])
+        return grupo
 
-    partes.append(f"{ind}Inventario del programa (categorías: {len(tipos)}):")
+    grupo.agregar("inventario", [f"{ind}Inventario del programa (categorías: {len(tipos)}):"])
 
     for tipo in tipos:
         items = (
@@ -190,10 +189,16 @@ def _contexto_inventario_programa(db: Session, prog: Programa, ind: str = "  ")
             .all()
         )
 
+        contexto_ia.registrar_inventario(prog.id, [tipo.id], [i.id for i in items])
+
         total_items = len(items)
         total_disponible = sum((i.cantidad_disponible or 0) for i in items)
 
-        partes.append(f"{ind}  ▸ Categoría: {tipo.nombre} ({total_items} ítems | disponible total: {total_disponible})")
+        categoria = grupo.agregar(
+            "inventario",
+            [f"{ind}  ▸ Categoría: {tipo.nombre} ({total_items} ítems | disponible total: {total_disponible})"],
+            padre=0,
+        )
 
         for item in items:
             # El nombre del ítem viene del JSON dinámico; buscamos claves comunes
@@ -206,9 +211,9 @@ def _contexto_inventario_programa(db: Session, prog: Programa, ind: str = "  ")
             fecha = item.fecha_inventario.strftime("%d/%m/%Y") if item.fecha_inventario else "—"
             obs   = (item.observaciones or "")[:80]
 
-            partes.append(
+            partes = [
                 f"{ind}    · {nombre_item} | Disponible: {item.cantidad_disponible} {item.unidad_medida or ''} | Fecha: {fecha}"
-            )
+            ]
             if obs:
                 partes.append(f"{ind}      Obs: {obs}")
 
@@ -238,89 +243,182 @@ def _contexto_inventario_programa(db: Session, prog: Programa, ind: str = "  ")
                 partes.append(
                     f"{ind}      ↳ Sugerido en Rec #{s.recomendacion_id}: {s.cantidad_sugerida} {item.unidad_medida or ''}"
                 )
+            grupo.agregar("inventario", partes, padre=categoria)
 
-    return partes
+    return grupo
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Fragmentos en caché (ver app/services/ai_contexto_cache.py)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _firma_lote(lote_id: int) -> tuple:
+    return (contexto_ia.version("lote", lote_id), contexto_ia.version("global"))
+
+
+def _firma_inventario(programa_id: int) -> tuple:
+    return (contexto_ia.version("inv", programa_id), contexto_ia.version("inv_global"))
+
+
+def _fragmentos_lotes(db: Session, lote_ids: list, ind: str) -> List[GrupoBloques]:
+    """Contexto de varios lotes; los que no están en caché se cargan en una sola consulta."""
+    firmas = {lote_id: _firma_lote(lote_id) for lote_id in lote_ids}
+    fragmentos = {
+        lote_id: contexto_ia.obtener_fragmento(("lote", lote_id, ind), firmas[lote_id])
+        for lote_id in lote_ids
+    }
+    faltantes = [lote_id for lote_id, lineas in fragmentos.items() if lineas is None]
+    if faltantes:
+        for lote in db.query(Lote).filter(Lote.id.in_(faltantes)).all():
+            fragmentos[lote.id] = _contexto_lote(db, lote, ind=ind)
+            contexto_ia.guardar_fragmento(("lote", lote.id, ind), firmas[lote.id], fragmentos[lote.id])
+
+    return [fragmentos[lote_id] for lote_id in lote_ids if fragmentos[lote_id] is not None]
+
+
+def _fragmento_inventario(db: Session, prog: Programa, ind: str) -> GrupoBloques:
+    return contexto_ia.fragmento(
+        ("inv", prog.id, ind), _firma_inventario(prog.id),
+        lambda: _contexto_inventario_programa(db, prog, ind=ind),
+    )
+
+
+def _fragmento_totales_granja(db: Session, granja_id: int, lote_ids: list) -> list:
+    firma = tuple((lote_id, _firma_lote(lote_id)) for lote_id in lote_ids)
+    return contexto_ia.fragmento(("granja", granja_id), firma, lambda: _totales_granja(db, granja_id))
+
+
+def _totales_programa(db: Session, prog: Programa) -> list:
+    t_diags_prog = db.query(sqlfunc.count(Diagnostico.id)).filter(Diagnostico.programa_id == prog.id).scalar() or 0
+    e_diags_prog = dict(db.query(Diagnostico.estado_revision, sqlfunc.count(Diagnostico.id)).filter(Diagnostico.programa_id == prog.id).group_by(Diagnostico.estado_revision).all())
+    t_recs_prog  = db.query(sqlfunc.count(Recomendacion.id)).join(Lote, Recomendacion.lote_id == Lote.id).filter(Lote.programa_id == prog.id).scalar() or 0
+    e_recs_prog  = dict(db.query(Recomendacion.estado, sqlfunc.count(Recomendacion.id)).join(Lote, Recomendacion.lote_id == Lote.id).filter(Lote.programa_id == prog.id).group_by(Recomendacion.estado).all())
+    t_labs_prog  = db.query(sqlfunc.count(Labor.id)).join(Lote, Labor.lote_id == Lote.id).filter(Lote.programa_id == prog.id).scalar() or 0
+    e_labs_prog  = dict(db.query(Labor.estado, sqlfunc.count(Labor.id)).join(Lote, Labor.lote_id == Lote.id).filter(Lote.programa_id == prog.id).group_by(Labor.estado).all())
+    return [
+        f"  Diagnósticos TOTAL: {t_diags_prog} | {json.dumps(e_diags_prog, ensure_ascii=False)}",
+        f"  Recomendaciones TOTAL: {t_recs_prog} | {json.dumps(e_recs_prog, ensure_ascii=False)}",
+        f"  Labores TOTAL: {t_labs_prog} | {json.dumps(e_labs_prog, ensure_ascii=False)}",
+    ]
+
+
+def _fragmento_totales_programa(db: Session, prog: Programa, lote_ids: list) -> list:
+    firma = (contexto_ia.version("programa", prog.id),) + tuple(
+        (lote_id, _firma_lote(lote_id)) for lote_id in lote_ids
+    )
+    return contexto_ia.fragmento(("programa", prog.id), firma, lambda: _totales_programa(db, prog))
+
+
+def _lotes_en_alcance(db: Session, programa_ids: list, granja_ids: list = ()):
+    """(lotes por programa, lotes por granja) con una sola consulta de ids."""
+    condiciones = [Lote.programa_id.in_(programa_ids)]
+    if granja_ids:
+        condiciones.append(Lote.granja_id.in_(granja_ids))
+    por_programa, por_granja = defaultdict(list), defaultdict(list)
+    for lote_id, programa_id, granja_id in (
+        db.query(Lote.id, Lote.programa_id, Lote.granja_id).filter(or_(*condiciones)).order_by(Lote.id).all()
+    ):
+        por_programa[programa_id].append(lote_id)
+        por_granja[granja_id].append(lote_id)
+    return por_programa, por_granja
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Constructor principal de contexto
 # ─────────────────────────────────────────────────────────────────────────────
 
+def _contexto_granjas(db: Session, rol: str, granjas: list, titulo: str) -> ContextoRecuperable:
+    """Contexto de admin / jefe_talento_humano / talento_humano: granja → programa → lote."""
+    programa_ids = sorted({p.id for g in granjas for p in g.programas})
+    lotes_programa, lotes_granja = _lotes_en_alcance(db, programa_ids, [g.id for g in granjas])
+
+    # La firma cubre la estructura visible y la versión de cada fragmento
+    firma = (
+        titulo,
+        tuple(
+            (g.id, g.nombre, g.ubicacion, tuple((p.id, p.nombre, p.tipo) for p in g.programas))
+            for g in granjas
+        ),
+        tuple((g.id, tuple(lotes_granja[g.id])) for g in granjas),
+        tuple((p, tuple(lotes_programa[p])) for p in programa_ids),
+        tuple(_firma_lote(lote_id) for ids in lotes_granja.values() for lote_id in ids),
+        tuple(_firma_inventario(p) for p in programa_ids),
+    )
+
+    def construir() -> ContextoRecuperable:
+        partes = [titulo]
+        for granja in granjas:
+            partes.append(f"\n=== GRANJA: {granja.nombre} — {granja.ubicacion} (ID {granja.id}) ===")
+            partes.extend(_fragmento_totales_granja(db, granja.id, lotes_granja[granja.id]))
+            for prog in granja.programas:
+                partes.append(f"\n  Programa: {prog.nombre} ({prog.tipo}) — ID {prog.id}")
+                partes.append(f"  Total lotes: {len(lotes_programa[prog.id])}")
+                partes.extend(_fragmentos_lotes(db, lotes_programa[prog.id], "    "))
+                partes.append(_fragmento_inventario(db, prog, "    "))
+        return ContextoRecuperable(partes)
+
+    return contexto_ia.snapshot((rol, tuple(g.id for g in granjas)), firma, construir)
+
+
+def _contexto_programas(db: Session, rol: str, programas: list) -> ContextoRecuperable:
+    """Contexto de docente / asesor / estudiante: sus programas → lotes."""
+    programa_ids = [p.id for p in programas]
+    lotes_programa, _ = _lotes_en_alcance(db, programa_ids)
+    titulo = f"Programas asignados: {', '.join(p.nombre for p in programas) or 'Ninguno'}"
+
+    firma = (
+        titulo,
+        tuple((p.id, p.nombre, p.tipo, tuple(lotes_programa[p.id])) for p in programas),
+        tuple(contexto_ia.version("programa", p) for p in programa_ids),
+        tuple(_firma_lote(lote_id) for p in programa_ids for lote_id in lotes_programa[p]),
+        tuple(_firma_inventario(p) for p in programa_ids),
+    )
+
+    def construir() -> ContextoRecuperable:
+        partes = [titulo]
+        for prog in programas:
+            partes.append(f"\n=== PROGRAMA: {prog.nombre} ({prog.tipo}) — ID {prog.id} ===")
+            partes.extend(_fragmento_totales_programa(db, prog, lotes_programa[prog.id]))
+            partes.append(f"  Total lotes: {len(lotes_programa[prog.id])}")
+            partes.extend(_fragmentos_lotes(db, lotes_programa[prog.id], "  "))
+            partes.append(_fragmento_inventario(db, prog, "  "))
+        return ContextoRecuperable(partes)
+
+    return contexto_ia.snapshot((rol, tuple(programa_ids)), firma, construir)
+
+
 def _construir_contexto_por_rol(db: Session, usuario, pregunta: str) -> str:
+    """
+    Contexto del alcance del usuario. Si no cabe en AI_CONTEXTO_MAX_TOKENS se
+    conservan los encabezados y TOTAL y solo los registros más relevantes
+    para la pregunta (ver app/services/ai_recuperacion.py).
+    """
     rol    = usuario.rol.nombre
     nombre = usuario.nombre
     partes = [f"Sistema de Gestión de Granjas — Universidad de Caldas\nUsuario: {nombre} | Rol: {rol}\n"]
+    contexto = None
 
     # ── ADMIN: ve todas las granjas (activas e inactivas) ─────────────────────
     if rol == "admin":
-        granjas = db.query(Granja).all()  # todas, sin filtro
-        partes.append(f"Granjas totales: {len(granjas)}")
-        for granja in granjas:
-            partes.append(f"\n=== GRANJA: {granja.nombre} — {granja.ubicacion} (ID {granja.id}) ===")
-            partes.extend(_totales_granja(db, granja.id))
-            for prog in granja.programas:
-                partes.append(f"\n  Programa: {prog.nombre} ({prog.tipo}) — ID {prog.id}")
-                lotes = db.query(Lote).filter(Lote.programa_id == prog.id).all()
-                partes.append(f"  Total lotes: {len(lotes)}")
-                for lote in lotes:
-                    partes.extend(_contexto_lote(db, lote, ind="    "))
-                partes.extend(_contexto_inventario_programa(db, prog, ind="    "))
+        granjas = db.query(Granja).options(selectinload(Granja.programas)).all()  # todas, sin filtro
+        contexto = _contexto_granjas(db, rol, granjas, f"Granjas totales: {len(granjas)}")
 
     # ── jefe_talento_humano : ve todas las granjas activas ───────────────────
     elif rol == "jefe_talento_humano":
-        granjas = db.query(Granja).filter(Granja.activo == True).all()
-        partes.append(f"Granjas activas: {len(granjas)}")
-        for granja in granjas:
-            partes.append(f"\n=== GRANJA: {granja.nombre} — {granja.ubicacion} (ID {granja.id}) ===")
-            partes.extend(_totales_granja(db, granja.id))
-            for prog in granja.programas:
-                partes.append(f"\n  Programa: {prog.nombre} ({prog.tipo}) — ID {prog.id}")
-                lotes = db.query(Lote).filter(Lote.programa_id == prog.id).all()
-                partes.append(f"  Total lotes: {len(lotes)}")
-                for lote in lotes:
-                    partes.extend(_contexto_lote(db, lote, ind="    "))
-                partes.extend(_contexto_inventario_programa(db, prog, ind="    "))
+        granjas = db.query(Granja).options(selectinload(Granja.programas)).filter(Granja.activo == True).all()
+        contexto = _contexto_granjas(db, rol, granjas, f"Granjas activas: {len(granjas)}")
 
     # ── talento_humano : ve solo sus granjas asignadas ───────────────────────
     elif rol == "talento_humano":
         granjas = usuario.granjas
-        partes.append(f"Granjas asignadas: {len(granjas)}")
-        for granja in granjas:
-            partes.append(f"\n=== GRANJA: {granja.nombre} — {granja.ubicacion} (ID {granja.id}) ===")
-            partes.extend(_totales_granja(db, granja.id))
-            for prog in granja.programas:
-                partes.append(f"\n  Programa: {prog.nombre} ({prog.tipo}) — ID {prog.id}")
-                lotes = db.query(Lote).filter(Lote.programa_id == prog.id).all()
-                partes.append(f"  Total lotes: {len(lotes)}")
-                for lote in lotes:
-                    partes.extend(_contexto_lote(db, lote, ind="    "))
-                partes.extend(_contexto_inventario_programa(db, prog, ind="    "))
+        contexto = _contexto_granjas(db, rol, granjas, f"Granjas asignadas: {len(granjas)}")
 
     # ── docente / asesor / estudiante : sus programas ────────────────────────
     elif rol in ("docente", "asesor", "estudiante"):
-        programas = usuario.programas
-        partes.append(f"Programas asignados: {', '.join(p.nombre for p in programas) or 'Ninguno'}")
-
-        for prog in programas:
-            # Totales del programa completo
-            t_diags_prog = db.query(sqlfunc.count(Diagnostico.id)).filter(Diagnostico.programa_id == prog.id).scalar() or 0
-            e_diags_prog = dict(db.query(Diagnostico.estado_revision, sqlfunc.count(Diagnostico.id)).filter(Diagnostico.programa_id == prog.id).group_by(Diagnostico.estado_revision).all())
-            t_recs_prog  = db.query(sqlfunc.count(Recomendacion.id)).join(Lote, Recomendacion.lote_id == Lote.id).filter(Lote.programa_id == prog.id).scalar() or 0
-            e_recs_prog  = dict(db.query(Recomendacion.estado, sqlfunc.count(Recomendacion.id)).join(Lote, Recomendacion.lote_id == Lote.id).filter(Lote.programa_id == prog.id).group_by(Recomendacion.estado).all())
-            t_labs_prog  = db.query(sqlfunc.count(Labor.id)).join(Lote, Labor.lote_id == Lote.id).filter(Lote.programa_id == prog.id).scalar() or 0
-            e_labs_prog  = dict(db.query(Labor.estado, sqlfunc.count(Labor.id)).join(Lote, Labor.lote_id == Lote.id).filter(Lote.programa_id == prog.id).group_by(Labor.estado).all())
-
-            partes.append(f"\n=== PROGRAMA: {prog.nombre} ({prog.tipo}) — ID {prog.id} ===")
-            partes.append(f"  Diagnósticos TOTAL: {t_diags_prog} | {json.dumps(e_diags_prog, ensure_ascii=False)}")
-            partes.append(f"  Recomendaciones TOTAL: {t_recs_prog} | {json.dumps(e_recs_prog, ensure_ascii=False)}")
-            partes.append(f"  Labores TOTAL: {t_labs_prog} | {json.dumps(e_labs_prog, ensure_ascii=False)}")
-
-            lotes = db.query(Lote).filter(Lote.programa_id == prog.id).all()
-            partes.append(f"  Total lotes: {len(lotes)}")
-            for lote in lotes:
-                partes.extend(_contexto_lote(db, lote, ind="  "))
-            partes.extend(_contexto_inventario_programa(db, prog, ind="  "))
+        contexto = _contexto_programas(db, rol, usuario.programas)
 
+    if contexto is not None:
+        partes.append(contexto.seleccionar(pregunta, settings.AI_CONTEXTO_MAX_TOKENS, settings.AI_CONTEXTO_TOP_K))
     return "\n".join(partes)
 
 
@@ -328,7 +426,7 @@ def _construir_contexto_por_rol(db: Session, usuario, pregunta: str) -> str:
 # Resumen de diagnóstico con IA
 # ─────────────────────────────────────────────────────────────────────────────
 
-def generar_resumen_diagnostico(db: Session, diagnostico_id: int, usuario) -> str:
+def prompt_resumen_diagnostico(db: Session, diagnostico_id: int, usuario) -> str:
     diag = db.query(Diagnostico).filter(Diagnostico.id == diagnostico_id).first()
     if not diag:
         raise ValueError("Diagnóstico no encontrado")
@@ -380,15 +478,18 @@ DATOS DEL FORMULARIO:
 
 Responde ÚNICAMENTE con el resumen estructurado, sin repetir los datos crudos.
 """
-    model = _get_gemini_model()
-    return model.generate_content(prompt).text
+    return prompt
+
+
+def generar_resumen_diagnostico(db: Session, diagnostico_id: int, usuario) -> str:
+    return generar(prompt_resumen_diagnostico(db, diagnostico_id, usuario))
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Chat con IA
 # ─────────────────────────────────────────────────────────────────────────────
 
-def responder_chat(db: Session, usuario, pregunta: str, historial: list) -> str:
+def prompt_chat(db: Session, usuario, pregunta: str, historial: list) -> str:
     rol = usuario.rol.nombre
 
     roles_permitidos = ("admin", "docente", "asesor", "talento_humano", "jefe_talento_humano")
@@ -422,6 +523,8 @@ HISTORIAL:
 PREGUNTA: {pregunta}
 
 RESPUESTA:"""
+    return prompt
 
-    model = _get_gemini_model()
-    return model.generate_content(prompt).text
\ No newline at end of file
+
+def responder_chat(db: Session, usuario, pregunta: str, historial: list) -> str:
+    return generar(prompt_chat(db, usuario, pregunta, historial))
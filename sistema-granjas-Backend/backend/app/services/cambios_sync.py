@@ -0,0 +1,270 @@
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, func, insert, or_, select, text
+from sqlalchemy.orm import Session
+
+from app.db.models import (
+    CambioSync, Labor, Recomendacion, Diagnostico, Planta, Lote,
+    ItemInventarioPrograma, ProgramaInventarioTipo,
+)
+
+logger = logging.getLogger(__name__)
+
+ENTIDADES = {
+    Labor: "labor",
+    Recomendacion: "recomendacion",
+    Diagnostico: "diagnostico",
+    Planta: "planta",
+    ItemInventarioPrograma: "item_inventario",
+}
+MODELOS = {nombre: modelo for modelo, nombre in ENTIDADES.items()}
+
+# Clave del pg_advisory_xact_lock que ordena las escrituras del registro
+_LLAVE_SECUENCIA = 7_302_614
+
+_PENDIENTES = "cambios_sync_pendientes"
+
+# (entidad, id) -> datos del cambio
+Pendientes = Dict[Tuple[str, int], Dict[str, Any]]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Captura: se acumula en cada flush y se escribe al confirmar la transacción
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _datos_alcance(obj) -> Dict[str, Any]:
+    """Columnas del propio objeto que definen su alcance (sin cargar relaciones)."""
+    if isinstance(obj, Labor):
+        return {"lote_id": obj.lote_id, "recomendacion_id": obj.recomendacion_id, "usuario_id": obj.trabajador_id}
+    if isinstance(obj, Recomendacion):
+        return {"lote_id": obj.lote_id, "usuario_id": obj.docente_id, "docente_id": obj.docente_id}
+    if isinstance(obj, Diagnostico):
+        return {"lote_id": obj.lote_id, "programa_id": obj.programa_id, "usuario_id": obj.usuario_id}
+    if isinstance(obj, Planta):
+        return {"lote_id": obj.lote_id}
+    return {"tipo_id": obj.tipo_id}
+
+
+def registrar_cambio(
+    session: Session, entidad: str, ids: Iterable[int], operacion: str = "upsert", **alcance: Any,
+) -> None:
+    """
+    Registra cambios hechos con INSERT/UPDATE/DELETE de Core, que no pasan
+    por el flush de la sesión (p. ej. el saldo del inventario o las plantas
+    generadas de un lote). `alcance` recibe las mismas columnas que
+    _datos_alcance (p. ej. lote_id); lo que falte se resuelve al confirmar.
+    """
+    pendientes: Pendientes = session.info.setdefault(_PENDIENTES, {})
+    for id_ in ids:
+        pendientes[(entidad, id_)] = {"operacion": operacion, **alcance}
+
+
+def _registrar_objeto(pendientes: Pendientes, obj, operacion: str) -> None:
+    entidad = ENTIDADES.get(type(obj))
+    if entidad is not None and obj.id is not None:
+        pendientes[(entidad, obj.id)] = {"operacion": operacion, **_datos_alcance(obj)}
+
+
+@event.listens_for(Session, "after_flush")
+def _al_flush(session, flush_context):
+    pendientes: Pendientes = session.info.setdefault(_PENDIENTES, {})
+    for obj in session.new:
+        _registrar_objeto(pendientes, obj, "upsert")
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            _registrar_objeto(pendientes, obj, "upsert")
+    for obj in session.deleted:
+        _registrar_objeto(pendientes, obj, "delete")
+        # Lotes y tipos borrados ya no se pueden consultar al confirmar: se
+        # guarda su alcance para las plantas e ítems que caen en cascada
+        if isinstance(obj, Lote):
+            pendientes[("lote", obj.id)] = {"programa_id": obj.programa_id, "granja_id": obj.granja_id}
+        elif isinstance(obj, ProgramaInventarioTipo):
+            pendientes[("tipo", obj.id)] = {"programa_id": obj.programa_id}
+
+
+def _resolver_alcance(session: Session, pendientes: Pendientes) -> List[Dict[str, Any]]:
+    """Completa programa/granja de cada cambio con pocas consultas por lote de ids."""
+    lotes_borrados = {i: (d["programa_id"], d["granja_id"]) for (e, i), d in pendientes.items() if e == "lote"}
+    tipos_borrados = {i: d["programa_id"] for (e, i), d in pendientes.items() if e == "tipo"}
+    pendientes = {k: d for k, d in pendientes.items() if k[0] in MODELOS}
+
+    items_sin_tipo = [i for (e, i), d in pendientes.items() if e == "item_inventario" and d.get("tipo_id") is None]
+    if items_sin_tipo:
+        tipos = dict(session.execute(
+            select(ItemInventarioPrograma.id, ItemInventarioPrograma.tipo_id)
+            .where(ItemInventarioPrograma.id.in_(items_sin_tipo))
+        ).all())
+        for item_id in items_sin_tipo:
+            pendientes[("item_inventario", item_id)]["tipo_id"] = tipos.get(item_id)
+
+    # Docente de la recomendación de cada labor, y su lote si la labor no tiene uno propio
+    recs = {d.get("recomendacion_id") for (e, _), d in pendientes.items()
+            if e == "labor" and d.get("recomendacion_id")}
+    datos_rec = {
+        f.id: (f.lote_id, f.docente_id)
+        for f in session.execute(
+            select(Recomendacion.id, Recomendacion.lote_id, Recomendacion.docente_id).where(Recomendacion.id.in_(recs))
+        )
+    } if recs else {}
+    lote_de_rec = {rec_id: lote_id for rec_id, (lote_id, _) in datos_rec.items()}
+    docente_de_rec = {rec_id: docente_id for rec_id, (_, docente_id) in datos_rec.items()}
+
+    lote_ids = {d.get("lote_id") for d in pendientes.values() if d.get("lote_id")} | set(lote_de_rec.values())
+    lotes = lotes_borrados
+    lotes.update({
+        f.id: (f.programa_id, f.granja_id)
+        for f in session.execute(select(Lote.id, Lote.programa_id, Lote.granja_id).where(Lote.id.in_(lote_ids)))
+    } if lote_ids else {})
+    tipo_ids = {d.get("tipo_id") for d in pendientes.values() if d.get("tipo_id")}
+    programa_de_tipo = tipos_borrados
+    programa_de_tipo.update(dict(session.execute(
+        select(ProgramaInventarioTipo.id, ProgramaInventarioTipo.programa_id).where(ProgramaInventarioTipo.id.in_(tipo_ids))
+    ).all()) if tipo_ids else {})
+
+    filas = []
+    for (entidad, entidad_id), d in pendientes.items():
+        lote_id = d.get("lote_id") or lote_de_rec.get(d.get("recomendacion_id"))
+        programa_id, granja_id = lotes.get(lote_id, (None, None))
+        if entidad == "item_inventario":
+            programa_id = programa_de_tipo.get(d.get("tipo_id"))
+        filas.append({
+            "entidad": entidad,
+            "entidad_id": entidad_id,
+            "operacion": d["operacion"],
+            "programa_id": d.get("programa_id") or programa_id,
+            "granja_id": granja_id,
+            "usuario_id": d.get("usuario_id"),
+            "docente_id": d.get("docente_id") or docente_de_rec.get(d.get("recomendacion_id")),
+        })
+    return filas
+
+
+@event.listens_for(Session, "before_commit")
+def _antes_de_confirmar(session):
+    # Los savepoints no escriben: el registro se escribe una vez, al confirmar la transacción externa
+    if session.in_nested_transaction():
+        return
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pendientes = session.info.pop(_PENDIENTES, None)
+    filas = _resolver_alcance(session, pendientes) if pendientes else []
+    if not filas:
+        return
+    conexion = session.connection()
+    if conexion.dialect.name == "postgresql":
+        # Serializa el tramo final de las transacciones que registran cambios:
+        # los seq se asignan en el mismo orden en que se confirman, así un
+        # cliente que ya leyó hasta N nunca recibe después un cambio < N
+        conexion.execute(text("SELECT pg_advisory_xact_lock(:llave)"), {"llave": _LLAVE_SECUENCIA})
+    conexion.execute(insert(CambioSync.__table__), filas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _al_revertir(session):
+    # Revertir un savepoint conserva lo acumulado fuera de él; un upsert de
+    # más solo hace que el cliente vuelva a leer la fila
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_PENDIENTES, None)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Lectura: cambios desde un seq, filtrados por alcance del usuario
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _filtro_alcance(usuario):
+    """
+    None = sin restricción; False = nada visible; si no, condición SQL sobre
+    cambios_sync. Cada entidad sigue el criterio de su listado (/labores,
+    /recomendaciones, /diagnosticos, /plantas, /inventario-dinamico); donde
+    el listado no restringe, se limita a los programas del usuario.
+    """
+    rol = usuario.rol.nombre
+    if rol in ("admin", "jefe_talento_humano"):
+        return None
+    entidad = CambioSync.entidad
+    en_programas = CambioSync.programa_id.in_([p.id for p in usuario.programas])
+    if rol == "talento_humano":
+        # Labores y recomendaciones de los lotes de sus granjas; inventario de sus programas
+        granja_ids = [g.id for g in usuario.granjas]
+        return or_(
+            entidad.in_(("labor", "recomendacion")) & CambioSync.granja_id.in_(granja_ids),
+            (entidad == "item_inventario") & en_programas,
+        )
+    if rol in ("docente", "asesor"):
+        # Labores de sus recomendaciones; el docente además solo ve sus recomendaciones
+        propias = ("labor", "recomendacion") if rol == "docente" else ("labor",)
+        return or_(
+            entidad.in_(propias) & (CambioSync.docente_id == usuario.id),
+            entidad.notin_(propias) & en_programas,
+        )
+    if rol == "estudiante":
+        # Solo sus diagnósticos; sin plantas ni inventario (no tiene acceso a esos listados)
+        return or_(
+            (entidad == "diagnostico") & (CambioSync.usuario_id == usuario.id),
+            entidad.in_(("labor", "recomendacion")) & en_programas,
+        )
+    if rol == "trabajador":
+        return (entidad == "labor") & (CambioSync.usuario_id == usuario.id)
+    return False
+
+
+def _fila_compacta(obj) -> Dict[str, Any]:
+    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
+
+
+def cambios_desde(db: Session, usuario, since: int, limit: int) -> Dict[str, Any]:
+    """
+    Cambios visibles para el usuario con seq > since, como mucho `limit`
+    registros del log. Cada entidad aparece una vez con su último seq:
+    `upsert` trae la fila actual (columnas propias, sin enriquecer) y
+    `delete` es una lápida. `hasta` es el seq a enviar en la siguiente
+    llamada; con `hay_mas` conviene pedir de nuevo de inmediato.
+    """
+    # El tope se fija antes de leer: lo confirmado después queda para la próxima llamada
+    tope = db.query(func.max(CambioSync.seq)).scalar() or 0
+    if since > tope:
+        # El cliente viene de otra base (restaurada o reiniciada): debe recargar completo
+        return {"desde": since, "hasta": tope, "hay_mas": False, "reiniciar": True, "cambios": []}
+
+    filtro = _filtro_alcance(usuario)
+    query = db.query(CambioSync).filter(CambioSync.seq > since, CambioSync.seq <= tope)
+    if filtro is False:
+        query = query.filter(False)
+    elif filtro is not None:
+        query = query.filter(filtro)
+    registros = query.order_by(CambioSync.seq).limit(limit + 1).all()
+
+    hay_mas = len(registros) > limit
+    registros = registros[:limit]
+    hasta = registros[-1].seq if hay_mas else tope
+
+    ultimos: Dict[Tuple[str, int], CambioSync] = {}
+    for r in registros:
+        ultimos[(r.entidad, r.entidad_id)] = r
+
+    actuales: Dict[Tuple[str, int], Any] = {}
+    por_entidad: Dict[str, List[int]] = {}
+    for (entidad, entidad_id), r in ultimos.items():
+        if r.operacion == "upsert":
+            por_entidad.setdefault(entidad, []).append(entidad_id)
+    for entidad, ids in por_entidad.items():
+        modelo = MODELOS[entidad]
+        for obj in db.query(modelo).filter(modelo.id.in_(ids)):
+            actuales[(entidad, obj.id)] = obj
+
+    cambios = []
+    for clave, r in sorted(ultimos.items(), key=lambda kv: kv[1].seq):
+        obj: Optional[Any] = actuales.get(clave)
+        # Un upsert cuya fila ya no existe se entrega como baja
+        borrado = r.operacion == "delete" or obj is None
+        cambios.append({
+            "seq": r.seq,
+            "entidad": r.entidad,
+            "id": r.entidad_id,
+            "operacion": "delete" if borrado else "upsert",
+            "datos": None if borrado else _fila_compacta(obj),
+        })
+    return {"desde": since, "hasta": hasta, "hay_mas": hay_mas, "reiniciar": False, "cambios": cambios}
@@ -0,0 +1,306 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db.models import Diagnostico, DiagnosticoTipo, DiagnosticoCampoEstadistica, colombia_now
+from app.db.upsert import bloquear, upsert
+from app.services.formulario_extractor import ExtractorFormulario
+
+logger = logging.getLogger(__name__)
+
+TIPOS_DISTRIBUCION = ("select", "radio", "checkbox", "boolean")
+TIPOS_NUMERICOS = ("number", "integer", "float")
+VALORES_VERDADEROS = ("true", "1", "si", "sí")
+
+# (subtipo_id, programa_id, dia)
+ClaveBucket = Tuple[int, int, date]
+
+# Restricción única de diagnostico_campo_estadisticas (destino del upsert)
+COLUMNAS_BUCKET = ["subtipo_id", "programa_id", "nombre_campo", "dia"]
+
+# Clase del pg_advisory_xact_lock por subtipo que serializa el recálculo
+_LLAVE_BLOQUEO = 7_302_615
+
+
+class EstadisticasDiagnosticoService:
+    """
+    Mantiene la tabla diagnostico_campo_estadisticas: conteos, sumas, mínimo y
+    máximo por (subtipo, campo, programa, día). Los endpoints de estadísticas
+    fusionan estos buckets en lugar de recorrer el JSON de cada formulario.
+    """
+
+    # ── Agregación parcial ───────────────────────────────────────────────────
+    @staticmethod
+    def parcial(valores: list, tipo_dato: str) -> Dict[str, Any]:
+        """Resume una lista de valores crudos en un bucket combinable."""
+        parcial: Dict[str, Any] = {
+            "total_respuestas": len(valores),
+            "distribucion": None,
+            "conteo_numerico": 0,
+            "suma": 0.0,
+            "minimo": None,
+            "maximo": None,
+        }
+        if tipo_dato in TIPOS_DISTRIBUCION:
+            distribucion: Dict[str, int] = {}
+            for v in valores:
+                items = v if isinstance(v, list) else [v]
+                for item in items:
+                    k = str(item)
+                    distribucion[k] = distribucion.get(k, 0) + 1
+            parcial["distribucion"] = distribucion
+        elif tipo_dato in TIPOS_NUMERICOS:
+            nums = []
+            for v in valores:
+                try:
+                    nums.append(float(v))
+                except (ValueError, TypeError):
+                    pass
+            if nums:
+                parcial["conteo_numerico"] = len(nums)
+                parcial["suma"] = sum(nums)
+                parcial["minimo"] = min(nums)
+                parcial["maximo"] = max(nums)
+        return parcial
+
+    @staticmethod
+    def combinar(destino: Dict[str, Any], origen: Dict[str, Any]) -> Dict[str, Any]:
+        """Suma el bucket `origen` sobre `destino` (in place)."""
+        destino["total_respuestas"] += origen["total_respuestas"] or 0
+        if origen.get("distribucion"):
+            distribucion = destino["distribucion"] if destino["distribucion"] is not None else {}
+            for k, n in origen["distribucion"].items():
+                distribucion[k] = distribucion.get(k, 0) + n
+            destino["distribucion"] = distribucion
+        if origen["conteo_numerico"]:
+            destino["conteo_numerico"] += origen["conteo_numerico"]
+            destino["suma"] += origen["suma"]
+            destino["minimo"] = origen["minimo"] if destino["minimo"] is None else min(destino["minimo"], origen["minimo"])
+            destino["maximo"] = origen["maximo"] if destino["maximo"] is None else max(destino["maximo"], origen["maximo"])
+        return destino
+
+    @staticmethod
+    def formatear(campo, agregado: Dict[str, Any]) -> Dict[str, Any]:
+        """Convierte un bucket agregado al formato de respuesta del endpoint."""
+        tipo_dato = campo.tipo_dato
+        opciones = campo.opciones
+        total_respuestas = agregado["total_respuestas"]
+        stat: Dict[str, Any] = {
+            "nombre_campo": campo.nombre_campo,
+            "etiqueta": campo.etiqueta,
+            "tipo_dato": tipo_dato,
+            "opciones": opciones,
+            "total_respuestas": total_respuestas,
+        }
+        conteos = agregado.get("distribucion") or {}
+
+        if tipo_dato in ("select", "radio"):
+            distribucion: Dict[str, int] = {}
+            if opciones and isinstance(opciones, list):
+                for op in opciones:
+                    distribucion[str(op)] = 0
+            for k, n in conteos.items():
+                distribucion[k] = distribucion.get(k, 0) + n
+            stat["distribucion"] = distribucion
+
+        elif tipo_dato == "checkbox":
+            stat["distribucion"] = dict(conteos)
+
+        elif tipo_dato in TIPOS_NUMERICOS:
+            if agregado["conteo_numerico"]:
+                stat["promedio"] = round(agregado["suma"] / agregado["conteo_numerico"], 2)
+                stat["minimo"] = agregado["minimo"]
+                stat["maximo"] = agregado["maximo"]
+            else:
+                stat["promedio"] = None
+                stat["minimo"] = None
+                stat["maximo"] = None
+
+        elif tipo_dato == "boolean":
+            true_count = sum(n for k, n in conteos.items() if k.lower() in VALORES_VERDADEROS)
+            stat["distribucion"] = {"Sí": true_count, "No": total_respuestas - true_count}
+
+        return stat
+
+    @staticmethod
+    def _vacio() -> Dict[str, Any]:
+        return {
+            "total_respuestas": 0,
+            "distribucion": None,
+            "conteo_numerico": 0,
+            "suma": 0.0,
+            "minimo": None,
+            "maximo": None,
+        }
+
+    @staticmethod
+    def calcular_en_vivo(campos, diagnosticos: Iterable[Diagnostico]) -> List[Dict[str, Any]]:
+        """Calcula las estadísticas directamente desde los formularios (sin buckets)."""
+        extractor = ExtractorFormulario(c.nombre_campo for c in campos)
+        valores = extractor.extraer_todos(d.formulario for d in diagnosticos)
+        resultado = []
+        for campo in sorted(campos, key=lambda c: c.orden):
+            parcial = EstadisticasDiagnosticoService.parcial(valores[campo.nombre_campo], campo.tipo_dato)
+            resultado.append(EstadisticasDiagnosticoService.formatear(campo, parcial))
+        return resultado
+
+    # ── Mantenimiento de buckets ─────────────────────────────────────────────
+    @staticmethod
+    def clave(diagnostico: Diagnostico) -> Optional[ClaveBucket]:
+        """Bucket al que pertenece un diagnóstico, o None si no tiene subtipo."""
+        if not diagnostico.diagnostico_tipo_id or not diagnostico.fecha_creacion:
+            return None
+        return (diagnostico.diagnostico_tipo_id, diagnostico.programa_id, diagnostico.fecha_creacion.date())
+
+    @staticmethod
+    def _escribir_buckets(db: Session, tipo: DiagnosticoTipo, diagnosticos: Iterable[Diagnostico]) -> None:
+        """
+        Agrupa los diagnósticos por (programa, día) y guarda un bucket por
+        campo con upsert: si otro proceso ya escribió el bucket se reemplaza.
+        """
+        grupos: Dict[Tuple[int, date], List[dict]] = defaultdict(list)
+        for diag in diagnosticos:
+            grupos[(diag.programa_id, diag.fecha_creacion.date())].append(diag.formulario or {})
+
+        extractor = ExtractorFormulario.para_tipo(tipo)
+        # Un bucket por nombre de campo (la tabla es única por nombre)
+        campos = list({c.nombre_campo: c for c in reversed(tipo.campos)}.values())
+        ahora = colombia_now()
+        filas = []
+        for (programa_id, dia), formularios in grupos.items():
+            valores = extractor.extraer_todos(formularios)
+            for campo in campos:
+                parcial = EstadisticasDiagnosticoService.parcial(valores[campo.nombre_campo], campo.tipo_dato)
+                filas.append({
+                    "subtipo_id": tipo.id,
+                    "programa_id": programa_id,
+                    "nombre_campo": campo.nombre_campo,
+                    "dia": dia,
+                    **parcial,
+                    "updated_at": ahora,
+                })
+        upsert(db, DiagnosticoCampoEstadistica.__table__, filas, COLUMNAS_BUCKET)
+
+    @staticmethod
+    def tiene_buckets(db: Session, subtipo_id: int) -> bool:
+        return db.query(DiagnosticoCampoEstadistica.id).filter(
+            DiagnosticoCampoEstadistica.subtipo_id == subtipo_id
+        ).first() is not None
+
+    @staticmethod
+    def _reconstruir(db: Session, subtipo_id: int) -> None:
+        tipo = db.query(DiagnosticoTipo).filter(DiagnosticoTipo.id == subtipo_id).first()
+        db.query(DiagnosticoCampoEstadistica).filter(
+            DiagnosticoCampoEstadistica.subtipo_id == subtipo_id
+        ).delete(synchronize_session=False)
+        if tipo:
+            diagnosticos = db.query(Diagnostico).filter(Diagnostico.diagnostico_tipo_id == subtipo_id).all()
+            EstadisticasDiagnosticoService._escribir_buckets(db, tipo, diagnosticos)
+
+    @staticmethod
+    def reconstruir_subtipo(db: Session, subtipo_id: int) -> None:
+        """Recalcula desde cero todos los buckets de un subtipo."""
+        bloquear(db, _LLAVE_BLOQUEO, subtipo_id)
+        EstadisticasDiagnosticoService._reconstruir(db, subtipo_id)
+        db.commit()
+
+    @staticmethod
+    def invalidar_subtipo(db: Session, subtipo_id: int) -> None:
+        """
+        Elimina los buckets de un subtipo (p. ej. al cambiar sus campos); se
+        reconstruyen en la siguiente consulta de estadísticas.
+        """
+        bloquear(db, _LLAVE_BLOQUEO, subtipo_id)
+        db.query(DiagnosticoCampoEstadistica).filter(
+            DiagnosticoCampoEstadistica.subtipo_id == subtipo_id
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def refrescar_buckets(db: Session, claves: Iterable[Optional[ClaveBucket]]) -> None:
+        """
+        Recalcula los buckets de las claves dadas a partir de los diagnósticos
+        de ese día. Cada subtipo se bloquea hasta el commit: quien llega después
+        lee los diagnósticos ya confirmados por el otro, así que el último en
+        escribir nunca deja un bucket desactualizado.
+        """
+        por_subtipo: Dict[int, Set[Tuple[int, date]]] = defaultdict(set)
+        for clave in claves:
+            if clave:
+                por_subtipo[clave[0]].add((clave[1], clave[2]))
+
+        # Siempre en el mismo orden, para que dos escritores no se bloqueen mutuamente
+        for subtipo_id in sorted(por_subtipo):
+            bloquear(db, _LLAVE_BLOQUEO, subtipo_id)
+            # Subtipo aún sin materializar: se construye completo para no dejar huecos
+            if not EstadisticasDiagnosticoService.tiene_buckets(db, subtipo_id):
+                EstadisticasDiagnosticoService._reconstruir(db, subtipo_id)
+                continue
+
+            tipo = db.query(DiagnosticoTipo).filter(DiagnosticoTipo.id == subtipo_id).first()
+            if not tipo:
+                continue
+            for programa_id, dia in por_subtipo[subtipo_id]:
+                diagnosticos = db.query(Diagnostico).filter(
+                    Diagnostico.diagnostico_tipo_id == subtipo_id,
+                    Diagnostico.programa_id == programa_id,
+                    Diagnostico.fecha_creacion >= datetime.combine(dia, datetime.min.time()),
+                    Diagnostico.fecha_creacion <= datetime.combine(dia, datetime.max.time()),
+                ).all()
+                if not diagnosticos:
+                    # Día sin diagnósticos (p. ej. se eliminó el último): sin buckets
+                    db.query(DiagnosticoCampoEstadistica).filter(
+                        DiagnosticoCampoEstadistica.subtipo_id == subtipo_id,
+                        DiagnosticoCampoEstadistica.programa_id == programa_id,
+                        DiagnosticoCampoEstadistica.dia == dia,
+                    ).delete(synchronize_session=False)
+                    continue
+                EstadisticasDiagnosticoService._escribir_buckets(db, tipo, diagnosticos)
+        db.commit()
+
+    # ── Consulta ─────────────────────────────────────────────────────────────
+    @staticmethod
+    def estadisticas_campos(
+        db: Session,
+        tipo: DiagnosticoTipo,
+        programa_ids: Optional[List[int]],
+        fecha_inicio: Optional[date],
+        fecha_fin: Optional[date],
+    ) -> List[Dict[str, Any]]:
+        """
+        Fusiona los buckets del subtipo para el rango pedido.
+        `programa_ids=None` significa sin restricción de programa.
+        """
+        if not EstadisticasDiagnosticoService.tiene_buckets(db, tipo.id):
+            existe = db.query(Diagnostico.id).filter(Diagnostico.diagnostico_tipo_id == tipo.id).first()
+            if existe:
+                EstadisticasDiagnosticoService.reconstruir_subtipo(db, tipo.id)
+
+        query = db.query(DiagnosticoCampoEstadistica).filter(
+            DiagnosticoCampoEstadistica.subtipo_id == tipo.id
+        )
+        if programa_ids is not None:
+            query = query.filter(DiagnosticoCampoEstadistica.programa_id.in_(programa_ids))
+        if fecha_inicio:
+            query = query.filter(DiagnosticoCampoEstadistica.dia >= fecha_inicio)
+        if fecha_fin:
+            query = query.filter(DiagnosticoCampoEstadistica.dia <= fecha_fin)
+
+        agregados: Dict[str, Dict[str, Any]] = defaultdict(EstadisticasDiagnosticoService._vacio)
+        for bucket in query.order_by(DiagnosticoCampoEstadistica.dia).all():
+            EstadisticasDiagnosticoService.combinar(agregados[bucket.nombre_campo], {
+                "total_respuestas": bucket.total_respuestas,
+                "distribucion": bucket.distribucion,
+                "conteo_numerico": bucket.conteo_numerico,
+                "suma": bucket.suma,
+                "minimo": bucket.minimo,
+                "maximo": bucket.maximo,
+            })
+
+        return [
+            EstadisticasDiagnosticoService.formatear(campo, agregados[campo.nombre_campo])
+            for campo in sorted(tipo.campos, key=lambda c: c.orden)
+        ]
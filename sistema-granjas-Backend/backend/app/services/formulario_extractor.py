@@ -0,0 +1,105 @@
+from typing import Dict, Iterable, List, Tuple
+
+
+_DIGITOS_ASCII = "0123456789"
+
+
+def _sin_sufijo(clave: str) -> Tuple[str, int]:
+    """Separa el sufijo numérico final (equivalente a `\\d*$`); devuelve (base, índice de corte)."""
+    base = clave.rstrip(_DIGITOS_ASCII)
+    corte = len(base)
+    # Dígitos no ASCII (`\d` de `re` también los acepta): caso raro, se recorre a mano
+    while corte > 0 and clave[corte - 1].isdecimal():
+        corte -= 1
+    return (base, corte) if corte == len(base) else (clave[:corte], corte)
+
+
+class ExtractorFormulario:
+    """
+    Extrae en una sola pasada los valores de todos los campos de un subtipo
+    desde el formulario de un diagnóstico.
+
+    Soporta dos estructuras:
+      1. Plana: formulario = {"campo": valor, ...}
+      2. Anidada: formulario = {"formularios_por_planta": {"1807": {"campo74": valor, ...}}}
+
+    En la estructura anidada una clave pertenece a un campo si es exactamente
+    su nombre o su nombre seguido de dígitos ("cuadrante74"). En lugar de una
+    regex por campo, a cada clave se le quita el sufijo numérico y la base se
+    busca en un dict que agrupa los nombres de campo por esa misma base; solo
+    cuando el nombre del campo termina en dígitos hace falta comparar prefijos.
+    Los valores pueden ser escalares o listas; las listas se aplanan.
+    """
+
+    def __init__(self, nombres_campo: Iterable[str]):
+        self.nombres: List[str] = list(dict.fromkeys(n for n in nombres_campo if n))
+        por_base: Dict[str, List[str]] = {}
+        for nombre in self.nombres:
+            por_base.setdefault(_sin_sufijo(nombre)[0], []).append(nombre)
+        # base -> (campos candidatos, requiere comparar prefijos)
+        self._por_base: Dict[str, Tuple[Tuple[str, ...], bool]] = {
+            base: (tuple(nombres), nombres != [base])
+            for base, nombres in por_base.items()
+        }
+
+    @classmethod
+    def para_tipo(cls, tipo) -> "ExtractorFormulario":
+        """Construye el extractor con todos los campos de un DiagnosticoTipo."""
+        return cls(c.nombre_campo for c in tipo.campos)
+
+    def campos_para_clave(self, clave: str) -> Tuple[str, ...]:
+        """Campos a los que pertenece una clave de formularios_por_planta."""
+        candidatos = self._por_base.get(_sin_sufijo(clave)[0])
+        if candidatos is None:
+            return ()
+        nombres, comparar = candidatos
+        if not comparar:
+            return nombres
+        # La clave y los candidatos comparten base y el resto son dígitos
+        return tuple(n for n in nombres if clave.startswith(n))
+
+    def _acumular(self, formulario: dict, valores: Dict[str, list]) -> None:
+        """Recorre el formulario una vez y añade cada valor a la lista de su campo."""
+        # ── Estructura anidada (formularios_por_planta) ──────────────────────
+        if "formularios_por_planta" in formulario:
+            campos_para_clave = self.campos_para_clave
+            for planta_data in formulario["formularios_por_planta"].values():
+                if not isinstance(planta_data, dict):
+                    continue
+                for key, val in planta_data.items():
+                    if val is None or val == "":
+                        continue
+                    destinos = campos_para_clave(key)
+                    if not destinos:
+                        continue
+                    if isinstance(val, list):
+                        items = [item for item in val if item is not None and item != ""]
+                        for destino in destinos:
+                            valores[destino].extend(items)
+                    else:
+                        for destino in destinos:
+                            valores[destino].append(val)
+            return
+
+        # ── Estructura plana ─────────────────────────────────────────────────
+        for nombre in self.nombres:
+            val = formulario.get(nombre)
+            if val is None or val == "":
+                continue
+            if isinstance(val, list):
+                valores[nombre].extend(item for item in val if item is not None and item != "")
+            else:
+                valores[nombre].append(val)
+
+    def extraer(self, formulario: dict) -> Dict[str, list]:
+        """Devuelve {nombre_campo: [valores]} de un formulario."""
+        valores: Dict[str, list] = {nombre: [] for nombre in self.nombres}
+        self._acumular(formulario, valores)
+        return valores
+
+    def extraer_todos(self, formularios: Iterable[dict]) -> Dict[str, list]:
+        """Acumula los valores de varios formularios, campo por campo."""
+        valores: Dict[str, list] = {nombre: [] for nombre in self.nombres}
+        for formulario in formularios:
+            self._acumular(formulario or {}, valores)
+        return valores
@@ -0,0 +1,182 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.db.models import Diagnostico, Planta, PlantaSaludDiaria, diagnostico_planta
+from app.db.upsert import bloquear, upsert
+
+logger = logging.getLogger(__name__)
+
+NIVELES_PRESION = ("ninguna", "baja", "media", "alta")
+VALORES_SIN_ENFERMEDAD = ("0", "false", "no", "", "ninguna")
+
+# (lote_id, dia)
+ClaveSalud = Tuple[int, date]
+
+# Restricción única de planta_salud_diaria (destino del upsert)
+COLUMNAS_SALUD = ["planta_id", "dia"]
+
+# Clase del pg_advisory_xact_lock por lote que serializa el recálculo
+_LLAVE_BLOQUEO = 7_302_616
+
+
+def presion_plagas(formulario: dict) -> int:
+    """Nivel de presión de plagas (índice en NIVELES_PRESION) según 'artropodos'."""
+    try:
+        articulos = formulario.get("artropodos", {})
+        if isinstance(articulos, dict):
+            total_plagas = sum(int(v) for v in articulos.values() if str(v).isdigit())
+            if total_plagas >= 10:
+                return 3
+            if total_plagas >= 5:
+                return 2
+            if total_plagas >= 1:
+                return 1
+    except Exception:
+        pass
+    return 0
+
+
+def tiene_enfermedades(formulario: dict) -> bool:
+    """True si 'enfermedades' reporta alguna enfermedad."""
+    try:
+        enf = formulario.get("enfermedades", {})
+        if isinstance(enf, dict):
+            return any(str(v).lower() not in VALORES_SIN_ENFERMEDAD for v in enf.values())
+        if isinstance(enf, list):
+            return len(enf) > 0
+    except Exception:
+        pass
+    return False
+
+
+class SaludPlantasService:
+    """
+    Mantiene planta_salud_diaria: por planta y día, número de diagnósticos,
+    última fecha, peor presión de plagas y si se reportaron enfermedades.
+    El mapa del lote se responde con una lectura agregada de esta tabla.
+    """
+
+    @staticmethod
+    def clave(diagnostico: Diagnostico) -> Optional[ClaveSalud]:
+        if not diagnostico.lote_id or not diagnostico.fecha_creacion:
+            return None
+        return (diagnostico.lote_id, diagnostico.fecha_creacion.date())
+
+    @staticmethod
+    def _escribir(db: Session, lote_id: int, desde: Optional[datetime] = None,
+                  hasta: Optional[datetime] = None) -> Set[Tuple[int, date]]:
+        """
+        Agrega los diagnósticos del lote (en el rango dado) por planta y día y
+        los guarda con upsert. Retorna las (planta_id, dia) escritas.
+        """
+        query = db.query(
+            Diagnostico.fecha_creacion, Diagnostico.formulario, diagnostico_planta.c.planta_id
+        ).join(
+            diagnostico_planta, diagnostico_planta.c.diagnostico_id == Diagnostico.id
+        ).filter(Diagnostico.lote_id == lote_id, diagnostico_planta.c.planta_id.isnot(None))
+        if desde:
+            query = query.filter(Diagnostico.fecha_creacion >= desde)
+        if hasta:
+            query = query.filter(Diagnostico.fecha_creacion <= hasta)
+
+        buckets: Dict[Tuple[int, date], Dict[str, Any]] = {}
+        for fecha, formulario, planta_id in query.all():
+            if not fecha:
+                continue
+            formulario = formulario or {}
+            b = buckets.get((planta_id, fecha.date()))
+            if b is None:
+                b = buckets[(planta_id, fecha.date())] = {
+                    "diagnosticos_count": 0, "ultima_fecha": fecha,
+                    "presion_max": 0, "tiene_enfermedades": False,
+                }
+            b["diagnosticos_count"] += 1
+            b["ultima_fecha"] = max(b["ultima_fecha"], fecha)
+            b["presion_max"] = max(b["presion_max"], presion_plagas(formulario))
+            b["tiene_enfermedades"] = b["tiene_enfermedades"] or tiene_enfermedades(formulario)
+
+        upsert(db, PlantaSaludDiaria.__table__, [
+            {"lote_id": lote_id, "planta_id": planta_id, "dia": dia, **b}
+            for (planta_id, dia), b in buckets.items()
+        ], COLUMNAS_SALUD)
+        return set(buckets)
+
+    @staticmethod
+    def tiene_datos(db: Session, lote_id: int) -> bool:
+        return db.query(PlantaSaludDiaria.id).filter(PlantaSaludDiaria.lote_id == lote_id).first() is not None
+
+    @staticmethod
+    def _reconstruir(db: Session, lote_id: int) -> None:
+        db.query(PlantaSaludDiaria).filter(PlantaSaludDiaria.lote_id == lote_id).delete(synchronize_session=False)
+        SaludPlantasService._escribir(db, lote_id)
+
+    @staticmethod
+    def reconstruir_lote(db: Session, lote_id: int) -> None:
+        bloquear(db, _LLAVE_BLOQUEO, lote_id)
+        SaludPlantasService._reconstruir(db, lote_id)
+        db.commit()
+
+    @staticmethod
+    def refrescar(db: Session, claves: Iterable[Optional[ClaveSalud]]) -> None:
+        """
+        Recalcula los días afectados de cada lote a partir de sus
+        diagnósticos. Cada lote se bloquea hasta el commit, igual que los
+        subtipos en EstadisticasDiagnosticoService.refrescar_buckets.
+        """
+        por_lote: Dict[int, Set[date]] = defaultdict(set)
+        for clave in claves:
+            if clave:
+                por_lote[clave[0]].add(clave[1])
+
+        for lote_id in sorted(por_lote):
+            bloquear(db, _LLAVE_BLOQUEO, lote_id)
+            # Lote aún sin materializar: se construye completo para no dejar huecos
+            if not SaludPlantasService.tiene_datos(db, lote_id):
+                SaludPlantasService._reconstruir(db, lote_id)
+                continue
+            for dia in por_lote[lote_id]:
+                escritas = SaludPlantasService._escribir(
+                    db, lote_id,
+                    datetime.combine(dia, datetime.min.time()),
+                    datetime.combine(dia, datetime.max.time()),
+                )
+                # Plantas que ese día ya no tienen diagnósticos
+                sobrantes = db.query(PlantaSaludDiaria).filter(
+                    PlantaSaludDiaria.lote_id == lote_id, PlantaSaludDiaria.dia == dia
+                )
+                plantas = [planta_id for planta_id, _ in escritas]
+                if plantas:
+                    sobrantes = sobrantes.filter(PlantaSaludDiaria.planta_id.notin_(plantas))
+                sobrantes.delete(synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def resumen_lote(db: Session, lote_id: int, fecha_inicio: Optional[date] = None,
+                     fecha_fin: Optional[date] = None) -> List[Any]:
+        """Una fila agregada por planta: una lectura por rango del índice (lote_id, dia)."""
+        if not SaludPlantasService.tiene_datos(db, lote_id):
+            existe = db.query(Diagnostico.id).filter(Diagnostico.lote_id == lote_id).first()
+            if existe:
+                SaludPlantasService.reconstruir_lote(db, lote_id)
+
+        s = PlantaSaludDiaria
+        stmt = select(
+            s.planta_id,
+            Planta.surco,
+            Planta.numero,
+            func.sum(s.diagnosticos_count).label("diagnosticos_count"),
+            func.max(s.ultima_fecha).label("ultima_fecha"),
+            func.max(s.presion_max).label("presion_max"),
+            func.max(case((s.tiene_enfermedades, 1), else_=0)).label("tiene_enfermedades"),
+        ).join(Planta, Planta.id == s.planta_id).where(s.lote_id == lote_id)
+        if fecha_inicio:
+            stmt = stmt.where(s.dia >= fecha_inicio)
+        if fecha_fin:
+            stmt = stmt.where(s.dia <= fecha_fin)
+        stmt = stmt.group_by(s.planta_id, Planta.surco, Planta.numero).order_by(s.planta_id)
+        return db.execute(stmt).all()
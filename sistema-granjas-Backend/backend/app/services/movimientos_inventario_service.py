@@ -0,0 +1,184 @@
+import logging
+from typing import Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from app.db.models import ItemInventarioPrograma, Labor, MovimientoInventario
+from app.services.cambios_sync import registrar_cambio
+
+logger = logging.getLogger(__name__)
+
+
+class Movimiento(NamedTuple):
+    """Movimiento solicitado; `cantidad` negativa es una salida de inventario."""
+    item_id: int
+    cantidad: float
+    origen: str
+    labor_id: Optional[int] = None
+    producto_labor_id: Optional[int] = None
+    recomendacion_id: Optional[int] = None
+    motivo: Optional[str] = None
+
+
+def _cantidad_consumida(registro) -> Optional[float]:
+    """Dosis aplicada si existe, si no la cantidad usada (labor o producto de labor)."""
+    return registro.dosis_aplicada or registro.cantidad_usada
+
+
+class MovimientosInventarioService:
+    """
+    Libro de movimientos del inventario dinámico.
+
+    Cada movimiento actualiza el saldo materializado
+    (items_inventario_programa.cantidad_disponible) con un único
+    `UPDATE ... SET cantidad_disponible = cantidad_disponible + :delta RETURNING`
+    y agrega una fila a movimientos_inventario en la misma transacción. El
+    UPDATE toma el bloqueo de fila, así que dos transacciones concurrentes
+    sobre el mismo ítem se serializan en lugar de pisarse. Las salidas nunca
+    dejan el saldo por debajo de cero: se aplica lo disponible y el
+    movimiento guarda la cantidad solicitada y la aplicada.
+
+    Los métodos no hacen commit: los movimientos se confirman con el resto
+    de la operación (p. ej. completar la labor).
+    """
+
+    @staticmethod
+    def _sincronizar(db: Session, item_id: int, saldo: float) -> None:
+        """Refleja el saldo nuevo en el ítem si ya está cargado en la sesión."""
+        item = db.identity_map.get(identity_key(ItemInventarioPrograma, item_id))
+        if item is not None:
+            set_committed_value(item, "cantidad_disponible", saldo)
+
+    @staticmethod
+    def aplicar(db: Session, movimientos: Iterable[Movimiento],
+                usuario_id: Optional[int] = None) -> List[MovimientoInventario]:
+        registros = []
+        # Orden por ítem: transacciones que tocan los mismos ítems toman los
+        # bloqueos de fila en el mismo orden y no se interbloquean
+        for mov in sorted(movimientos, key=lambda m: m.item_id):
+            if not mov.cantidad:
+                continue
+            saldo = db.execute(
+                update(ItemInventarioPrograma)
+                .where(ItemInventarioPrograma.id == mov.item_id)
+                .values(cantidad_disponible=func.coalesce(ItemInventarioPrograma.cantidad_disponible, 0.0) + mov.cantidad)
+                .returning(ItemInventarioPrograma.cantidad_disponible)
+                .execution_options(synchronize_session=False)
+            ).scalar_one_or_none()
+            if saldo is None:
+                logger.warning(f"Movimiento de inventario sobre ítem inexistente #{mov.item_id}")
+                continue
+
+            aplicada = mov.cantidad
+            if saldo < 0:
+                # El bloqueo de fila ya es nuestro: llevar a cero no compite con nadie
+                aplicada -= saldo
+                saldo = 0.0
+                db.execute(
+                    update(ItemInventarioPrograma)
+                    .where(ItemInventarioPrograma.id == mov.item_id)
+                    .values(cantidad_disponible=0.0)
+                    .execution_options(synchronize_session=False)
+                )
+
+            registro = MovimientoInventario(
+                item_id=mov.item_id,
+                origen=mov.origen,
+                cantidad=aplicada,
+                cantidad_solicitada=mov.cantidad,
+                saldo_resultante=saldo,
+                labor_id=mov.labor_id,
+                producto_labor_id=mov.producto_labor_id,
+                recomendacion_id=mov.recomendacion_id,
+                usuario_id=usuario_id,
+                motivo=mov.motivo,
+            )
+            db.add(registro)
+            registros.append(registro)
+            MovimientosInventarioService._sincronizar(db, mov.item_id, saldo)
+            # El UPDATE directo no pasa por el flush: se anota para /api/sync/changes
+            registrar_cambio(db, "item_inventario", [mov.item_id])
+        db.flush()
+        return registros
+
+    @staticmethod
+    def fijar_saldo(db: Session, item_id: int, cantidad: float, usuario_id: Optional[int] = None,
+                    motivo: str = "Ajuste manual") -> Optional[MovimientoInventario]:
+        """
+        Ajuste a un saldo absoluto (edición del ítem). Lee el saldo con
+        SELECT ... FOR UPDATE y registra la diferencia como movimiento.
+        """
+        actual = db.execute(
+            select(ItemInventarioPrograma.cantidad_disponible)
+            .where(ItemInventarioPrograma.id == item_id)
+            .with_for_update()
+        ).scalar_one_or_none()
+        diferencia = cantidad - (actual or 0.0)
+        if not diferencia:
+            return None
+        registros = MovimientosInventarioService.aplicar(
+            db, [Movimiento(item_id, diferencia, "ajuste", motivo=motivo)], usuario_id
+        )
+        return registros[0] if registros else None
+
+    @staticmethod
+    def consumos_labor(labor: Labor) -> List[Movimiento]:
+        """
+        Salidas que genera completar una labor:
+          - el ítem de la labor con su dosis aplicada (o cantidad usada);
+          - cada producto de la labor (ProductoLabor) con su ítem;
+          - si la labor no indica ítem ni productos, el ítem sugerido por la
+            recomendación con la cantidad de la labor o la sugerida.
+        """
+        movimientos = []
+        cantidad = _cantidad_consumida(labor)
+        if labor.inventario_item_id:
+            if cantidad:
+                movimientos.append(Movimiento(labor.inventario_item_id, -cantidad, "labor", labor_id=labor.id))
+        elif not labor.productos and labor.recomendacion and labor.recomendacion.inventario_item_id:
+            cantidad = cantidad or labor.recomendacion.cantidad_sugerida
+            if cantidad:
+                movimientos.append(Movimiento(
+                    labor.recomendacion.inventario_item_id, -cantidad, "recomendacion",
+                    labor_id=labor.id, recomendacion_id=labor.recomendacion_id,
+                ))
+
+        for producto in labor.productos:
+            cantidad = _cantidad_consumida(producto)
+            if producto.inventario_item_id and cantidad:
+                movimientos.append(Movimiento(
+                    producto.inventario_item_id, -cantidad, "labor",
+                    labor_id=labor.id, producto_labor_id=producto.id,
+                ))
+        return movimientos
+
+    @staticmethod
+    def descontar_labor(db: Session, labor: Labor, usuario_id: Optional[int] = None) -> List[MovimientoInventario]:
+        """
+        Descuenta del inventario los consumos de una labor completada, una
+        sola vez: la fila de la labor se bloquea y, si ya tiene movimientos
+        registrados, no se vuelve a descontar.
+        """
+        db.execute(select(Labor.id).where(Labor.id == labor.id).with_for_update())
+        ya_descontada = db.query(MovimientoInventario.id).filter(
+            MovimientoInventario.labor_id == labor.id,
+            MovimientoInventario.origen.in_(("labor", "recomendacion")),
+        ).first()
+        if ya_descontada:
+            return []
+        return MovimientosInventarioService.aplicar(
+            db, MovimientosInventarioService.consumos_labor(labor), usuario_id
+        )
+
+    @staticmethod
+    def listar(db: Session, item_id: int, limit: int = 100) -> List[MovimientoInventario]:
+        return (
+            db.query(MovimientoInventario)
+            .filter(MovimientoInventario.item_id == item_id)
+            .order_by(MovimientoInventario.id.desc())
+            .limit(limit)
+            .all()
+        )
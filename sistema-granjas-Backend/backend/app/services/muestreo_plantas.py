@@ -0,0 +1,172 @@
+import math
+import random
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.db.models import Diagnostico, Planta, diagnostico_planta
+
+
+class MuestreoPlantas:
+    """
+    Muestreo de plantas productivas de un lote que no hayan sido evaluadas con
+    el mismo tipo de diagnóstico desde `desde`, sin `ORDER BY random()`.
+
+    - Las plantas ya evaluadas se obtienen una sola vez y solo de los
+      diagnósticos del lote (antes el anti-join recorría los de todos los lotes).
+    - Las plantas de un lote se generan en bloque y sus ids son casi contiguos:
+      se sortean ids en [min, max] y se comprueban por clave primaria. Si la
+      densidad de elegibles en ese rango es baja, o faltan plantas tras varias
+      rondas, se leen los ids elegibles y se muestrea en memoria. En ambos
+      casos cada planta elegible tiene la misma probabilidad.
+    - Modo "estratificado": reparte la muestra entre surcos proporcionalmente a
+      sus plantas elegibles (restos mayores) y muestrea dentro de cada surco.
+    """
+
+    DENSIDAD_MINIMA = 0.2
+    MAX_RONDAS = 4
+    BLOQUE_IN = 1000
+
+    def __init__(self, db: Session, lote_id: int, tipo_diagnostico: str, desde: datetime,
+                 rng: Optional[random.Random] = None):
+        self.db = db
+        self.lote_id = lote_id
+        self.tipo_diagnostico = tipo_diagnostico
+        self.desde = desde
+        self.rng = rng or random.SystemRandom()
+        self.productiva = and_(Planta.lote_id == lote_id, Planta.estado == "productivo")
+
+    # Columnas que necesita la respuesta (PlantaGenerada); se evita cargar objetos ORM
+    COLUMNAS = (Planta.id, Planta.codigo, Planta.surco, Planta.numero, Planta.lote_id)
+
+    def _evaluadas(self) -> Dict[int, int]:
+        """{planta_id: surco} de las plantas productivas del lote ya evaluadas."""
+        filas = self.db.execute(
+            select(Planta.id, Planta.surco).distinct()
+            .join(diagnostico_planta, diagnostico_planta.c.planta_id == Planta.id)
+            .join(Diagnostico, Diagnostico.id == diagnostico_planta.c.diagnostico_id)
+            .where(
+                self.productiva,
+                Diagnostico.lote_id == self.lote_id,
+                Diagnostico.tipo_diagnostico == self.tipo_diagnostico,
+                Diagnostico.fecha_creacion >= self.desde,
+            )
+        ).all()
+        return {planta_id: surco for planta_id, surco in filas}
+
+    def _todas(self, evaluadas: Dict[int, int]) -> List[Tuple[int, int]]:
+        """(id, surco) de todas las elegibles: camino de respaldo."""
+        filas = self.db.execute(select(Planta.id, Planta.surco).where(self.productiva)).all()
+        return [(i, s) for i, s in filas if i not in evaluadas]
+
+    def _comprobar(self, candidatos: List[int], evaluadas: Dict[int, int]) -> List[Row]:
+        """Filtra ids sorteados a los elegibles, por clave primaria."""
+        encontrados: List[Row] = []
+        for i in range(0, len(candidatos), self.BLOQUE_IN):
+            bloque = candidatos[i:i + self.BLOQUE_IN]
+            encontrados.extend(
+                fila for fila in self.db.execute(
+                    select(*self.COLUMNAS).where(self.productiva, Planta.id.in_(bloque))
+                ).all()
+                if fila.id not in evaluadas
+            )
+        return encontrados
+
+    def _por_rango(self, cuotas: Dict[Optional[int], int], elegibles_por_estrato: Dict[Optional[int], int],
+                   id_min: int, id_max: int, evaluadas: Dict[int, int],
+                   estratificar: bool) -> Optional[List[Row]]:
+        """
+        Sortea ids en el rango hasta cubrir la cuota de cada estrato (None = sin
+        estratos). Devuelve None si no lo logra en MAX_RONDAS.
+        """
+        rango = id_max - id_min + 1
+        probados: Set[int] = set()
+        aciertos: Dict[Optional[int], List[Row]] = defaultdict(list)
+        for _ in range(self.MAX_RONDAS):
+            faltantes = {e: c - len(aciertos[e]) for e, c in cuotas.items() if len(aciertos[e]) < c}
+            if not faltantes:
+                break
+            # Sorteos necesarios para el estrato más escaso, con margen
+            necesarios = max(f * rango / elegibles_por_estrato[e] for e, f in faltantes.items())
+            n = min(rango - len(probados), math.ceil(necesarios * 1.25) + 8)
+            if n <= 0:
+                break
+            candidatos: List[int] = []
+            while len(candidatos) < n:
+                c = self.rng.randint(id_min, id_max)
+                if c not in probados:
+                    probados.add(c)
+                    candidatos.append(c)
+            for fila in self._comprobar(candidatos, evaluadas):
+                aciertos[fila.surco if estratificar else None].append(fila)
+
+        seleccion: List[Row] = []
+        for estrato, cuota in cuotas.items():
+            if len(aciertos[estrato]) < cuota:
+                return None
+            # Los aciertos son una muestra uniforme del estrato: submuestrear a la cuota
+            seleccion.extend(self.rng.sample(aciertos[estrato], cuota))
+        return seleccion
+
+    def _cuotas(self, k: int, por_estrato: Dict[int, int]) -> Dict[int, int]:
+        """Asignación proporcional por restos mayores."""
+        total = sum(por_estrato.values())
+        exactas = {e: k * n / total for e, n in por_estrato.items()}
+        cuotas = {e: int(c) for e, c in exactas.items()}
+        restantes = k - sum(cuotas.values())
+        orden = sorted(exactas, key=lambda e: (exactas[e] - cuotas[e], self.rng.random()), reverse=True)
+        for e in orden[:restantes]:
+            cuotas[e] += 1
+        return {e: c for e, c in cuotas.items() if c > 0}
+
+    def muestrear(self, k: int, modo: str = "aleatorio") -> Tuple[int, List[Row]]:
+        """Devuelve (elegibles, filas de las plantas muestreadas ordenadas por surco y número)."""
+        estratificar = modo == "estratificado"
+        evaluadas = self._evaluadas()
+
+        if estratificar:
+            filas = self.db.execute(
+                select(Planta.surco, func.count(Planta.id), func.min(Planta.id), func.max(Planta.id))
+                .where(self.productiva).group_by(Planta.surco)
+            ).all()
+            por_estrato = {surco: n for surco, n, _, _ in filas}
+            for surco in evaluadas.values():
+                por_estrato[surco] -= 1
+            por_estrato = {s: n for s, n in por_estrato.items() if n > 0}
+            id_min = min((f[2] for f in filas), default=None)
+            id_max = max((f[3] for f in filas), default=None)
+        else:
+            n, id_min, id_max = self.db.execute(
+                select(func.count(Planta.id), func.min(Planta.id), func.max(Planta.id)).where(self.productiva)
+            ).one()
+            por_estrato = {None: int(n or 0) - len(evaluadas)}
+        elegibles = sum(por_estrato.values())
+        if elegibles <= 0 or k <= 0:
+            return max(elegibles, 0), []
+
+        plantas: Optional[List[Row]] = None
+        ids: List[int] = []
+        if elegibles <= k:
+            ids = [i for i, _ in self._todas(evaluadas)]
+        else:
+            cuotas = self._cuotas(k, por_estrato) if estratificar else {None: k}
+            if elegibles / (id_max - id_min + 1) >= self.DENSIDAD_MINIMA:
+                plantas = self._por_rango(cuotas, por_estrato, id_min, id_max, evaluadas, estratificar)
+            if plantas is None:
+                agrupadas: Dict[Optional[int], List[int]] = defaultdict(list)
+                for planta_id, surco in self._todas(evaluadas):
+                    agrupadas[surco if estratificar else None].append(planta_id)
+                ids = [i for e, c in cuotas.items() for i in self.rng.sample(agrupadas[e], c)]
+
+        if plantas is None:
+            plantas = []
+            for i in range(0, len(ids), self.BLOQUE_IN):
+                plantas.extend(self.db.execute(
+                    select(*self.COLUMNAS).where(Planta.id.in_(ids[i:i + self.BLOQUE_IN]))
+                ).all())
+        plantas.sort(key=lambda p: (p.surco, p.numero))
+        return elegibles, plantas
@@ -0,0 +1,150 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, List, Literal, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_, select, tuple_
+from sqlalchemy.orm import Query, Session
+
+ModoPaginacion = Literal["offset", "cursor"]
+ModoConteo = Literal["exacto", "cache", "estimado", "ninguno"]
+
+
+def resolver_modos(paginacion: ModoPaginacion, cursor: Optional[str],
+                   conteo: Optional[ModoConteo]) -> Tuple[bool, ModoConteo]:
+    """
+    (usar_cursor, modo_conteo). Enviar un cursor implica paginación por cursor;
+    sin modo explícito, el conteo es exacto con offset y se omite con cursor.
+    """
+    usar_cursor = paginacion == "cursor" or bool(cursor)
+    return usar_cursor, conteo or ("ninguno" if usar_cursor else "exacto")
+
+
+def codificar_cursor(fecha: Optional[datetime], id_: int) -> str:
+    """Cursor opaco con la última posición (fecha, id) servida."""
+    datos = [fecha.isoformat() if fecha else None, id_]
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        fecha, id_ = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return (datetime.fromisoformat(fecha) if fecha else None), int(id_)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+
+def paginar_por_cursor(query: Query, col_fecha, col_id, cursor: Optional[str],
+                       limit: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Paginación por clave (keyset) en orden `fecha DESC NULLS FIRST, id DESC`.
+
+    El orden coincide con el recorrido inverso de un índice (fecha, id), así
+    que cada página es una lectura por rango desde el cursor, sin OFFSET:
+    el coste no crece con la profundidad. Con `col_fecha=None` se pagina solo
+    por id. Devuelve (items, siguiente_cursor); None si no hay más páginas.
+    """
+    if cursor:
+        fecha, ultimo_id = decodificar_cursor(cursor)
+        if col_fecha is None:
+            query = query.filter(col_id < ultimo_id)
+        elif fecha is None:
+            # Los registros sin fecha van primero: tras ellos vienen todos los fechados
+            query = query.filter(or_(and_(col_fecha.is_(None), col_id < ultimo_id), col_fecha.isnot(None)))
+        else:
+            query = query.filter(tuple_(col_fecha, col_id) < tuple_(fecha, ultimo_id))
+
+    orden = [col_id.desc()] if col_fecha is None else [col_fecha.desc().nullsfirst(), col_id.desc()]
+    items = query.order_by(None).order_by(*orden).limit(limit + 1).all()
+
+    siguiente = None
+    if len(items) > limit:
+        items = items[:limit]
+        ultimo = items[-1]
+        siguiente = codificar_cursor(
+            getattr(ultimo, col_fecha.key) if col_fecha is not None else None,
+            getattr(ultimo, col_id.key),
+        )
+    return items, siguiente
+
+
+class ConteoCache:
+    """
+    Conteos recientes en proceso, por consulta (SQL + parámetros), con TTL.
+    Evita repetir un COUNT completo en cada página de un scroll infinito.
+    """
+
+    def __init__(self, ttl_segundos: int = 60, max_entradas: int = 512):
+        self.ttl = ttl_segundos
+        self.max_entradas = max_entradas
+        self._conteos: "OrderedDict[tuple, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _clave(db: Session, stmt) -> tuple:
+        compilado = stmt.compile(dialect=db.get_bind().dialect)
+        return str(compilado), tuple(sorted((k, repr(v)) for k, v in compilado.params.items()))
+
+    def obtener(self, db: Session, stmt, calcular) -> int:
+        clave = self._clave(db, stmt)
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._conteos.get(clave)
+            if entrada and ahora - entrada[0] < self.ttl:
+                return entrada[1]
+
+        total = calcular()
+        with self._lock:
+            self._conteos[clave] = (ahora, total)
+            self._conteos.move_to_end(clave)
+            while len(self._conteos) > self.max_entradas:
+                self._conteos.popitem(last=False)
+        return total
+
+
+conteos = ConteoCache()
+
+
+def _estimar_postgres(db: Session, stmt) -> Optional[int]:
+    """Filas estimadas por el planificador (EXPLAIN), sin recorrer la tabla."""
+    compilado = stmt.compile(dialect=db.get_bind().dialect)
+    # Savepoint: un fallo del EXPLAIN no debe abortar la transacción de la petición
+    with db.begin_nested():
+        fila = db.connection().exec_driver_sql(
+            "EXPLAIN (FORMAT JSON) " + str(compilado), compilado.params
+        ).scalar()
+    plan = json.loads(fila) if isinstance(fila, str) else fila
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def contar(db: Session, query: Query, modo: ModoConteo) -> Optional[int]:
+    """
+    Total de la consulta según el modo:
+      - exacto: COUNT en cada petición (comportamiento histórico).
+      - cache: COUNT exacto reutilizado durante ConteoCache.ttl segundos.
+      - estimado: estimación del planificador en PostgreSQL; en otros motores
+        cae a "cache".
+      - ninguno: no se calcula (None).
+    """
+    if modo == "ninguno":
+        return None
+    if modo == "exacto":
+        return query.order_by(None).count()
+
+    subconsulta = query.order_by(None).statement.subquery()
+    if modo == "estimado" and db.get_bind().dialect.name == "postgresql":
+        try:
+            return _estimar_postgres(db, select(subconsulta))
+        except Exception:
+            pass
+    stmt = select(func.count()).select_from(subconsulta)
+    return conteos.obtener(db, stmt, lambda: db.execute(stmt).scalar() or 0)
+
+
+def paginas(total: Optional[int], limit: int) -> Optional[int]:
+    return None if total is None else (total + limit - 1) // limit
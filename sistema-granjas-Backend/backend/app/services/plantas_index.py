@@ -0,0 +1,126 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.db.models import Planta
+
+
+class IndicePlantasLote:
+    """
+    Cuadrícula densa (surco × número) con el id de la planta productiva que
+    ocupa cada celda (0 = vacía). Permite buscar la planta productiva más
+    cercana a un punto revisando solo anillos alrededor del objetivo, en vez
+    de recorrer todas las plantas del lote.
+    """
+
+    def __init__(self, filas: Iterable[Tuple[int, int, int]], surcos: int, plantas_por_surco: int):
+        filas = sorted(filas)  # (id, surco, numero): el id menor gana si hay celdas repetidas
+        max_surco = max([surcos] + [f[1] for f in filas])
+        max_numero = max([plantas_por_surco] + [f[2] for f in filas])
+        self.ids = np.zeros((max_surco + 1, max_numero + 1), dtype=np.int64)
+        for planta_id, surco, numero in reversed(filas):
+            if surco >= 0 and numero >= 0:
+                self.ids[surco, numero] = planta_id
+        self.total = int(np.count_nonzero(self.ids))
+
+    def _candidatas(self, surco: int, numero: int, radio: int, excluir: Set[int]):
+        s0, s1 = max(0, surco - radio), min(self.ids.shape[0], surco + radio + 1)
+        n0, n1 = max(0, numero - radio), min(self.ids.shape[1], numero + radio + 1)
+        ventana = self.ids[s0:s1, n0:n1]
+        ss, nn = np.nonzero(ventana)
+        ids = ventana[ss, nn]
+        if excluir:
+            mascara = ~np.isin(ids, list(excluir))
+            ss, nn, ids = ss[mascara], nn[mascara], ids[mascara]
+        return ss + s0, nn + n0, ids
+
+    def mas_cercana(self, surco: int, numero: int, excluir: Set[int]) -> Optional[int]:
+        """Id de la planta productiva más cercana (euclídea; empate → menor id)."""
+        if self.total - len(excluir) <= 0:
+            return None
+        radio_max = max(self.ids.shape)
+        radio = 0
+        while True:
+            ss, nn, ids = self._candidatas(surco, numero, radio, excluir)
+            if ids.size:
+                dist = np.hypot(ss - surco, nn - numero)
+                # Una celda fuera de la ventana aún podría estar más cerca que la
+                # mejor encontrada en una esquina: se amplía hasta esa distancia
+                alcance = int(math.ceil(dist.min()))
+                if alcance > radio:
+                    ss, nn, ids = self._candidatas(surco, numero, alcance, excluir)
+                    dist = np.hypot(ss - surco, nn - numero)
+                mejor = np.lexsort((ids, dist))[0]
+                return int(ids[mejor])
+            if radio >= radio_max:
+                return None
+            radio = min(radio * 2 if radio else 1, radio_max)
+
+
+class IndicePlantasCache:
+    """
+    Caché en proceso de índices por lote. Cada consulta valida la entrada con
+    una firma barata (conteos, max id y max updated_at de las plantas del
+    lote), de modo que cualquier escritura sobre Planta —incluidas las
+    inserciones masivas o las de otro worker— la invalida.
+    """
+
+    def __init__(self, max_lotes: int = 64):
+        self.max_lotes = max_lotes
+        self._indices: "OrderedDict[int, Tuple[tuple, IndicePlantasLote]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def resumen_lote(db: Session, lote_id: int) -> dict:
+        """Totales del lote y firma de versión en una sola consulta agregada."""
+        total, productivas, max_id, max_actualizada = db.query(
+            func.count(Planta.id),
+            func.coalesce(func.sum(case((Planta.estado == "productivo", 1), else_=0)), 0),
+            func.max(Planta.id),
+            func.max(Planta.updated_at),
+        ).filter(Planta.lote_id == lote_id).one()
+        return {
+            "total": int(total or 0),
+            "productivas": int(productivas or 0),
+            "firma": (total, productivas, max_id, max_actualizada),
+        }
+
+    def obtener(self, db: Session, lote, firma: tuple) -> IndicePlantasLote:
+        with self._lock:
+            entrada = self._indices.get(lote.id)
+            if entrada and entrada[0] == firma:
+                self._indices.move_to_end(lote.id)
+                return entrada[1]
+
+        filas = db.query(Planta.id, Planta.surco, Planta.numero).filter(
+            Planta.lote_id == lote.id,
+            Planta.estado == "productivo",
+        ).all()
+        indice = IndicePlantasLote(filas, lote.surcos or 1, lote.plantas_por_surco or 1)
+
+        with self._lock:
+            self._indices[lote.id] = (firma, indice)
+            self._indices.move_to_end(lote.id)
+            while len(self._indices) > self.max_lotes:
+                self._indices.popitem(last=False)
+        return indice
+
+
+indice_plantas = IndicePlantasCache()
+
+
+def seleccionar_mas_cercanas(indice: IndicePlantasLote, objetivos: List[Tuple[int, int]]) -> List[int]:
+    """Para cada objetivo elige la planta libre más cercana (sin repetir)."""
+    seleccionadas: List[int] = []
+    usados: Set[int] = set()
+    for surco, numero in objetivos:
+        planta_id = indice.mas_cercana(surco, numero, usados)
+        if planta_id is not None:
+            seleccionadas.append(planta_id)
+            usados.add(planta_id)
+    return seleccionadas
@@ -0,0 +1,105 @@
+import logging
+import time
+from typing import List
+
+import jwt as pyjwt
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.r2_storage import (
+    CACHE_CONTROL, consultar_objetos_r2, delete_file_from_r2,
+    firmar_subida_r2, key_diagnostico, url_publica_r2,
+)
+from app.schemas.subida_schema import ArchivoSubida, SubidaFirmada, SubidaVerificada
+
+logger = logging.getLogger(__name__)
+
+# Distingue estos tokens de los de sesión (que llevan "sub"): uno no sirve por el otro
+_TIPO_TOKEN = "subida_r2"
+
+# Margen para confirmar después de que vence la URL de subida
+_MARGEN_CONFIRMACION_SEGUNDOS = 3600
+
+TIPOS_PERMITIDOS = ("image/", "video/", "audio/", "application/pdf")
+
+
+class SubidasDirectasService:
+    """
+    Subida directa a R2 con URLs firmadas: la API solo maneja metadatos.
+
+      1. `firmar`: por cada archivo genera una key
+         diagnosticos/{año}/{mes}/{día}/{prefix}_{uuid}.ext, la URL de PUT
+         firmada y un token que identifica la key y al usuario.
+      2. El cliente hace PUT del archivo a R2.
+      3. `verificar`: con los tokens, comprueba con HEAD que cada objeto
+         existe y no excede el tamaño máximo; luego el endpoint lo asocia al
+         diagnóstico o crea la evidencia.
+    """
+
+    @staticmethod
+    def firmar(archivos: List[ArchivoSubida], usuario_id: int) -> List[SubidaFirmada]:
+        max_bytes = settings.R2_SUBIDA_MAX_MB * 1024 * 1024
+        expira = settings.R2_SUBIDA_EXPIRA_SEGUNDOS
+        subidas = []
+        for archivo in archivos:
+            if not archivo.content_type.startswith(TIPOS_PERMITIDOS):
+                raise HTTPException(400, f"Tipo de archivo no permitido: {archivo.content_type}")
+            if archivo.tamano > max_bytes:
+                raise HTTPException(413, f"{archivo.nombre} supera el máximo de {settings.R2_SUBIDA_MAX_MB} MB")
+
+            key = key_diagnostico(archivo.nombre, archivo.prefix)
+            token = pyjwt.encode({
+                "tipo": _TIPO_TOKEN,
+                "key": key,
+                "usuario_id": usuario_id,
+                "prefix": archivo.prefix,
+                "exp": int(time.time()) + expira + _MARGEN_CONFIRMACION_SEGUNDOS,
+            }, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+            subidas.append(SubidaFirmada(
+                key=key,
+                url_subida=firmar_subida_r2(key, archivo.content_type, expira),
+                headers={"Content-Type": archivo.content_type, "Cache-Control": CACHE_CONTROL},
+                url_publica=url_publica_r2(key),
+                token=token,
+                expira_en=expira,
+            ))
+        return subidas
+
+    @staticmethod
+    def _leer_token(token: str, usuario_id: int) -> dict:
+        try:
+            datos = pyjwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except pyjwt.PyJWTError:
+            raise HTTPException(400, "Token de subida inválido o vencido")
+        if datos.get("tipo") != _TIPO_TOKEN:
+            raise HTTPException(400, "Token de subida inválido o vencido")
+        if datos.get("usuario_id") != usuario_id:
+            raise HTTPException(403, "La subida pertenece a otro usuario")
+        return datos
+
+    @staticmethod
+    def verificar(tokens: List[str], usuario_id: int) -> List[SubidaVerificada]:
+        """
+        Valida los tokens y consulta los objetos en paralelo. Un objeto que
+        supera el tamaño máximo se borra; si alguno falta o no es válido se
+        responde con error y no se asocia ninguno.
+        """
+        datos = [SubidasDirectasService._leer_token(t, usuario_id) for t in tokens]
+        objetos = consultar_objetos_r2([d["key"] for d in datos])
+
+        max_bytes = settings.R2_SUBIDA_MAX_MB * 1024 * 1024
+        verificadas = []
+        for d, objeto in zip(datos, objetos):
+            if objeto is None:
+                raise HTTPException(409, f"El archivo {d['key']} no se ha subido todavía")
+            if objeto["tamano"] > max_bytes:
+                delete_file_from_r2(url_publica_r2(d["key"]))
+                raise HTTPException(413, f"El archivo supera el máximo de {settings.R2_SUBIDA_MAX_MB} MB")
+            verificadas.append(SubidaVerificada(
+                key=d["key"],
+                url=url_publica_r2(d["key"]),
+                prefix=d["prefix"],
+                content_type=objeto["content_type"],
+                tamano=objeto["tamano"],
+            ))
+        return verificadas
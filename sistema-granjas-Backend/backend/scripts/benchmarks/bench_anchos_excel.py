@@ -0,0 +1,100 @@
+"""
+Benchmark del ancho de columnas en ExportService._create_excel_response.
+
+Compara el cálculo anterior (astype(str).map(len).max() sobre cada columna
+completa) con ExportService._estimar_anchos (muestra + str.len() vectorizado)
+en una hoja sintética tipo formulario dinámico. Con --completo mide además la
+respuesta Excel entera, antes y después.
+
+    python scripts/benchmarks/bench_anchos_excel.py --filas 100000 --columnas 24
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comun import cronometrar, preparar_entorno, resumen  # noqa: E402
+
+preparar_entorno("anchos_excel")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from openpyxl.styles import Font, PatternFill  # noqa: E402
+
+from app.export.exportService import ExportService  # noqa: E402
+
+
+def hoja_sintetica(filas: int, columnas: int) -> pd.DataFrame:
+    """Mezcla de textos, números y fechas como en las hojas de diagnósticos"""
+    rng = np.random.default_rng(0)
+    datos = {}
+    for idx in range(columnas):
+        nombre = f"Campo Formulario {idx}"
+        if idx % 3 == 0:
+            datos[nombre] = rng.integers(0, 1000, filas)
+        elif idx % 3 == 1:
+            datos[nombre] = pd.Series(rng.choice(["A", "Broca", "Roya amarilla", "Sin novedad en el surco"], filas))
+        else:
+            datos[nombre] = pd.Series(pd.date_range("2024-01-01", periods=filas, freq="min").strftime("%Y-%m-%d %H:%M"))
+    return pd.DataFrame(datos)
+
+
+def anchos_anteriores(df: pd.DataFrame):
+    """Cálculo previo: convierte cada columna completa a str de Python"""
+    return [
+        min(max(df[column].astype(str).map(len).max(), len(str(column))) + 2, 50)
+        for column in df.columns
+    ]
+
+
+def excel_anterior(df: pd.DataFrame) -> bytes:
+    """_create_excel_response previo (anchos completos y estilo celda por celda)"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        df.to_excel(writer, sheet_name="Datos", index=False)
+        worksheet = writer.sheets["Datos"]
+        for column in df.columns:
+            column_length = max(df[column].astype(str).map(len).max(), len(str(column)))
+            col_idx = df.columns.get_loc(column)
+            worksheet.column_dimensions[chr(65 + col_idx)].width = min(column_length + 2, 50)
+        for cell in worksheet[1]:
+            cell.font = Font(bold=True, color="000000")
+            cell.fill = PatternFill(start_color="DDDDDD", fill_type="solid")
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--columnas", type=int, default=24, help="máximo 26: el cálculo anterior usaba chr(65 + idx)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--completo", action="store_true", help="medir también la respuesta Excel completa (lento)")
+    args = parser.parse_args()
+    if args.columnas > 26:
+        parser.error("--columnas no puede superar 26")
+
+    df = hoja_sintetica(args.filas, args.columnas)
+    print(f"Hoja sintética: {args.filas} filas x {args.columnas} columnas")
+
+    antes = cronometrar(lambda: anchos_anteriores(df), args.repeticiones)
+    despues = cronometrar(lambda: ExportService._estimar_anchos(df), args.repeticiones)
+    print(f"Anchos, anterior:  {resumen(antes)}")
+    print(f"Anchos, vectorial: {resumen(despues)}")
+    print(f"Aceleración: x{min(antes) / min(despues):.0f}")
+
+    if args.completo:
+        service = ExportService(db=None)
+        inicio = time.perf_counter()
+        excel_anterior(df)
+        t_antes = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        # El libro se genera completo antes de crear la respuesta
+        service._create_excel_response({"Datos": df}, "bench")
+        t_despues = time.perf_counter() - inicio
+        print(f"Respuesta completa: anterior {t_antes:.1f} s, actual {t_despues:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
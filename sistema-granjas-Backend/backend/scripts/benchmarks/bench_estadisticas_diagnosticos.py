@@ -0,0 +1,113 @@
+"""
+Benchmark de GET /api/diagnosticos/estadisticas/resumen (obtener_estadisticas).
+
+Inserta N diagnósticos repartidos en varios lotes, monitoreos y tipos, y mide
+la latencia y el número de sentencias SQL por llamada. Termina con código 1
+si la mediana supera el presupuesto o si la llamada usa más de una consulta.
+
+    python scripts/benchmarks/bench_estadisticas_diagnosticos.py --diagnosticos 100000 --presupuesto-ms 500
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comun import crear_base, cronometrar, preparar_entorno, resumen, sembrar_basico  # noqa: E402
+
+preparar_entorno("estadisticas")
+
+from datetime import datetime, timedelta  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.api.diagnosticos import obtener_estadisticas  # noqa: E402
+from app.db import models as m  # noqa: E402
+from app.db.database import engine  # noqa: E402
+
+LOTES = 20
+MONITOREOS = 3
+TIPOS = ("plagas", "enfermedades", "suelo", "arvenses")
+
+
+def sembrar(db, n: int):
+    base = sembrar_basico(db)
+    programa, granja, lote = base["programa"], base["granja"], base["lote"]
+    lotes = [lote.id]
+    for idx in range(1, LOTES):
+        otro = m.Lote(
+            nombre=f"Lote {idx}", granja_id=granja.id, programa_id=programa.id,
+            tipo_lote_id=lote.tipo_lote_id, fecha_inicio=datetime(2024, 1, 1),
+        )
+        db.add(otro)
+        db.flush()
+        lotes.append(otro.id)
+    monitoreos = [base["monitoreo"].id]
+    for idx in range(1, MONITOREOS):
+        otro = m.Monitoreo(nombre=f"Monitoreo {idx}", programa_id=programa.id)
+        db.add(otro)
+        db.flush()
+        monitoreos.append(otro.id)
+
+    inicio = datetime(2025, 1, 1)
+    for desde in range(0, n, 10_000):
+        db.execute(m.Diagnostico.__table__.insert(), [
+            dict(
+                programa_id=programa.id, tipo_monitoreo_id=monitoreos[i % MONITOREOS],
+                lote_id=lotes[i % LOTES], usuario_id=base["usuario"].id,
+                diagnostico_tipo_id=base["subtipo"].id, tipo_diagnostico=TIPOS[i % len(TIPOS)],
+                condiciones_dia="soleado", formulario={}, estado_revision="pendiente_revision",
+                fecha_creacion=inicio + timedelta(minutes=i),
+            )
+            for i in range(desde, min(desde + 10_000, n))
+        ])
+    db.commit()
+    return base["usuario"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--diagnosticos", type=int, default=100_000)
+    parser.add_argument("--presupuesto-ms", type=float, default=500)
+    parser.add_argument("--repeticiones", type=int, default=7)
+    args = parser.parse_args()
+
+    db = crear_base()
+    usuario = sembrar(db, args.diagnosticos)
+    print(f"{args.diagnosticos} diagnósticos en {LOTES} lotes, {MONITOREOS} monitoreos, {len(TIPOS)} tipos")
+
+    # El usuario y su rol quedan cargados en la sesión, como tras la
+    # autenticación: solo se cuentan las consultas del endpoint
+    _ = (usuario.rol.nombre, list(usuario.programas))
+    sentencias = []
+    event.listen(engine, "before_cursor_execute", lambda *a, **k: sentencias.append(1))
+
+    def llamar(**filtros):
+        sentencias.clear()
+        respuesta = obtener_estadisticas(
+            programa_id=filtros.get("programa_id"), fecha_inicio=filtros.get("fecha_inicio"),
+            fecha_fin=filtros.get("fecha_fin"), db=db, user=usuario,
+        )
+        return respuesta, len(sentencias)
+
+    fallo = False
+    casos = {
+        "sin filtros": {},
+        "con rango de fechas": {"fecha_inicio": datetime(2025, 1, 10).date(), "fecha_fin": datetime(2025, 2, 10).date()},
+    }
+    for nombre, filtros in casos.items():
+        respuesta, consultas = llamar(**filtros)
+        tiempos = cronometrar(lambda: llamar(**filtros), args.repeticiones)
+        mediana_ms = statistics.median(tiempos) * 1000
+        print(f"{nombre}: total={respuesta.total}, {consultas} consulta(s), {resumen(tiempos)}")
+        if consultas > 1:
+            print(f"  FALLA: se esperaba una sola consulta y hubo {consultas}")
+            fallo = True
+        if mediana_ms > args.presupuesto_ms:
+            print(f"  FALLA: la mediana supera el presupuesto de {args.presupuesto_ms:.0f} ms")
+            fallo = True
+
+    sys.exit(1 if fallo else 0)
+
+
+if __name__ == "__main__":
+    main()
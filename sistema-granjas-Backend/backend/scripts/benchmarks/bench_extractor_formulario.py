@@ -0,0 +1,106 @@
+"""
+Micro-benchmark de la extracción de campos de formularios de diagnóstico.
+
+Compara el enfoque anterior (una regex `^campo\\d*$` compilada por campo y por
+formulario, recorriendo el formulario una vez por campo) con
+ExtractorFormulario, que recorre cada formulario una sola vez. Antes de medir
+verifica que ambos devuelven exactamente lo mismo.
+
+    python scripts/benchmarks/bench_extractor_formulario.py --formularios 2000 --plantas 10
+    python scripts/benchmarks/bench_extractor_formulario.py --sufijos   # campos que terminan en dígitos
+"""
+import argparse
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comun import cronometrar, preparar_entorno, resumen  # noqa: E402
+
+preparar_entorno("extractor_formulario")
+
+from app.services.formulario_extractor import ExtractorFormulario  # noqa: E402
+
+
+def extraer_con_regex(formulario: dict, nombre_campo: str) -> list:
+    """Implementación anterior (_extraer_valores_campo en api/diagnosticos.py)"""
+    valores: list = []
+    if "formularios_por_planta" in formulario:
+        pattern = re.compile(r'^' + re.escape(nombre_campo) + r'\d*$')
+        for planta_data in formulario["formularios_por_planta"].values():
+            if not isinstance(planta_data, dict):
+                continue
+            for key, val in planta_data.items():
+                if not pattern.match(key):
+                    continue
+                if val is None or val == "":
+                    continue
+                if isinstance(val, list):
+                    valores.extend(item for item in val if item is not None and item != "")
+                else:
+                    valores.append(val)
+        return valores
+
+    val = formulario.get(nombre_campo)
+    if val is None or val == "":
+        return valores
+    if isinstance(val, list):
+        valores.extend(item for item in val if item is not None and item != "")
+    else:
+        valores.append(val)
+    return valores
+
+
+def formularios_sinteticos(n: int, plantas: int, campos: list) -> list:
+    """Formularios anidados (claves campo+id de planta) y algunos planos"""
+    rng = random.Random(1)
+    valores = [1, "A", ["a", "", None], "", None, 2.5, "Roya"]
+    formularios = []
+    for d in range(n):
+        por_planta = {}
+        for p in range(plantas):
+            planta_id = d * plantas + p
+            datos = {f"{campo}{planta_id}": rng.choice(valores) for campo in campos}
+            datos["observacion_libre"] = "sin novedad"
+            por_planta[str(planta_id)] = datos
+        formularios.append({"formularios_por_planta": por_planta})
+    formularios += [{campo: rng.choice(valores) for campo in campos} for _ in range(n // 10)]
+    return formularios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formularios", type=int, default=2000)
+    parser.add_argument("--plantas", type=int, default=10, help="plantas por formulario anidado")
+    parser.add_argument("--campos", type=int, default=20)
+    parser.add_argument("--sufijos", action="store_true",
+                        help="incluir campos cuyo nombre termina en dígitos (camino lento del extractor)")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    campos = [f"campo_{chr(97 + (c % 26))}{c // 26 or ''}" for c in range(args.campos)] + ["cuadrante", "nmero_total"]
+    if args.sufijos:
+        campos += ["campo", "campo1", "x9"]
+    formularios = formularios_sinteticos(args.formularios, args.plantas, campos)
+
+    def anterior():
+        return {c: [v for f in formularios for v in extraer_con_regex(f, c)] for c in campos}
+
+    def una_pasada():
+        return ExtractorFormulario(campos).extraer_todos(formularios)
+
+    if anterior() != una_pasada():
+        print("FALLA: los resultados no coinciden")
+        sys.exit(1)
+    print(f"{len(formularios)} formularios, {len(campos)} campos: resultados idénticos")
+
+    t_anterior = cronometrar(anterior, args.repeticiones, calentamiento=0)
+    t_nuevo = cronometrar(una_pasada, args.repeticiones, calentamiento=0)
+    print(f"Regex por campo: {resumen(t_anterior)}")
+    print(f"Una pasada:      {resumen(t_nuevo)}")
+    print(f"Aceleración: x{min(t_anterior) / min(t_nuevo):.1f}")
+
+
+if __name__ == "__main__":
+    main()
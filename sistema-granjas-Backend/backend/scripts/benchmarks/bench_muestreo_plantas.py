@@ -0,0 +1,112 @@
+"""
+Benchmark del muestreo de plantas de POST /api/diagnosticos/generar-plantas.
+
+Crea dos lotes de --plantas plantas (250 surcos) con un 20 % improductivas y
+diagnósticos recientes repartidos entre ambos, y compara la consulta anterior
+(anti-join contra los diagnósticos de todos los lotes + ORDER BY random()) con
+MuestreoPlantas en modo aleatorio y estratificado, para una muestra del 5 %.
+
+    python scripts/benchmarks/bench_muestreo_plantas.py --plantas 100000
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comun import crear_base, cronometrar, preparar_entorno, resumen, sembrar_basico  # noqa: E402
+
+preparar_entorno("muestreo_plantas")
+
+from collections import Counter  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from app.CRUD.plantas import crear_plantas_para_lote  # noqa: E402
+from app.db import models as m  # noqa: E402
+from app.services.muestreo_plantas import MuestreoPlantas  # noqa: E402
+
+SURCOS = 250
+TIPO = "plagas"
+
+
+def sembrar(db, plantas: int, diagnosticos: int):
+    base = sembrar_basico(db, surcos=SURCOS, plantas_por_surco=plantas // SURCOS)
+    otro = m.Lote(
+        nombre="Lote vecino", granja_id=base["granja"].id, programa_id=base["programa"].id,
+        tipo_lote_id=base["lote"].tipo_lote_id, surcos=SURCOS, plantas_por_surco=plantas // SURCOS,
+        fecha_inicio=datetime(2024, 1, 1),
+    )
+    db.add(otro)
+    db.commit()
+    lote = base["lote"]
+    for destino in (lote, otro):
+        crear_plantas_para_lote(db, destino.id)
+    db.query(m.Planta).filter(
+        m.Planta.lote_id == lote.id, (m.Planta.surco * 7 + m.Planta.numero) % 5 == 0
+    ).update({"estado": "improductivo"}, synchronize_session=False)
+
+    # 10 plantas por diagnóstico; la mayoría en el lote vecino
+    rng = random.Random(0)
+    ahora = datetime.utcnow()
+    for destino, n in ((otro, diagnosticos * 6 // 7), (lote, diagnosticos // 7)):
+        ids = [i for (i,) in db.query(m.Planta.id).filter(m.Planta.lote_id == destino.id)]
+        creados = db.execute(
+            insert(m.Diagnostico.__table__).returning(m.Diagnostico.__table__.c.id),
+            [dict(
+                programa_id=base["programa"].id, tipo_monitoreo_id=base["monitoreo"].id, lote_id=destino.id,
+                usuario_id=base["usuario"].id, tipo_diagnostico=TIPO, condiciones_dia="soleado",
+                formulario={}, fecha_creacion=ahora,
+            ) for _ in range(n)],
+        ).scalars().all()
+        db.execute(insert(m.diagnostico_planta), [
+            dict(diagnostico_id=d, planta_id=p) for d in creados for p in rng.sample(ids, 10)
+        ])
+    db.commit()
+    return lote
+
+
+def muestreo_anterior(db, lote_id: int, k: int, desde: datetime):
+    """Consulta previa de generar_plantas_aleatorias"""
+    subquery = select(m.diagnostico_planta.c.planta_id).join(
+        m.Diagnostico, m.Diagnostico.id == m.diagnostico_planta.c.diagnostico_id
+    ).where(m.Diagnostico.tipo_diagnostico == TIPO, m.Diagnostico.fecha_creacion >= desde)
+    query = db.query(m.Planta).filter(
+        m.Planta.lote_id == lote_id, m.Planta.estado == "productivo", ~m.Planta.id.in_(subquery)
+    )
+    return query.count(), query.order_by(func.random()).limit(k).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plantas", type=int, default=100_000, help="plantas por lote (múltiplo de 250)")
+    parser.add_argument("--diagnosticos", type=int, default=3500)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    db = crear_base()
+    lote = sembrar(db, args.plantas, args.diagnosticos)
+    desde = datetime.utcnow() - timedelta(days=30)
+    productivas = db.query(m.Planta).filter(m.Planta.lote_id == lote.id, m.Planta.estado == "productivo").count()
+    k = max(1, int(productivas * 5 / 100))
+    print(f"Lote de {args.plantas} plantas ({productivas} productivas), muestra de {k}")
+
+    elegibles_anterior, _ = muestreo_anterior(db, lote.id, k, desde)
+    tiempos = cronometrar(lambda: muestreo_anterior(db, lote.id, k, desde), args.repeticiones)
+    print(f"ORDER BY random(): {resumen(tiempos)}, elegibles={elegibles_anterior}")
+
+    for modo in ("aleatorio", "estratificado"):
+        def muestrear():
+            return MuestreoPlantas(db, lote.id, TIPO, desde).muestrear(k, modo)
+
+        elegibles, plantas = muestrear()
+        assert elegibles == elegibles_anterior and len(plantas) == k
+        tiempos = cronometrar(muestrear, args.repeticiones)
+        por_surco = Counter(p.surco for p in plantas)
+        print(f"{modo}: {resumen(tiempos)}, surcos cubiertos={len(por_surco)}, "
+              f"plantas por surco {min(por_surco.values())}-{max(por_surco.values())}")
+
+
+if __name__ == "__main__":
+    main()
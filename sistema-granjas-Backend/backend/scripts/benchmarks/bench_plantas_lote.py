@@ -0,0 +1,99 @@
+"""
+Benchmark de POST /api/plantas/generar-para-lote (crear_plantas_para_lote).
+
+Genera la cuadrícula completa de lotes de 10k a 100k plantas con una planta
+ya existente, y verifica que una segunda llamada no crea nada. Con --anterior
+mide también la versión previa (una consulta y un objeto ORM por celda, más un
+refresh por planta tras el commit) en los tamaños de hasta --max-anterior.
+
+    python scripts/benchmarks/bench_plantas_lote.py --tamanos 10000 50000 100000 --anterior
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from comun import crear_base, preparar_entorno, sembrar_basico  # noqa: E402
+
+preparar_entorno("plantas_lote")
+
+from datetime import datetime  # noqa: E402
+
+from app.CRUD.plantas import crear_plantas_para_lote, generar_codigo_planta  # noqa: E402
+from app.db import models as m  # noqa: E402
+from app.schemas.planta_schema import GenerarPlantasResponse  # noqa: E402
+
+
+def crear_plantas_anterior(db, lote_id: int):
+    """Implementación previa: SELECT por celda y refresh por planta creada"""
+    lote = db.query(m.Lote).filter(m.Lote.id == lote_id).first()
+    plantas_creadas = []
+    for surco in range(1, lote.surcos + 1):
+        for numero in range(1, lote.plantas_por_surco + 1):
+            existente = db.query(m.Planta).filter(
+                m.Planta.lote_id == lote_id, m.Planta.surco == surco, m.Planta.numero == numero
+            ).first()
+            if not existente:
+                nueva = m.Planta(
+                    lote_id=lote_id, surco=surco, numero=numero,
+                    codigo=generar_codigo_planta(lote.nombre, surco, numero), estado="productivo",
+                )
+                db.add(nueva)
+                plantas_creadas.append(nueva)
+    db.commit()
+    for p in plantas_creadas:
+        db.refresh(p)
+    return plantas_creadas
+
+
+def lote_con_una_planta(db, base, nombre: str, surcos: int, plantas_por_surco: int):
+    lote = m.Lote(
+        nombre=nombre, granja_id=base["granja"].id, programa_id=base["programa"].id,
+        tipo_lote_id=base["lote"].tipo_lote_id, surcos=surcos, plantas_por_surco=plantas_por_surco,
+        fecha_inicio=datetime(2024, 1, 1),
+    )
+    db.add(lote)
+    db.flush()
+    db.add(m.Planta(lote_id=lote.id, surco=1, numero=1, codigo=generar_codigo_planta(nombre, 1, 1)))
+    db.commit()
+    return lote
+
+
+def medir(db, base, nombre: str, total: int, funcion):
+    """Segundos hasta tener la respuesta serializable, como en el endpoint"""
+    surcos = 100
+    lote = lote_con_una_planta(db, base, nombre, surcos, total // surcos)
+    inicio = time.perf_counter()
+    plantas = funcion(db, lote.id)
+    GenerarPlantasResponse(mensaje="bench", creadas=len(plantas), total_esperadas=total, plantas=plantas)
+    segundos = time.perf_counter() - inicio
+    assert len(plantas) == total - 1
+    assert db.query(m.Planta).filter(m.Planta.lote_id == lote.id).count() == total
+    return segundos, lote.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 50_000, 100_000],
+                        help="plantas por lote (múltiplos de 100)")
+    parser.add_argument("--anterior", action="store_true", help="medir también la implementación previa")
+    parser.add_argument("--max-anterior", type=int, default=10_000)
+    args = parser.parse_args()
+
+    db = crear_base()
+    base = sembrar_basico(db)
+    for total in args.tamanos:
+        segundos, lote_id = medir(db, base, f"Actual {total}", total, crear_plantas_para_lote)
+        inicio = time.perf_counter()
+        assert crear_plantas_para_lote(db, lote_id) == []
+        repetida = time.perf_counter() - inicio
+        linea = f"{total} plantas: {segundos:.2f} s (segunda llamada {repetida:.2f} s)"
+        if args.anterior and total <= args.max_anterior:
+            anterior, _ = medir(db, base, f"Anterior {total}", total, crear_plantas_anterior)
+            linea += f", anterior {anterior:.2f} s (x{anterior / segundos:.0f})"
+        print(linea)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Utilidades compartidas por los benchmarks de scripts/benchmarks.
+
+Cada benchmark crea su propia base de datos (SQLite temporal por defecto, o
+BENCH_DATABASE_URL) antes de importar la aplicación. Las tablas de esa base
+se borran y se vuelven a crear: nunca apuntar BENCH_DATABASE_URL a una base
+con datos reales.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def preparar_entorno(nombre: str) -> str:
+    """Configura DATABASE_URL para el benchmark y agrega backend/ al path"""
+    url = os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{os.path.join(tempfile.gettempdir(), f'bench_{nombre}.db')}"
+    os.environ["DATABASE_URL"] = url
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import logging
+    logging.disable(logging.WARNING)
+    return url
+
+
+def crear_base():
+    """Borra y crea todas las tablas; retorna una sesión nueva"""
+    from app.db.database import Base, SessionLocal, engine
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return SessionLocal()
+
+
+def sembrar_basico(db, surcos: int = 10, plantas_por_surco: int = 10):
+    """
+    Crea lo mínimo para operar sobre un lote: rol admin, usuario, granja,
+    programa, tipo de lote, monitoreo, subtipo de diagnóstico y un lote sin
+    plantas. Retorna un dict con los objetos creados.
+    """
+    from datetime import datetime
+    from app.db import models as m
+
+    rol = m.Rol(nombre="admin")
+    db.add(rol)
+    db.flush()
+    usuario = m.Usuario(nombre="Benchmark", email="bench@example.com", rol_id=rol.id)
+    granja = m.Granja(nombre="Granja bench", ubicacion="Manizales")
+    programa = m.Programa(nombre="Café", tipo="agricola")
+    tipo_lote = m.TipoLote(nombre="Campo")
+    db.add_all([usuario, granja, programa, tipo_lote])
+    db.flush()
+    usuario.programas.append(programa)
+    lote = m.Lote(
+        nombre="Lote bench", granja_id=granja.id, programa_id=programa.id, tipo_lote_id=tipo_lote.id,
+        surcos=surcos, plantas_por_surco=plantas_por_surco, fecha_inicio=datetime(2024, 1, 1),
+    )
+    monitoreo = m.Monitoreo(nombre="Plagas", programa_id=programa.id)
+    db.add_all([lote, monitoreo])
+    db.flush()
+    subtipo = m.DiagnosticoTipo(programa_id=programa.id, monitoreo_id=monitoreo.id, nombre="Broca")
+    db.add(subtipo)
+    db.commit()
+    return {
+        "usuario": usuario, "granja": granja, "programa": programa,
+        "lote": lote, "monitoreo": monitoreo, "subtipo": subtipo,
+    }
+
+
+def cronometrar(funcion: Callable[[], object], repeticiones: int = 5, calentamiento: int = 1) -> List[float]:
+    """Tiempos (s) de `repeticiones` ejecuciones después de `calentamiento` sin medir"""
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def resumen(tiempos: List[float]) -> str:
+    return f"mediana {statistics.median(tiempos) * 1000:.1f} ms (mín {min(tiempos) * 1000:.1f}, máx {max(tiempos) * 1000:.1f})"
@@ -0,0 +1,61 @@
+"""
+Configuración común de las pruebas.
+
+DATABASE_URL se fija antes de importar la aplicación: las pruebas siempre usan
+una base SQLite temporal (o TEST_DATABASE_URL), nunca la del archivo .env,
+porque el fixture `db` borra y vuelve a crear todas las tablas.
+"""
+import os
+import tempfile
+
+_DIRECTORIO = tempfile.mkdtemp(prefix="granjas_tests_")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or f"sqlite:///{os.path.join(_DIRECTORIO, 'test.db')}"
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Sesión sobre un esquema recién creado"""
+    from app.db import models  # noqa: F401  registra todas las tablas
+    from app.db.database import Base, SessionLocal, engine
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+
+@pytest.fixture
+def datos_basicos(db):
+    """Rol admin, usuario, granja, programa, tipo de lote, lote, monitoreo y subtipo"""
+    from datetime import datetime
+    from app.db import models as m
+
+    rol = m.Rol(nombre="admin")
+    db.add(rol)
+    db.flush()
+    usuario = m.Usuario(nombre="Pruebas", email="pruebas@example.com", rol_id=rol.id)
+    granja = m.Granja(nombre="Granja pruebas", ubicacion="Manizales")
+    programa = m.Programa(nombre="Café", tipo="agricola")
+    tipo_lote = m.TipoLote(nombre="Campo")
+    db.add_all([usuario, granja, programa, tipo_lote])
+    db.flush()
+    usuario.programas.append(programa)
+    lote = m.Lote(
+        nombre="Lote 1", granja_id=granja.id, programa_id=programa.id, tipo_lote_id=tipo_lote.id,
+        surcos=4, plantas_por_surco=5, fecha_inicio=datetime(2024, 1, 1),
+    )
+    monitoreo = m.Monitoreo(nombre="Plagas", programa_id=programa.id)
+    db.add_all([lote, monitoreo])
+    db.flush()
+    subtipo = m.DiagnosticoTipo(programa_id=programa.id, monitoreo_id=monitoreo.id, nombre="Broca")
+    db.add(subtipo)
+    db.commit()
+    return {
+        "usuario": usuario, "granja": granja, "programa": programa,
+        "lote": lote, "monitoreo": monitoreo, "subtipo": subtipo,
+    }
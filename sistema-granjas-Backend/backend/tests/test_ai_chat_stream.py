@@ -0,0 +1,141 @@
+"""
+POST /api/ai/chat/stream contra la aplicación ASGI completa, con el modelo
+local (AI_MODELO=stub): orden de los eventos, liberación del cupo del modelo cuando
+el cliente se desconecta y 503 con Retry-After cuando no hay cupo.
+"""
+import asyncio
+import gc
+import json
+import time
+from datetime import timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.db import models as m
+from app.services.ai_modelo import limite_llm
+
+
+@pytest.fixture
+def app(db, monkeypatch):
+    monkeypatch.setattr(settings, "AI_MODELO", "stub")
+    monkeypatch.setattr(settings, "AI_STUB_RETARDO_MS", 0)
+    from app.main import app
+    return app
+
+
+@pytest.fixture
+def token(datos_basicos):
+    return create_access_token({"sub": datos_basicos["usuario"].email}, timedelta(hours=6))
+
+
+def _llamar(app, token: str, payload: dict, desconectar_tras: int = None) -> dict:
+    """
+    Envía un POST por ASGI y recoge los eventos SSE. Con `desconectar_tras`
+    el cliente se desconecta después de recibir ese número de tokens.
+    """
+    async def ejecutar():
+        cuerpo = json.dumps(payload).encode()
+        enviado = False
+        desconectado = asyncio.Event()
+        respuesta = {"status": None, "headers": {}, "eventos": []}
+        pendiente = ""
+
+        async def receive():
+            nonlocal enviado
+            if not enviado:
+                enviado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            await desconectado.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(mensaje):
+            nonlocal pendiente
+            if mensaje["type"] == "http.response.start":
+                respuesta["status"] = mensaje["status"]
+                respuesta["headers"] = {k.decode().lower(): v.decode() for k, v in mensaje["headers"]}
+            elif mensaje["type"] == "http.response.body":
+                pendiente += mensaje.get("body", b"").decode()
+                *bloques, pendiente = pendiente.split("\n\n")
+                for bloque in bloques:
+                    lineas = dict(linea.split(": ", 1) for linea in bloque.split("\n") if ": " in linea)
+                    if "event" in lineas:
+                        respuesta["eventos"].append((lineas["event"], json.loads(lineas["data"])))
+                tokens = sum(1 for nombre, _ in respuesta["eventos"] if nombre == "token")
+                if desconectar_tras and tokens >= desconectar_tras:
+                    desconectado.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/api/ai/chat/stream", "raw_path": b"/api/ai/chat/stream", "root_path": "",
+            "query_string": b"", "server": ("testserver", 80), "client": ("testclient", 50000),
+            "headers": [
+                (b"host", b"testserver"),
+                (b"content-type", b"application/json"),
+                (b"authorization", f"Bearer {token}".encode()),
+            ],
+        }
+        await app(scope, receive, send)
+        return respuesta
+
+    return asyncio.run(ejecutar())
+
+
+def _esperar_cupos_libres(segundos: float = 3) -> int:
+    limite = time.monotonic() + segundos
+    while limite_llm.activas and time.monotonic() < limite:
+        gc.collect()
+        time.sleep(0.02)
+    return limite_llm.activas
+
+
+def test_eventos_en_orden_sesion_tokens_fin(app, token, db):
+    respuesta = _llamar(app, token, {"pregunta": "¿Cuántos lotes hay en la granja?"})
+
+    assert respuesta["status"] == 200
+    assert respuesta["headers"]["content-type"].startswith("text/event-stream")
+    nombres = [nombre for nombre, _ in respuesta["eventos"]]
+    assert nombres[0] == "sesion"
+    assert nombres[-1] == "fin"
+    assert set(nombres[1:-1]) == {"token"}
+
+    sesion_id = respuesta["eventos"][0][1]["sesion_id"]
+    fin = respuesta["eventos"][-1][1]
+    assert fin["sesion_id"] == sesion_id
+    guardado = db.get(m.ChatMensaje, fin["mensaje_id"])
+    assert guardado.rol == "assistant"
+    assert guardado.contenido == "".join(datos["texto"] for nombre, datos in respuesta["eventos"] if nombre == "token")
+    assert _esperar_cupos_libres() == 0
+
+
+def test_desconexion_del_cliente_libera_el_cupo(app, token, db, monkeypatch):
+    # Unas 300 palabras a 20 ms: el stream completo tardaría varios segundos
+    monkeypatch.setattr(settings, "AI_STUB_RETARDO_MS", 20)
+
+    inicio = time.monotonic()
+    respuesta = _llamar(app, token, {"pregunta": "palabra " * 300}, desconectar_tras=3)
+
+    assert time.monotonic() - inicio < 3
+    nombres = [nombre for nombre, _ in respuesta["eventos"]]
+    assert nombres[0] == "sesion" and "fin" not in nombres
+    assert _esperar_cupos_libres() == 0
+    # Sin respuesta completa no se guarda mensaje del asistente
+    assert db.query(m.ChatMensaje).filter(m.ChatMensaje.rol == "assistant").count() == 0
+
+
+def test_modelo_saturado_responde_503_con_retry_after(app, token, db, monkeypatch):
+    monkeypatch.setattr(limite_llm, "espera", 0.05)
+    cupos = [limite_llm.adquirir() for _ in range(limite_llm.max_concurrencia)]
+    try:
+        respuesta = _llamar(app, token, {"pregunta": "¿Hay cupo?"})
+    finally:
+        for cupo in cupos:
+            cupo.liberar()
+
+    assert respuesta["status"] == 503
+    assert respuesta["headers"]["retry-after"] == "5"
+    assert respuesta["eventos"] == []
+    # La pregunta no queda guardada
+    assert db.query(m.ChatMensaje).count() == 0
+    assert limite_llm.activas == 0
@@ -0,0 +1,114 @@
+"""
+Alcance de /sync/changes por rol (mismos criterios que los listados) y
+registro de las plantas generadas con INSERT de Core.
+"""
+from datetime import datetime
+
+import pytest
+
+from app.CRUD.plantas import crear_plantas_para_lote
+from app.db import models as m
+from app.services.cambios_sync import cambios_desde
+
+
+@pytest.fixture
+def escenario(db, datos_basicos):
+    """
+    Usuarios de cada rol en el programa de datos_basicos, dos recomendaciones
+    con una labor cada una, un diagnóstico por estudiante, un ítem de
+    inventario y un lote de otra granja y programa con su propia labor.
+    """
+    lote = datos_basicos["lote"]
+    programa = datos_basicos["programa"]
+    usuarios = {}
+    for nombre in ("docente", "asesor", "estudiante", "trabajador", "talento_humano"):
+        rol = m.Rol(nombre=nombre)
+        db.add(rol)
+        db.flush()
+        for sufijo in ("a", "b"):
+            usuario = m.Usuario(nombre=f"{nombre} {sufijo}", email=f"{nombre}-{sufijo}@example.com", rol_id=rol.id)
+            db.add(usuario)
+            usuario.programas.append(programa)
+            usuarios[f"{nombre}_{sufijo}"] = usuario
+    usuarios["talento_humano_a"].granjas.append(datos_basicos["granja"])
+
+    otra_granja = m.Granja(nombre="Otra granja", ubicacion="Chinchiná")
+    otro_programa = m.Programa(nombre="Plátano", tipo="agricola")
+    db.add_all([otra_granja, otro_programa])
+    db.flush()
+    otro_lote = m.Lote(
+        nombre="Lote 2", granja_id=otra_granja.id, programa_id=otro_programa.id,
+        tipo_lote_id=lote.tipo_lote_id, surcos=1, plantas_por_surco=1, fecha_inicio=datetime(2024, 1, 1),
+    )
+    db.add(otro_lote)
+    db.flush()
+
+    recs = {
+        "a": m.Recomendacion(titulo="Rec A", docente_id=usuarios["docente_a"].id, lote_id=lote.id),
+        "b": m.Recomendacion(titulo="Rec B", docente_id=usuarios["asesor_b"].id, lote_id=lote.id),
+        "otra": m.Recomendacion(titulo="Rec otra", docente_id=usuarios["docente_a"].id, lote_id=otro_lote.id),
+    }
+    db.add_all(recs.values())
+    db.flush()
+    labores = {
+        clave: m.Labor(recomendacion_id=rec.id, estado="pendiente", trabajador_id=usuarios["trabajador_a"].id)
+        for clave, rec in recs.items()
+    }
+    diagnosticos = {
+        sufijo: m.Diagnostico(
+            programa_id=programa.id, lote_id=lote.id, usuario_id=usuarios[f"estudiante_{sufijo}"].id,
+            tipo_diagnostico="plagas", condiciones_dia="soleado",
+        )
+        for sufijo in ("a", "b")
+    }
+    tipo = m.ProgramaInventarioTipo(programa_id=programa.id, nombre="Insumos")
+    db.add_all([*labores.values(), *diagnosticos.values(), tipo])
+    db.flush()
+    item = m.ItemInventarioPrograma(tipo_id=tipo.id, cantidad_disponible=10.0, valores={"nombre": "Urea"})
+    db.add(item)
+    db.commit()
+    return {"usuarios": usuarios, "recs": recs, "labores": labores, "diagnosticos": diagnosticos, "item": item}
+
+
+def _visibles(db, usuario) -> set:
+    return {(c["entidad"], c["id"]) for c in cambios_desde(db, usuario, 0, 1000)["cambios"]}
+
+
+def test_alcance_por_rol(db, datos_basicos, escenario):
+    u, recs, labores, diags = escenario["usuarios"], escenario["recs"], escenario["labores"], escenario["diagnosticos"]
+    item = ("item_inventario", escenario["item"].id)
+    rec = {clave: ("recomendacion", r.id) for clave, r in recs.items()}
+    lab = {clave: ("labor", l.id) for clave, l in labores.items()}
+    diag = {clave: ("diagnostico", d.id) for clave, d in diags.items()}
+
+    todos = _visibles(db, datos_basicos["usuario"])
+    assert {*rec.values(), *lab.values(), *diag.values(), item} <= todos
+
+    # Docente: sus recomendaciones y las labores de ellas, también fuera de sus programas
+    assert _visibles(db, u["docente_a"]) == {rec["a"], rec["otra"], lab["a"], lab["otra"], diag["a"], diag["b"], item}
+    assert _visibles(db, u["docente_b"]) == {diag["a"], diag["b"], item}
+    # Asesor: labores de sus recomendaciones, recomendaciones de sus programas
+    assert _visibles(db, u["asesor_b"]) == {rec["a"], rec["b"], lab["b"], diag["a"], diag["b"], item}
+    assert _visibles(db, u["asesor_a"]) == {rec["a"], rec["b"], diag["a"], diag["b"], item}
+    # Estudiante: solo sus diagnósticos
+    assert _visibles(db, u["estudiante_a"]) == {rec["a"], rec["b"], lab["a"], lab["b"], diag["a"]}
+    assert _visibles(db, u["estudiante_b"]) == {rec["a"], rec["b"], lab["a"], lab["b"], diag["b"]}
+    # Trabajador: solo las labores asignadas
+    assert _visibles(db, u["trabajador_a"]) == {lab["a"], lab["b"], lab["otra"]}
+    assert _visibles(db, u["trabajador_b"]) == set()
+    # Talento humano: labores y recomendaciones de sus granjas, inventario de sus programas
+    assert _visibles(db, u["talento_humano_a"]) == {rec["a"], rec["b"], lab["a"], lab["b"], item}
+    assert _visibles(db, u["talento_humano_b"]) == {item}
+
+
+def test_plantas_generadas_aparecen_en_los_cambios(db, datos_basicos, escenario):
+    desde = cambios_desde(db, datos_basicos["usuario"], 0, 1000)["hasta"]
+
+    creadas = crear_plantas_para_lote(db, datos_basicos["lote"].id)
+
+    for usuario in (datos_basicos["usuario"], escenario["usuarios"]["docente_b"]):
+        respuesta = cambios_desde(db, usuario, desde, 1000)
+        assert sorted(c["id"] for c in respuesta["cambios"] if c["entidad"] == "planta") == sorted(p.id for p in creadas)
+        assert all(c["operacion"] == "upsert" for c in respuesta["cambios"])
+        assert {c["datos"]["codigo"] for c in respuesta["cambios"]} == {p.codigo for p in creadas}
+    assert not any(c["entidad"] == "planta" for c in cambios_desde(db, escenario["usuarios"]["estudiante_a"], desde, 1000)["cambios"])
@@ -0,0 +1,83 @@
+"""
+Equivalencia entre la extracción anterior (una regex `^campo\\d*$` por campo)
+y ExtractorFormulario sobre formularios de ejemplo.
+"""
+import re
+
+import pytest
+
+from app.services.formulario_extractor import ExtractorFormulario
+
+
+def extraer_con_regex(formulario: dict, nombre_campo: str) -> list:
+    """Implementación anterior (_extraer_valores_campo en api/diagnosticos.py)"""
+    valores: list = []
+    if "formularios_por_planta" in formulario:
+        pattern = re.compile(r'^' + re.escape(nombre_campo) + r'\d*$')
+        for planta_data in formulario["formularios_por_planta"].values():
+            if not isinstance(planta_data, dict):
+                continue
+            for key, val in planta_data.items():
+                if not pattern.match(key):
+                    continue
+                if val is None or val == "":
+                    continue
+                if isinstance(val, list):
+                    valores.extend(item for item in val if item is not None and item != "")
+                else:
+                    valores.append(val)
+        return valores
+
+    val = formulario.get(nombre_campo)
+    if val is None or val == "":
+        return valores
+    if isinstance(val, list):
+        valores.extend(item for item in val if item is not None and item != "")
+    else:
+        valores.append(val)
+    return valores
+
+
+FORMULARIOS = {
+    "plano": {
+        "cuadrante": "A", "nmero_total": 3, "vacio": "", "nulo": None,
+        "sintomas": ["amarillamiento", "", None, "manchas"], "otro": 1,
+    },
+    "anidado": {
+        "formularios_por_planta": {
+            "1807": {"cuadrante1807": "B", "nmero_total1807": 0, "sintomas1807": ["roya", None]},
+            "1808": {"cuadrante1808": "", "nmero_total1808": None, "sintomas1808": []},
+            "1809": "no es un dict",
+            "1810": {"cuadrante": "C", "cuadrante_extra1810": "no pertenece", "nmero_total1810": 2.5},
+        }
+    },
+    # Nombres de campo que terminan en dígitos o son prefijo de otros
+    "ambiguo": {
+        "formularios_por_planta": {
+            "5": {"campo5": 1, "campo15": 2, "campo1": 3, "x9": "a", "x95": "b", "x": "c"},
+            "6": {"campo": 4, "campo16": 5, "campo١٢": 6, "campox6": 7},
+        }
+    },
+    "anidado_vacio": {"formularios_por_planta": {}},
+}
+
+CAMPOS = ["cuadrante", "nmero_total", "sintomas", "vacio", "nulo", "campo", "campo1", "x9", "x", "inexistente"]
+
+
+@pytest.mark.parametrize("nombre", FORMULARIOS)
+def test_extraer_equivale_a_regex_por_campo(nombre):
+    formulario = FORMULARIOS[nombre]
+    extraidos = ExtractorFormulario(CAMPOS).extraer(formulario)
+
+    for campo in CAMPOS:
+        esperado = extraer_con_regex(formulario, campo)
+        assert extraidos.get(campo, []) == esperado, campo
+        assert ExtractorFormulario([campo]).extraer(formulario)[campo] == esperado, campo
+
+
+def test_extraer_todos_equivale_a_regex_por_campo():
+    formularios = list(FORMULARIOS.values())
+
+    esperado = {c: [v for f in formularios for v in extraer_con_regex(f, c)] for c in CAMPOS}
+
+    assert ExtractorFormulario(CAMPOS).extraer_todos(formularios) == esperado
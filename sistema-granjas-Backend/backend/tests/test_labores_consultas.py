@@ -0,0 +1,104 @@
+"""
+Regresión N+1 de los listados de labores: el número de sentencias SQL no debe
+crecer con la cantidad de labores, trabajadores, evidencias ni productos.
+"""
+import pytest
+from sqlalchemy import event
+
+from app.CRUD import labores as crud
+from app.db import models as m
+from app.db.database import engine
+
+
+@pytest.fixture
+def contar_sentencias():
+    sentencias = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    yield sentencias
+    event.remove(engine, "before_cursor_execute", registrar)
+
+
+@pytest.fixture
+def recomendacion(db, datos_basicos):
+    recomendacion = m.Recomendacion(
+        titulo="Control de broca", docente_id=datos_basicos["usuario"].id, lote_id=datos_basicos["lote"].id,
+    )
+    db.add(recomendacion)
+    db.commit()
+    return recomendacion
+
+
+def _agregar_labores(db, datos, recomendacion, n: int):
+    """n labores con trabajadores, ítems, evidencias y productos distintos"""
+    tipo = m.ProgramaInventarioTipo(programa_id=datos["programa"].id, nombre="Insumos")
+    db.add(tipo)
+    db.flush()
+    items = [
+        m.ItemInventarioPrograma(tipo_id=tipo.id, cantidad_disponible=100.0, valores={"nombre": f"Insumo {i}"})
+        for i in range(max(2, n // 4))
+    ]
+    trabajadores = [
+        m.Usuario(nombre=f"Trabajador {i}", email=f"t{n}-{i}@example.com", rol_id=datos["usuario"].rol_id)
+        for i in range(max(2, n // 2))
+    ]
+    db.add_all(items + trabajadores)
+    db.flush()
+    for i in range(n):
+        labor = m.Labor(
+            recomendacion_id=recomendacion.id, lote_id=datos["lote"].id, estado="pendiente",
+            # La mitad para el usuario de la prueba (listado por trabajador)
+            trabajador_id=datos["usuario"].id if i % 2 else trabajadores[i % len(trabajadores)].id,
+            comentario=f"labor {i}",
+            inventario_item_id=items[i % len(items)].id if i % 3 else None,
+        )
+        db.add(labor)
+        db.flush()
+        db.add_all(
+            m.Evidencia(labor_id=labor.id, usuario_id=trabajadores[(i + j) % len(trabajadores)].id,
+                        tipo="foto", url_archivo=f"evidencia-{i}-{j}.jpg", descripcion="avance")
+            for j in range(i % 4)
+        )
+        db.add_all(
+            m.ProductoLabor(labor_id=labor.id, inventario_item_id=items[(i + j) % len(items)].id, cantidad_usada=1)
+            for j in range(i % 3)
+        )
+    db.commit()
+
+
+LISTADOS = {
+    "listar_labores_crud": lambda db, usuario, recomendacion: crud.listar_labores_crud(
+        db, skip=0, limit=100, usuario=usuario),
+    "listar_labores_crud (cursor)": lambda db, usuario, recomendacion: crud.listar_labores_crud(
+        db, limit=100, usuario=usuario, modo_paginacion="cursor"),
+    "listar_labores_por_trabajador": lambda db, usuario, recomendacion: crud.listar_labores_por_trabajador(
+        db, trabajador_id=usuario.id, usuario=usuario),
+    "listar_labores_por_recomendacion": lambda db, usuario, recomendacion: crud.listar_labores_por_recomendacion(
+        db, recomendacion_id=recomendacion.id, usuario=usuario),
+}
+
+
+def _sentencias_del_listado(db, datos, recomendacion, contar_sentencias, nombre, n):
+    _agregar_labores(db, datos, recomendacion, n)
+    # Como en una petición nueva: nada cargado en la sesión salvo el usuario autenticado
+    db.expire_all()
+    usuario = datos["usuario"]
+    _ = usuario.rol.nombre
+    contar_sentencias.clear()
+    resultado = LISTADOS[nombre](db, usuario, recomendacion)
+    return len(contar_sentencias), resultado
+
+
+@pytest.mark.parametrize("nombre", LISTADOS)
+def test_consultas_constantes_al_crecer_las_labores(db, datos_basicos, recomendacion, contar_sentencias, nombre):
+    pocas, resultado = _sentencias_del_listado(db, datos_basicos, recomendacion, contar_sentencias, nombre, 8)
+    assert resultado["items"]
+
+    # 8 + 80 labores: más trabajadores, ítems, evidencias y productos
+    muchas, resultado = _sentencias_del_listado(db, datos_basicos, recomendacion, contar_sentencias, nombre, 80)
+    assert len(resultado["items"]) > 8
+
+    assert muchas == pocas, contar_sentencias
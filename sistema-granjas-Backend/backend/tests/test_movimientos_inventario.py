@@ -0,0 +1,128 @@
+"""
+Libro de movimientos de inventario: descuentos al completar labores, ajustes
+manuales y consistencia del saldo con el libro bajo escrituras concurrentes.
+"""
+import threading
+
+import pytest
+from sqlalchemy import func
+
+from app.CRUD.labores import completar_labor_crud
+from app.db import models as m
+from app.db.database import SessionLocal
+from app.services.movimientos_inventario_service import Movimiento, MovimientosInventarioService
+
+
+@pytest.fixture
+def items(db, datos_basicos):
+    tipo = m.ProgramaInventarioTipo(programa_id=datos_basicos["programa"].id, nombre="Insumos")
+    db.add(tipo)
+    db.flush()
+    items = [
+        m.ItemInventarioPrograma(tipo_id=tipo.id, cantidad_disponible=100.0, valores={"nombre": f"Insumo {i}"})
+        for i in range(3)
+    ]
+    db.add_all(items)
+    db.commit()
+    return items
+
+
+@pytest.fixture
+def labor(db, datos_basicos, items):
+    """Labor con su ítem (dosis 5) y dos productos de 3 y 2 unidades"""
+    recomendacion = m.Recomendacion(
+        titulo="Fertilizar", docente_id=datos_basicos["usuario"].id, lote_id=datos_basicos["lote"].id,
+    )
+    db.add(recomendacion)
+    db.flush()
+    labor = m.Labor(
+        recomendacion_id=recomendacion.id, lote_id=datos_basicos["lote"].id, estado="en_progreso",
+        inventario_item_id=items[0].id, cantidad_usada=8, dosis_aplicada=5,
+    )
+    labor.productos = [
+        m.ProductoLabor(inventario_item_id=items[1].id, cantidad_usada=3),
+        m.ProductoLabor(inventario_item_id=items[2].id, cantidad_usada=4, dosis_aplicada=2),
+    ]
+    db.add(labor)
+    db.commit()
+    return labor
+
+
+def _saldos(db, items):
+    db.expire_all()
+    return [db.get(m.ItemInventarioPrograma, item.id).cantidad_disponible for item in items]
+
+
+def test_completar_labor_descuenta_item_y_productos(db, datos_basicos, items, labor):
+    completar_labor_crud(db, labor, datos_basicos["usuario"])
+
+    assert _saldos(db, items) == [95.0, 97.0, 98.0]
+    movimientos = db.query(m.MovimientoInventario).filter(m.MovimientoInventario.labor_id == labor.id).all()
+    assert sorted((mov.item_id, mov.cantidad) for mov in movimientos) == [
+        (items[0].id, -5.0), (items[1].id, -3.0), (items[2].id, -2.0),
+    ]
+    assert all(mov.origen == "labor" for mov in movimientos)
+
+
+def test_completar_dos_veces_descuenta_una_sola_vez(db, datos_basicos, items, labor):
+    completar_labor_crud(db, labor, datos_basicos["usuario"])
+    completar_labor_crud(db, labor, datos_basicos["usuario"])
+
+    assert _saldos(db, items) == [95.0, 97.0, 98.0]
+    assert db.query(m.MovimientoInventario).count() == 3
+
+
+def test_salida_mayor_al_saldo_se_detiene_en_cero(db, items):
+    (registro,) = MovimientosInventarioService.aplicar(db, [Movimiento(items[0].id, -130.0, "labor")])
+    db.commit()
+
+    assert _saldos(db, items)[0] == 0.0
+    assert registro.cantidad == -100.0
+    assert registro.cantidad_solicitada == -130.0
+    assert registro.saldo_resultante == 0.0
+
+
+def test_fijar_saldo_registra_la_diferencia(db, datos_basicos, items):
+    registro = MovimientosInventarioService.fijar_saldo(db, items[0].id, 120.0, datos_basicos["usuario"].id)
+    db.commit()
+
+    assert _saldos(db, items)[0] == 120.0
+    assert (registro.origen, registro.cantidad, registro.saldo_resultante) == ("ajuste", 20.0, 120.0)
+    # Fijar el saldo que ya tiene no registra nada
+    assert MovimientosInventarioService.fijar_saldo(db, items[0].id, 120.0) is None
+
+
+def test_saldo_igual_al_libro_con_escrituras_concurrentes(db, items):
+    item_id = items[0].id
+    MovimientosInventarioService.fijar_saldo(db, item_id, 30.0)
+    db.commit()
+    errores = []
+
+    def trabajar(indice: int):
+        sesion = SessionLocal()
+        try:
+            for paso in range(10):
+                # Más salidas que entradas: varias llegan a cero y se recortan
+                cantidad = 1.0 if (indice + paso) % 3 == 0 else -2.0
+                MovimientosInventarioService.aplicar(sesion, [Movimiento(item_id, cantidad, "ajuste")])
+                sesion.commit()
+        except Exception as e:
+            errores.append(e)
+            sesion.rollback()
+        finally:
+            sesion.close()
+
+    hilos = [threading.Thread(target=trabajar, args=(i,)) for i in range(16)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert errores == []
+    saldo = _saldos(db, items)[0]
+    libro = db.query(func.sum(m.MovimientoInventario.cantidad)).filter(
+        m.MovimientoInventario.item_id == item_id
+    ).scalar()
+    assert saldo == pytest.approx(100.0 + libro)
+    assert db.query(m.MovimientoInventario).filter(m.MovimientoInventario.item_id == item_id).count() == 1 + 16 * 10
+    assert db.query(func.min(m.MovimientoInventario.saldo_resultante)).scalar() >= 0
@@ -0,0 +1,90 @@
+import random
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from app.CRUD.plantas import crear_plantas_para_lote
+from app.db import models as m
+from app.services.muestreo_plantas import MuestreoPlantas
+
+DESDE = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def lote(db, datos_basicos):
+    """Lote de 10 surcos x 20 plantas, todas productivas"""
+    lote = datos_basicos["lote"]
+    lote.surcos, lote.plantas_por_surco = 10, 20
+    db.commit()
+    crear_plantas_para_lote(db, lote.id)
+    return lote
+
+
+def _improductivas(db, lote, condicion):
+    db.query(m.Planta).filter(m.Planta.lote_id == lote.id, condicion).update(
+        {"estado": "improductivo"}, synchronize_session=False
+    )
+    db.commit()
+
+
+def _evaluar(db, datos, lote, plantas):
+    diagnostico = m.Diagnostico(
+        programa_id=datos["programa"].id, tipo_monitoreo_id=datos["monitoreo"].id, lote_id=lote.id,
+        usuario_id=datos["usuario"].id, tipo_diagnostico="plagas", condiciones_dia="soleado",
+        formulario={}, fecha_creacion=datetime(2025, 1, 1),
+    )
+    diagnostico.plantas = plantas
+    db.add(diagnostico)
+    db.commit()
+
+
+def _por_surco(db, lote, k, semilla):
+    elegibles, plantas = MuestreoPlantas(db, lote.id, "plagas", DESDE, random.Random(semilla)).muestrear(
+        k, "estratificado"
+    )
+    assert len({p.id for p in plantas}) == len(plantas)
+    return elegibles, Counter(p.surco for p in plantas)
+
+
+@pytest.mark.parametrize("semilla", range(10))
+def test_estratificado_reparte_la_cuota_de_cada_surco(db, lote, semilla):
+    elegibles, por_surco = _por_surco(db, lote, 30, semilla)
+
+    assert elegibles == 200
+    assert por_surco == {surco: 3 for surco in range(1, 11)}
+
+
+@pytest.mark.parametrize("semilla", range(10))
+def test_estratificado_proporcional_a_las_elegibles(db, lote, semilla):
+    # Surcos 6-10 con la mitad de plantas productivas
+    _improductivas(db, lote, (m.Planta.surco > 5) & (m.Planta.numero > 10))
+
+    elegibles, por_surco = _por_surco(db, lote, 30, semilla)
+
+    assert elegibles == 150
+    assert por_surco == {**{s: 4 for s in range(1, 6)}, **{s: 2 for s in range(6, 11)}}
+
+
+def test_estratificado_excluye_las_evaluadas(db, datos_basicos, lote):
+    # Surco 1: 10 de 20 plantas ya evaluadas con el mismo tipo
+    evaluadas = db.query(m.Planta).filter(m.Planta.lote_id == lote.id, m.Planta.surco == 1, m.Planta.numero <= 10).all()
+    _evaluar(db, datos_basicos, lote, evaluadas)
+    ids_evaluadas = {p.id for p in evaluadas}
+
+    for semilla in range(10):
+        _, plantas = MuestreoPlantas(db, lote.id, "plagas", DESDE, random.Random(semilla)).muestrear(38, "estratificado")
+        assert not ids_evaluadas & {p.id for p in plantas}
+        # 190 elegibles, 38 = 20 %: 2 del surco 1 y 4 de cada uno de los demás
+        assert Counter(p.surco for p in plantas) == {1: 2, **{s: 4 for s in range(2, 11)}}
+
+
+@pytest.mark.parametrize("semilla", range(10))
+def test_estratificado_con_baja_densidad_de_ids(db, lote, semilla):
+    # Solo 2 productivas por surco: el sorteo por rango de ids cede al muestreo en memoria
+    _improductivas(db, lote, m.Planta.numero > 2)
+
+    elegibles, por_surco = _por_surco(db, lote, 10, semilla)
+
+    assert elegibles == 20
+    assert por_surco == {surco: 1 for surco in range(1, 11)}
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from app.CRUD.plantas import crear_plantas_para_lote
+from app.db import models as m
+
+
+def test_genera_solo_las_celdas_que_faltan(db, datos_basicos):
+    lote = datos_basicos["lote"]
+    db.add(m.Planta(lote_id=lote.id, surco=2, numero=3, codigo="MANUAL-1"))
+    db.commit()
+
+    creadas = crear_plantas_para_lote(db, lote.id)
+
+    assert len(creadas) == 4 * 5 - 1
+    assert [(p.surco, p.numero) for p in creadas] == sorted(
+        (s, n) for s in range(1, 5) for n in range(1, 6) if (s, n) != (2, 3)
+    )
+    assert crear_plantas_para_lote(db, lote.id) == []
+    assert db.query(m.Planta).filter(m.Planta.lote_id == lote.id).count() == 20
+
+
+def test_choque_de_codigo_con_otro_lote_es_un_error(db, datos_basicos):
+    lote = datos_basicos["lote"]
+    crear_plantas_para_lote(db, lote.id)
+    # "lote 1" genera los mismos códigos que "Lote 1"
+    homonimo = m.Lote(
+        nombre="lote 1", granja_id=lote.granja_id, programa_id=lote.programa_id,
+        tipo_lote_id=lote.tipo_lote_id, surcos=2, plantas_por_surco=2, fecha_inicio=datetime(2024, 1, 1),
+    )
+    db.add(homonimo)
+    db.commit()
+
+    with pytest.raises(ValueError, match="ya están en uso"):
+        crear_plantas_para_lote(db, homonimo.id)
+
+    assert db.query(m.Planta).filter(m.Planta.lote_id == homonimo.id).count() == 0
+
+
+def test_sin_indice_unico_de_celda_genera_con_insert_simple(db, datos_basicos, monkeypatch):
+    # Base de datos donde la migración no pudo crear uq_planta_lote_surco_numero
+    from sqlalchemy import MetaData, UniqueConstraint
+    from app.CRUD import plantas as crud_plantas
+    from app.db.database import Base
+
+    copia = MetaData()
+    for tabla in Base.metadata.sorted_tables:
+        tabla.to_metadata(copia)
+    sin_indice = copia.tables["plantas"]
+    sin_indice.constraints = {
+        c for c in sin_indice.constraints
+        if not (isinstance(c, UniqueConstraint) and c.name == "uq_planta_lote_surco_numero")
+    }
+    conexion = db.connection()
+    m.Planta.__table__.drop(conexion)
+    sin_indice.create(conexion)
+    db.commit()
+    monkeypatch.setattr(crud_plantas, "_motores_con_indice_celda", set())
+
+    lote = datos_basicos["lote"]
+    db.add_all([
+        m.Planta(lote_id=lote.id, surco=1, numero=1, codigo="DUPLICADA-1"),
+        m.Planta(lote_id=lote.id, surco=1, numero=1, codigo="DUPLICADA-2"),
+    ])
+    db.commit()
+
+    assert not crud_plantas._indice_celda_existe(db)
+    creadas = crear_plantas_para_lote(db, lote.id)
+
+    assert len(creadas) == 4 * 5 - 1
+    assert crear_plantas_para_lote(db, lote.id) == []
@@ -0,0 +1,132 @@
+"""
+subir_archivos_r2 con un cliente S3 falso en memoria (mismas llamadas que
+boto3: upload_fileobj, put_object, delete_object).
+"""
+import asyncio
+import io
+import re
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+from starlette.datastructures import Headers
+
+from app.core import r2_storage
+from app.core.config import settings
+
+
+class ClienteR2Falso:
+    """
+    Guarda los objetos en un dict. `retardo(key)` simula la latencia de cada
+    subida y `fallar(key)` decide qué subidas fallan.
+    """
+
+    def __init__(self, retardo=lambda key: 0, fallar=lambda key: False):
+        self.retardo = retardo
+        self.fallar = fallar
+        self.objetos = {}
+        self.borrados = []
+        self._lock = threading.Lock()
+
+    def _guardar(self, key: str, contenido: bytes):
+        time.sleep(self.retardo(key))
+        if self.fallar(key):
+            raise ConnectionError(f"fallo simulado subiendo {key}")
+        with self._lock:
+            self.objetos[key] = contenido
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        self._guardar(key, fileobj.read())
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._guardar(Key, Body)
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.objetos.pop(Key, None)
+            self.borrados.append(Key)
+
+
+@pytest.fixture
+def r2(monkeypatch):
+    def configurar(procesar: bool = False, **kwargs) -> ClienteR2Falso:
+        cliente = ClienteR2Falso(**kwargs)
+        monkeypatch.setattr(settings, "r2_client", cliente, raising=False)
+        monkeypatch.setattr(settings, "R2_BUCKET_NAME", "pruebas")
+        monkeypatch.setattr(settings, "R2_PUBLIC_URL", "https://cdn.example.com")
+        monkeypatch.setattr(settings, "IMAGENES_PROCESAR", procesar)
+        return cliente
+    return configurar
+
+
+def _indice(key: str) -> int:
+    """Índice del archivo a partir del prefix planta_{i} de la key"""
+    return int(re.search(r"planta_(\d+)_", key).group(1))
+
+
+def _archivo(contenido: bytes, nombre: str, content_type: str = "application/octet-stream") -> UploadFile:
+    return UploadFile(file=io.BytesIO(contenido), filename=nombre, headers=Headers({"content-type": content_type}))
+
+
+def _foto(color) -> bytes:
+    salida = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(salida, format="JPEG")
+    return salida.getvalue()
+
+
+def test_resultados_en_el_orden_de_entrada(r2):
+    # Los últimos archivos terminan primero
+    cliente = r2(retardo=lambda key: (6 - _indice(key)) * 0.02)
+    archivos = [(f"planta_{i}", _archivo(f"contenido {i}".encode(), f"f{i}.bin")) for i in range(6)]
+
+    resultados = asyncio.run(r2_storage.subir_archivos_r2(archivos))
+
+    assert [_indice(r["url"]) for r in resultados] == list(range(6))
+    for i, resultado in enumerate(resultados):
+        key = resultado["url"].removeprefix("https://cdn.example.com/")
+        assert cliente.objetos[key] == f"contenido {i}".encode()
+        assert resultado["miniatura"] is None
+
+
+def test_una_subida_fallida_borra_las_demas(r2):
+    # La que falla es la más lenta: las otras ya están en R2 cuando falla
+    cliente = r2(
+        retardo=lambda key: 0.15 if _indice(key) == 3 else 0,
+        fallar=lambda key: _indice(key) == 3,
+    )
+    archivos = [(f"planta_{i}", _archivo(b"x" * 100, f"f{i}.bin")) for i in range(6)]
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(r2_storage.subir_archivos_r2(archivos))
+
+    assert error.value.status_code == 500
+    assert cliente.objetos == {}
+    assert sorted(_indice(k) for k in cliente.borrados) == [0, 1, 2, 4, 5]
+
+
+def test_fotos_procesadas_si_falla_una_miniatura_no_queda_nada(r2):
+    cliente = r2(procesar=True, fallar=lambda key: _indice(key) == 1 and "_mini" in key)
+    colores = ["red", "green", "blue"]
+    archivos = [(f"planta_{i}", _archivo(_foto(c), f"f{i}.jpg", "image/jpeg")) for i, c in enumerate(colores)]
+
+    with pytest.raises(HTTPException):
+        asyncio.run(r2_storage.subir_archivos_r2(archivos))
+
+    assert cliente.objetos == {}
+    # Foto y miniatura de los otros dos archivos, más la foto principal del que falló
+    assert len(cliente.borrados) == 5
+
+
+def test_fotos_procesadas_con_miniatura_en_orden(r2):
+    cliente = r2(procesar=True, retardo=lambda key: (3 - _indice(key)) * 0.02)
+    archivos = [(f"planta_{i}", _archivo(_foto("red"), f"f{i}.jpg", "image/jpeg")) for i in range(3)]
+
+    resultados = asyncio.run(r2_storage.subir_archivos_r2(archivos))
+
+    assert [_indice(r["url"]) for r in resultados] == [0, 1, 2]
+    for resultado in resultados:
+        base = resultado["url"].rsplit(".", 1)[0]
+        assert resultado["miniatura"].startswith(base + "_mini")
+    assert len(cliente.objetos) == 6
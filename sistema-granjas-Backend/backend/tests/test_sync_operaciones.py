@@ -0,0 +1,113 @@
+"""
+POST /api/sync/operaciones: reenvío de claves ya procesadas y lotes con
+operaciones aplicadas y rechazadas.
+"""
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.security import create_access_token
+from app.db import models as m
+
+
+@pytest.fixture
+def cliente(db, datos_basicos):
+    from app.main import app
+    token = create_access_token({"sub": datos_basicos["usuario"].email}, timedelta(hours=6))
+    return TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+
+@pytest.fixture
+def labor(db, datos_basicos):
+    """Labor pendiente que descuenta 5 unidades de un ítem con 100"""
+    tipo = m.ProgramaInventarioTipo(programa_id=datos_basicos["programa"].id, nombre="Insumos")
+    db.add(tipo)
+    db.flush()
+    item = m.ItemInventarioPrograma(tipo_id=tipo.id, cantidad_disponible=100.0, valores={"nombre": "Urea"})
+    recomendacion = m.Recomendacion(
+        titulo="Fertilizar", docente_id=datos_basicos["usuario"].id, lote_id=datos_basicos["lote"].id,
+    )
+    db.add_all([item, recomendacion])
+    db.flush()
+    labor = m.Labor(
+        recomendacion_id=recomendacion.id, lote_id=datos_basicos["lote"].id, estado="pendiente",
+        inventario_item_id=item.id, dosis_aplicada=5,
+    )
+    db.add(labor)
+    db.commit()
+    return labor
+
+
+def _enviar(cliente, *operaciones):
+    respuesta = cliente.post("/api/sync/operaciones", json={"operaciones": list(operaciones)})
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()
+
+
+def _saldo(db, labor) -> float:
+    db.expire_all()
+    return db.get(m.ItemInventarioPrograma, labor.inventario_item_id).cantidad_disponible
+
+
+def test_reenviar_la_misma_clave_no_aplica_dos_veces(cliente, db, labor):
+    operacion = {"clave": "c-1", "tipo": "completar", "labor_id": labor.id}
+
+    primera = _enviar(cliente, operacion)
+    segunda = _enviar(cliente, operacion)
+
+    assert primera["aplicadas"] == 1
+    assert primera["resultados"][0]["estado"] == "aplicada"
+    assert primera["resultados"][0]["repetida"] is False
+    assert segunda["aplicadas"] == 0
+    assert segunda["resultados"][0]["estado"] == "aplicada"
+    assert segunda["resultados"][0]["repetida"] is True
+    assert segunda["resultados"][0]["labor"] == primera["resultados"][0]["labor"]
+    assert _saldo(db, labor) == 95.0
+    assert db.query(m.MovimientoInventario).count() == 1
+    assert db.query(m.SyncOperacion).count() == 1
+
+
+def test_lote_con_operaciones_aplicadas_y_rechazadas(cliente, db, labor):
+    operaciones = [
+        {"clave": "a-1", "tipo": "avance", "labor_id": labor.id, "avance_porcentaje": 40},
+        {"clave": "a-2", "tipo": "completar", "labor_id": 9999},
+        {"clave": "a-3", "tipo": "avance", "labor_id": labor.id, "avance_porcentaje": 100},
+    ]
+
+    respuesta = _enviar(cliente, *operaciones)
+
+    assert [(r["clave"], r["estado"], r["status_code"]) for r in respuesta["resultados"]] == [
+        ("a-1", "aplicada", 200), ("a-2", "rechazada", 404), ("a-3", "aplicada", 200),
+    ]
+    assert (respuesta["aplicadas"], respuesta["rechazadas"], respuesta["errores"]) == (2, 1, 0)
+    # La operación rechazada no deshace las demás
+    db.expire_all()
+    assert db.get(m.Labor, labor.id).estado == "completada"
+    assert _saldo(db, labor) == 95.0
+
+    # El reenvío devuelve el mismo rechazo sin volver a intentarlo
+    repetido = _enviar(cliente, *operaciones)
+    assert [(r["estado"], r["repetida"]) for r in repetido["resultados"]] == [
+        ("aplicada", True), ("rechazada", True), ("aplicada", True),
+    ]
+    assert repetido["resultados"][1]["detalle"] == "Labor no encontrada"
+    assert _saldo(db, labor) == 95.0
+
+
+def test_avance_sin_porcentaje_rechaza_el_lote(cliente, db, labor):
+    respuesta = cliente.post("/api/sync/operaciones", json={"operaciones": [
+        {"clave": "v-1", "tipo": "completar", "labor_id": labor.id},
+        {"clave": "v-2", "tipo": "avance", "labor_id": labor.id},
+    ]})
+
+    # El cliente reenvía entonces una por una y descarta la que da 422
+    assert respuesta.status_code == 422
+    assert db.query(m.SyncOperacion).count() == 0
+
+
+def test_endpoint_anterior_responde_410(cliente):
+    respuesta = cliente.post("/api/sync", json={"tipo": "x", "data": {}})
+
+    assert respuesta.status_code == 410
+    assert "/api/sync/operaciones" in respuesta.json()["detail"]
@@ -3,6 +3,7 @@ import type { DiagnosticoDetalle } from '../../types/diagnosticoTypes';
 import Modal from '../Common/Modal';
 import diagnosticoService from '../../services/diagnosticoService';
 import { exportarDiagnosticoPDF } from '../../utils/pdfExport';
+import { miniaturaFoto, urlFoto, type FotoSubida } from '../../utils/normalize';
 
 interface DetallesDiagnosticoModalProps {
     isOpen: boolean;
@@ -41,7 +42,7 @@ const DetallesDiagnosticoModal: React.FC<DetallesDiagnosticoModalProps> = ({ isO
     if (!diagnostico) return null;
     const d = data || diagnostico;
 
-    const fotosSubidas = d.formulario?.fotos_subidas as Record<string, string[]> | undefined;
+    const fotosSubidas = d.formulario?.fotos_subidas as Record<string, FotoSubida[]> | undefined;
     const tieneFotos = fotosSubidas && Object.keys(fotosSubidas).length > 0;
     const totalFotos = tieneFotos ? Object.values(fotosSubidas!).flat().length : 0;
     const tienePlantas = !!d.formulario?.plantas?.length;
@@ -344,9 +345,9 @@ const DetallesDiagnosticoModal: React.FC<DetallesDiagnosticoModalProps> = ({ isO
                                             <span className="text-xs bg-gray-100 text-gray-500 px-2 py-0.5 rounded-full">{urls.length} foto{urls.length !== 1 ? 's' : ''}</span>
                                         </div>
                                         <div className="grid grid-cols-2 sm:grid-cols-3 md:grid-cols-4 gap-3">
-                                            {urls.map((url, idx) => (
-                                                <div key={idx} className="relative group cursor-pointer aspect-square rounded-xl overflow-hidden bg-gray-100 shadow-sm hover:shadow-md transition-all" onClick={() => setImagenSeleccionada(url)}>
-                                                    <img src={url} alt={`${campo}-${idx + 1}`} className="w-full h-full object-cover transform group-hover:scale-105 transition-transform duration-300" loading="lazy" onError={(e) => { (e.target as HTMLImageElement).src = 'https://via.placeholder.com/300?text=Error'; }} />
+                                            {urls.map((foto, idx) => (
+                                                <div key={idx} className="relative group cursor-pointer aspect-square rounded-xl overflow-hidden bg-gray-100 shadow-sm hover:shadow-md transition-all" onClick={() => setImagenSeleccionada(urlFoto(foto))}>
+                                                    <img src={miniaturaFoto(foto)} alt={`${campo}-${idx + 1}`} className="w-full h-full object-cover transform group-hover:scale-105 transition-transform duration-300" loading="lazy" onError={(e) => { (e.target as HTMLImageElement).src = 'https://via.placeholder.com/300?text=Error'; }} />
                                                     <div className="absolute inset-0 bg-black/40 opacity-0 group-hover:opacity-100 transition-opacity flex items-center justify-center">
                                                         <i className="fas fa-search-plus text-white text-xl"></i>
                                                     </div>
@@ -14,6 +14,7 @@ import type { DiagnosticoTipo } from '../../services/diagnosticoDinamicoService'
 import { useAuth } from '../../hooks/useAuth';
 import Modal from '../Common/Modal';
 import AISummaryModal from '../AI/AISummaryModal';
+import { miniaturaFoto, urlFoto, type FotoSubida } from '../../utils/normalize';
 
 // ── Interfaces ──────────────────────────────────────────────────────────────────
 interface ProductoSugerido {
@@ -224,16 +225,16 @@ const DetallesDiagnosticoModal: React.FC<{
                                     Evidencias fotográficas
                                 </h3>
                                 <div className="grid grid-cols-2 md:grid-cols-4 gap-3">
-                                    {Object.values(diagnostico.formulario.fotos_subidas).flat().map((url: string, idx: number) => (
+                                    {(Object.values(diagnostico.formulario.fotos_subidas) as FotoSubida[][]).flat().map((foto, idx: number) => (
                                         <a 
                                             key={idx} 
-                                            href={url} 
+                                            href={urlFoto(foto)} 
                                             target="_blank" 
                                             rel="noopener noreferrer"
                                             className="block overflow-hidden rounded-lg border border-gray-200 hover:shadow-md transition"
                                         >
                                             <img 
-                                                src={url} 
+                                                src={miniaturaFoto(foto)} 
                                                 alt="Evidencia" 
                                                 className="w-full h-24 object-cover"
                                                 loading="lazy"
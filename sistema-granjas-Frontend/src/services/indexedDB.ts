@@ -10,6 +10,7 @@ export interface PendingData {
 
 export interface OfflineAction {
   id?: number;
+  clave?: string; // clave de idempotencia para /sync/operaciones
   tipo: 'avance' | 'completar';
   labor_id: number;
   avance?: number;
@@ -75,7 +76,7 @@ export const getCachedLabores = async (): Promise<any[]> => {
 // ── Offline actions ──────────────────────────────────────────────────────────
 export const addOfflineAction = async (action: Omit<OfflineAction, 'id'>) => {
   const db = await getDB();
-  await db.add('pending_actions', action);
+  await db.add('pending_actions', { clave: crypto.randomUUID(), ...action });
 };
 
 export const getAllOfflineActions = async (): Promise<OfflineAction[]> => {
@@ -1,6 +1,8 @@
-import { getAllPending, deletePending, getAllOfflineActions, deleteOfflineAction } from './indexedDB';
+import { getAllPending, clearAll, getAllOfflineActions, deleteOfflineAction } from './indexedDB';
+import type { OfflineAction } from './indexedDB';
 
 const API_BASE = import.meta.env.VITE_API_URL || '/api';
+const SYNC_BATCH_SIZE = 200;
 
 const getHeaders = (): HeadersInit => {
   const token = localStorage.getItem('token');
@@ -10,46 +12,107 @@ const getHeaders = (): HeadersInit => {
   };
 };
 
+const aOperacion = (accion: OfflineAction) => ({
+  // Acciones encoladas antes de existir la clave: derivarla de forma estable
+  clave: accion.clave ?? `accion-${accion.id}-${accion.timestamp}`,
+  tipo: accion.tipo,
+  labor_id: accion.labor_id,
+  avance_porcentaje: accion.tipo === 'avance' ? accion.avance : undefined,
+  comentario: accion.comentario,
+  creado_en: accion.timestamp,
+});
+
+// Mismas reglas que OperacionSync en el backend: una acción que no las
+// cumple haría que el servidor rechace el lote completo con 422
+const esOperacionValida = (accion: OfflineAction): boolean => {
+  if (accion.tipo !== 'avance' && accion.tipo !== 'completar') return false;
+  if (!Number.isInteger(accion.labor_id) || accion.labor_id <= 0) return false;
+  if (accion.tipo === 'avance') {
+    if (!Number.isInteger(accion.avance) || accion.avance! < 0 || accion.avance! > 100) return false;
+  }
+  return (accion.comentario ?? '').length <= 2000;
+};
+
+const enviarOperaciones = (acciones: OfflineAction[]) =>
+  fetch(`${API_BASE}/sync/operaciones`, {
+    method: 'POST',
+    headers: getHeaders(),
+    body: JSON.stringify({ operaciones: acciones.map(aOperacion) }),
+  });
+
+/**
+ * Aplica la respuesta del servidor a la cola: 'aplicada' y 'rechazada' son
+ * definitivas y se borran; 'error' se reintenta en la próxima sincronización.
+ */
+const procesarResultados = async (acciones: OfflineAction[], resultados: any[]) => {
+  let aplicadas = 0;
+  for (let j = 0; j < acciones.length; j++) {
+    if (resultados[j]?.estado !== 'error') {
+      await deleteOfflineAction(acciones[j].id!);
+      if (resultados[j]?.estado === 'aplicada') aplicadas++;
+    }
+  }
+  return aplicadas;
+};
+
+/**
+ * El servidor rechazó el lote con 422: se envía cada acción por separado
+ * para que una sola acción inválida no bloquee el resto de la cola.
+ * Devuelve null si hay que detener la sincronización (sin red, sesión vencida).
+ */
+const enviarUnaPorUna = async (acciones: OfflineAction[]): Promise<number | null> => {
+  let aplicadas = 0;
+  for (const accion of acciones) {
+    const res = await enviarOperaciones([accion]);
+    if (res.status === 422) {
+      console.warn('Acción offline descartada por datos inválidos:', accion);
+      await deleteOfflineAction(accion.id!);
+      continue;
+    }
+    if (!res.ok) return null;
+    const { resultados } = await res.json();
+    aplicadas += await procesarResultados([accion], resultados);
+  }
+  return aplicadas;
+};
+
 export const syncPendingData = async () => {
   try {
-    // 1. Sync offline labor actions
-    const acciones = await getAllOfflineActions();
-    if (acciones.length > 0) {
-      let synced = 0;
-      for (const accion of acciones) {
-        try {
-          let url = '';
-          let body: any = {};
-          if (accion.tipo === 'avance') {
-            url = `${API_BASE}/labores/${accion.labor_id}/registrar-avance`;
-            body = { avance_porcentaje: accion.avance, comentario: accion.comentario };
-          } else if (accion.tipo === 'completar') {
-            url = `${API_BASE}/labores/${accion.labor_id}/completar`;
-          }
-          if (!url) continue;
-          const res = await fetch(url, { method: 'POST', headers: getHeaders(), body: JSON.stringify(body) });
-          if (res.ok) {
-            await deleteOfflineAction(accion.id!);
-            synced++;
-          }
-        } catch { /* skip */ }
+    // 1. Sync offline labor actions: por lotes, en orden y con clave de
+    //    idempotencia (reenviar un lote ya aplicado no repite nada)
+    const acciones: OfflineAction[] = [];
+    for (const accion of await getAllOfflineActions()) {
+      if (esOperacionValida(accion)) {
+        acciones.push(accion);
+      } else {
+        console.warn('Acción offline descartada por datos inválidos:', accion);
+        await deleteOfflineAction(accion.id!);
       }
-      if (synced > 0) console.log(`✅ ${synced} acción(es) offline sincronizada(s)`);
     }
-
-    // 2. Sync legacy pending_sync store (kept for backward compat)
-    const pendientes = await getAllPending();
-    if (pendientes.length === 0) return;
-    for (const item of pendientes) {
+    let synced = 0;
+    for (let i = 0; i < acciones.length; i += SYNC_BATCH_SIZE) {
+      const lote = acciones.slice(i, i + SYNC_BATCH_SIZE);
       try {
-        const res = await fetch(`${API_BASE}/sync`, {
-          method: 'POST',
-          headers: getHeaders(),
-          body: JSON.stringify(item),
-        });
-        if (res.ok) await deletePending(item.id as number);
-      } catch { /* skip */ }
+        const res = await enviarOperaciones(lote);
+        if (res.status === 422) {
+          const aplicadas = await enviarUnaPorUna(lote);
+          if (aplicadas === null) break;
+          synced += aplicadas;
+          continue;
+        }
+        if (!res.ok) break;
+        const { resultados } = await res.json();
+        synced += await procesarResultados(lote, resultados);
+      } catch {
+        break;
+      }
     }
+    if (synced > 0) console.log(`✅ ${synced} acción(es) offline sincronizada(s)`);
+
+    // 2. Legacy pending_sync store: /sync nunca guardó estos datos (ahora
+    //    responde 410), así que se vacía en lugar de reenviarlos
+    const pendientes = await getAllPending();
+    if (pendientes.length > 0) await clearAll();
   } catch (error) {
     console.error('Error en sincronización:', error);
   }
@@ -7,4 +7,17 @@ export const normalizarArray = <T,>(respuesta: any): T[] => {
   if (respuesta?.items && Array.isArray(respuesta.items)) return respuesta.items;
   if (respuesta?.data && Array.isArray(respuesta.data)) return respuesta.data;
   return [];
-};
\ No newline at end of file
+};
+
+/**
+ * Foto de `formulario.fotos_subidas`: URL (formato anterior) u objeto con
+ * la foto procesada y su miniatura.
+ */
+export type FotoSubida = string | { url: string; miniatura?: string | null };
+
+export const urlFoto = (foto: FotoSubida): string =>
+  typeof foto === 'string' ? foto : foto.url;
+
+/** Miniatura para listas y grillas; si no existe, la foto completa. */
+export const miniaturaFoto = (foto: FotoSubida): string =>
+  typeof foto === 'string' ? foto : foto.miniatura || foto.url;
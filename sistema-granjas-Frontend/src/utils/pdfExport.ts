@@ -247,7 +247,7 @@ export function exportarDiagnosticoPDF(data: any): void {
     y = drawSectionHeader(doc, y, '3. Métricas de monitoreo');
     const form = data.formulario;
     const plantasCount = form?.plantas?.length || 0;
-    const fotosCount = form?.fotos_subidas ? Object.values(form.fotos_subidas as Record<string, string[]>).flat().length : 0;
+    const fotosCount = form?.fotos_subidas ? Object.values(form.fotos_subidas as Record<string, unknown[]>).flat().length : 0;
     const metricRows = [
         { label: 'Plantas evaluadas', value: String(plantasCount) },
         { label: 'Fotos subidas', value: String(fotosCount) },